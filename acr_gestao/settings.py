@@ -1,4 +1,5 @@
 from pathlib import Path
+from celery.schedules import crontab
 from django.urls import reverse_lazy
 import os
 import secrets
@@ -148,6 +149,76 @@ DEFAULT_FROM_EMAIL = os.getenv("DEFAULT_FROM_EMAIL", "noreply@example.com")
 CELERY_BROKER_URL = os.getenv("CELERY_BROKER_URL", "redis://localhost:6379/0")
 CELERY_RESULT_BACKEND = os.getenv("CELERY_RESULT_BACKEND", CELERY_BROKER_URL)
 
+# Cache partilhada entre processos (necessária para limites de envio globais,
+# locks das tarefas e versões de cache); sem ela cada processo usa a sua memória
+if os.getenv("REDIS_CACHE_URL"):
+    CACHES = {
+        "default": {
+            "BACKEND": "django.core.cache.backends.redis.RedisCache",
+            "LOCATION": os.getenv("REDIS_CACHE_URL"),
+        }
+    }
+elif not DEBUG:
+    print("WARNING: REDIS_CACHE_URL not set; each process uses its own local-memory cache. Set it for production.")
+
+# Campanhas: destinatários por subtarefa e limites de envio por canal
+# (mensagens/segundo, partilhados por todos os workers; 0 = sem limite)
+NOTIFICATION_SHARD_SIZE = int(os.getenv("NOTIFICATION_SHARD_SIZE", "5000"))
+NOTIFICATION_RATE_LIMITS = {
+    "email": int(os.getenv("EMAIL_RATE_LIMIT_PER_SECOND", "14")),
+    "sms": int(os.getenv("SMS_RATE_LIMIT_PER_SECOND", "10")),
+}
+
+# Google Calendar: segundos sem alterações antes de enviar um evento editado
+GOOGLE_SYNC_DEBOUNCE_SECONDS = int(os.getenv("GOOGLE_SYNC_DEBOUNCE_SECONDS", "30"))
+# Google Calendar: pedidos/segundo à API por organização, partilhados pelos workers (0 = sem limite)
+GOOGLE_API_RATE_LIMIT = int(os.getenv("GOOGLE_API_RATE_LIMIT_PER_SECOND", "10"))
+
+# Outbox transacional: mensagens por lote do relay e tentativas antes de descartar
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "500"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "5"))
+# Dias que as mensagens processadas ficam guardadas antes de serem apagadas
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))
+CELERY_BEAT_SCHEDULE = {
+    "relay-outbox": {"task": "core.tasks.relay_outbox_task", "schedule": 5.0},
+    "purge-outbox": {"task": "core.tasks.purge_outbox_task", "schedule": crontab(hour=4, minute=15)},
+    "purge-report-jobs": {"task": "reports.tasks.purge_report_jobs_task", "schedule": 60 * 60.0},
+    "score-churn": {"task": "notifications.tasks.score_churn_task", "schedule": crontab(hour=3, minute=30)},
+    "close-commissions": {
+        "task": "core.tasks.close_commissions_task",
+        "schedule": crontab(day_of_month=1, hour=4, minute=0),
+    },
+    "billing-run": {"task": "core.tasks.billing_run_task", "schedule": crontab(day_of_month=1, hour=2, minute=0)},
+    "credit-snapshots": {
+        "task": "core.tasks.credit_snapshots_task",
+        "schedule": crontab(day_of_month=1, hour=1, minute=0),
+    },
+    "expire-subscriptions": {"task": "core.tasks.expire_subscriptions_task", "schedule": crontab(hour=0, minute=30)},
+}
+
+# Faturação mensal: dias após o início do mês até ao vencimento da mensalidade
+BILLING_DUE_DAYS = int(os.getenv("BILLING_DUE_DAYS", "8"))
+
+# Comissões: aulas por mês usadas para valorizar uma aula de um plano sem
+# créditos incluídos (mensal/ilimitado) no fecho mensal
+COMMISSION_CLASSES_PER_MONTH = int(os.getenv("COMMISSION_CLASSES_PER_MONTH", "8"))
+
+# Risco de abandono: pontuação a partir da qual um membro passa a "churn_risk"
+# e dias sem aulas (nem subscrição ativa) até passar a "churned"
+CHURN_RISK_THRESHOLD = float(os.getenv("CHURN_RISK_THRESHOLD", "0.6"))
+CHURNED_AFTER_DAYS = int(os.getenv("CHURNED_AFTER_DAYS", "90"))
+
+# Relatórios assíncronos: fila própria (worker dedicado, ex. `celery -A acr_gestao
+# worker -Q reports -c 2`) para não competir com as tarefas interativas,
+# jobs simultâneos por organização, timeout e retenção dos ficheiros
+CELERY_TASK_ROUTES = {"reports.tasks.generate_report_task": {"queue": "reports"}}
+REPORT_JOBS_PER_ORGANIZATION = int(os.getenv("REPORT_JOBS_PER_ORGANIZATION", "2"))
+REPORT_JOB_TIMEOUT = int(os.getenv("REPORT_JOB_TIMEOUT_SECONDS", "3600"))
+REPORT_JOB_RETENTION_HOURS = int(os.getenv("REPORT_JOB_RETENTION_HOURS", "24"))
+# Ficheiros dos relatórios (dados pessoais): fora de MEDIA_ROOT, que o nginx serve publicamente;
+# só são descarregados pela vista job_download. Partilhado entre os workers e o web.
+REPORTS_ROOT = Path(os.getenv("REPORTS_ROOT", BASE_DIR / "private" / "reports"))
+
 # Configurações de segurança para produção
 if not DEBUG:
     SESSION_COOKIE_HTTPONLY = True
@@ -8,6 +8,7 @@ from django.db.models import Count, Q
 from django.utils import timezone
 from datetime import timedelta
 from . import models
+from .services.invoicing import save_invoice_items
 
 
 class OrgScopedAdmin(admin.ModelAdmin):
@@ -148,6 +149,13 @@ class InvoiceAdmin(OrgScopedAdmin):
     search_fields = ['person__first_name', 'person__last_name', 'person__email']
     inlines = [InvoiceItemInline]
 
+    def save_formset(self, request, form, formset, change):
+        if formset.model is not models.InvoiceItem:
+            return super().save_formset(request, form, formset, change)
+        # Linhas gravadas em lote e total calculado uma vez (não por linha)
+        items = formset.save(commit=False)
+        save_invoice_items(form.instance, items, formset.deleted_objects)
+
 
 class PriceInline(admin.TabularInline):
     model = models.Price
@@ -2,7 +2,7 @@ from django.shortcuts import render, get_object_or_404, redirect
 from .auth_views import role_required
 from django.contrib import messages
 from django.core.paginator import Paginator
-from django.db.models import Q, Count, Sum
+from django.db.models import Q, Count
 from django.http import JsonResponse
 from django.utils import timezone
 from datetime import datetime, timedelta
@@ -18,6 +18,8 @@ from .models import (
     Payment, Organization, InstructorCommission
 )
 from .forms import PersonForm, InstructorForm, ModalityForm, EventForm
+from reports.models import RevenueBucket
+from reports.revenue import revenue_total
 
 logger = logging.getLogger(__name__)
 
@@ -86,12 +88,8 @@ def _get_dashboard_data(org):
     ).order_by('starts_at')[:5]
 
     # Receitas do mês atual
-    current_month = timezone.now().replace(day=1)
-    monthly_revenue = Payment.objects.filter(
-        organization=org,
-        status=Payment.Status.COMPLETED,
-        paid_date__gte=current_month
-    ).aggregate(total=Sum('amount'))['total'] or 0
+    today = timezone.localdate()
+    monthly_revenue = revenue_total(org, today.replace(day=1), today, source=RevenueBucket.Source.PAYMENT)
 
     return {
         'total_clients': total_clients,
@@ -5,3 +5,6 @@ class CoreConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "core"
     verbose_name = "Core (ACR Gestão)"
+
+    def ready(self):
+        from .services import enrolment  # noqa: F401 - propaga os membros das turmas às aulas
@@ -7,7 +7,7 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from django.utils import timezone
 from django.db.models import Sum, Count, Q
-from datetime import timedelta
+from datetime import datetime, time, timedelta
 import logging
 from django.db import DatabaseError
 from django.core.exceptions import ObjectDoesNotExist
@@ -18,6 +18,8 @@ from .models import (
     SystemAlert, UserProfile, Modality, Resource, Payment, InstructorCommission
 )
 from .services.alerts import AlertService, CreditHistoryService
+from reports.models import RevenueBucket
+from reports.revenue import revenue_total
 
 logger = logging.getLogger(__name__)
 
@@ -160,11 +162,7 @@ def dashboard_admin(request):
                 organization=org,
                 starts_at__date=today
             ).count(),
-            'weekly_revenue': ClientSubscription.objects.filter(
-                organization=org,
-                payment_date__gte=week_start,
-                is_paid=True
-            ).aggregate(Sum('payment_plan__price'))['payment_plan__price__sum'] or 0,
+            'weekly_revenue': revenue_total(org, week_start, today, source=RevenueBucket.Source.SUBSCRIPTION),
         }
 
         # Próximos eventos (hoje apenas)
@@ -375,18 +373,32 @@ def credit_history_view(request):
             person=person
         ).select_related('payment_plan').order_by('-created_at')
 
+        # Extrato do mês pedido (?month=AAAA-MM; por omissão o corrente), a partir dos snapshots de saldo
+        now = timezone.now()
+        try:
+            month = datetime.strptime(request.GET.get('month', ''), '%Y-%m').date()
+        except ValueError:
+            month = timezone.localdate(now).replace(day=1)
+        next_month = (month + timedelta(days=32)).replace(day=1)
+        start = timezone.make_aware(datetime.combine(month, time.min))
+        month_end = timezone.make_aware(datetime.combine(next_month, time.min))
+        end = min(month_end, now)
+
         # Resumo de créditos atual
         try:
-            credit_summary = CreditHistoryService.get_client_credit_summary(person, org)
+            credit_summary = CreditHistoryService.get_client_credit_summary(person, org, start, end)
         except DatabaseError as e:
             logger.error("Erro ao obter resumo de créditos: %s", e)
-            credit_summary = {'total_credits': 0, 'active_subscriptions': []}
+            credit_summary = {'total_credits': 0, 'active_subscriptions': [], 'statements': []}
 
         context = {
             'person': person,
             'bookings_history': bookings_history,
             'subscriptions_history': subscriptions_history,
             'credit_summary': credit_summary,
+            'month': month,
+            'previous_month': (month - timedelta(days=1)).replace(day=1),
+            'next_month': next_month if month_end <= now else None,
         }
 
         return render(request, 'core/credit_history.html', context)
@@ -18,9 +18,11 @@ from django.db import IntegrityError
 from googleapiclient.errors import HttpError
 
 from .models import Organization, Instructor, Event, GoogleCalendarConfig, InstructorGoogleCalendar, GoogleCalendarSyncLog
-from .services.google_calendar import get_google_calendar_service
+from .services.google_calendar import GoogleQuotaExceeded, get_google_calendar_service
 from .middleware import get_current_organization
-from .tasks import sync_instructor_events_task, sync_event_task
+from .tasks import (
+    organization_sync_group, sync_event_task, sync_instructor_events_task, sync_organization_events_task
+)
 
 logger = logging.getLogger(__name__)
 
@@ -188,7 +190,9 @@ def google_calendar_instructors(request):
         return redirect('core:google_calendar_setup')
 
     # Obter instrutores com suas configurações
-    instructors = Instructor.objects.filter(organization=organization, is_active=True)
+    instructors = Instructor.objects.filter(
+        organization=organization, is_active=True
+    ).select_related('google_calendar')
 
     instructor_configs = []
     for instructor in instructors:
@@ -265,13 +269,49 @@ def google_calendar_sync_instructor(request, instructor_id):
             messages.success(request, f"Sincronização iniciada para {instructor.full_name}.")
             logger.info("Sincronização agendada para %s", instructor.full_name)
 
-    except HttpError as e:
+    except (HttpError, GoogleQuotaExceeded) as e:
         messages.error(request, f"Erro na sincronização para {instructor.full_name}: {e}")
         logger.error(f"Erro na sincronização para {instructor.full_name}: {e}")
 
     return redirect('core:google_calendar_instructors')
 
 
+@role_required(["admin", "staff"])
+@require_http_methods(["POST"])
+def google_calendar_sync_all(request):
+    """Sincronizar todos os instrutores da organização em paralelo."""
+    try:
+        organization = get_current_organization(request)
+    except Organization.DoesNotExist:
+        raise Http404("Nenhuma organização configurada.")
+
+    try:
+        if getattr(settings, "CELERY_TASK_ALWAYS_EAGER", False):
+            results = organization_sync_group(organization.id).apply().get()
+            totals = {
+                key: sum(stats.get(key, 0) for stats in results)
+                for key in ('success', 'imported', 'errors', 'skipped')
+            }
+            messages.success(
+                request,
+                f"Sincronização completa de {len(results)} instrutores: "
+                f"{totals['success']} eventos exportados, "
+                f"{totals['imported']} importados, "
+                f"{totals['errors']} erros, "
+                f"{totals['skipped']} ignorados."
+            )
+        else:
+            sync_organization_events_task.delay(organization.id)
+            messages.success(request, "Sincronização de todos os instrutores iniciada.")
+            logger.info("Sincronização da organização %s agendada", organization.name)
+
+    except (HttpError, GoogleQuotaExceeded) as e:
+        messages.error(request, f"Erro na sincronização: {e}")
+        logger.error(f"Erro na sincronização da organização {organization.name}: {e}")
+
+    return redirect('core:google_calendar_instructors')
+
+
 @role_required(["admin", "staff"])
 @require_http_methods(["POST"])
 def google_calendar_toggle_instructor_sync(request, instructor_id):
@@ -378,7 +418,7 @@ def google_calendar_api_sync_event(request, event_id):
 
     except Event.DoesNotExist:
         return JsonResponse({'error': 'Evento não encontrado'}, status=404)
-    except (ValidationError, HttpError) as e:
+    except (ValidationError, HttpError, GoogleQuotaExceeded) as e:
         logger.error(f"Erro na API de sincronização para evento {event_id}: {e}")
         return JsonResponse({'error': str(e)}, status=500)
 
@@ -0,0 +1,35 @@
+"""
+Gera as mensalidades (pagamentos pendentes) de um mês.
+
+Corre no dia 1 de cada mês pelo Celery beat (``billing_run_task``); repetir a
+corrida para o mesmo mês não cria pagamentos duplicados.
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.tasks import billing_run_task
+
+
+class Command(BaseCommand):
+    help = "Gera as mensalidades pendentes dos clientes ativos de um mês"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='Apenas esta organização (id)')
+        parser.add_argument('--month', help='Mês a faturar (AAAA-MM); por omissão, o mês atual')
+
+    def handle(self, *args, **options):
+        period = None
+        if options['month']:
+            try:
+                period = datetime.strptime(options['month'], '%Y-%m').date().isoformat()
+            except ValueError as exc:
+                raise CommandError("Mês inválido (use AAAA-MM)") from exc
+
+        results = billing_run_task(organization_id=options['organization'], period=period)
+        for organization_id, result in results.items():
+            self.stdout.write(
+                f"Organização {organization_id} ({result['period']}): "
+                f"{result['created']} mensalidades, €{result['total']}"
+            )
+        self.stdout.write(self.style.SUCCESS("Faturação mensal concluída"))
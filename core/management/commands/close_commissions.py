@@ -0,0 +1,39 @@
+"""
+Fecha as comissões dos instrutores de um mês.
+
+Corre no dia 1 de cada mês pelo Celery beat (``close_commissions_task``) para o
+mês anterior; o comando permite recalcular um mês à mão (comissões já pagas não
+são alteradas).
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.tasks import close_commissions_task
+
+
+class Command(BaseCommand):
+    help = "Calcula as comissões dos instrutores de um mês e mostra o resumo de pagamentos"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='Apenas esta organização (id)')
+        parser.add_argument('--month', help='Mês a fechar (AAAA-MM); por omissão, o mês anterior')
+
+    def handle(self, *args, **options):
+        year = month = None
+        if options['month']:
+            try:
+                parsed = datetime.strptime(options['month'], '%Y-%m')
+            except ValueError as exc:
+                raise CommandError("Mês inválido (use AAAA-MM)") from exc
+            year, month = parsed.year, parsed.month
+
+        results = close_commissions_task(organization_id=options['organization'], year=year, month=month)
+        for organization_id, result in results.items():
+            self.stdout.write(f"Organização {organization_id} ({result['month']}): {result['events']} aulas")
+            for payout in result['payouts']:
+                self.stdout.write(
+                    f"  {payout['instructor']}: {payout['classes']} aulas, receita €{payout['revenue']}, "
+                    f"comissão €{payout['amount']} (por pagar €{payout['due']})"
+                )
+        self.stdout.write(self.style.SUCCESS("Fecho de comissões concluído"))
@@ -0,0 +1,39 @@
+"""
+Snapshots de saldo de créditos (``CreditBalanceSnapshot``).
+
+Corre no dia 1 de cada mês pelo Celery beat (``credit_snapshots_task``); o
+comando permite criar snapshots numa data (ex. carga inicial de meses
+anteriores, por ordem) e conferir todos os snapshots com o histórico.
+"""
+from datetime import datetime, time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.utils import timezone
+
+from core.services.credits import take_snapshots, verify_snapshots
+
+
+class Command(BaseCommand):
+    help = "Cria snapshots de saldo de créditos e verifica-os contra o histórico"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--at', help='Data do snapshot (AAAA-MM-DD, início do dia); por omissão, início do mês')
+        parser.add_argument('--verify-only', action='store_true', help='Apenas verificar os snapshots existentes')
+
+    def handle(self, *args, **options):
+        if not options['verify_only']:
+            if options['at']:
+                try:
+                    day = datetime.strptime(options['at'], '%Y-%m-%d').date()
+                except ValueError as exc:
+                    raise CommandError("Data inválida (use AAAA-MM-DD)") from exc
+            else:
+                day = timezone.localdate().replace(day=1)
+            taken_at = timezone.make_aware(datetime.combine(day, time.min))
+            created = take_snapshots(taken_at)
+            self.stdout.write(f"{created} snapshots em {taken_at:%Y-%m-%d %H:%M}")
+
+        mismatches = verify_snapshots()
+        if mismatches:
+            raise CommandError(f"{len(mismatches)} snapshots não batem com o histórico: {mismatches[:20]}")
+        self.stdout.write(self.style.SUCCESS("Snapshots conferidos com o histórico"))
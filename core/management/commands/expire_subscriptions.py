@@ -0,0 +1,32 @@
+"""
+Expiração de créditos e subscrições terminados.
+
+Corre todas as noites pelo Celery beat (``expire_subscriptions_task``); o
+comando permite repetir a expiração para uma data ou uma organização.
+"""
+from datetime import datetime
+
+from django.core.management.base import BaseCommand, CommandError
+
+from core.services.expiry import run_expiry
+
+
+class Command(BaseCommand):
+    help = "Expira créditos e subscrições terminados (por conjuntos)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--date', help='Data de referência (AAAA-MM-DD); por omissão, hoje')
+        parser.add_argument('--organization', type=int, help='ID da organização (por omissão, todas)')
+
+    def handle(self, *args, **options):
+        today = None
+        if options['date']:
+            try:
+                today = datetime.strptime(options['date'], '%Y-%m-%d').date()
+            except ValueError as exc:
+                raise CommandError("Data inválida (use AAAA-MM-DD)") from exc
+        result = run_expiry(today, organization_id=options['organization'])
+        self.stdout.write(self.style.SUCCESS(
+            f"{result['credits_expired']} saldos de créditos expirados, "
+            f"{result['subscriptions_expired']} subscrições expiradas"
+        ))
@@ -0,0 +1,20 @@
+"""
+Reconstrói o índice de identidade entre organizações (``PersonIdentity``).
+
+Necessário após importações de clientes com ``bulk_create`` (que não passam por
+``Person.save()``) ou mudança da ``SECRET_KEY``.
+"""
+from django.core.management.base import BaseCommand
+
+from core.services.identity import rebuild_identities
+
+
+class Command(BaseCommand):
+    help = "Reconstrói o índice de identidade (NIF/email) entre organizações"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='Apenas esta organização (id)')
+
+    def handle(self, *args, **options):
+        links = rebuild_identities(organization_id=options['organization'])
+        self.stdout.write(self.style.SUCCESS(f"Índice de identidade reconstruído ({links} ligações)"))
@@ -0,0 +1,33 @@
+"""
+Relay do outbox transacional.
+
+Entrega as mensagens pendentes (sincronização Google, invalidação de caches,
+notificações) em lotes. Com ``--loop`` corre como processo dedicado,
+esperando ``--interval`` segundos quando o outbox fica vazio.
+"""
+
+import time
+from django.core.management.base import BaseCommand
+
+from core.services.outbox import drain_outbox
+
+
+class Command(BaseCommand):
+    """Comando para entregar as mensagens do outbox."""
+
+    help = 'Entrega as mensagens pendentes do outbox transacional'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, help='Mensagens por lote (padrão: OUTBOX_BATCH_SIZE)')
+        parser.add_argument('--loop', action='store_true', help='Correr continuamente como processo dedicado')
+        parser.add_argument('--interval', type=float, default=1.0, help='Espera em segundos com o outbox vazio')
+
+    def handle(self, *args, **options):
+        while True:
+            relayed = drain_outbox(batch_size=options['batch_size'])
+            if relayed or not options['loop']:
+                self.stdout.write(self.style.SUCCESS(f'{relayed} mensagens entregues'))
+            if not options['loop']:
+                return
+            if not relayed:
+                time.sleep(options['interval'])
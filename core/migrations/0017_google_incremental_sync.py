@@ -0,0 +1,23 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_person_updated_at'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='instructorgooglecalendar',
+            name='next_sync_token',
+            field=models.CharField(blank=True, help_text='nextSyncToken da Calendar API para importar apenas alterações', max_length=255, verbose_name='Token de Sincronização'),
+        ),
+        migrations.AlterField(
+            model_name='event',
+            name='google_calendar_id',
+            field=models.CharField(blank=True, db_index=True, help_text='ID do evento no Google Calendar', max_length=255, null=True, verbose_name='ID Google Calendar'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:19
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0017_google_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='event',
+            name='google_sync_hash',
+            field=models.CharField(blank=True, editable=False, help_text='SHA-256 do último payload enviado ao Google', max_length=64, verbose_name='Hash Sincronização Google'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:21
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0018_event_google_sync_hash'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='googlecalendarconfig',
+            name='token_version',
+            field=models.PositiveIntegerField(default=0, editable=False, help_text='Incrementada a cada nova autorização OAuth (invalida clientes em cache)', verbose_name='Versão dos Tokens'),
+        ),
+    ]
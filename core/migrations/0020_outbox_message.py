@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:34
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0019_google_token_version'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='OutboxMessage',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('topic', models.CharField(choices=[('event.changed', 'Evento alterado'), ('event.deleted', 'Evento eliminado'), ('booking.changed', 'Reserva alterada')], max_length=32, verbose_name='Tópico')),
+                ('object_id', models.PositiveBigIntegerField(verbose_name='ID do Objeto')),
+                ('payload', models.JSONField(blank=True, default=dict, verbose_name='Dados')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+                ('processed_at', models.DateTimeField(blank=True, null=True, verbose_name='Processado em')),
+                ('attempts', models.PositiveSmallIntegerField(default=0, verbose_name='Tentativas')),
+                ('last_error', models.TextField(blank=True, verbose_name='Último Erro')),
+            ],
+            options={
+                'verbose_name': 'Mensagem Outbox',
+                'verbose_name_plural': 'Mensagens Outbox',
+                'ordering': ['id'],
+            },
+        ),
+        migrations.AddField(
+            model_name='outboxmessage',
+            name='organization',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='outbox_messages', to='core.organization'),
+        ),
+        migrations.AddIndex(
+            model_name='outboxmessage',
+            index=models.Index(condition=models.Q(('processed_at__isnull', True)), fields=['id'], name='outbox_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0020_outbox_message'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='outboxmessage',
+            name='topic',
+            field=models.CharField(choices=[('event.changed', 'Evento alterado'), ('event.deleted', 'Evento eliminado'), ('booking.changed', 'Reserva alterada'), ('payment.changed', 'Pagamento alterado'), ('subscription.changed', 'Subscrição alterada'), ('commission.changed', 'Comissão alterada')], max_length=32, verbose_name='Tópico'),
+        ),
+    ]
@@ -0,0 +1,22 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:00
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_outbox_revenue_topics'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='payment',
+            name='billing_period',
+            field=models.DateField(blank=True, help_text='1.º dia do mês da mensalidade (pagamentos gerados pela faturação mensal)', null=True, verbose_name='Período de Faturação'),
+        ),
+        migrations.AddConstraint(
+            model_name='payment',
+            constraint=models.UniqueConstraint(condition=models.Q(('billing_period__isnull', False)), fields=('organization', 'person', 'billing_period'), name='unique_payment_billing_period'),
+        ),
+    ]
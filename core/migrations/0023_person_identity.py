@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:04
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0022_payment_billing_period'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PersonIdentity',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('nif', 'NIF'), ('email', 'Email')], max_length=8, verbose_name='Tipo')),
+                ('digest', models.CharField(max_length=64, verbose_name='Hash')),
+            ],
+        ),
+        migrations.AddField(
+            model_name='personidentity',
+            name='people',
+            field=models.ManyToManyField(blank=True, related_name='identities', to='core.person'),
+        ),
+        migrations.AddConstraint(
+            model_name='personidentity',
+            constraint=models.UniqueConstraint(fields=('kind', 'digest'), name='unique_person_identity'),
+        ),
+    ]
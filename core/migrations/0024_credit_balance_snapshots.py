@@ -0,0 +1,54 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:10
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0023_person_identity'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='CreditBalanceSnapshot',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('taken_at', models.DateTimeField(verbose_name='Ponto de controlo')),
+                ('balance', models.IntegerField(verbose_name='Saldo')),
+                ('entries', models.PositiveIntegerField(default=0, verbose_name='Movimentos')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='Criado em')),
+            ],
+            options={
+                'ordering': ['-taken_at'],
+            },
+        ),
+        migrations.AddIndex(
+            model_name='credithistory',
+            index=models.Index(fields=['person', 'created_at'], name='credithistory_person_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='credithistory',
+            index=models.Index(fields=['subscription', 'created_at'], name='credithistory_sub_idx'),
+        ),
+        migrations.AddField(
+            model_name='creditbalancesnapshot',
+            name='organization',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='core.organization'),
+        ),
+        migrations.AddField(
+            model_name='creditbalancesnapshot',
+            name='person',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_snapshots', to='core.person'),
+        ),
+        migrations.AddField(
+            model_name='creditbalancesnapshot',
+            name='subscription',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='credit_snapshots', to='core.clientsubscription'),
+        ),
+        migrations.AddConstraint(
+            model_name='creditbalancesnapshot',
+            constraint=models.UniqueConstraint(fields=('subscription', 'taken_at'), name='unique_credit_snapshot'),
+        ),
+    ]
@@ -0,0 +1,25 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:14
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0024_credit_balance_snapshots'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='clientsubscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['organization', 'person'], name='clientsub_active_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubscription',
+            index=models.Index(condition=models.Q(('status', 'active')), fields=['end_date'], name='clientsub_active_end_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='clientsubscription',
+            index=models.Index(condition=models.Q(('remaining_credits__gt', 0), ('status', 'active')), fields=['credits_expire_date'], name='clientsub_credits_expiry_idx'),
+        ),
+    ]
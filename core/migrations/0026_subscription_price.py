@@ -0,0 +1,30 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:34
+
+import django.core.validators
+from django.db import migrations, models
+from django.db.models import OuterRef, Subquery
+
+
+def copy_plan_prices(apps, schema_editor):
+    # Sem histórico de preços: as subscrições existentes ficam com o preço atual do plano
+    ClientSubscription = apps.get_model("core", "ClientSubscription")
+    PaymentPlan = apps.get_model("core", "PaymentPlan")
+    ClientSubscription.objects.filter(price__isnull=True).update(
+        price=Subquery(PaymentPlan.objects.filter(pk=OuterRef("payment_plan_id")).values("price")[:1])
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0025_subscription_active_indexes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='clientsubscription',
+            name='price',
+            field=models.DecimalField(blank=True, decimal_places=2, max_digits=10, null=True, validators=[django.core.validators.MinValueValidator(0)], verbose_name='Preço'),
+        ),
+        migrations.RunPython(copy_plan_prices, migrations.RunPython.noop),
+    ]
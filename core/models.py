@@ -1,11 +1,12 @@
 from __future__ import annotations
 
 # Core Django imports (models/validators/timezone)
-from django.db import models, DatabaseError
+from django.db import models, DatabaseError, transaction
 from django.core.validators import MinValueValidator, MaxValueValidator
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 from django.contrib.auth.models import User
+from datetime import datetime
 from decimal import Decimal
 import logging
 
@@ -106,6 +107,7 @@ class Person(models.Model):
     photo = models.ImageField("Foto", upload_to=_person_upload_to, null=True, blank=True)
     status = models.CharField(max_length=20, choices=Status.choices, default=Status.ACTIVE)
     created_at = models.DateTimeField("Criado em", auto_now_add=True)
+    updated_at = models.DateTimeField("Atualizado em", auto_now=True, db_index=True)
     last_activity = models.DateTimeField("Última Atividade", null=True, blank=True)
 
     # Novo campo para multi-entidade
@@ -137,9 +139,17 @@ class Person(models.Model):
         return f"{n} ({self.get_entity_affiliation_display()})"
 
     def save(self, *args, **kwargs):
+        adding = self._state.adding
         super().save(*args, **kwargs)
         from django.db import connection
 
+        if adding:
+            self._invalidate_reports()
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None or {"nif", "email"} & set(update_fields):
+            from .services.identity import sync_person_identities
+            sync_person_identities(self)
+
         if connection.vendor != "postgresql":
             return
         # Atualiza SearchVector (método simples; ideal usar trigger no Postgres)
@@ -149,6 +159,17 @@ class Person(models.Model):
         except DatabaseError as e:
             logger.warning("Falha ao atualizar SearchVector para Person %s: %s", self.pk, e)
 
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._invalidate_reports()
+        return result
+
+    def _invalidate_reports(self) -> None:
+        # O resumo de relatórios conta os clientes da organização
+        from .services.cache_versions import bump_cache_version
+        organization_id = self.organization_id
+        transaction.on_commit(lambda: bump_cache_version("reports", organization_id))
+
     @property
     def full_name(self) -> str:
         return f"{self.first_name} {self.last_name}".strip()
@@ -167,6 +188,29 @@ class Person(models.Model):
         return Decimal("0.0")
 
 
+class PersonIdentity(models.Model):
+    """Identidade comum a clientes de várias organizações (NIF ou email normalizado).
+
+    Guarda apenas o hash (``core.services.identity``); ``people`` liga os
+    registos ``Person`` de cada organização com o mesmo NIF/email.
+    """
+    class Kind(models.TextChoices):
+        NIF = "nif", "NIF"
+        EMAIL = "email", "Email"
+
+    kind = models.CharField("Tipo", max_length=8, choices=Kind.choices)
+    digest = models.CharField("Hash", max_length=64)
+    people = models.ManyToManyField(Person, related_name="identities", blank=True)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["kind", "digest"], name="unique_person_identity"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.kind}:{self.digest[:12]}"
+
+
 class Instructor(models.Model):
     """Personal trainers and instructors."""
     class EntityAffiliation(models.TextChoices):
@@ -272,6 +316,21 @@ class Membership(models.Model):
     def __str__(self) -> str:
         return f"{self.person} - {self.plan} ({self.status})"
 
+    def save(self, *args, **kwargs):
+        super().save(*args, **kwargs)
+        self._invalidate_caches()
+
+    def delete(self, *args, **kwargs):
+        result = super().delete(*args, **kwargs)
+        self._invalidate_caches()
+        return result
+
+    def _invalidate_caches(self) -> None:
+        from .services.eligibility import invalidate_memberships
+        from .services.pricing import invalidate_pricing
+        invalidate_memberships(self.organization_id)
+        invalidate_pricing(self.organization_id)
+
 
 class Product(models.Model):
     """Billable item (membership, drop-in, pack, etc.) scoped to org."""
@@ -318,6 +377,17 @@ class Price(models.Model):
             return False
         return self.valid_from <= day
 
+    def save(self, *args, **kwargs):
+        from .services.pricing import invalidate_pricing
+        super().save(*args, **kwargs)
+        invalidate_pricing(self.organization_id)
+
+    def delete(self, *args, **kwargs):
+        from .services.pricing import invalidate_pricing
+        result = super().delete(*args, **kwargs)
+        invalidate_pricing(self.organization_id)
+        return result
+
 
 class Resource(models.Model):
     """Bookable resource (room/court/etc.) - MELHORADO com suas sugestões."""
@@ -441,10 +511,12 @@ class Event(models.Model):
 
     # Campos para integração Google Calendar (FASE 2)
     google_calendar_id = models.CharField("ID Google Calendar", max_length=255, blank=True, null=True,
-                                        help_text="ID do evento no Google Calendar")
+                                        db_index=True, help_text="ID do evento no Google Calendar")
     google_calendar_sync_enabled = models.BooleanField("Sincronização Google Calendar", default=True,
                                                       help_text="Se deve sincronizar com Google Calendar")
     last_google_sync = models.DateTimeField("Última Sincronização Google", null=True, blank=True)
+    google_sync_hash = models.CharField("Hash Sincronização Google", max_length=64, blank=True, editable=False,
+                                        help_text="SHA-256 do último payload enviado ao Google")
 
     class Meta:
         indexes = [
@@ -484,9 +556,29 @@ class Event(models.Model):
         from .services.scheduling import ensure_no_conflict
         ensure_no_conflict(self)
 
+    # Campos gravados pela própria sincronização Google (não geram efeitos secundários)
+    SYNC_BOOKKEEPING_FIELDS = frozenset({"google_calendar_id", "google_sync_hash", "last_google_sync"})
+
     def save(self, *args, **kwargs):
         self.full_clean()
-        super().save(*args, **kwargs)
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and set(update_fields) <= self.SYNC_BOOKKEEPING_FIELDS:
+            super().save(*args, **kwargs)
+            return
+        from .services.outbox import record_event_change
+        adding = self._state.adding
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_event_change(self)
+            if adding and self.event_type == self.EventType.GROUP_CLASS and self.class_group_id:
+                from .services.enrolment import enrol_members
+                enrol_members([self])
+
+    def delete(self, *args, **kwargs):
+        from .services.outbox import record_event_change
+        with transaction.atomic():
+            record_event_change(self, deleted=True)
+            return super().delete(*args, **kwargs)
 
     @property
     def bookings_count(self) -> int:
@@ -553,6 +645,18 @@ class Booking(models.Model):
             if not self.subscription_used.has_credits():
                 raise ValidationError("Subscrição não tem créditos suficientes.")
 
+    def save(self, *args, **kwargs):
+        from .services.outbox import record_booking_change
+        with transaction.atomic():
+            super().save(*args, **kwargs)
+            record_booking_change(self)
+
+    def delete(self, *args, **kwargs):
+        from .services.outbox import record_booking_change
+        with transaction.atomic():
+            record_booking_change(self)
+            return super().delete(*args, **kwargs)
+
     def mark_checked_in(self):
         self.status = "checked_in"
         self.save(update_fields=["status"])
@@ -566,6 +670,62 @@ class Booking(models.Model):
         return timezone.now() < (self.event.starts_at - timezone.timedelta(hours=2))
 
 
+class RevenueSourceMixin:
+    """Modelos com valores de receita (pagamentos, subscrições, comissões).
+
+    As gravações que tocam em ``REVENUE_FIELDS`` registam no outbox, na mesma
+    transação, os dias afetados (o anterior e o atual) para que os agregados de
+    receita (``reports.revenue``) sejam recalculados só nesses dias.
+
+    Cada modelo define ``REVENUE_TOPIC``, ``REVENUE_FIELDS``,
+    ``REVENUE_DAY_FIELDS`` (campos lidos por ``revenue_day``) e
+    ``revenue_day()``, o dia em que o valor conta como receita (None se não
+    conta); a falta de algum deles falha logo na definição do modelo. Os valores
+    de ``REVENUE_DAY_FIELDS`` lidos da base de dados ficam guardados na
+    instância para calcular o dia anterior sem nova consulta.
+    """
+    REVENUE_TOPIC = ""
+    REVENUE_FIELDS = frozenset()
+    REVENUE_DAY_FIELDS = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if not (cls.REVENUE_TOPIC and cls.REVENUE_FIELDS and cls.REVENUE_DAY_FIELDS
+                and callable(getattr(cls, "revenue_day", None))):
+            raise TypeError(
+                f"{cls.__name__} tem de definir REVENUE_TOPIC, REVENUE_FIELDS, REVENUE_DAY_FIELDS e revenue_day()"
+            )
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance._remember_revenue_state()
+        return instance
+
+    def _remember_revenue_state(self) -> None:
+        # Campos diferidos ficam de fora (o dia anterior é então lido da base de dados)
+        self._stored_revenue_state = {
+            name: self.__dict__[name] for name in self.REVENUE_DAY_FIELDS if name in self.__dict__
+        }
+
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is not None and not set(update_fields) & self.REVENUE_FIELDS:
+            return super().save(*args, **kwargs)
+        from .services.outbox import record_revenue_change, stored_revenue_day
+        with transaction.atomic():
+            previous_day = stored_revenue_day(self)
+            super().save(*args, **kwargs)
+            record_revenue_change(self, previous_day)
+        self._remember_revenue_state()
+
+    def delete(self, *args, **kwargs):
+        from .services.outbox import record_revenue_change, stored_revenue_day
+        with transaction.atomic():
+            record_revenue_change(self, stored_revenue_day(self), deleted=True)
+            return super().delete(*args, **kwargs)
+
+
 class Invoice(models.Model):
     """Basic invoice header."""
     class Status(models.TextChoices):
@@ -587,9 +747,12 @@ class Invoice(models.Model):
         return f"Invoice #{self.pk or 'new'} - {self.person}"
 
     def recompute_total(self) -> None:
-        """Recompute total from dependent items."""
-        agg = sum((it.quantity * it.unit_price for it in self.items.all()), start=0)
-        self.total = agg
+        """Recompute total from dependent items (one aggregate query).
+
+        To add several lines at once use ``core.services.invoicing``.
+        """
+        from .services.invoicing import items_total
+        self.total = items_total(self)
         self.save(update_fields=["total"])
 
 
@@ -604,12 +767,16 @@ class InvoiceItem(models.Model):
         return f"{self.description} x{self.quantity}"
 
     def save(self, *args, **kwargs):
-        """Auto-update invoice total after saving the line."""
+        """Auto-update invoice total after saving a single line.
+
+        Batch writes (``build_invoice``/``save_invoice_items``) skip this and
+        compute the total once.
+        """
         super().save(*args, **kwargs)
         self.invoice.recompute_total()
 
 
-class Payment(models.Model):
+class Payment(RevenueSourceMixin, models.Model):
     """Payment records for clients."""
     class Method(models.TextChoices):
         CASH = "cash", "Dinheiro"
@@ -632,12 +799,24 @@ class Payment(models.Model):
     description = models.CharField("Descrição", max_length=200, blank=True)
     due_date = models.DateField("Data de Vencimento", null=True, blank=True)
     paid_date = models.DateField("Data de Pagamento", null=True, blank=True)
+    billing_period = models.DateField(
+        "Período de Faturação", null=True, blank=True,
+        help_text="1.º dia do mês da mensalidade (pagamentos gerados pela faturação mensal)"
+    )
     notes = models.TextField("Notas", blank=True)
     created_at = models.DateTimeField("Criado em", auto_now_add=True)
     updated_at = models.DateTimeField("Atualizado em", auto_now=True)
 
     class Meta:
         ordering = ["-created_at"]
+        constraints = [
+            # Uma mensalidade por cliente e mês: a faturação mensal pode ser repetida
+            models.UniqueConstraint(
+                fields=["organization", "person", "billing_period"],
+                name="unique_payment_billing_period",
+                condition=models.Q(billing_period__isnull=False),
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.person.full_name} - €{self.amount} ({self.status})"
@@ -648,8 +827,18 @@ class Payment(models.Model):
             return False
         return timezone.now().date() > self.due_date
 
+    REVENUE_TOPIC = "payment.changed"
+    REVENUE_FIELDS = frozenset({"status", "amount", "method", "paid_date", "person"})
+    REVENUE_DAY_FIELDS = ("status", "paid_date", "created_at")
+
+    def revenue_day(self):
+        """Dia em que o pagamento conta como receita (None se não concluído)."""
+        if self.status != self.Status.COMPLETED:
+            return None
+        return self.paid_date or timezone.localdate(self.created_at or timezone.now())
+
 
-class InstructorCommission(models.Model):
+class InstructorCommission(RevenueSourceMixin, models.Model):
     """Comissões dos instrutores por aula/evento."""
     instructor = models.ForeignKey(Instructor, on_delete=models.CASCADE, related_name="commissions")
     event = models.ForeignKey(Event, on_delete=models.CASCADE, related_name="commissions")
@@ -698,6 +887,14 @@ class InstructorCommission(models.Model):
     def __str__(self) -> str:
         return f"{self.instructor.full_name} - {self.event.title} (€{self.instructor_amount})"
 
+    REVENUE_TOPIC = "commission.changed"
+    REVENUE_FIELDS = frozenset({"event", "total_revenue", "commission_rate", "instructor_amount"})
+    REVENUE_DAY_FIELDS = ("event_id",)
+
+    def revenue_day(self):
+        """Dia da aula a que a comissão respeita."""
+        return timezone.localdate(self.event.starts_at)
+
     def save(self, *args, **kwargs):
         """Calcular automaticamente os valores baseados na comissão."""
         if self.total_revenue and self.commission_rate:
@@ -718,6 +915,10 @@ class GoogleCalendarConfig(models.Model):
     access_token = models.TextField("Access Token", blank=True)
     refresh_token = models.TextField("Refresh Token", blank=True)
     token_expiry = models.DateTimeField("Token Expiry", null=True, blank=True)
+    token_version = models.PositiveIntegerField(
+        "Versão dos Tokens", default=0, editable=False,
+        help_text="Incrementada a cada nova autorização OAuth (invalida clientes em cache)"
+    )
 
     # Configurações de sincronização
     sync_enabled = models.BooleanField("Sincronização Ativa", default=False)
@@ -770,6 +971,10 @@ class InstructorGoogleCalendar(models.Model):
 
     # Metadados
     last_sync = models.DateTimeField("Última Sincronização", null=True, blank=True)
+    next_sync_token = models.CharField(
+        "Token de Sincronização", max_length=255, blank=True,
+        help_text="nextSyncToken da Calendar API para importar apenas alterações"
+    )
     sync_errors = models.TextField("Erros de Sincronização", blank=True)
 
     created_at = models.DateTimeField(auto_now_add=True)
@@ -827,6 +1032,45 @@ class GoogleCalendarSyncLog(models.Model):
         return f"{self.get_sync_type_display()} - {self.get_status_display()} ({self.created_at})"
 
 
+class OutboxMessage(models.Model):
+    """Efeito secundário pendente (outbox transacional).
+
+    Gravado na mesma transação que a alteração ao ``Event``/``Booking`` (ou aos
+    valores de receita) e entregue depois pelo relay (``relay_outbox``), pelo
+    menos uma vez.
+    """
+
+    class Topic(models.TextChoices):
+        EVENT_CHANGED = "event.changed", "Evento alterado"
+        EVENT_DELETED = "event.deleted", "Evento eliminado"
+        BOOKING_CHANGED = "booking.changed", "Reserva alterada"
+        PAYMENT_CHANGED = "payment.changed", "Pagamento alterado"
+        SUBSCRIPTION_CHANGED = "subscription.changed", "Subscrição alterada"
+        COMMISSION_CHANGED = "commission.changed", "Comissão alterada"
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="outbox_messages")
+    topic = models.CharField("Tópico", max_length=32, choices=Topic.choices)
+    object_id = models.PositiveBigIntegerField("ID do Objeto")
+    payload = models.JSONField("Dados", default=dict, blank=True)
+
+    created_at = models.DateTimeField("Criado em", auto_now_add=True)
+    processed_at = models.DateTimeField("Processado em", null=True, blank=True)
+    attempts = models.PositiveSmallIntegerField("Tentativas", default=0)
+    last_error = models.TextField("Último Erro", blank=True)
+
+    class Meta:
+        ordering = ["id"]
+        verbose_name = "Mensagem Outbox"
+        verbose_name_plural = "Mensagens Outbox"
+        indexes = [
+            # O relay só lê mensagens pendentes, por ordem de id
+            models.Index(fields=["id"], condition=models.Q(processed_at__isnull=True), name="outbox_pending_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.topic} #{self.object_id} ({'processada' if self.processed_at else 'pendente'})"
+
+
 # Adicionar antes do modelo Payment
 class PaymentPlan(models.Model):
     """Planos de pagamento flexíveis para mensalidades e créditos."""
@@ -871,7 +1115,7 @@ class PaymentPlan(models.Model):
         return f"{self.name} - {self.get_plan_type_display()} ({self.get_entity_type_display()})"
 
 
-class ClientSubscription(models.Model):
+class ClientSubscription(RevenueSourceMixin, models.Model):
     """Subscrições ativas dos clientes aos planos de pagamento."""
     class Status(models.TextChoices):
         ACTIVE = "active", "Ativo"
@@ -894,6 +1138,10 @@ class ClientSubscription(models.Model):
     # Controlo de pagamentos
     is_paid = models.BooleanField("Pago", default=False)
     payment_date = models.DateField("Data de Pagamento", null=True, blank=True)
+    # Preço do plano no momento da compra (por omissão, o preço atual do plano)
+    price = models.DecimalField(
+        "Preço", max_digits=10, decimal_places=2, null=True, blank=True, validators=[MinValueValidator(0)]
+    )
 
     notes = models.TextField("Notas", blank=True)
     created_at = models.DateTimeField("Criado em", auto_now_add=True)
@@ -903,6 +1151,18 @@ class ClientSubscription(models.Model):
         ordering = ["-start_date"]
         verbose_name = "Subscrição de Cliente"
         verbose_name_plural = "Subscrições de Clientes"
+        # Índices parciais: só as subscrições ativas (as expiradas acumulam-se)
+        indexes = [
+            models.Index(
+                fields=["organization", "person"], condition=models.Q(status="active"),
+                name="clientsub_active_idx",
+            ),
+            models.Index(fields=["end_date"], condition=models.Q(status="active"), name="clientsub_active_end_idx"),
+            models.Index(
+                fields=["credits_expire_date"], condition=models.Q(status="active", remaining_credits__gt=0),
+                name="clientsub_credits_expiry_idx",
+            ),
+        ]
 
     def __str__(self) -> str:
         return f"{self.person.full_name} - {self.payment_plan.name} ({self.status})"
@@ -915,6 +1175,27 @@ class ClientSubscription(models.Model):
             return False
         return True
 
+    REVENUE_TOPIC = "subscription.changed"
+    REVENUE_FIELDS = frozenset({"is_paid", "payment_date", "start_date", "payment_plan", "price"})
+    REVENUE_DAY_FIELDS = ("is_paid", "payment_date", "start_date")
+
+    def revenue_day(self):
+        """Dia em que a subscrição conta como receita (None se não paga)."""
+        if not self.is_paid:
+            return None
+        day = self.payment_date or self.start_date
+        # ``start_date`` usa ``timezone.now`` como default: datetime até ser relido
+        return timezone.localdate(day) if isinstance(day, datetime) else day
+
+    def save(self, *args, **kwargs):
+        # O preço fica fixado na compra: alterações posteriores ao plano não mudam a receita
+        if self.price is None and self.payment_plan_id:
+            self.price = self.payment_plan.price
+            update_fields = kwargs.get("update_fields")
+            if update_fields is not None:
+                kwargs["update_fields"] = {*update_fields, "price"}
+        super().save(*args, **kwargs)
+
     def has_credits(self) -> bool:
         """Verifica se ainda tem créditos disponíveis."""
         if self.payment_plan.plan_type != PaymentPlan.PlanType.CREDITS:
@@ -922,12 +1203,16 @@ class ClientSubscription(models.Model):
         return self.remaining_credits > 0
 
     def use_credit(self) -> bool:
-        """Usa um crédito se disponível. Retorna True se conseguiu usar."""
-        if not self.has_credits():
+        """Usa um crédito se disponível. Retorna True se conseguiu usar.
+
+        O saldo é decrementado atomicamente na base de dados e o uso fica no
+        histórico (ver ``core.services.credits``).
+        """
+        from .services.credits import InsufficientCredits, consume_credits
+        try:
+            consume_credits(self, 1)
+        except InsufficientCredits:
             return False
-        if self.payment_plan.plan_type == PaymentPlan.PlanType.CREDITS:
-            self.remaining_credits -= 1
-            self.save(update_fields=['remaining_credits'])
         return True
 
 
@@ -1002,11 +1287,42 @@ class CreditHistory(models.Model):
         ordering = ["-created_at"]
         verbose_name = "Histórico de Créditos"
         verbose_name_plural = "Histórico de Créditos"
+        indexes = [
+            models.Index(fields=["person", "created_at"], name="credithistory_person_idx"),
+            models.Index(fields=["subscription", "created_at"], name="credithistory_sub_idx"),
+        ]
 
     def __str__(self) -> str:
         return f"{self.person.full_name} - {self.get_action_display()} ({self.credits_amount:+d})"
 
 
+class CreditBalanceSnapshot(models.Model):
+    """Saldo de créditos de uma subscrição num ponto de controlo (ex. início do mês).
+
+    ``balance`` é o saldo segundo o histórico antes de ``taken_at``: saldo de
+    abertura (``credits_before`` do primeiro movimento) mais a soma dos
+    movimentos anteriores; ``entries`` conta esses movimentos. Saldos numa data
+    leem o último snapshot e só os movimentos seguintes (ver
+    ``core.services.credits``).
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
+    subscription = models.ForeignKey(ClientSubscription, on_delete=models.CASCADE, related_name="credit_snapshots")
+    person = models.ForeignKey(Person, on_delete=models.CASCADE, related_name="credit_snapshots")
+    taken_at = models.DateTimeField("Ponto de controlo")
+    balance = models.IntegerField("Saldo")
+    entries = models.PositiveIntegerField("Movimentos", default=0)
+    created_at = models.DateTimeField("Criado em", auto_now_add=True)
+
+    class Meta:
+        ordering = ["-taken_at"]
+        constraints = [
+            models.UniqueConstraint(fields=["subscription", "taken_at"], name="unique_credit_snapshot"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.subscription_id} @ {self.taken_at:%Y-%m-%d}: {self.balance}"
+
+
 # Modelo para alertas de sistema
 class SystemAlert(models.Model):
     """Alertas automáticos do sistema."""
@@ -3,11 +3,13 @@ Serviços para gestão de alertas automáticos e notificações.
 """
 from django.utils import timezone
 from django.db.models import Q
-from datetime import timedelta
+from datetime import datetime, timedelta
 from ..models import (
     SystemAlert, ClientSubscription, Person, CreditHistory,
     PaymentPlan, Booking, Organization
 )
+from .credits import credit_statement
+from .expiry import run_expiry
 
 
 class AlertService:
@@ -86,47 +88,12 @@ class AlertService:
 
     @staticmethod
     def check_expired_credits(organization: Organization):
-        """Verifica créditos expirados e cria alertas."""
-        today = timezone.now().date()
+        """Expira créditos e subscrições terminados e cria alertas.
 
-        expired_subscriptions = ClientSubscription.objects.filter(
-            organization=organization,
-            status=ClientSubscription.Status.ACTIVE,
-            payment_plan__plan_type=PaymentPlan.PlanType.CREDITS,
-            credits_expire_date__lt=today,
-            remaining_credits__gt=0
-        ).select_related('person', 'payment_plan')
-
-        for subscription in expired_subscriptions:
-            # Criar histórico de expiração
-            CreditHistory.objects.create(
-                organization=organization,
-                person=subscription.person,
-                subscription=subscription,
-                action=CreditHistory.Action.EXPIRE,
-                credits_amount=-subscription.remaining_credits,
-                credits_before=subscription.remaining_credits,
-                credits_after=0,
-                description=f"Créditos expirados em {today}"
-            )
-
-            # Criar alerta
-            SystemAlert.objects.create(
-                organization=organization,
-                alert_type=SystemAlert.AlertType.CREDITS_EXPIRED,
-                person=subscription.person,
-                title=f"Créditos Expirados - {subscription.person.full_name}",
-                message=f"{subscription.remaining_credits} créditos do plano {subscription.payment_plan.name} expiraram em {today}.",
-                metadata={
-                    'subscription_id': subscription.id,
-                    'expired_credits': subscription.remaining_credits,
-                    'expiry_date': today.isoformat()
-                }
-            )
-
-            # Remover créditos expirados
-            subscription.remaining_credits = 0
-            subscription.save(update_fields=['remaining_credits'])
+        Operação por conjuntos (ver ``core.services.expiry.run_expiry``), a
+        mesma do job noturno, restrita à organização.
+        """
+        return run_expiry(organization_id=organization.pk)
 
     @staticmethod
     def create_booking_reminder(booking: Booking, hours_before: int = 2):
@@ -175,7 +142,11 @@ class CreditHistoryService:
 
     @staticmethod
     def log_credit_usage(booking: Booking):
-        """Regista uso de crédito numa reserva."""
+        """Regista uso de crédito numa reserva.
+
+        Para consumir créditos usar ``core.services.credits.consume_credits``,
+        que altera o saldo e grava o histórico de forma atómica.
+        """
         if booking.subscription_used:
             CreditHistory.objects.create(
                 organization=booking.organization,
@@ -191,7 +162,7 @@ class CreditHistoryService:
 
     @staticmethod
     def log_credit_refund(booking: Booking):
-        """Regista reembolso de crédito por cancelamento."""
+        """Regista reembolso de crédito por cancelamento (ver ``refund_credits``)."""
         if booking.subscription_used:
             CreditHistory.objects.create(
                 organization=booking.organization,
@@ -206,8 +177,15 @@ class CreditHistoryService:
             )
 
     @staticmethod
-    def get_client_credit_summary(person: Person, organization: Organization):
-        """Obtém resumo de créditos de um cliente."""
+    def get_client_credit_summary(person: Person, organization: Organization,
+                                  start: datetime | None = None, end: datetime | None = None):
+        """Obtém resumo de créditos de um cliente.
+
+        ``statements`` traz o extrato de cada subscrição de créditos ativa entre
+        ``start`` e ``end`` (por omissão, do início do mês até agora): saldo
+        inicial lido do último snapshot, movimentos e saldo final (ver
+        ``core.services.credits.credit_statement``).
+        """
         active_subscriptions = ClientSubscription.objects.filter(
             organization=organization,
             person=person,
@@ -222,8 +200,18 @@ class CreditHistoryService:
             person=person
         ).order_by('-created_at')[:10]  # Últimos 10 registos
 
+        end = end or timezone.now()
+        start = start or timezone.localtime(end).replace(day=1, hour=0, minute=0, second=0, microsecond=0)
+        statements = [
+            {'subscription': subscription, **credit_statement(subscription, start, end)}
+            for subscription in active_subscriptions
+        ]
+
         return {
             'total_credits': total_credits,
             'active_subscriptions': active_subscriptions,
-            'recent_history': credit_history
+            'recent_history': credit_history,
+            'period_start': start,
+            'period_end': end,
+            'statements': statements,
         }
@@ -0,0 +1,91 @@
+"""
+Faturação mensal das mensalidades (pagamentos pendentes por cliente e mês).
+
+``billing_run`` lê os clientes ativos da organização numa única consulta, com a
+mensalidade já calculada em SQL a partir da afiliação e das mensalidades da
+organização (a mesma regra de ``Person.get_monthly_fee``, sem carregar a
+organização por cliente), e cria os ``Payment`` pendentes com ``bulk_create``
+em blocos (``BILLING_CHUNK_SIZE``).
+
+Idempotente por período: ``Payment.billing_period`` (1.º dia do mês) tem uma
+restrição única por organização e cliente e clientes já faturados no mês são
+excluídos na consulta. Corridas concorrentes da mesma organização são
+serializadas pelo lock da organização (``select_for_update``), pelo que cada
+uma só conta os pagamentos que ela própria criou. Os pagamentos criados estão
+pendentes, pelo que não contam como receita até serem marcados como pagos.
+"""
+from __future__ import annotations
+
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Case, DecimalField, Exists, F, OuterRef, Value, When
+
+from ..models import Organization, Payment, Person
+
+BILLING_CHUNK_SIZE = 2000
+FEE = DecimalField(max_digits=10, decimal_places=2)
+
+
+def billing_period(day: date) -> date:
+    """Período de faturação (1.º dia do mês) de ``day``."""
+    return day.replace(day=1)
+
+
+def monthly_fee_expression():
+    """Mensalidade do cliente em SQL (ver ``Person.get_monthly_fee``)."""
+    affiliation = Person.EntityAffiliation
+    gym, wellness = F("organization__gym_monthly_fee"), F("organization__wellness_monthly_fee")
+    return Case(
+        When(entity_affiliation=affiliation.ACR_ONLY, then=gym),
+        When(entity_affiliation=affiliation.PROFORM_ONLY, then=wellness),
+        When(entity_affiliation=affiliation.BOTH, then=gym + wellness),
+        default=Value(Decimal("0")),
+        output_field=FEE,
+    )
+
+
+def billable_people(organization: Organization, period: date):
+    """(id, mensalidade) dos clientes ativos ainda sem mensalidade no período."""
+    billed = Payment.objects.filter(
+        organization=organization, person=OuterRef("pk"), billing_period=period
+    )
+    return (
+        Person.objects.filter(organization=organization, status=Person.Status.ACTIVE)
+        .annotate(fee=monthly_fee_expression())
+        .filter(fee__gt=0)
+        .exclude(Exists(billed))
+        .order_by("pk")
+        .values_list("pk", "fee")
+    )
+
+
+def billing_run(organization: Organization, period: date, chunk_size: int = BILLING_CHUNK_SIZE) -> dict:
+    """Cria as mensalidades pendentes do período; repetir não duplica.
+
+    Returns:
+        dict: período, pagamentos criados e total faturado
+    """
+    period = billing_period(period)
+    label = period.strftime("%m/%Y")
+    due_date = period + timedelta(days=settings.BILLING_DUE_DAYS)
+
+    with transaction.atomic():
+        # Serializa corridas concorrentes da mesma organização antes de ler os clientes
+        Organization.objects.select_for_update().filter(pk=organization.pk).exists()
+        payments = [
+            Payment(
+                organization=organization, person_id=person_id, amount=Decimal(fee).quantize(Decimal("0.01")),
+                status=Payment.Status.PENDING, description=f"Mensalidade {label}",
+                due_date=due_date, billing_period=period,
+            )
+            for person_id, fee in billable_people(organization, period)
+        ]
+        Payment.objects.bulk_create(payments, batch_size=chunk_size)
+    return {
+        "period": period.isoformat(),
+        "created": len(payments),
+        "total": sum((payment.amount for payment in payments), start=Decimal("0")),
+    }
@@ -0,0 +1,35 @@
+"""
+Versões de cache por organização.
+
+Em vez de apagar chaves (cujos nomes dependem de datas e filtros), as chaves de
+cache incluem uma versão por ``namespace`` e organização; incrementar a versão
+invalida de uma vez todas as entradas antigas, que expiram sozinhas.
+"""
+from __future__ import annotations
+
+from django.core.cache import cache
+
+
+def _version_key(namespace: str, organization_id: int) -> str:
+    return f"cachever:{namespace}:{organization_id}"
+
+
+def cache_version(namespace: str, organization_id: int) -> int:
+    """Versão atual das entradas de ``namespace`` da organização."""
+    key = _version_key(namespace, organization_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, 1, None)
+        version = cache.get(key, 1)
+    return version
+
+
+def bump_cache_version(namespace: str, organization_id: int) -> int:
+    """Invalida as entradas de ``namespace`` da organização e devolve a nova versão."""
+    key = _version_key(namespace, organization_id)
+    try:
+        return cache.incr(key)
+    except ValueError:
+        # Ainda sem versão: qualquer valor diferente de 1 invalida as entradas existentes
+        cache.add(key, 2, None)
+        return cache.get(key, 2)
@@ -0,0 +1,183 @@
+"""
+Fecho mensal das comissões de instrutores.
+
+``close_month`` calcula, numa única consulta agregada, a receita de cada aula
+terminada no mês a partir das reservas:
+
+- reserva paga à parte (``is_paid``): ``payment_amount``;
+- reserva com subscrição: ``credits_used`` × valor de uma aula do plano
+  (preço / ``credits_included``; planos sem créditos incluídos valem
+  ``COMMISSION_CLASSES_PER_MONTH`` aulas por mês de duração);
+
+aplica a taxa do instrutor consoante a entidade da aula (modalidade, ou espaço
+quando não há modalidade) e grava todas as comissões do mês com um único
+``bulk_create(update_conflicts=True)`` sobre (instrutor, evento). Comissões já
+pagas não são recalculadas. Devolve o resumo de pagamentos por instrutor.
+
+Como ``bulk_create`` não passa por ``InstructorCommission.save``, os dias
+afetados são registados no outbox para os agregados de receita.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time
+from decimal import ROUND_HALF_UP, Decimal
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import (
+    Case,
+    Count,
+    DecimalField,
+    Exists,
+    ExpressionWrapper,
+    F,
+    FloatField,
+    OuterRef,
+    Q,
+    Sum,
+    Value,
+    When,
+)
+from django.db.models.functions import Cast, Coalesce, NullIf
+from django.utils import timezone
+
+from ..models import Booking, Event, InstructorCommission, Modality, Organization, OutboxMessage
+from .outbox import record_revenue_days
+
+CENTS = Decimal("0.01")
+MONEY = DecimalField(max_digits=12, decimal_places=2)
+# Reservas que geram receita (a falta não devolve o crédito)
+BILLABLE_STATUSES = (Booking.Status.CONFIRMED, Booking.Status.CHECKED_IN, Booking.Status.NO_SHOW)
+
+
+def month_bounds(year: int, month: int):
+    """Início e fim (exclusivo) do mês, em datetimes aware no fuso atual."""
+    start = timezone.make_aware(datetime.combine(date(year, month, 1), time.min))
+    next_month = date(year + month // 12, month % 12 + 1, 1)
+    return start, timezone.make_aware(datetime.combine(next_month, time.min))
+
+
+def _booking_revenue():
+    """Expressão com a receita de uma reserva (``bookings__``), para ``Sum``."""
+    plan = "bookings__subscription_used__payment_plan__"
+    # Aulas que o preço do plano paga; divisor em vírgula flutuante para evitar a
+    # divisão inteira do SQLite (o resultado é arredondado ao cêntimo em Python)
+    classes = Cast(
+        Coalesce(
+            NullIf(F(f"{plan}credits_included"), 0),
+            F(f"{plan}duration_months") * settings.COMMISSION_CLASSES_PER_MONTH,
+        ),
+        output_field=FloatField(),
+    )
+    # Preço fixado na compra da subscrição (o do plano só para subscrições sem ele)
+    price = Coalesce(F("bookings__subscription_used__price"), F(f"{plan}price"))
+    class_value = ExpressionWrapper(price / classes, output_field=MONEY)
+    return Case(
+        When(bookings__is_paid=True, then=F("bookings__payment_amount")),
+        When(
+            bookings__subscription_used__isnull=False,
+            then=ExpressionWrapper(F("bookings__credits_used") * class_value, output_field=MONEY),
+        ),
+        default=Value(Decimal("0")),
+        output_field=MONEY,
+    )
+
+
+def month_event_revenue(organization: Organization, year: int, month: int, now=None):
+    """Aulas terminadas do mês, com instrutor, receita e taxa (uma consulta)."""
+    now = now or timezone.now()
+    start, end = month_bounds(year, month)
+    paid = InstructorCommission.objects.filter(event=OuterRef("pk"), instructor=OuterRef("instructor"), is_paid=True)
+    proform = Modality.EntityType.PROFORM
+    return (
+        Event.objects.filter(
+            organization=organization, instructor__isnull=False,
+            starts_at__gte=start, starts_at__lt=end, ends_at__lte=now,
+        )
+        .exclude(Exists(paid))
+        .annotate(
+            revenue=Coalesce(
+                Sum(_booking_revenue(), filter=Q(bookings__status__in=BILLABLE_STATUSES)),
+                Value(Decimal("0")), output_field=MONEY,
+            ),
+            rate=Case(
+                When(
+                    Q(modality__entity_type=proform) | Q(modality__isnull=True, resource__entity_type=proform),
+                    then=F("instructor__proform_commission_rate"),
+                ),
+                default=F("instructor__acr_commission_rate"),
+            ),
+        )
+        .values_list("pk", "instructor_id", "starts_at", "revenue", "rate")
+        .order_by("pk")
+    )
+
+
+def close_month(organization: Organization, year: int, month: int, now=None) -> dict:
+    """Calcula e grava as comissões do mês e devolve o resumo por instrutor."""
+    rows = list(month_event_revenue(organization, year, month, now))
+    commissions = []
+    for event_id, instructor_id, _starts_at, revenue, rate in rows:
+        total = Decimal(revenue).quantize(CENTS, ROUND_HALF_UP)
+        rate = Decimal(rate)
+        instructor_amount = (total * rate / 100).quantize(CENTS, ROUND_HALF_UP)
+        commissions.append(InstructorCommission(
+            organization=organization, event_id=event_id, instructor_id=instructor_id,
+            total_revenue=total, commission_rate=rate,
+            instructor_amount=instructor_amount, entity_amount=total - instructor_amount,
+        ))
+
+    start, end = month_bounds(year, month)
+    month_filter = Q(organization=organization, event__starts_at__gte=start, event__starts_at__lt=end)
+    with transaction.atomic():
+        # Aulas que mudaram de instrutor: a comissão antiga (por pagar) deixa de ser devida
+        stale = InstructorCommission.objects.filter(month_filter, is_paid=False).exclude(
+            instructor_id=F("event__instructor_id")
+        )
+        # Os dias das comissões apagadas também mudam de receita (ex. aula que ficou sem instrutor)
+        days = {timezone.localdate(starts_at) for starts_at in stale.values_list("event__starts_at", flat=True)}
+        stale.delete()
+        InstructorCommission.objects.bulk_create(
+            commissions,
+            batch_size=1000,
+            update_conflicts=True,
+            unique_fields=["instructor", "event"],
+            update_fields=["total_revenue", "commission_rate", "instructor_amount", "entity_amount"],
+        )
+        days.update(timezone.localdate(starts_at) for _, _, starts_at, _, _ in rows)
+        record_revenue_days(organization.pk, OutboxMessage.Topic.COMMISSION_CHANGED, days)
+
+    return {
+        "month": f"{year:04d}-{month:02d}",
+        "events": len(rows),
+        "payouts": payout_summary(organization, year, month),
+    }
+
+
+def payout_summary(organization: Organization, year: int, month: int) -> list[dict]:
+    """Totais do mês por instrutor (aulas, receita, a pagar e já pago)."""
+    start, end = month_bounds(year, month)
+    rows = (
+        InstructorCommission.objects.filter(
+            organization=organization, event__starts_at__gte=start, event__starts_at__lt=end
+        )
+        .values("instructor_id", "instructor__first_name", "instructor__last_name")
+        .annotate(
+            classes=Count("pk"),
+            revenue=Sum("total_revenue"),
+            amount=Sum("instructor_amount"),
+            paid=Coalesce(Sum("instructor_amount", filter=Q(is_paid=True)), Value(Decimal("0")), output_field=MONEY),
+        )
+        .order_by("instructor__first_name", "instructor__last_name")
+    )
+    return [
+        {
+            "instructor_id": row["instructor_id"],
+            "instructor": f"{row['instructor__first_name']} {row['instructor__last_name']}".strip(),
+            "classes": row["classes"],
+            "revenue": Decimal(row["revenue"]).quantize(CENTS),
+            "amount": Decimal(row["amount"]).quantize(CENTS),
+            "due": (Decimal(row["amount"]) - Decimal(row["paid"])).quantize(CENTS),
+        }
+        for row in rows
+    ]
@@ -0,0 +1,320 @@
+"""
+Livro de créditos das subscrições (consumo e reembolso atómicos).
+
+O saldo (``ClientSubscription.remaining_credits``) é alterado na base de dados
+com um único ``UPDATE`` condicional que devolve o novo saldo (``RETURNING``):
+
+    UPDATE ... SET remaining_credits = remaining_credits - n
+    WHERE id = ... AND remaining_credits >= n RETURNING remaining_credits
+
+Assim duas reservas em simultâneo nunca gastam o mesmo crédito nem deixam o
+saldo negativo, e o ``CreditHistory`` correspondente é gravado na mesma
+transação com ``credits_before``/``credits_after`` calculados a partir do saldo
+devolvido (e não de valores da instância, possivelmente desatualizados).
+
+Só as subscrições de planos de créditos têm saldo; nas restantes (mensal,
+ilimitado) o consumo é aceite sem movimento (``None``).
+
+As inscrições em lote (ex. turmas) usam ``consume_booking_credits`` e
+``refund_booking_credits``: um único ``UPDATE ... CASE`` por bloco de
+subscrições e o histórico com ``bulk_create``.
+
+Snapshots mensais do saldo (``take_snapshots``) mantêm as leituras de saldo
+numa data e de extratos limitadas aos movimentos recentes; ``verify_snapshots``
+confere todos os snapshots com o histórico.
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import datetime, timezone as dt_timezone
+
+from django.db import connection, models, transaction
+from django.db.models import Count, Exists, ExpressionWrapper, F, IntegerField, OuterRef, Subquery, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from ..models import Booking, ClientSubscription, CreditBalanceSnapshot, CreditHistory, PaymentPlan
+from .locks import cache_lock
+
+SNAPSHOT_CHUNK_SIZE = 2000
+# Subscrições por UPDATE nas operações em lote (4 parâmetros por subscrição)
+LEDGER_CHUNK_SIZE = 500
+INTEGER = IntegerField()
+# Início do histórico para subscrições ainda sem snapshot
+SNAPSHOT_EPOCH = datetime(2000, 1, 1, tzinfo=dt_timezone.utc)
+
+
+class InsufficientCredits(Exception):
+    """A subscrição não tem créditos suficientes."""
+
+
+def _subscription_id(subscription) -> int:
+    return getattr(subscription, "pk", subscription)
+
+
+def _apply(subscription_id: int, delta: int):
+    """Soma ``delta`` ao saldo se o resultado não for negativo; devolve a linha alterada."""
+    quote = connection.ops.quote_name
+    subscriptions = quote(ClientSubscription._meta.db_table)
+    plans = quote(PaymentPlan._meta.db_table)
+    now = models.DateTimeField().get_db_prep_value(timezone.now(), connection)
+    sql = (
+        f"UPDATE {subscriptions} SET remaining_credits = remaining_credits + %s, updated_at = %s "
+        f"WHERE id = %s AND remaining_credits + %s >= 0 "
+        f"AND payment_plan_id IN (SELECT id FROM {plans} WHERE plan_type = %s) "
+        f"RETURNING remaining_credits, organization_id, person_id"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [delta, now, subscription_id, delta, PaymentPlan.PlanType.CREDITS])
+        return cursor.fetchone()
+
+
+def _record(subscription, delta: int, action: str, booking: Booking | None, description: str) -> CreditHistory | None:
+    subscription_id = _subscription_id(subscription)
+    with transaction.atomic():
+        row = _apply(subscription_id, delta)
+        if row is None:
+            credit_plan = ClientSubscription.objects.filter(
+                pk=subscription_id, payment_plan__plan_type=PaymentPlan.PlanType.CREDITS
+            ).exists()
+            if credit_plan:
+                raise InsufficientCredits("Subscrição não tem créditos suficientes.")
+            return None
+        after, organization_id, person_id = row
+        entry = CreditHistory.objects.create(
+            organization_id=organization_id,
+            person_id=person_id,
+            subscription_id=subscription_id,
+            booking=booking,
+            action=action,
+            credits_amount=delta,
+            credits_before=after - delta,
+            credits_after=after,
+            description=description,
+        )
+    if isinstance(subscription, ClientSubscription):
+        subscription.remaining_credits = after
+    return entry
+
+
+def consume_credits(subscription, credits: int = 1, *, booking: Booking | None = None,
+                    description: str = "") -> CreditHistory | None:
+    """Gasta ``credits`` da subscrição (instância ou id).
+
+    Raises:
+        InsufficientCredits: plano de créditos sem saldo suficiente
+    """
+    if credits <= 0:
+        raise ValueError("O número de créditos tem de ser positivo")
+    return _record(subscription, -credits, CreditHistory.Action.USE, booking,
+                   description or f"Uso de {credits} crédito(s)")
+
+
+def refund_credits(subscription, credits: int = 1, *, booking: Booking | None = None,
+                   description: str = "") -> CreditHistory | None:
+    """Devolve ``credits`` à subscrição (ex. cancelamento de reserva)."""
+    if credits <= 0:
+        raise ValueError("O número de créditos tem de ser positivo")
+    return _record(subscription, credits, CreditHistory.Action.REFUND, booking,
+                   description or f"Reembolso de {credits} crédito(s)")
+
+
+def _apply_many(deltas: dict[int, int]) -> dict[int, int]:
+    """Versão em lote de ``_apply``: um ``UPDATE`` com ``CASE`` por subscrição.
+
+    Só altera as subscrições de créditos cujo saldo não fica negativo; devolve
+    o novo saldo de cada uma.
+    """
+    quote = connection.ops.quote_name
+    subscriptions = quote(ClientSubscription._meta.db_table)
+    plans = quote(PaymentPlan._meta.db_table)
+    now = models.DateTimeField().get_db_prep_value(timezone.now(), connection)
+    case = "CASE id " + " ".join(["WHEN %s THEN %s"] * len(deltas)) + " END"
+    case_params = [value for item in deltas.items() for value in item]
+    ids = ", ".join(["%s"] * len(deltas))
+    sql = (
+        f"UPDATE {subscriptions} SET remaining_credits = remaining_credits + {case}, updated_at = %s "
+        f"WHERE id IN ({ids}) AND remaining_credits + {case} >= 0 "
+        f"AND payment_plan_id IN (SELECT id FROM {plans} WHERE plan_type = %s) "
+        f"RETURNING id, remaining_credits"
+    )
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [*case_params, now, *deltas, *case_params, PaymentPlan.PlanType.CREDITS])
+        return dict(cursor.fetchall())
+
+
+def _record_bookings(bookings, sign: int, action: str, description: str) -> set[int]:
+    bookings = [booking for booking in bookings if booking.subscription_used_id and booking.credits_used > 0]
+    if not bookings:
+        return set()
+    deltas = defaultdict(int)
+    for booking in bookings:
+        deltas[booking.subscription_used_id] += sign * booking.credits_used
+    items = list(deltas.items())
+    with transaction.atomic():
+        balances = {}
+        for start in range(0, len(items), LEDGER_CHUNK_SIZE):
+            balances.update(_apply_many(dict(items[start:start + LEDGER_CHUNK_SIZE])))
+        # Saldo antes do lote; os movimentos seguem a ordem das reservas
+        running = {pk: after - deltas[pk] for pk, after in balances.items()}
+        entries = []
+        for booking in bookings:
+            subscription_id = booking.subscription_used_id
+            if subscription_id not in running:
+                continue
+            delta = sign * booking.credits_used
+            before = running[subscription_id]
+            running[subscription_id] = before + delta
+            entries.append(CreditHistory(
+                organization_id=booking.organization_id, person_id=booking.person_id,
+                subscription_id=subscription_id, booking_id=booking.pk, action=action,
+                credits_amount=delta, credits_before=before, credits_after=before + delta,
+                description=description.format(credits=booking.credits_used),
+            ))
+        CreditHistory.objects.bulk_create(entries, batch_size=SNAPSHOT_CHUNK_SIZE)
+    return set(balances)
+
+
+def consume_booking_credits(bookings) -> set[int]:
+    """Versão em lote de ``consume_credits``: gasta ``credits_used`` de cada reserva.
+
+    Tudo ou nada por subscrição (``subscription_used``, de planos de créditos):
+    as que não têm saldo para todas as suas reservas ficam inalteradas.
+
+    Returns:
+        set: ids das subscrições debitadas
+    """
+    return _record_bookings(bookings, -1, CreditHistory.Action.USE, "Uso de {credits} crédito(s)")
+
+
+def refund_booking_credits(bookings) -> set[int]:
+    """Versão em lote de ``refund_credits`` (ex. reservas canceladas em lote)."""
+    return _record_bookings(bookings, 1, CreditHistory.Action.REFUND, "Reembolso de {credits} crédito(s)")
+
+
+# --- Snapshots de saldo ----------------------------------------------------------------
+#
+# O histórico cresce sempre; os saldos numa data e os extratos partem do último
+# ``CreditBalanceSnapshot`` anterior e somam só os movimentos seguintes (índice
+# por subscrição e data), em vez de percorrer todo o histórico.
+
+
+def _ledger(subscription_ref: str = "pk"):
+    return CreditHistory.objects.filter(subscription=OuterRef(subscription_ref)).order_by()
+
+
+def _opening_balance(subscription_ref: str = "pk"):
+    """Saldo antes do primeiro movimento da subscrição."""
+    return Subquery(_ledger(subscription_ref).order_by("created_at", "pk").values("credits_before")[:1])
+
+
+def _ledger_totals(queryset):
+    """Subconsultas (soma, contagem) dos movimentos de ``queryset``."""
+    grouped = queryset.values("subscription")
+    return (
+        Coalesce(Subquery(grouped.annotate(total=Sum("credits_amount")).values("total")), 0),
+        Coalesce(Subquery(grouped.annotate(total=Count("pk")).values("total")), 0),
+    )
+
+
+def _pending_snapshots(taken_at: datetime, organization_id: int | None) -> list:
+    """Snapshots em ``taken_at`` ainda por gravar (uma consulta)."""
+    previous = CreditBalanceSnapshot.objects.filter(
+        subscription=OuterRef("pk"), taken_at__lt=taken_at
+    ).order_by("-taken_at")
+    subscriptions = ClientSubscription.objects.filter(
+        Exists(_ledger().filter(created_at__lt=taken_at))
+    ).exclude(
+        Exists(CreditBalanceSnapshot.objects.filter(subscription=OuterRef("pk"), taken_at=taken_at))
+    ).annotate(
+        since=Coalesce(Subquery(previous.values("taken_at")[:1]), Value(SNAPSHOT_EPOCH)),
+        base=Coalesce(Subquery(previous.values("balance")[:1]), _opening_balance(), 0, output_field=INTEGER),
+        base_entries=Coalesce(Subquery(previous.values("entries")[:1]), 0),
+    )
+    if organization_id:
+        subscriptions = subscriptions.filter(organization_id=organization_id)
+    delta, count = _ledger_totals(_ledger().filter(created_at__gte=OuterRef("since"), created_at__lt=taken_at))
+    rows = subscriptions.annotate(delta=delta, count=count).values_list(
+        "pk", "organization_id", "person_id", "base", "delta", "base_entries", "count"
+    )
+    return [
+        CreditBalanceSnapshot(
+            organization_id=organization, subscription_id=pk, person_id=person, taken_at=taken_at,
+            balance=base + delta, entries=base_entries + count,
+        )
+        for pk, organization, person, base, delta, base_entries, count in rows
+    ]
+
+
+def take_snapshots(taken_at: datetime, organization_id: int | None = None) -> int:
+    """Grava o saldo em ``taken_at`` de todas as subscrições com movimentos.
+
+    Incremental: cada saldo parte do snapshot anterior da subscrição e soma só
+    os movimentos desde então, numa única consulta; repetir não duplica. Um
+    lock por ``taken_at`` serializa a tarefa e o comando: quem não o obtém não
+    grava nada.
+
+    Returns:
+        int: snapshots gravados por esta chamada (0 se outro processo já os está a gravar)
+    """
+    with cache_lock(f"credit-snapshots:{taken_at.isoformat()}") as acquired:
+        if not acquired:
+            return 0
+        snapshots = _pending_snapshots(taken_at, organization_id)
+        # ignore_conflicts: rede de segurança caso o lock expire a meio
+        CreditBalanceSnapshot.objects.bulk_create(snapshots, batch_size=SNAPSHOT_CHUNK_SIZE, ignore_conflicts=True)
+        return len(snapshots)
+
+
+def balance_at(subscription, at: datetime) -> int:
+    """Saldo segundo o histórico imediatamente antes de ``at`` (snapshot + movimentos seguintes)."""
+    subscription_id = _subscription_id(subscription)
+    entries = CreditHistory.objects.filter(subscription_id=subscription_id, created_at__lt=at)
+    snapshot = (
+        CreditBalanceSnapshot.objects.filter(subscription_id=subscription_id, taken_at__lte=at)
+        .order_by("-taken_at").values_list("taken_at", "balance").first()
+    )
+    if snapshot:
+        since, base = snapshot
+        entries = entries.filter(created_at__gte=since)
+    else:
+        first = (
+            CreditHistory.objects.filter(subscription_id=subscription_id)
+            .order_by("created_at", "pk").values_list("credits_before", flat=True).first()
+        )
+        base = first or 0
+    return base + (entries.aggregate(total=Sum("credits_amount"))["total"] or 0)
+
+
+def credit_statement(subscription, start: datetime, end: datetime) -> dict:
+    """Extrato de ``start`` a ``end`` (exclusivo): saldo inicial, movimentos e saldo final."""
+    opening = balance_at(subscription, start)
+    entries = list(
+        CreditHistory.objects.filter(
+            subscription_id=_subscription_id(subscription), created_at__gte=start, created_at__lt=end
+        ).order_by("created_at", "pk")
+    )
+    return {
+        "opening": opening,
+        "entries": entries,
+        "closing": opening + sum(entry.credits_amount for entry in entries),
+    }
+
+
+def verify_snapshots(organization_id: int | None = None) -> list[int]:
+    """Ids dos snapshots que não batem com o histórico (uma consulta para todos)."""
+    snapshots = CreditBalanceSnapshot.objects.all()
+    if organization_id:
+        snapshots = snapshots.filter(organization_id=organization_id)
+    total, count = _ledger_totals(_ledger("subscription").filter(created_at__lt=OuterRef("taken_at")))
+    return list(
+        snapshots.annotate(
+            ledger_balance=ExpressionWrapper(
+                Coalesce(_opening_balance("subscription"), 0) + total, output_field=INTEGER
+            ),
+            ledger_entries=count,
+        )
+        .exclude(balance=F("ledger_balance"), entries=F("ledger_entries"))
+        .order_by("pk")
+        .values_list("pk", flat=True)
+    )
@@ -0,0 +1,97 @@
+"""
+Elegibilidade por membership (cliente com membership ativa num dia).
+
+``MembershipEligibility`` carrega numa consulta os intervalos das memberships
+ativas de um conjunto de clientes de uma organização e guarda-os por cliente
+em arrays compactos (``array``) de ordinais de data, já ordenados e fundidos.
+A pergunta "está ativo no dia X?" é respondida em memória com ``bisect``, para
+um cliente (``is_active``) ou muitos (``active_on``); só os clientes ainda não
+carregados geram consulta.
+
+``eligibility_for(organization, request)`` guarda uma instância por pedido e
+organização; gravar ou apagar uma ``Membership`` incrementa a versão de cache
+``memberships`` da organização e as instâncias antigas deixam de ser usadas.
+"""
+from __future__ import annotations
+
+from array import array
+from bisect import bisect_right
+from datetime import date
+
+from django.db import transaction
+
+from ..models import Membership
+from .cache_versions import bump_cache_version, cache_version
+
+# Fim de uma membership sem data de fim
+OPEN_END = date.max.toordinal()
+REQUEST_ATTRIBUTE = "_membership_eligibility"
+LOAD_CHUNK_SIZE = 2000
+_EMPTY = (array("l"), array("l"))
+
+
+def _merge(intervals) -> tuple[array, array]:
+    """Funde intervalos (início, fim) sobrepostos ou contíguos em arrays ordenados."""
+    starts, ends = array("l"), array("l")
+    for start, end in sorted(intervals):
+        if ends and start <= ends[-1] + 1:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+    return starts, ends
+
+
+class MembershipEligibility:
+    """Intervalos de memberships ativas dos clientes de uma organização."""
+
+    def __init__(self, organization_id: int, version: int | None = None):
+        self.organization_id = organization_id
+        self.version = version
+        self._intervals: dict[int, tuple[array, array]] = {}
+
+    def load(self, person_ids) -> None:
+        """Carrega (numa consulta por bloco) os clientes ainda não carregados."""
+        missing = sorted({int(pk) for pk in person_ids} - self._intervals.keys())
+        for offset in range(0, len(missing), LOAD_CHUNK_SIZE):
+            chunk = missing[offset:offset + LOAD_CHUNK_SIZE]
+            found: dict[int, list] = {}
+            rows = Membership.objects.filter(
+                organization_id=self.organization_id, person_id__in=chunk, status=Membership.Status.ACTIVE
+            ).values_list("person_id", "starts_on", "ends_on")
+            for person_id, starts_on, ends_on in rows:
+                found.setdefault(person_id, []).append(
+                    (starts_on.toordinal(), ends_on.toordinal() if ends_on else OPEN_END)
+                )
+            for person_id in chunk:
+                self._intervals[person_id] = _merge(found[person_id]) if person_id in found else _EMPTY
+
+    def is_active(self, person_id: int, day: date) -> bool:
+        self.load([person_id])
+        starts, ends = self._intervals[int(person_id)]
+        index = bisect_right(starts, day.toordinal()) - 1
+        return index >= 0 and ends[index] >= day.toordinal()
+
+    def active_on(self, person_ids, day: date) -> set[int]:
+        """Clientes de ``person_ids`` com membership ativa em ``day``."""
+        person_ids = [int(pk) for pk in person_ids]
+        self.load(person_ids)
+        return {pk for pk in person_ids if self.is_active(pk, day)}
+
+
+def eligibility_for(organization, request=None) -> MembershipEligibility:
+    """Instância da organização, partilhada durante o pedido (se ``request``)."""
+    organization_id = getattr(organization, "pk", organization)
+    version = cache_version("memberships", organization_id)
+    if request is None:
+        return MembershipEligibility(organization_id, version)
+    store = request.__dict__.setdefault(REQUEST_ATTRIBUTE, {})
+    eligibility = store.get(organization_id)
+    if eligibility is None or eligibility.version != version:
+        eligibility = store[organization_id] = MembershipEligibility(organization_id, version)
+    return eligibility
+
+
+def invalidate_memberships(organization_id: int) -> None:
+    """Invalida as instâncias em uso da organização (após o commit)."""
+    transaction.on_commit(lambda: bump_cache_version("memberships", organization_id))
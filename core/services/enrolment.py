@@ -0,0 +1,250 @@
+"""
+Inscrição automática dos membros das turmas nas aulas de turma.
+
+Ao criar uma aula de turma (``Event.EventType.GROUP_CLASS`` com
+``class_group``) os membros ativos da turma ficam inscritos de uma vez
+(``enrol_members``), com um número fixo de consultas por lote de aulas:
+
+- a capacidade é validada uma vez por aula, contra ``max_students`` da turma
+  (e a ``capacity`` do evento, se menor); quem não cabe fica em lista de espera
+  (ou de fora, se a aula não a tiver);
+- as reservas são criadas com um único ``bulk_create`` (sem o
+  ``ensure_no_conflict``/``ensure_capacity`` de cada ``Booking``);
+- os créditos são consumidos em lote (``consume_booking_credits``): uma
+  subscrição mensal/ilimitada ativa tem prioridade (a aula já está incluída);
+  sem ela, usa-se a subscrição de créditos com validade mais próxima;
+- reservas canceladas dos mesmos clientes (ex. membro removido e readicionado)
+  são reativadas com um ``bulk_update``, com a mesma validação de capacidade e
+  consumo de créditos.
+
+As alterações aos membros da turma (``ClassGroup.members``) propagam-se às
+aulas futuras em blocos de ``ENROLMENT_CHUNK_SIZE`` aulas: novos membros são
+inscritos e os removidos têm as reservas futuras canceladas e os créditos
+devolvidos (``withdraw_members``).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, datetime
+
+from django.db import transaction
+from django.db.models import Q
+from django.db.models.signals import m2m_changed
+from django.dispatch import receiver
+from django.utils import timezone
+
+from ..models import Booking, ClassGroup, ClientSubscription, Event, PaymentPlan, Person
+from .credits import consume_booking_credits, refund_booking_credits
+from .outbox import record_booking_changes
+
+ENROLMENT_CHUNK_SIZE = 200
+BOOKING_BATCH_SIZE = 2000
+
+Members = ClassGroup.members.through
+
+
+def _active_members(group_ids, person_ids=None) -> dict[int, list[int]]:
+    """Membros ativos por turma, pela ordem de entrada na turma."""
+    rows = Members.objects.filter(classgroup_id__in=group_ids, person__status=Person.Status.ACTIVE)
+    if person_ids is not None:
+        rows = rows.filter(person_id__in=person_ids)
+    members = defaultdict(list)
+    for group_id, person_id in rows.order_by("pk").values_list("classgroup_id", "person_id"):
+        members[group_id].append(person_id)
+    return members
+
+
+def _subscriptions(organization_ids, person_ids, today) -> dict[tuple, tuple]:
+    """Subscrição a usar por (organização, cliente): ``(id, plano de créditos?, saldo)``.
+
+    Prefere a primeira subscrição ativa sem créditos (mensal, ilimitado), que
+    já inclui as aulas; sem ela, a de créditos com saldo e validade mais
+    próxima.
+    """
+    rows = ClientSubscription.objects.filter(
+        Q(end_date__isnull=True) | Q(end_date__gte=today),
+        organization_id__in=organization_ids,
+        person_id__in=person_ids,
+        status=ClientSubscription.Status.ACTIVE,
+        start_date__lte=today,
+    ).order_by("pk").values_list(
+        "pk", "organization_id", "person_id", "payment_plan__plan_type", "remaining_credits", "credits_expire_date"
+    )
+    included, packs = {}, {}
+    for pk, organization_id, person_id, plan_type, remaining, expires in rows:
+        key = (organization_id, person_id)
+        if plan_type != PaymentPlan.PlanType.CREDITS:
+            included.setdefault(key, (pk, False, 0))
+            continue
+        if remaining <= 0 or (expires and expires < today):
+            continue
+        rank = expires or date.max
+        if key not in packs or rank < packs[key][0]:
+            packs[key] = (rank, (pk, True, remaining))
+    chosen = {key: subscription for key, (_rank, subscription) in packs.items()}
+    chosen.update(included)
+    return chosen
+
+
+def enrol_members(events, person_ids=None) -> dict:
+    """Inscreve os membros ativos das turmas nas aulas de turma ``events``.
+
+    ``person_ids`` limita a inscrição a esses clientes (ex. novos membros).
+    Clientes já com reserva ativa na aula (confirmada, em lista de espera, ...)
+    são ignorados; as reservas canceladas são reativadas.
+
+    Returns:
+        dict: reservas confirmadas, em lista de espera e clientes que não couberam
+    """
+    events = [event for event in events if event.event_type == Event.EventType.GROUP_CLASS and event.class_group_id]
+    result = {"confirmed": 0, "waitlist": 0, "skipped": 0}
+    if not events:
+        return result
+
+    group_ids = {event.class_group_id for event in events}
+    max_students = dict(ClassGroup.objects.filter(pk__in=group_ids).values_list("pk", "max_students"))
+    members = _active_members(group_ids, person_ids)
+    booked = defaultdict(set)
+    cancelled = defaultdict(dict)
+    confirmed = defaultdict(int)
+    for pk, event_id, person_id, status in Booking.objects.filter(event__in=events).values_list(
+        "pk", "event_id", "person_id", "status"
+    ):
+        if status == Booking.Status.CANCELLED:
+            cancelled[event_id][person_id] = pk
+            continue
+        booked[event_id].add(person_id)
+        if status == Booking.Status.CONFIRMED:
+            confirmed[event_id] += 1
+    everyone = {person_id for people in members.values() for person_id in people}
+    subscriptions = _subscriptions({event.organization_id for event in events}, everyone, timezone.localdate())
+    budget = {pk: remaining for pk, credit_plan, remaining in subscriptions.values() if credit_plan}
+
+    bookings, reactivated, debits = [], [], []
+    for event in sorted(events, key=lambda event: (event.starts_at, event.pk)):
+        # Capacidade validada uma vez por aula
+        limit = max_students.get(event.class_group_id, 0)
+        if event.capacity:
+            limit = min(limit, event.capacity)
+        seats = limit - confirmed[event.pk]
+        for person_id in members.get(event.class_group_id, ()):
+            if person_id in booked[event.pk]:
+                continue
+            booking = Booking(organization_id=event.organization_id, event=event, person_id=person_id)
+            if person_id in cancelled[event.pk]:
+                booking.pk = cancelled[event.pk][person_id]
+                booking.status = Booking.Status.CONFIRMED
+            if seats <= 0:
+                if not event.waitlist_enabled:
+                    result["skipped"] += 1
+                    continue
+                booking.status = Booking.Status.WAITLIST
+                result["waitlist"] += 1
+            else:
+                seats -= 1
+                result["confirmed"] += 1
+                subscription = subscriptions.get((event.organization_id, person_id))
+                if subscription:
+                    pk, credit_plan, _remaining = subscription
+                    if not credit_plan:
+                        booking.subscription_used_id = pk
+                    elif budget[pk] >= booking.credits_used:
+                        budget[pk] -= booking.credits_used
+                        booking.subscription_used_id = pk
+                        debits.append(booking)
+            (reactivated if booking.pk else bookings).append(booking)
+    if not bookings and not reactivated:
+        return result
+
+    with transaction.atomic():
+        Booking.objects.bulk_create(bookings, batch_size=BOOKING_BATCH_SIZE)
+        Booking.objects.bulk_update(
+            reactivated, ["status", "cancelled_at", "subscription_used", "credits_used"], batch_size=BOOKING_BATCH_SIZE
+        )
+        debited = consume_booking_credits(debits)
+        # Saldo gasto entretanto por outra reserva: a inscrição fica sem subscrição
+        unpaid = [booking for booking in debits if booking.subscription_used_id not in debited]
+        if unpaid:
+            Booking.objects.filter(pk__in=[booking.pk for booking in unpaid]).update(subscription_used=None)
+            for booking in unpaid:
+                booking.subscription_used_id = None
+        record_booking_changes(bookings + reactivated)
+    return result
+
+
+def withdraw_members(events, person_ids) -> int:
+    """Cancela as reservas dos clientes nas ``events`` e devolve os créditos em lote.
+
+    Returns:
+        int: reservas canceladas
+    """
+    bookings = list(
+        Booking.objects.filter(event__in=events, person_id__in=person_ids)
+        .exclude(status=Booking.Status.CANCELLED)
+        .order_by("pk")
+    )
+    if not bookings:
+        return 0
+    now = timezone.now()
+    refunds = [booking for booking in bookings if booking.status == Booking.Status.CONFIRMED]
+    with transaction.atomic():
+        Booking.objects.filter(pk__in=[booking.pk for booking in bookings]).update(
+            status=Booking.Status.CANCELLED, cancelled_at=now
+        )
+        refund_booking_credits(refunds)
+        for booking in bookings:
+            booking.status = Booking.Status.CANCELLED
+            booking.cancelled_at = now
+        record_booking_changes(bookings)
+    return len(bookings)
+
+
+def future_group_events(group_ids, now: datetime | None = None):
+    """Aulas de turma ainda por começar, por ordem."""
+    return Event.objects.filter(
+        class_group_id__in=group_ids,
+        event_type=Event.EventType.GROUP_CLASS,
+        starts_at__gt=now or timezone.now(),
+    ).order_by("starts_at", "pk")
+
+
+def propagate_membership(group_ids, *, added=(), removed=(), now: datetime | None = None) -> dict:
+    """Aplica às aulas futuras das turmas os membros adicionados/removidos, em blocos."""
+    result = {"enrolled": 0, "cancelled": 0}
+    if not added and not removed:
+        return result
+    events = future_group_events(group_ids, now)
+    last = None
+    while True:
+        chunk = events
+        if last is not None:
+            chunk = chunk.filter(Q(starts_at__gt=last.starts_at) | Q(starts_at=last.starts_at, pk__gt=last.pk))
+        chunk = list(chunk[:ENROLMENT_CHUNK_SIZE])
+        if not chunk:
+            return result
+        if removed:
+            result["cancelled"] += withdraw_members(chunk, removed)
+        if added:
+            enrolled = enrol_members(chunk, person_ids=added)
+            result["enrolled"] += enrolled["confirmed"] + enrolled["waitlist"]
+        last = chunk[-1]
+
+
+@receiver(m2m_changed, sender=Members)
+def _members_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Propaga ``ClassGroup.members`` (de qualquer dos lados) às aulas futuras."""
+    if action == "pre_clear":
+        related = instance.class_groups if reverse else instance.members
+        instance._cleared_class_members = set(related.values_list("pk", flat=True))
+        return
+    if action == "post_clear":
+        pk_set = getattr(instance, "_cleared_class_members", set())
+    elif action not in ("post_add", "post_remove"):
+        return
+    if not pk_set:
+        return
+    change = "added" if action == "post_add" else "removed"
+    if reverse:
+        propagate_membership(pk_set, **{change: [instance.pk]})
+    else:
+        propagate_membership([instance.pk], **{change: pk_set})
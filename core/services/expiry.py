@@ -0,0 +1,104 @@
+"""
+Expiração noturna de créditos e subscrições, por conjuntos.
+
+Numa transação e com um número fixo de instruções, independentemente do
+número de subscrições:
+
+1. ``INSERT ... SELECT`` dos movimentos ``EXPIRE`` no ``CreditHistory`` para as
+   subscrições ativas de créditos com saldo cujos créditos
+   (``credits_expire_date``) ou a própria subscrição (``end_date``) já
+   terminaram;
+2. ``UPDATE ... WHERE`` que zera esses saldos;
+3. ``UPDATE ... WHERE`` que passa a ``expired`` as subscrições ativas com
+   ``end_date`` ultrapassada.
+
+As linhas afetadas são bloqueadas antes (``select_for_update``) para que um
+consumo concorrente não altere o saldo entre o histórico e o ``UPDATE``; a
+mesma leitura devolve os dados dos alertas ``CREDITS_EXPIRED``, criados com
+``bulk_create``. Os índices parciais de ``ClientSubscription`` sobre as
+subscrições ativas mantêm estas consultas (e os filtros "ativas" do resto da
+aplicação) pequenos à medida que as expiradas se acumulam.
+"""
+from __future__ import annotations
+
+from datetime import date
+
+from django.db import connection, transaction
+from django.db.models import CharField, DateTimeField, F, IntegerField, Q, Value
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+from ..models import ClientSubscription, CreditHistory, PaymentPlan, SystemAlert
+
+ALERT_CHUNK_SIZE = 2000
+
+
+def expired_credits(today: date, organization_id: int | None = None):
+    """Subscrições ativas de créditos com saldo já expirado em ``today``."""
+    queryset = ClientSubscription.objects.filter(
+        Q(credits_expire_date__lt=today) | Q(end_date__lt=today),
+        status=ClientSubscription.Status.ACTIVE,
+        payment_plan__plan_type=PaymentPlan.PlanType.CREDITS,
+        remaining_credits__gt=0,
+    )
+    if organization_id:
+        queryset = queryset.filter(organization_id=organization_id)
+    return queryset
+
+
+def _insert_expire_history(queryset, today: date, now) -> int:
+    """``INSERT INTO credithistory (...) SELECT ...`` a partir de ``queryset``."""
+    columns = {
+        "organization_id": F("organization_id"),
+        "person_id": F("person_id"),
+        "subscription_id": F("pk"),
+        "action": Value(CreditHistory.Action.EXPIRE, output_field=CharField()),
+        "credits_amount": Cast(F("remaining_credits"), IntegerField()) * -1,
+        "credits_before": F("remaining_credits"),
+        "credits_after": Value(0, output_field=IntegerField()),
+        "description": Value(f"Créditos expirados em {today}", output_field=CharField()),
+        "created_at": Value(now, output_field=DateTimeField()),
+    }
+    aliases = {f"expire_{name}": expression for name, expression in columns.items()}
+    select = queryset.order_by().annotate(**aliases).values_list(*aliases)
+    sql, params = select.query.sql_with_params()
+    quote = connection.ops.quote_name
+    target = ", ".join(quote(CreditHistory._meta.get_field(name.removesuffix("_id")).column) for name in columns)
+    with connection.cursor() as cursor:
+        cursor.execute(f"INSERT INTO {quote(CreditHistory._meta.db_table)} ({target}) {sql}", params)
+        return cursor.rowcount
+
+
+def run_expiry(today: date | None = None, organization_id: int | None = None) -> dict:
+    """Expira créditos e subscrições terminados; devolve as contagens."""
+    today = today or timezone.localdate()
+    now = timezone.now()
+    credits = expired_credits(today, organization_id)
+    ended = ClientSubscription.objects.filter(status=ClientSubscription.Status.ACTIVE, end_date__lt=today)
+    if organization_id:
+        ended = ended.filter(organization_id=organization_id)
+
+    with transaction.atomic():
+        expiring = list(
+            credits.select_for_update(of=("self",)).values_list(
+                "pk", "organization_id", "person_id", "remaining_credits",
+                "person__first_name", "person__last_name", "payment_plan__name",
+            ).order_by("pk")
+        )
+        history = _insert_expire_history(credits, today, now) if expiring else 0
+        zeroed = credits.update(remaining_credits=0, updated_at=now) if expiring else 0
+        expired = ended.update(status=ClientSubscription.Status.EXPIRED, updated_at=now)
+        SystemAlert.objects.bulk_create(
+            [
+                SystemAlert(
+                    organization_id=organization, alert_type=SystemAlert.AlertType.CREDITS_EXPIRED,
+                    person_id=person,
+                    title=f"Créditos Expirados - {f'{first_name} {last_name}'.strip()}",
+                    message=f"{remaining} créditos do plano {plan_name} expiraram em {today}.",
+                    metadata={'subscription_id': pk, 'expired_credits': remaining, 'expiry_date': today.isoformat()},
+                )
+                for pk, organization, person, remaining, first_name, last_name, plan_name in expiring
+            ],
+            batch_size=ALERT_CHUNK_SIZE,
+        )
+    return {"credits_expired": zeroed, "history": history, "subscriptions_expired": expired}
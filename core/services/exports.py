@@ -0,0 +1,158 @@
+"""
+Exportações CSV em streaming.
+
+As linhas são lidas com ``values_list`` e ``.iterator(chunk_size)`` (sem
+instanciar modelos nem carregar o resultado inteiro) e escritas para o cliente
+à medida que são geradas, em blocos de ~64 KB, opcionalmente comprimidos em
+gzip. A memória usada é constante, qualquer que seja o número de linhas.
+"""
+from __future__ import annotations
+
+import csv
+import zlib
+from datetime import datetime, time, timedelta
+
+from django.db.models import Count, Q
+from django.http import StreamingHttpResponse
+from django.utils import timezone
+
+from ..models import Booking
+
+EXPORT_CHUNK_SIZE = 2000
+# Bytes acumulados antes de enviar um bloco ao cliente
+STREAM_BUFFER_SIZE = 64 * 1024
+
+
+class Echo:
+    """Pseudo-buffer para ``csv.writer``: devolve a linha em vez de a guardar."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header, rows):
+    """Gera o CSV em blocos de texto de ~``STREAM_BUFFER_SIZE`` caracteres."""
+    writer = csv.writer(Echo())
+    buffer = [writer.writerow(header)]
+    size = len(buffer[0])
+    for row in rows:
+        line = writer.writerow(row)
+        buffer.append(line)
+        size += len(line)
+        if size >= STREAM_BUFFER_SIZE:
+            yield "".join(buffer)
+            buffer, size = [], 0
+    if buffer:
+        yield "".join(buffer)
+
+
+def iter_encoded(chunks, compress: bool = False):
+    """Codifica os blocos em UTF-8 e, se pedido, comprime-os em gzip à medida."""
+    if not compress:
+        for chunk in chunks:
+            yield chunk.encode("utf-8")
+        return
+    # wbits=31: formato gzip (cabeçalho + CRC), legível por gunzip/zcat
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode("utf-8"))
+        if data:
+            yield data
+    yield compressor.flush()
+
+
+def csv_response(filename: str, header, rows, compress: bool = False) -> StreamingHttpResponse:
+    """Resposta em streaming com o CSV (``filename.gz`` quando comprimido)."""
+    if compress:
+        response = StreamingHttpResponse(iter_encoded(iter_csv(header, rows), True), content_type="application/gzip")
+        filename = f"{filename}.gz"
+    else:
+        response = StreamingHttpResponse(iter_encoded(iter_csv(header, rows)), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = f"attachment; filename={filename}"
+    return response
+
+
+def date_bounds(start_date=None, end_date=None):
+    """Limites ``[início, fim[`` (datetimes aware) para um intervalo de datas inclusivo."""
+    start = timezone.make_aware(datetime.combine(start_date, time.min)) if start_date else None
+    end = timezone.make_aware(datetime.combine(end_date + timedelta(days=1), time.min)) if end_date else None
+    return start, end
+
+
+EVENT_EXPORT_HEADER = [
+    'Data Inicio', 'Hora Inicio', 'Hora Fim', 'Titulo', 'Modalidade',
+    'Instrutor', 'Espaco', 'Capacidade', 'Reservas', 'Estado'
+]
+
+
+def event_export_rows(events_qs, now=None, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Linhas do CSV de eventos a partir de um queryset filtrado de ``Event``."""
+    now = now or timezone.now()
+    rows = events_qs.annotate(
+        export_bookings=Count('bookings', filter=Q(bookings__status=Booking.Status.CONFIRMED))
+    ).values_list(
+        'starts_at', 'ends_at', 'title', 'modality__name', 'instructor__first_name',
+        'instructor__last_name', 'resource__name', 'capacity', 'export_bookings',
+    )
+    for (starts_at, ends_at, title, modality, first_name, last_name,
+         resource, capacity, bookings) in rows.iterator(chunk_size=chunk_size):
+        if starts_at > now:
+            status_label = 'Agendada'
+        elif ends_at < now:
+            status_label = 'Concluida'
+        else:
+            status_label = 'A decorrer'
+        yield [
+            starts_at.strftime('%Y-%m-%d'),
+            starts_at.strftime('%H:%M'),
+            ends_at.strftime('%H:%M'),
+            title,
+            modality or '',
+            f"{first_name} {last_name}".strip() if first_name is not None else '',
+            resource or '',
+            capacity,
+            bookings,
+            status_label,
+        ]
+
+
+BOOKING_EXPORT_HEADER = ['Evento', 'Data', 'Hora', 'Cliente', 'Estado', 'Criada em']
+
+
+def booking_export_rows(bookings_qs, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Linhas do CSV de reservas a partir de um queryset filtrado de ``Booking``."""
+    rows = bookings_qs.values_list(
+        'event__title', 'event__starts_at', 'person__first_name', 'person__last_name', 'status', 'created_at',
+    )
+    for title, starts_at, first_name, last_name, status, created_at in rows.iterator(chunk_size=chunk_size):
+        yield [
+            title,
+            starts_at.strftime('%Y-%m-%d'),
+            starts_at.strftime('%H:%M'),
+            f"{first_name} {last_name}".strip(),
+            status,
+            created_at.strftime('%Y-%m-%d %H:%M'),
+        ]
+
+
+PAYMENT_EXPORT_HEADER = ['Data', 'Cliente', 'NIF', 'Descricao', 'Metodo', 'Estado', 'Valor', 'Data de Pagamento']
+
+
+def payment_export_rows(payments_qs, chunk_size: int = EXPORT_CHUNK_SIZE):
+    """Linhas do CSV de pagamentos a partir de um queryset filtrado de ``Payment``."""
+    rows = payments_qs.values_list(
+        'created_at', 'person__first_name', 'person__last_name', 'person__nif',
+        'description', 'method', 'status', 'amount', 'paid_date',
+    )
+    for (created_at, first_name, last_name, nif, description, method,
+         status, amount, paid_date) in rows.iterator(chunk_size=chunk_size):
+        yield [
+            created_at.strftime('%Y-%m-%d'),
+            f"{first_name} {last_name}".strip(),
+            nif or '',
+            description,
+            method,
+            status,
+            f"{amount:.2f}",
+            paid_date.isoformat() if paid_date else '',
+        ]
@@ -3,28 +3,35 @@ Serviços de integração com Google Calendar API.
 Implementa OAuth2, sincronização de eventos e gestão de calendários.
 """
 
+import hashlib
 import json
 import logging
 import os
-from datetime import datetime, timedelta
+import threading
+from datetime import datetime, timedelta, timezone as dt_timezone
+from functools import lru_cache
 from typing import Dict, List, Optional, Tuple
 
 from django.conf import settings
+from django.db.models import Count, Q
 from django.utils import timezone
 from django.core.exceptions import ValidationError
 
 from google.auth.transport.requests import Request
 from google.oauth2.credentials import Credentials
 from google_auth_oauthlib.flow import Flow
-from googleapiclient.discovery import build
+from googleapiclient.discovery import build, build_from_document
+from googleapiclient.discovery_cache import get_static_doc
 from googleapiclient.errors import HttpError
 from googleapiclient.http import MediaFileUpload
 from google.auth.exceptions import RefreshError
 
 from ..models import (
     Organization, Event, Instructor, GoogleCalendarConfig,
-    InstructorGoogleCalendar, GoogleCalendarSyncLog
+    InstructorGoogleCalendar, GoogleCalendarSyncLog, Booking
 )
+from .rate_limit import RateLimiter
+from .scheduling import find_conflicting_events
 
 logger = logging.getLogger(__name__)
 
@@ -35,6 +42,68 @@ GOOGLE_CALENDAR_SCOPES = [
     'https://www.googleapis.com/auth/drive.file'
 ]
 
+# Limite de pedidos por batch HTTP recomendado para a Calendar API
+GOOGLE_BATCH_LIMIT = 50
+
+# Motivos de 403 que indicam quota (os restantes 403 são erros de permissão)
+GOOGLE_QUOTA_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded', 'quotaExceeded'}
+
+
+class GoogleQuotaExceeded(Exception):
+    """A Calendar API respondeu 403/429 por quota; a operação deve ser repetida mais tarde."""
+
+
+def is_quota_error(error) -> bool:
+    """Indica se ``error`` é uma resposta de quota (429, ou 403 por limite de débito)."""
+    if not isinstance(error, HttpError):
+        return False
+    if error.resp.status == 429:
+        return True
+    if error.resp.status != 403:
+        return False
+    try:
+        details = json.loads(error.content or b'{}').get('error', {}).get('errors', [])
+    except (ValueError, AttributeError):
+        return False
+    return any(isinstance(detail, dict) and detail.get('reason') in GOOGLE_QUOTA_REASONS for detail in details)
+
+
+def google_rate_limiter(organization_id: int) -> Optional[RateLimiter]:
+    """Limitador de pedidos à API partilhado por todos os workers da organização."""
+    limit = getattr(settings, 'GOOGLE_API_RATE_LIMIT', 0)
+    if not limit:
+        return None
+    return RateLimiter(f'google:{organization_id}', capacity=limit, period=1.0)
+
+# Cache por processo: credenciais partilhadas entre threads e clientes
+# construídos por thread (httplib2 não é thread-safe), ambos indexados por
+# (organization_id, token_version).
+_credentials_cache: Dict[Tuple[int, int], Credentials] = {}
+_credentials_lock = threading.Lock()
+_thread_clients = threading.local()
+
+
+@lru_cache(maxsize=1)
+def _calendar_discovery_document() -> Dict:
+    """Documento de discovery estático da Calendar v3, lido e interpretado uma vez."""
+    return json.loads(get_static_doc('calendar', 'v3'))
+
+
+def clear_google_client_cache(organization_id: Optional[int] = None):
+    """Esquecer credenciais e clientes em cache (todas as organizações por omissão).
+
+    Os clientes das outras threads deixam de ser usados quando a versão dos
+    tokens muda.
+    """
+    with _credentials_lock:
+        for key in list(_credentials_cache):
+            if organization_id is None or key[0] == organization_id:
+                del _credentials_cache[key]
+    clients = getattr(_thread_clients, 'clients', {})
+    for key in list(clients):
+        if organization_id is None or key[0] == organization_id:
+            del clients[key]
+
 class GoogleCalendarService:
     """Serviço principal para integração Google Calendar."""
 
@@ -42,6 +111,7 @@ class GoogleCalendarService:
         self.organization = organization
         self.config = None
         self.service = None
+        self.limiter = google_rate_limiter(organization.pk)
         self._initialize_config()
 
     def _initialize_config(self):
@@ -115,43 +185,64 @@ class GoogleCalendarService:
         self.config.refresh_token = credentials.refresh_token
         self.config.token_expiry = credentials.expiry
         self.config.sync_enabled = True
+        self.config.token_version += 1
         self.config.save()
+        clear_google_client_cache(self.organization.pk)
 
         logger.info(f"OAuth2 configurado com sucesso para {self.organization.name}")
 
+    def _cache_key(self) -> Tuple[int, int]:
+        return (self.organization.pk, self.config.token_version)
+
     def _get_credentials(self) -> Optional[Credentials]:
-        """Obter credenciais válidas, renovando se necessário."""
+        """Obter credenciais válidas (cache por processo), renovando se necessário."""
         if not self.config.access_token:
             return None
 
-        credentials = Credentials(
-            token=self.config.access_token,
-            refresh_token=self.config.refresh_token,
-            token_uri="https://oauth2.googleapis.com/token",
-            client_id=self.config.client_id,
-            client_secret=self.config.client_secret,
-            scopes=GOOGLE_CALENDAR_SCOPES
-        )
-
-        # Renovar token se necessário
-        if credentials.expired and credentials.refresh_token:
-            try:
-                credentials.refresh(Request())
-
-                # Atualizar tokens na configuração
+        key = self._cache_key()
+        with _credentials_lock:
+            credentials = _credentials_cache.get(key)
+            if credentials is None:
+                expiry = self.config.token_expiry
+                if expiry and timezone.is_aware(expiry):
+                    # google-auth trabalha com datetimes UTC sem timezone
+                    expiry = timezone.make_naive(expiry, dt_timezone.utc)
+                credentials = Credentials(
+                    token=self.config.access_token,
+                    refresh_token=self.config.refresh_token,
+                    token_uri="https://oauth2.googleapis.com/token",
+                    client_id=self.config.client_id,
+                    client_secret=self.config.client_secret,
+                    scopes=GOOGLE_CALENDAR_SCOPES,
+                    expiry=expiry,
+                )
+                _credentials_cache[key] = credentials
+
+            # Renovar token se necessário (uma thread de cada vez)
+            if credentials.expired and credentials.refresh_token:
+                try:
+                    credentials.refresh(Request())
+                except RefreshError as e:
+                    logger.error(f"Erro ao renovar token para {self.organization.name}: {e}")
+                    _credentials_cache.pop(key, None)
+                    return None
+
+                # Persistir apenas os campos do token, sem save() completo
+                token_expiry = credentials.expiry
+                if token_expiry and timezone.is_naive(token_expiry):
+                    token_expiry = timezone.make_aware(token_expiry, dt_timezone.utc)
+                GoogleCalendarConfig.objects.filter(pk=self.config.pk).update(
+                    access_token=credentials.token, token_expiry=token_expiry
+                )
                 self.config.access_token = credentials.token
-                self.config.token_expiry = credentials.expiry
-                self.config.save()
+                self.config.token_expiry = token_expiry
 
                 logger.info(f"Token renovado para {self.organization.name}")
-            except RefreshError as e:
-                logger.error(f"Erro ao renovar token para {self.organization.name}: {e}")
-                return None
 
         return credentials
 
     def _get_service(self):
-        """Obter serviço Google Calendar API."""
+        """Obter serviço Google Calendar API (cliente reutilizado por thread)."""
         if self.service:
             return self.service
 
@@ -159,9 +250,30 @@ class GoogleCalendarService:
         if not credentials:
             raise ValidationError("Credenciais Google Calendar não configuradas ou inválidas")
 
-        self.service = build('calendar', 'v3', credentials=credentials)
+        key = self._cache_key()
+        clients = getattr(_thread_clients, 'clients', None)
+        if clients is None:
+            clients = _thread_clients.clients = {}
+        client = clients.get(key)
+        if client is None:
+            # Versões antigas dos tokens desta organização deixam de ser usadas
+            for stale in [k for k in clients if k[0] == key[0]]:
+                del clients[stale]
+            client = build_from_document(_calendar_discovery_document(), credentials=credentials)
+            clients[key] = client
+
+        self.service = client
         return self.service
 
+    def _throttle(self, requests: int = 1):
+        """Consumir ``requests`` pedidos do limite da organização (bloqueia se preciso)."""
+        if not self.limiter:
+            return
+        while requests > 0:
+            tokens = min(requests, self.limiter.capacity)
+            self.limiter.acquire(tokens)
+            requests -= tokens
+
     def _parse_datetime(self, data: Dict) -> Optional[datetime]:
         """Converter informação de data do Google para objeto datetime."""
         if not data:
@@ -253,6 +365,36 @@ class GoogleCalendarService:
 
             raise ValidationError(error_msg)
 
+    def _passes_entity_filter(self, event: Event, instructor_config: InstructorGoogleCalendar) -> bool:
+        """Verificar se a entidade da modalidade está incluída na sincronização do instrutor."""
+        if event.modality:
+            if (event.modality.entity_type == "acr" and not instructor_config.sync_acr_events) or \
+               (event.modality.entity_type == "proform" and not instructor_config.sync_proform_events):
+                return False
+        return True
+
+    def _build_event_body(self, event: Event) -> Dict:
+        """Preparar o corpo do evento para a Calendar API."""
+        return {
+            'summary': event.title,
+            'description': self._format_event_description(event),
+            'start': {
+                'dateTime': event.starts_at.isoformat(),
+                'timeZone': 'Europe/Lisbon',
+            },
+            'end': {
+                'dateTime': event.ends_at.isoformat(),
+                'timeZone': 'Europe/Lisbon',
+            },
+            'location': event.resource.name,
+            'colorId': self._get_event_color_id(event)
+        }
+
+    def _payload_hash(self, calendar_id: str, event_body: Dict) -> str:
+        """Hash estável do payload enviado ao Google (inclui o calendário de destino)."""
+        payload = json.dumps({'calendarId': calendar_id, 'body': event_body}, sort_keys=True, default=str)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
     def sync_event_to_google(self, event: Event) -> bool:
         """
         Sincronizar evento específico para Google Calendar.
@@ -277,28 +419,17 @@ class GoogleCalendarService:
             return False
 
         # Verificar filtros de entidade
-        if event.modality:
-            if (event.modality.entity_type == "acr" and not instructor_config.sync_acr_events) or \
-               (event.modality.entity_type == "proform" and not instructor_config.sync_proform_events):
-                return False
+        if not self._passes_entity_filter(event, instructor_config):
+            return False
 
-        try:
-            # Preparar dados do evento
-            event_body = {
-                'summary': event.title,
-                'description': self._format_event_description(event),
-                'start': {
-                    'dateTime': event.starts_at.isoformat(),
-                    'timeZone': 'Europe/Lisbon',
-                },
-                'end': {
-                    'dateTime': event.ends_at.isoformat(),
-                    'timeZone': 'Europe/Lisbon',
-                },
-                'location': event.resource.name,
-                'colorId': self._get_event_color_id(event)
-            }
+        event_body = self._build_event_body(event)
+        payload_hash = self._payload_hash(instructor_config.google_calendar_id, event_body)
+        if event.google_calendar_id and event.google_sync_hash == payload_hash:
+            # Nada mudou desde o último envio: evitar o pedido HTTP
+            return True
 
+        try:
+            self._throttle()
             if event.google_calendar_id:
                 # Atualizar evento existente
                 updated_event = service.events().update(
@@ -307,6 +438,10 @@ class GoogleCalendarService:
                     body=event_body
                 ).execute()
 
+                event.google_sync_hash = payload_hash
+                event.last_google_sync = timezone.now()
+                event.save(update_fields=['google_sync_hash', 'last_google_sync'])
+
                 sync_type = GoogleCalendarSyncLog.SyncType.UPDATE
                 logger.info(f"Evento atualizado no Google Calendar: {event.title}")
 
@@ -319,8 +454,9 @@ class GoogleCalendarService:
 
                 # Armazenar ID do evento
                 event.google_calendar_id = created_event['id']
+                event.google_sync_hash = payload_hash
                 event.last_google_sync = timezone.now()
-                event.save(update_fields=['google_calendar_id', 'last_google_sync'])
+                event.save(update_fields=['google_calendar_id', 'google_sync_hash', 'last_google_sync'])
 
                 sync_type = GoogleCalendarSyncLog.SyncType.CREATE
                 logger.info(f"Evento criado no Google Calendar: {event.title}")
@@ -362,6 +498,8 @@ class GoogleCalendarService:
                 error_message=error_msg
             )
 
+            if is_quota_error(e):
+                raise GoogleQuotaExceeded(error_msg) from e
             return False
 
     def delete_event_from_google(self, event: Event) -> bool:
@@ -374,51 +512,99 @@ class GoogleCalendarService:
         if not event.google_calendar_id or not event.instructor:
             return False
 
+        if not self.delete_remote_event(event.instructor, event.google_calendar_id, event=event, title=event.title):
+            return False
+
+        # Limpar ID do evento
+        event.google_calendar_id = None
+        event.save(update_fields=['google_calendar_id'])
+        return True
+
+    def delete_remote_event(self, instructor: Instructor, google_event_id: str,
+                            event: Optional[Event] = None, title: str = '') -> bool:
+        """
+        Eliminar um evento do calendário Google do instrutor pelo seu ID remoto.
+
+        Usado também depois de o ``Event`` local já ter sido apagado (``event=None``).
+
+        Returns:
+            bool: True se eliminado com sucesso
+        """
         try:
             service = self._get_service()
-            instructor_config = event.instructor.google_calendar
+            instructor_config = instructor.google_calendar
 
+            self._throttle()
             service.events().delete(
                 calendarId=instructor_config.google_calendar_id,
-                eventId=event.google_calendar_id
+                eventId=google_event_id
             ).execute()
 
             # Log da eliminação
             GoogleCalendarSyncLog.objects.create(
                 organization=self.organization,
-                instructor=event.instructor,
+                instructor=instructor,
                 event=event,
                 sync_type=GoogleCalendarSyncLog.SyncType.DELETE,
                 status=GoogleCalendarSyncLog.Status.SUCCESS,
-                google_event_id=event.google_calendar_id,
-                google_calendar_id=instructor_config.google_calendar_id
+                google_event_id=google_event_id,
+                google_calendar_id=instructor_config.google_calendar_id,
+                sync_data={'event_title': title} if title else {}
             )
 
-            # Limpar ID do evento
-            event.google_calendar_id = None
-            event.save(update_fields=['google_calendar_id'])
-
-            logger.info(f"Evento eliminado do Google Calendar: {event.title}")
+            logger.info(f"Evento eliminado do Google Calendar: {title or google_event_id}")
             return True
 
         except HttpError as e:
-            error_msg = f"Erro ao eliminar evento {event.title}: {e}"
+            error_msg = f"Erro ao eliminar evento {title or google_event_id}: {e}"
             logger.error(error_msg)
 
             # Log do erro
             GoogleCalendarSyncLog.objects.create(
                 organization=self.organization,
-                instructor=event.instructor,
+                instructor=instructor,
                 event=event,
                 sync_type=GoogleCalendarSyncLog.SyncType.DELETE,
                 status=GoogleCalendarSyncLog.Status.ERROR,
                 error_message=error_msg
             )
 
+            if is_quota_error(e):
+                raise GoogleQuotaExceeded(error_msg) from e
             return False
 
+    def _list_changed_events(self, service, instructor_config: InstructorGoogleCalendar) -> Tuple[List[Dict], str]:
+        """
+        Listar eventos alterados desde o último ``nextSyncToken`` (todas as páginas).
+
+        Sem token faz a listagem inicial a partir de agora, que devolve o
+        primeiro token para as sincronizações seguintes.
+
+        Returns:
+            Tuple[List[Dict], str]: (items, next_sync_token)
+        """
+        params = {
+            'calendarId': instructor_config.google_calendar_id,
+            'singleEvents': True,
+            'maxResults': 250,
+        }
+        if instructor_config.next_sync_token:
+            params['syncToken'] = instructor_config.next_sync_token
+        else:
+            params['timeMin'] = timezone.now().isoformat()
+
+        items = []
+        page_token = None
+        while True:
+            self._throttle()
+            response = service.events().list(pageToken=page_token, **params).execute()
+            items.extend(response.get('items', []))
+            page_token = response.get('nextPageToken')
+            if not page_token:
+                return items, response.get('nextSyncToken', '')
+
     def sync_events_from_google(self, instructor: Instructor) -> Dict[str, int]:
-        """Importar eventos do Google Calendar para o sistema local."""
+        """Importar alterações do Google Calendar para o sistema local (incremental)."""
         stats = {'imported': 0, 'errors': 0, 'skipped': 0}
 
         try:
@@ -430,54 +616,211 @@ class GoogleCalendarService:
             return stats
 
         service = self._get_service()
-        time_min = timezone.now()
-        time_max = time_min + timedelta(days=30)
-
         try:
-            events = service.events().list(
-                calendarId=instructor_config.google_calendar_id,
-                timeMin=time_min.isoformat(),
-                timeMax=time_max.isoformat(),
-                singleEvents=True,
-                orderBy='startTime'
-            ).execute()
+            try:
+                items, next_sync_token = self._list_changed_events(service, instructor_config)
+            except HttpError as e:
+                # 410 Gone: token expirado, é necessária uma sincronização completa
+                if e.resp.status != 410 or not instructor_config.next_sync_token:
+                    raise
+                logger.info(f"Sync token expirado para {instructor.full_name}; a repetir sincronização completa")
+                instructor_config.next_sync_token = ''
+                items, next_sync_token = self._list_changed_events(service, instructor_config)
         except HttpError as e:
             logger.error(f"Erro ao obter eventos do Google para {instructor.full_name}: {e}")
+            if is_quota_error(e):
+                raise GoogleQuotaExceeded(str(e)) from e
             stats['errors'] += 1
             return stats
 
-        for item in events.get('items', []):
+        # A mesma alteração pode surgir em várias páginas; prevalece a mais recente
+        latest = {}
+        for item in items:
             google_event_id = item.get('id')
             if not google_event_id:
                 stats['skipped'] += 1
                 continue
+            latest[google_event_id] = item
 
-            local_event = Event.objects.filter(
+        local_events = {
+            event.google_calendar_id: event
+            for event in Event.objects.filter(
                 organization=self.organization,
                 instructor=instructor,
-                google_calendar_id=google_event_id
-            ).first()
+                google_calendar_id__in=list(latest),
+            )
+        }
 
-            if not local_event:
+        now = timezone.now()
+        changed = []
+        for google_event_id, item in latest.items():
+            local_event = local_events.get(google_event_id)
+            if not local_event or item.get('status') == 'cancelled':
                 stats['skipped'] += 1
                 continue
 
-            try:
-                local_event.title = item.get('summary', local_event.title)
-                start_dt = self._parse_datetime(item.get('start', {}))
-                end_dt = self._parse_datetime(item.get('end', {}))
-                if start_dt and end_dt:
-                    local_event.starts_at = start_dt
-                    local_event.ends_at = end_dt
-                local_event.last_google_sync = timezone.now()
-                local_event.save(update_fields=['title', 'starts_at', 'ends_at', 'last_google_sync'])
-                stats['imported'] += 1
-            except Exception as e:
-                logger.error(f"Erro ao atualizar evento {google_event_id}: {e}")
+            local_event.title = item.get('summary', local_event.title)
+            start_dt = self._parse_datetime(item.get('start', {}))
+            end_dt = self._parse_datetime(item.get('end', {}))
+            if start_dt and end_dt and end_dt > start_dt:
+                local_event.starts_at = start_dt
+                local_event.ends_at = end_dt
+            local_event.last_google_sync = now
+            changed.append(local_event)
+
+        conflicts = find_conflicting_events(changed)
+        for local_event in changed:
+            if local_event.pk in conflicts:
+                logger.error(
+                    f"Erro ao atualizar evento {local_event.google_calendar_id}: conflito de horário no espaço"
+                )
                 stats['errors'] += 1
+        updates = [event for event in changed if event.pk not in conflicts]
+        Event.objects.bulk_update(updates, ['title', 'starts_at', 'ends_at', 'last_google_sync'], batch_size=500)
+        stats['imported'] += len(updates)
+
+        instructor_config.next_sync_token = next_sync_token or ''
+        instructor_config.save(update_fields=['next_sync_token'])
 
         return stats
 
+    def _future_events_for_sync(self, instructor: Instructor, days: int = 30):
+        """Eventos dos próximos ``days`` dias, com os dados da descrição já carregados."""
+        now = timezone.now()
+        return Event.objects.filter(
+            instructor=instructor,
+            organization=self.organization,
+            starts_at__gte=now,
+            starts_at__lte=now + timedelta(days=days),
+            google_calendar_sync_enabled=True
+        ).select_related('modality', 'resource').annotate(
+            active_bookings=Count('bookings', filter=~Q(bookings__status=Booking.Status.CANCELLED))
+        )
+
+    def sync_events_to_google_batch(self, instructor: Instructor, events) -> Dict[str, int]:
+        """
+        Exportar vários eventos para o Google Calendar em pedidos batch.
+
+        Agrupa até ``GOOGLE_BATCH_LIMIT`` inserts/updates por pedido HTTP, grava
+        os logs com ``bulk_create`` e atualiza ``last_sync`` do instrutor uma vez.
+        Eventos cujo payload não mudou desde o último envio são ignorados.
+
+        Se a API responder com erro de quota, os lotes seguintes não são
+        enviados: o que já foi sincronizado é gravado e é levantada
+        ``GoogleQuotaExceeded`` para que o chamador repita mais tarde (os
+        eventos enviados não voltam a sê-lo graças ao hash do payload).
+
+        Returns:
+            Dict[str, int]: contagens de ``success``, ``errors`` e ``skipped``
+        """
+        stats = {'success': 0, 'errors': 0, 'skipped': 0}
+
+        try:
+            instructor_config = instructor.google_calendar
+        except InstructorGoogleCalendar.DoesNotExist:
+            self.create_instructor_calendar(instructor)
+            instructor_config = InstructorGoogleCalendar.objects.get(instructor=instructor)
+
+        calendar_id = instructor_config.google_calendar_id
+        pending = []
+        for event in events:
+            if (not instructor_config.sync_enabled or not event.google_calendar_sync_enabled
+                    or not self._passes_entity_filter(event, instructor_config)):
+                stats['skipped'] += 1
+                continue
+            body = self._build_event_body(event)
+            payload_hash = self._payload_hash(calendar_id, body)
+            if event.google_calendar_id and event.google_sync_hash == payload_hash:
+                # Inalterado desde o último envio
+                stats['skipped'] += 1
+                continue
+            pending.append((event, body, payload_hash))
+        if not pending:
+            return stats
+
+        service = self._get_service()
+        now = timezone.now()
+        synced_events = []
+        logs = []
+        quota_error = None
+
+        def _log(event, sync_type, status, error_message=''):
+            logs.append(GoogleCalendarSyncLog(
+                organization=self.organization,
+                instructor=instructor,
+                event=event,
+                sync_type=sync_type,
+                status=status,
+                google_event_id=event.google_calendar_id or '',
+                google_calendar_id=calendar_id,
+                error_message=error_message,
+                sync_data={
+                    'event_title': event.title,
+                    'starts_at': event.starts_at.isoformat(),
+                    'ends_at': event.ends_at.isoformat()
+                } if status == GoogleCalendarSyncLog.Status.SUCCESS else {},
+            ))
+
+        for start in range(0, len(pending), GOOGLE_BATCH_LIMIT):
+            if quota_error is not None:
+                break
+            chunk = {str(item[0].pk): item for item in pending[start:start + GOOGLE_BATCH_LIMIT]}
+            responses = {}
+
+            def _collect(request_id, response, exception, responses=responses):
+                responses[request_id] = (response, exception)
+
+            batch = service.new_batch_http_request(callback=_collect)
+            for request_id, (event, body, _hash) in chunk.items():
+                if event.google_calendar_id:
+                    request = service.events().update(
+                        calendarId=calendar_id, eventId=event.google_calendar_id, body=body
+                    )
+                else:
+                    request = service.events().insert(calendarId=calendar_id, body=body)
+                batch.add(request, request_id=request_id)
+
+            self._throttle(len(chunk))
+            try:
+                batch.execute()
+            except HttpError as e:
+                logger.error(f"Erro no batch de sincronização para {instructor.full_name}: {e}")
+                if is_quota_error(e):
+                    quota_error = e
+
+            for request_id, (event, _body, payload_hash) in chunk.items():
+                sync_type = (GoogleCalendarSyncLog.SyncType.UPDATE if event.google_calendar_id
+                             else GoogleCalendarSyncLog.SyncType.CREATE)
+                response, exception = responses.get(request_id, (None, None))
+                if exception is not None or response is None:
+                    if is_quota_error(exception):
+                        quota_error = exception
+                    error_msg = f"Erro ao sincronizar evento {event.title}: {exception or 'sem resposta'}"
+                    logger.error(error_msg)
+                    _log(event, sync_type, GoogleCalendarSyncLog.Status.ERROR, error_msg)
+                    stats['errors'] += 1
+                    continue
+
+                if not event.google_calendar_id:
+                    event.google_calendar_id = response['id']
+                event.google_sync_hash = payload_hash
+                event.last_google_sync = now
+                synced_events.append(event)
+                _log(event, sync_type, GoogleCalendarSyncLog.Status.SUCCESS)
+                stats['success'] += 1
+
+        Event.objects.bulk_update(
+            synced_events, ['google_calendar_id', 'google_sync_hash', 'last_google_sync'], batch_size=500
+        )
+        GoogleCalendarSyncLog.objects.bulk_create(logs, batch_size=500)
+
+        instructor_config.last_sync = now
+        instructor_config.save(update_fields=['last_sync'])
+
+        if quota_error is not None:
+            raise GoogleQuotaExceeded(str(quota_error)) from quota_error
+        return stats
+
     def sync_all_instructor_events(self, instructor: Instructor) -> Dict[str, int]:
         """Sincronizar eventos entre o sistema e o Google Calendar."""
 
@@ -495,24 +838,11 @@ class GoogleCalendarService:
             logger.error(f"Erro ao criar calendário para {instructor.full_name}: {e}")
             return stats
 
-        # Sincronizar eventos futuros (próximos 30 dias) para o Google
-        future_events = Event.objects.filter(
-            instructor=instructor,
-            organization=self.organization,
-            starts_at__gte=timezone.now(),
-            starts_at__lte=timezone.now() + timedelta(days=30),
-            google_calendar_sync_enabled=True
-        )
-
-        for event in future_events:
-            try:
-                if self.sync_event_to_google(event):
-                    stats['success'] += 1
-                else:
-                    stats['skipped'] += 1
-            except HttpError as e:
-                logger.error(f"Erro ao sincronizar evento {event.title}: {e}")
-                stats['errors'] += 1
+        # Sincronizar eventos futuros (próximos 30 dias) para o Google, em batch
+        future_events = self._future_events_for_sync(instructor)
+        export_stats = self.sync_events_to_google_batch(instructor, list(future_events))
+        for key in ('success', 'errors', 'skipped'):
+            stats[key] += export_stats[key]
 
         logger.info(f"Sincronização completa para {instructor.full_name}: {stats}")
         return stats
@@ -552,7 +882,10 @@ class GoogleCalendarService:
             description_parts.append(f"Local: {event.resource.name}")
 
         if event.capacity:
-            booked = event.bookings_count
+            # Usa a contagem anotada quando disponível (sincronização em batch)
+            booked = getattr(event, 'active_bookings', None)
+            if booked is None:
+                booked = event.bookings_count
             description_parts.append(f"Ocupação: {booked}/{event.capacity}")
 
         if event.description:
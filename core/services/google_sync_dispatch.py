@@ -0,0 +1,162 @@
+"""
+Despacho agregado (debounce) da sincronização de eventos para o Google Calendar.
+
+Cada alteração a um evento apenas marca o evento como "sujo" na cache e, se
+ainda não houver uma sincronização pendente, agenda uma única tarefa com
+``GOOGLE_SYNC_DEBOUNCE_SECONDS`` de atraso. Enquanto o evento continuar a ser
+editado a tarefa reagenda-se; só após um período sem alterações é feito o
+envio, com o estado mais recente da base de dados. Arrastar uma aula três vezes
+no Gantt resulta assim num único pedido ao Google e num único log.
+
+Um evento criado e apagado dentro da janela nunca chega ao Google (no-op); um
+evento apagado depois de sincronizado é removido pelo ID remoto guardado no
+momento da eliminação.
+"""
+from __future__ import annotations
+
+import logging
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from kombu.exceptions import OperationalError
+
+from ..models import Event, GoogleCalendarConfig, Instructor, Organization
+from .google_calendar import GoogleQuotaExceeded, get_google_calendar_service
+
+logger = logging.getLogger(__name__)
+
+
+def _debounce_seconds() -> float:
+    return float(getattr(settings, "GOOGLE_SYNC_DEBOUNCE_SECONDS", 30))
+
+
+def _state_key(event_id: int) -> str:
+    return f"gsync:event:{event_id}"
+
+
+def _pending_key(event_id: int) -> str:
+    return f"gsync:pending:{event_id}"
+
+
+def _ttl() -> int:
+    # Margem larga: as chaves só servem enquanto a tarefa pendente não corre
+    return int(max(_debounce_seconds() * 20, 600))
+
+
+def _auto_sync_enabled(organization_id: int) -> bool:
+    return GoogleCalendarConfig.objects.filter(
+        organization_id=organization_id, sync_enabled=True, auto_sync_events=True
+    ).exists()
+
+
+def mark_event_dirty(event: Event, *, deleted: bool = False, now: float | None = None,
+                     auto_sync: bool | None = None) -> bool:
+    """Regista uma alteração ao evento e agenda a sincronização se necessário.
+
+    Chamado pelo relay do outbox (``core.services.outbox``) com o estado do
+    evento gravado; para eventos apagados, ``event`` traz o ID remoto guardado
+    no momento da eliminação. ``auto_sync`` evita a consulta à configuração
+    quando o chamador já a verificou.
+
+    Returns:
+        bool: True se foi agendada uma nova tarefa (False se já havia uma
+        pendente ou se a organização não sincroniza automaticamente)
+    """
+    if not event.pk or not event.instructor_id:
+        return False
+
+    now = time.time() if now is None else now
+    state = cache.get(_state_key(event.pk)) or {}
+    state.update(
+        organization_id=event.organization_id,
+        instructor_id=event.instructor_id,
+        dirty_at=now,
+        deleted=deleted,
+        title=event.title,
+    )
+    # O ID remoto mais recente conhecido (pode ter sido criado entretanto)
+    state["google_calendar_id"] = event.google_calendar_id or state.get("google_calendar_id")
+    cache.set(_state_key(event.pk), state, _ttl())
+
+    if not cache.add(_pending_key(event.pk), True, _ttl()):
+        return False
+    if not (auto_sync if auto_sync is not None else _auto_sync_enabled(event.organization_id)):
+        cache.delete_many([_pending_key(event.pk), _state_key(event.pk)])
+        return False
+
+    from ..tasks import flush_event_sync_task
+
+    try:
+        flush_event_sync_task.apply_async(args=[event.pk], countdown=_debounce_seconds())
+    except OperationalError as exc:
+        # Broker indisponível: libertar a marca para a próxima edição tentar de novo
+        cache.delete(_pending_key(event.pk))
+        logger.warning("Não foi possível agendar a sincronização do evento %s: %s", event.pk, exc)
+        return False
+    return True
+
+
+def flush_event_sync(event_id: int, *, force: bool = False, now: float | None = None) -> dict:
+    """Executa a sincronização agregada de um evento marcado como sujo.
+
+    Se a API responder com erro de quota, o evento volta a ficar pendente e
+    a tarefa é reagendada (``waiting``) em vez de perder a alteração.
+
+    Returns:
+        dict: ``status`` é ``waiting`` (com ``countdown`` até nova tentativa),
+        ``noop``, ``synced`` ou ``deleted``; os dois últimos incluem ``success``.
+    """
+    state = cache.get(_state_key(event_id))
+    if state is None:
+        cache.delete(_pending_key(event_id))
+        return {"status": "noop"}
+
+    now = time.time() if now is None else now
+    remaining = state["dirty_at"] + _debounce_seconds() - now
+    if remaining > 0 and not force:
+        return {"status": "waiting", "countdown": remaining}
+
+    # Libertar a marca antes de sincronizar: edições a partir daqui agendam nova tarefa
+    cache.delete(_pending_key(event_id))
+    state = cache.get(_state_key(event_id)) or state
+    cache.delete(_state_key(event_id))
+
+    organization = Organization.objects.filter(pk=state["organization_id"]).first()
+    if organization is None:
+        return {"status": "noop"}
+
+    event = (
+        Event.objects.select_related("instructor__google_calendar", "modality", "resource")
+        .filter(pk=event_id, organization=organization)
+        .first()
+    )
+    service = get_google_calendar_service(organization)
+    try:
+        return _push(service, organization, event, state)
+    except GoogleQuotaExceeded:
+        # Voltar a marcar como pendente (sem sobrepor uma edição entretanto registada)
+        state["dirty_at"] = now
+        cache.add(_state_key(event_id), state, _ttl())
+        cache.add(_pending_key(event_id), True, _ttl())
+        return {"status": "waiting", "countdown": _debounce_seconds()}
+
+
+def _push(service, organization: Organization, event: Event | None, state: dict) -> dict:
+    if event is not None and not state["deleted"]:
+        return {"status": "synced", "success": service.sync_event_to_google(event)}
+
+    google_event_id = state.get("google_calendar_id")
+    if not google_event_id:
+        # Criado e apagado dentro da janela (nunca chegou ao Google)
+        return {"status": "noop"}
+
+    instructor = (
+        Instructor.objects.select_related("google_calendar")
+        .filter(pk=state["instructor_id"], organization=organization)
+        .first()
+    )
+    if instructor is None or not hasattr(instructor, "google_calendar"):
+        return {"status": "noop"}
+    success = service.delete_remote_event(instructor, google_event_id, title=state.get("title", ""))
+    return {"status": "deleted", "success": success}
@@ -0,0 +1,139 @@
+"""
+Índice de identidade entre organizações.
+
+Os clientes (``Person``) pertencem a uma organização; o mesmo cliente inscrito
+em duas organizações (ex. ACR e ginásio) tem dois registos sem ligação. Cada
+NIF e email normalizado gera um hash (HMAC-SHA256 com a ``SECRET_KEY``, para não
+guardar os dados em claro fora do tenant) numa ``PersonIdentity``, ligada a
+todos os registos ``Person`` com esse valor. "O mesmo cliente noutra
+organização" passa a ser um join indexado (``person__identities__people``).
+
+O índice é mantido em ``Person.save()`` (``sync_person_identities``) e pode ser
+reconstruído em lote (``rebuild_identities``, comando ``rebuild_identities``),
+por exemplo após importações com ``bulk_create`` ou mudança da ``SECRET_KEY``.
+"""
+from __future__ import annotations
+
+import re
+
+from django.db import transaction
+from django.db.models import Exists, OuterRef
+from django.utils.crypto import salted_hmac
+
+from ..models import Organization, Person, PersonIdentity
+from .cache_versions import bump_cache_version
+
+Kind = PersonIdentity.Kind
+Through = PersonIdentity.people.through
+IDENTITY_SALT = "core.services.identity"
+REBUILD_CHUNK_SIZE = 2000
+
+
+def normalize_nif(nif: str) -> str:
+    value = re.sub(r"[^0-9A-Za-z]", "", nif or "").upper()
+    # Prefixo de país do NIF europeu (PT123456789)
+    if value.startswith("PT") and value[2:].isdigit():
+        value = value[2:]
+    return value
+
+
+def normalize_email(email: str) -> str:
+    return (email or "").strip().lower()
+
+
+def identity_digest(kind: str, value: str) -> str:
+    return salted_hmac(IDENTITY_SALT, f"{kind}:{value}", algorithm="sha256").hexdigest()
+
+
+def identity_keys(nif: str, email: str) -> set[tuple[str, str]]:
+    """(tipo, hash) do NIF e do email, ignorando os vazios."""
+    keys = set()
+    for kind, value in ((Kind.NIF, normalize_nif(nif)), (Kind.EMAIL, normalize_email(email))):
+        if value:
+            keys.add((kind, identity_digest(kind, value)))
+    return keys
+
+
+def _identity_ids(keys) -> dict[tuple[str, str], int]:
+    """Ids das identidades de ``keys``, criando as que faltam."""
+    keys = set(keys)
+    if not keys:
+        return {}
+    PersonIdentity.objects.bulk_create(
+        [PersonIdentity(kind=kind, digest=digest) for kind, digest in keys],
+        batch_size=REBUILD_CHUNK_SIZE, ignore_conflicts=True,
+    )
+    digests = sorted({digest for _, digest in keys})
+    ids = {}
+    for start in range(0, len(digests), REBUILD_CHUNK_SIZE):
+        rows = PersonIdentity.objects.filter(digest__in=digests[start:start + REBUILD_CHUNK_SIZE])
+        for kind, digest, pk in rows.values_list("kind", "digest", "pk"):
+            if (kind, digest) in keys:
+                ids[(kind, digest)] = pk
+    return ids
+
+
+def sync_person_identities(person: Person) -> None:
+    """Atualiza as identidades de um cliente após gravar NIF/email."""
+    wanted = identity_keys(person.nif, person.email)
+    current = set(person.identities.values_list("kind", "digest"))
+    if wanted == current:
+        return
+    with transaction.atomic():
+        person.identities.set(_identity_ids(wanted).values())
+    # A elegibilidade para descontos em cache depende das ligações (ver ``pricing``)
+    organization_id = person.organization_id
+    transaction.on_commit(lambda: bump_cache_version("pricing", organization_id))
+
+
+def _linked_organizations(organization_id: int | None) -> set[int]:
+    """Organizações com clientes ligados aos clientes de ``organization_id`` (todas se None)."""
+    if not organization_id:
+        return set(Organization.objects.values_list("pk", flat=True))
+    linked = Person.objects.filter(identities__people__organization_id=organization_id)
+    return {organization_id, *linked.values_list("organization_id", flat=True).distinct()}
+
+
+def rebuild_identities(organization_id: int | None = None) -> int:
+    """Reconstrói o índice (de uma organização ou de todas) em lote.
+
+    Depois do commit invalida a elegibilidade para descontos em cache
+    (``pricing``) das organizações afetadas: a reconstruída e as dos clientes
+    ligados às identidades antigas ou novas dos seus clientes.
+
+    Returns:
+        int: ligações cliente-identidade gravadas
+    """
+    people = Person.objects.order_by("pk")
+    if organization_id:
+        people = people.filter(organization_id=organization_id)
+    rows = [(pk, identity_keys(nif, email)) for pk, nif, email in people.values_list("pk", "nif", "email")]
+
+    with transaction.atomic():
+        ids = _identity_ids(set().union(*(keys for _, keys in rows)))
+        links = Through.objects.all()
+        if organization_id:
+            links = links.filter(person__organization_id=organization_id)
+        affected = _linked_organizations(organization_id)
+        links.delete()
+        Through.objects.bulk_create(
+            [Through(person_id=pk, personidentity_id=ids[key]) for pk, keys in rows for key in keys],
+            batch_size=REBUILD_CHUNK_SIZE,
+        )
+        PersonIdentity.objects.filter(people__isnull=True).delete()
+        if organization_id:
+            affected |= _linked_organizations(organization_id)
+
+    def invalidate():
+        for org_id in sorted(affected):
+            bump_cache_version("pricing", org_id)
+
+    transaction.on_commit(invalidate)
+    return sum(len(keys) for _, keys in rows)
+
+
+def linked_people(organization: Organization, other: Organization):
+    """Clientes de ``organization`` que também são clientes de ``other``."""
+    return Person.objects.filter(organization=organization).filter(
+        Exists(Person.objects.filter(organization=other, identities__people=OuterRef("pk")))
+    )
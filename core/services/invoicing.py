@@ -0,0 +1,95 @@
+"""
+Criação de faturas com as linhas numa só passagem.
+
+``InvoiceItem.save()`` recalcula o total da fatura a cada linha (uma leitura de
+todas as linhas e uma gravação da fatura por linha). Para faturas com várias
+linhas, e para a faturação em lote, as linhas são gravadas com ``bulk_create``
+/ ``bulk_update`` e o total é calculado uma única vez:
+
+- ``build_invoice``: fatura nova com todas as linhas, numa transação;
+- ``save_invoice_items``: alterações de linhas de uma fatura existente (usado
+  pelo inline do admin).
+"""
+from __future__ import annotations
+
+from dataclasses import dataclass
+from datetime import date
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import DecimalField, ExpressionWrapper, F, Sum
+
+from ..models import Invoice, InvoiceItem, Organization, Person
+
+CENTS = Decimal("0.01")
+
+
+@dataclass(frozen=True)
+class InvoiceLine:
+    description: str
+    quantity: Decimal
+    unit_price: Decimal
+
+
+def lines_total(lines) -> Decimal:
+    """Total de linhas já em memória (``InvoiceLine`` ou ``InvoiceItem``)."""
+    return sum(
+        (Decimal(line.quantity) * Decimal(line.unit_price) for line in lines), start=Decimal("0")
+    ).quantize(CENTS)
+
+
+def items_total(invoice: Invoice) -> Decimal:
+    """Total das linhas gravadas de uma fatura, numa consulta agregada."""
+    total = invoice.items.aggregate(
+        total=Sum(ExpressionWrapper(
+            F("quantity") * F("unit_price"), output_field=DecimalField(max_digits=20, decimal_places=4)
+        ))
+    )["total"]
+    return Decimal(total or 0).quantize(CENTS)
+
+
+def invoice_items(invoice: Invoice, lines) -> list[InvoiceItem]:
+    return [
+        InvoiceItem(
+            invoice=invoice, description=line.description, quantity=line.quantity, unit_price=line.unit_price
+        )
+        for line in lines
+    ]
+
+
+def build_invoice(
+    organization: Organization,
+    person: Person,
+    lines,
+    *,
+    issue_date: date | None = None,
+    status: str = Invoice.Status.DRAFT,
+) -> Invoice:
+    """Cria a fatura com as linhas (``InvoiceLine``) e o total, numa transação.
+
+    Duas escritas (fatura e linhas), independentemente do número de linhas.
+    """
+    lines = list(lines)
+    invoice = Invoice(organization=organization, person=person, status=status, total=lines_total(lines))
+    if issue_date is not None:
+        invoice.issue_date = issue_date
+    with transaction.atomic():
+        invoice.save()
+        InvoiceItem.objects.bulk_create(invoice_items(invoice, lines))
+    return invoice
+
+
+def save_invoice_items(invoice: Invoice, items=(), deleted=()) -> Invoice:
+    """Grava linhas novas/alteradas e apaga ``deleted``; o total é atualizado uma vez."""
+    new = [item for item in items if item.pk is None]
+    changed = [item for item in items if item.pk is not None]
+    with transaction.atomic():
+        if deleted:
+            InvoiceItem.objects.filter(invoice=invoice, pk__in=[item.pk for item in deleted]).delete()
+        for item in new:
+            item.invoice = invoice
+        InvoiceItem.objects.bulk_create(new)
+        InvoiceItem.objects.bulk_update(changed, ["description", "quantity", "unit_price"])
+        invoice.total = items_total(invoice)
+        invoice.save(update_fields=["total"])
+    return invoice
@@ -0,0 +1,32 @@
+"""
+Locks distribuídos simples sobre a cache partilhada.
+
+``cache.add`` só grava a chave se ainda não existir, operação atómica em
+Redis/Memcached, pelo que serve de exclusão mútua entre workers. O lock expira
+sozinho após ``timeout`` segundos se o processo que o detém morrer.
+"""
+from __future__ import annotations
+
+import uuid
+from contextlib import contextmanager
+
+from django.core.cache import cache
+
+
+@contextmanager
+def cache_lock(key: str, timeout: int = 600):
+    """Tenta obter o lock ``key`` sem bloquear.
+
+    Yields:
+        bool: True se o lock foi obtido (e é libertado à saída), False se outro
+        processo já o detém.
+    """
+    lock_key = f"lock:{key}"
+    token = uuid.uuid4().hex
+    acquired = cache.add(lock_key, token, timeout)
+    try:
+        yield acquired
+    finally:
+        # Não libertar um lock que entretanto expirou e foi obtido por outro processo
+        if acquired and cache.get(lock_key) == token:
+            cache.delete(lock_key)
@@ -0,0 +1,293 @@
+"""
+Outbox transacional para os efeitos secundários de ``Event`` e ``Booking`` (e
+dos modelos com valores de receita, ver ``RevenueSourceMixin``).
+
+As gravações destes modelos escrevem uma ``OutboxMessage`` na mesma transação
+(ver ``Event.save``/``Booking.save``), sem qualquer chamada ao broker no pedido
+HTTP. Um relay (``relay_outbox``, corrido pelo comando ``relay_outbox`` ou pela
+tarefa ``relay_outbox_task``) lê as mensagens pendentes por ordem de id em
+lotes, descarta duplicados do mesmo objeto e entrega-as aos handlers
+registados: sincronização Google (despacho agregado), invalidação de caches
+por versão e, via ``register_handler``, tarefas de outras apps
+(notificações, agregados de receita).
+
+A entrega é pelo menos uma vez: um lote só é marcado como processado depois de
+todos os handlers terem corrido, pelo que os handlers devem ser idempotentes.
+Recomenda-se um único relay para preservar a ordem entre lotes. Os handlers
+correm com as mensagens bloqueadas: chamadas ao broker e invalidações de cache
+são adiadas com ``publish`` para depois do commit do lote.
+
+As mensagens processadas ficam ``OUTBOX_RETENTION_DAYS`` dias para diagnóstico
+e são depois apagadas por ``purge_outbox`` (tarefa ``purge_outbox_task``).
+"""
+from __future__ import annotations
+
+import logging
+from datetime import datetime, timedelta
+from functools import partial
+from typing import Callable, Iterable
+
+from django.conf import settings
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import Event, GoogleCalendarConfig, OutboxMessage
+from .cache_versions import bump_cache_version
+from .google_sync_dispatch import mark_event_dirty
+
+logger = logging.getLogger(__name__)
+
+Topic = OutboxMessage.Topic
+
+# (tópicos, handler) por ordem de registo; cada handler recebe a lista de mensagens do lote
+_handlers: list[tuple[frozenset, Callable]] = []
+
+
+def register_handler(*topics: str):
+    """Regista ``handler(messages)`` para as mensagens dos ``topics`` indicados."""
+    def decorator(func):
+        _handlers.append((frozenset(topics), func))
+        return func
+    return decorator
+
+
+def publish(func: Callable, *args, **kwargs) -> None:
+    """Adia ``func(*args, **kwargs)`` para depois do commit do lote do relay.
+
+    Para chamadas ao broker e invalidações de cache feitas pelos handlers: não
+    correm com as mensagens bloqueadas e nunca antes de os dados estarem
+    visíveis. Uma falha fica registada sem afetar as restantes.
+    """
+    transaction.on_commit(partial(func, *args, **kwargs), robust=True)
+
+
+def record_event_change(event: Event, *, deleted: bool = False) -> OutboxMessage:
+    """Regista a alteração (ou eliminação) de um evento; chamar dentro da transação."""
+    payload = {}
+    if deleted:
+        # O evento deixa de existir: guardar o necessário para remover a cópia no Google
+        payload = {
+            "instructor_id": event.instructor_id,
+            "title": event.title,
+            "google_calendar_id": event.google_calendar_id,
+        }
+    return OutboxMessage.objects.create(
+        organization_id=event.organization_id,
+        topic=Topic.EVENT_DELETED if deleted else Topic.EVENT_CHANGED,
+        object_id=event.pk,
+        payload=payload,
+    )
+
+
+def record_booking_change(booking) -> OutboxMessage:
+    """Regista a alteração de uma reserva; chamar dentro da transação."""
+    return OutboxMessage.objects.create(
+        organization_id=booking.organization_id,
+        topic=Topic.BOOKING_CHANGED,
+        object_id=booking.pk,
+        payload={"event_id": booking.event_id, "person_id": booking.person_id, "status": booking.status},
+    )
+
+
+def record_booking_changes(bookings) -> list:
+    """Versão em lote de ``record_booking_change`` (``bulk_create``/``update`` de reservas)."""
+    return OutboxMessage.objects.bulk_create([
+        OutboxMessage(
+            organization_id=booking.organization_id,
+            topic=Topic.BOOKING_CHANGED,
+            object_id=booking.pk,
+            payload={"event_id": booking.event_id, "person_id": booking.person_id, "status": booking.status},
+        )
+        for booking in bookings
+    ])
+
+
+REVENUE_TOPICS = frozenset({Topic.PAYMENT_CHANGED, Topic.SUBSCRIPTION_CHANGED, Topic.COMMISSION_CHANGED})
+
+
+def stored_revenue_day(instance):
+    """Dia de receita da versão gravada de ``instance`` (None se ainda não existe).
+
+    Usa os valores guardados quando a instância foi lida da base de dados
+    (``RevenueSourceMixin.from_db``); só instâncias construídas à mão ou com
+    campos diferidos obrigam a ler a versão gravada.
+    """
+    if instance.pk is None:
+        return None
+    state = getattr(instance, "_stored_revenue_state", None)
+    if state is None or len(state) < len(instance.REVENUE_DAY_FIELDS):
+        stored = type(instance).objects.filter(pk=instance.pk).first()
+        return stored.revenue_day() if stored else None
+    if all(getattr(instance, name) == value for name, value in state.items()):
+        return instance.revenue_day()
+    stored = type(instance)(pk=instance.pk, organization_id=instance.organization_id, **state)
+    return stored.revenue_day()
+
+
+def record_revenue_days(organization_id: int, topic: str, days, object_id: int = 0) -> OutboxMessage | None:
+    """Regista dias de receita a recalcular; chamar dentro da transação.
+
+    Usado diretamente pelas gravações em lote (``bulk_create``/``update``), que
+    não passam por ``save()``.
+    """
+    days = {day for day in days if day}
+    if not days:
+        return None
+    return OutboxMessage.objects.create(
+        organization_id=organization_id,
+        topic=topic,
+        object_id=object_id,
+        payload={"days": sorted(day.isoformat() for day in days)},
+    )
+
+
+def record_revenue_change(instance, previous_day=None, *, deleted: bool = False) -> OutboxMessage | None:
+    """Regista os dias de receita afetados por uma gravação; chamar dentro da transação."""
+    days = {previous_day}
+    if not deleted:
+        days.add(instance.revenue_day())
+    return record_revenue_days(instance.organization_id, instance.REVENUE_TOPIC, days, object_id=instance.pk)
+
+
+def _object_key(message: OutboxMessage) -> tuple:
+    if message.topic in REVENUE_TOPICS:
+        # Cada mensagem traz dias diferentes (ex.: pagamento movido duas vezes): não colapsar
+        return message.topic, message.pk
+    # event.changed e event.deleted do mesmo evento colapsam: prevalece o mais recente
+    return message.topic.split(".", 1)[0], message.object_id
+
+
+def deduplicate(messages: Iterable[OutboxMessage]) -> list:
+    """Última mensagem de cada objeto, por ordem de id."""
+    latest = {}
+    for message in messages:
+        latest[_object_key(message)] = message
+    return sorted(latest.values(), key=lambda message: message.pk)
+
+
+def relay_outbox(batch_size: int | None = None) -> int:
+    """Entrega um lote de mensagens pendentes.
+
+    Returns:
+        int: mensagens lidas do outbox (0 quando não há nada pendente)
+    """
+    batch_size = batch_size or settings.OUTBOX_BATCH_SIZE
+    max_attempts = settings.OUTBOX_MAX_ATTEMPTS
+    with transaction.atomic():
+        batch = list(
+            OutboxMessage.objects.select_for_update(skip_locked=True)
+            .filter(processed_at__isnull=True)
+            .order_by("id")[:batch_size]
+        )
+        if not batch:
+            return 0
+
+        unique = deduplicate(batch)
+        failed = {}
+        for topics, handler in _handlers:
+            messages = [message for message in unique if message.topic in topics]
+            if not messages:
+                continue
+            try:
+                # Savepoint por handler: um erro de base de dados (ex. statement timeout no
+                # PostgreSQL) não aborta o lote e as tentativas continuam a ser contadas
+                with transaction.atomic():
+                    handler(messages)
+            except Exception as exc:  # handlers externos: qualquer falha deixa as mensagens pendentes
+                logger.exception("Handler do outbox %s falhou", handler.__name__)
+                for message in messages:
+                    failed[message.pk] = f"{handler.__name__}: {exc}"
+
+        now = timezone.now()
+        done = [message.pk for message in batch if message.pk not in failed]
+        OutboxMessage.objects.filter(pk__in=done).update(processed_at=now, attempts=F("attempts") + 1)
+        for message in batch:
+            if message.pk not in failed:
+                continue
+            give_up = message.attempts + 1 >= max_attempts
+            if give_up:
+                logger.error("Mensagem do outbox %s descartada após %s tentativas", message.pk, max_attempts)
+            OutboxMessage.objects.filter(pk=message.pk).update(
+                attempts=F("attempts") + 1,
+                last_error=failed[message.pk],
+                processed_at=now if give_up else None,
+            )
+    return len(batch)
+
+
+def drain_outbox(batch_size: int | None = None, max_batches: int | None = None) -> int:
+    """Entrega lotes até o outbox ficar vazio (ou até ``max_batches``)."""
+    total = 0
+    batches = 0
+    while max_batches is None or batches < max_batches:
+        relayed = relay_outbox(batch_size)
+        if not relayed:
+            break
+        total += relayed
+        batches += 1
+    return total
+
+
+PURGE_CHUNK_SIZE = 5000
+
+
+def purge_outbox(now: datetime | None = None) -> int:
+    """Apaga, em blocos, as mensagens processadas há mais de ``OUTBOX_RETENTION_DAYS`` dias.
+
+    Returns:
+        int: mensagens apagadas
+    """
+    cutoff = (now or timezone.now()) - timedelta(days=settings.OUTBOX_RETENTION_DAYS)
+    processed = OutboxMessage.objects.filter(processed_at__lt=cutoff)
+    deleted = 0
+    while True:
+        chunk = list(processed.order_by("pk").values_list("pk", flat=True)[:PURGE_CHUNK_SIZE])
+        if not chunk:
+            return deleted
+        deleted += OutboxMessage.objects.filter(pk__in=chunk).delete()[0]
+
+
+# --- Handlers do core -----------------------------------------------------------------
+
+
+@register_handler(Topic.EVENT_CHANGED, Topic.EVENT_DELETED, Topic.BOOKING_CHANGED, *REVENUE_TOPICS)
+def bump_schedule_caches(messages):
+    """Invalida o Gantt (eventos e reservas) e os relatórios (eventos e receita)."""
+    gantt = {message.organization_id for message in messages if message.topic not in REVENUE_TOPICS}
+    reports = {message.organization_id for message in messages if message.topic != Topic.BOOKING_CHANGED}
+    for organization_id in gantt:
+        publish(bump_cache_version, "gantt", organization_id)
+    for organization_id in reports:
+        publish(bump_cache_version, "reports", organization_id)
+
+
+@register_handler(Topic.EVENT_CHANGED, Topic.EVENT_DELETED, Topic.BOOKING_CHANGED)
+def dispatch_google_sync(messages):
+    """Marca os eventos afetados para o despacho agregado da sincronização Google.
+
+    As reservas também contam: a descrição enviada ao Google inclui a ocupação.
+    """
+    organizations = set(
+        GoogleCalendarConfig.objects.filter(
+            organization_id__in={message.organization_id for message in messages},
+            sync_enabled=True,
+            auto_sync_events=True,
+        ).values_list("organization_id", flat=True)
+    )
+    messages = [message for message in messages if message.organization_id in organizations]
+    deleted = {message.object_id: message for message in messages if message.topic == Topic.EVENT_DELETED}
+    changed_ids = {message.object_id for message in messages if message.topic == Topic.EVENT_CHANGED}
+    changed_ids.update(
+        message.payload["event_id"] for message in messages if message.topic == Topic.BOOKING_CHANGED
+    )
+    changed_ids.difference_update(deleted)
+
+    events = Event.objects.filter(pk__in=changed_ids, instructor__isnull=False).only(
+        "pk", "organization_id", "instructor_id", "title", "google_calendar_id"
+    )
+    for event in events:
+        publish(mark_event_dirty, event, auto_sync=True)
+    for message in deleted.values():
+        snapshot = Event(pk=message.object_id, organization_id=message.organization_id, **message.payload)
+        publish(mark_event_dirty, snapshot, deleted=True, auto_sync=True)
@@ -1,36 +1,157 @@
+"""
+Cotação de preços de produtos.
+
+Os preços de cada produto (``Price``, intervalos ``valid_from``..``valid_to``)
+são lidos uma vez para uma tabela ordenada (``PriceBook``) guardada em cache e
+procurados por data com ``bisect``. A elegibilidade para o desconto "ACR +
+Ginásio" (memberships ativas nas duas organizações, do próprio registo ou do
+mesmo cliente na outra organização via ``core.services.identity``) é resolvida
+para muitos clientes de uma vez pelos intervalos de ``core.services.eligibility``
+(uma consulta por organização) e também guardada em cache por cliente e dia.
+
+As entradas usam a versão de cache ``pricing`` da organização, incrementada
+quando um ``Price`` ou uma ``Membership`` é gravado ou apagado
+(``invalidate_pricing``).
+"""
 from __future__ import annotations
+
+from bisect import bisect_right
+from dataclasses import dataclass
 from datetime import date
 from decimal import Decimal
+
+from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Q
-from core.models import Organization, Person, Product, Price, Membership
 
+from core.models import Organization, Person, Price, Product
+
+from .cache_versions import bump_cache_version, cache_version
+from .eligibility import eligibility_for
+
+DISCOUNT_RATE = Decimal("0.90")
+DISCOUNT_DOMAINS = ("acr", "gym")
+PRICING_CACHE_TIMEOUT = 60 * 60
+# As organizações mudam raramente: a resolução por domínio expira sozinha
+DISCOUNT_ORGS_CACHE_TIMEOUT = 10 * 60
+
+
+@dataclass(frozen=True)
+class PriceBook:
+    """Intervalos de preço de um produto, ordenados por ``valid_from``."""
+    starts: tuple[date, ...]
+    ends: tuple[date | None, ...]
+    amounts: tuple[Decimal, ...]
+
+    @classmethod
+    def from_prices(cls, rows) -> "PriceBook":
+        rows = sorted(rows, key=lambda row: row[0])
+        return cls(
+            starts=tuple(row[0] for row in rows),
+            ends=tuple(row[1] for row in rows),
+            amounts=tuple(Decimal(row[2]) for row in rows),
+        )
+
+    def price_on(self, day: date) -> Decimal | None:
+        """Preço em vigor em ``day``: o de início mais recente ainda válido."""
+        index = bisect_right(self.starts, day)
+        while index > 0:
+            index -= 1
+            end = self.ends[index]
+            if end is None or end >= day:
+                return self.amounts[index]
+        return None
+
+
+def invalidate_pricing(organization_id: int) -> None:
+    """Invalida preços e elegibilidade em cache da organização (após o commit)."""
+    transaction.on_commit(lambda: bump_cache_version("pricing", organization_id))
 
-def has_active_membership(person: Person, org: Organization, day: date) -> bool:
-    qs = Membership.objects.filter(person=person, organization=org, status=Membership.Status.ACTIVE)
-    return qs.filter(starts_on__lte=day).filter(Q(ends_on__isnull=True) | Q(ends_on__gte=day)).exists()
 
+def price_book(product: Product) -> PriceBook:
+    version = cache_version("pricing", product.organization_id)
+    key = f"pricing:book:{product.pk}:v{version}"
+    book = cache.get(key)
+    if book is None:
+        book = PriceBook.from_prices(
+            Price.objects.filter(product=product, organization=product.organization_id)
+            .values_list("valid_from", "valid_to", "amount")
+            .order_by()
+        )
+        cache.set(key, book, timeout=PRICING_CACHE_TIMEOUT)
+    return book
 
-def compute_price(person: Person, product: Product, day: date) -> Decimal:
-    # Preço ativo para o produto/organização
-    price = (
-        Price.objects.filter(product=product, organization=product.organization, valid_from__lte=day)
-        .filter(Q(valid_to__isnull=True) | Q(valid_to__gte=day))
-        .order_by("-valid_from")
-        .first()
+
+def discount_organizations() -> tuple[int, int] | None:
+    """Ids das organizações do desconto (ACR e ginásio), ou None se não houver par único."""
+    key = "pricing:discount-orgs"
+    cached = cache.get(key)
+    if cached is None:
+        rows = list(
+            Organization.objects.filter(
+                Q(domain__icontains=DISCOUNT_DOMAINS[0]) | Q(domain__icontains=DISCOUNT_DOMAINS[1])
+            ).values_list("pk", "domain")
+        )
+        ids = []
+        for needle in DISCOUNT_DOMAINS:
+            matches = [pk for pk, domain in rows if needle in domain.lower()]
+            ids.append(matches[0] if len(matches) == 1 else None)
+        cached = tuple(ids) if None not in ids else ()
+        cache.set(key, cached, timeout=DISCOUNT_ORGS_CACHE_TIMEOUT)
+    return cached or None
+
+
+def _linked_records(person_ids) -> dict[int, set[int]]:
+    """Registos de cada cliente: o próprio e os da mesma identidade (NIF/email)."""
+    records = {pk: {pk} for pk in person_ids}
+    rows = Person.objects.filter(pk__in=person_ids, identities__isnull=False).values_list(
+        "pk", "identities__people"
     )
-    if not price:
-        raise ValueError("Sem preço ativo para este produto")
+    for pk, linked_id in rows:
+        records[pk].add(linked_id)
+    return records
 
-    amount = Decimal(price.amount)
 
-    # Desconto “ACR + Ginásio” (exemplo 10%) — se ambas memberships ativas
-    try:
-        acr = Organization.objects.get(domain__icontains="acr")
-        gym = Organization.objects.get(domain__icontains="gym")
-    except Organization.DoesNotExist:
-        return amount
+def discount_eligible(person_ids, day: date, request=None) -> set[int]:
+    """Clientes com memberships ativas nas duas organizações do desconto em ``day``.
+
+    A membership pode estar no registo do próprio cliente ou no registo da mesma
+    identidade (NIF/email) na outra organização. A atividade de cada registo é
+    respondida por ``eligibility_for`` (partilhada durante o pedido, se
+    ``request``).
+    """
+    organizations = discount_organizations()
+    person_ids = set(person_ids)
+    if not organizations or not person_ids:
+        return set()
 
-    if has_active_membership(person, acr, day) and has_active_membership(person, gym, day):
-        amount = (amount * Decimal("0.90")).quantize(Decimal("0.01"))
+    versions = ".".join(str(cache_version("pricing", org_id)) for org_id in organizations)
+    prefix = f"pricing:discount:{organizations[0]}:{organizations[1]}:v{versions}:{day.isoformat()}:"
+    cached = cache.get_many([f"{prefix}{pk}" for pk in person_ids])
+    eligible = {pk for pk in person_ids if cached.get(f"{prefix}{pk}")}
+    missing = [pk for pk in person_ids if f"{prefix}{pk}" not in cached]
+    if missing:
+        records = _linked_records(missing)
+        candidates = set().union(*records.values())
+        active = [eligibility_for(org_id, request).active_on(candidates, day) for org_id in organizations]
+        found = {pk for pk, linked in records.items() if all(linked & active_ids for active_ids in active)}
+        cache.set_many({f"{prefix}{pk}": pk in found for pk in missing}, timeout=PRICING_CACHE_TIMEOUT)
+        eligible |= found
+    return eligible
 
-    return amount
+
+def quote_many(persons, product: Product, day: date, request=None) -> dict[int, Decimal]:
+    """Preço do produto em ``day`` para cada cliente (``{person_id: valor}``)."""
+    amount = price_book(product).price_on(day)
+    if amount is None:
+        raise ValueError("Sem preço ativo para este produto")
+
+    person_ids = [getattr(person, "pk", person) for person in persons]
+    eligible = discount_eligible(person_ids, day, request)
+    discounted = (amount * DISCOUNT_RATE).quantize(Decimal("0.01"))
+    return {pk: discounted if pk in eligible else amount for pk in person_ids}
+
+
+def compute_price(person: Person, product: Product, day: date, request=None) -> Decimal:
+    # Desconto “ACR + Ginásio” (exemplo 10%) — se ambas memberships ativas
+    return quote_many([person], product, day, request)[person.pk]
@@ -0,0 +1,64 @@
+"""
+Limitação de débito partilhada entre processos (token bucket sobre a cache).
+
+Cada janela de ``period`` segundos repõe ``capacity`` tokens. O consumo usa
+``cache.incr``, que é atómico em Redis/Memcached, pelo que vários workers
+Celery ligados à mesma cache respeitam um único limite global.
+"""
+from __future__ import annotations
+
+import time
+
+from django.core.cache import cache
+
+
+class RateLimiter:
+    """Token bucket com reposição por janela, identificado por ``key``."""
+
+    def __init__(self, key: str, capacity: int, period: float = 1.0, *, clock=None, sleep=None):
+        if capacity <= 0:
+            raise ValueError("capacity deve ser positivo")
+        self.key = key
+        self.capacity = capacity
+        self.period = period
+        self._clock = clock or time.time
+        self._sleep = sleep or time.sleep
+
+    def try_acquire(self, tokens: int = 1) -> float:
+        """Tenta consumir ``tokens``.
+
+        Returns:
+            float: 0 se os tokens foram consumidos; caso contrário, os segundos
+            até à próxima reposição.
+        """
+        if tokens > self.capacity:
+            raise ValueError("Pedido excede a capacidade do limitador")
+
+        now = self._clock()
+        window = int(now // self.period)
+        bucket_key = f"ratelimit:{self.key}:{window}"
+        # Janela expira sozinha; margem para relógios ligeiramente desalinhados
+        cache.add(bucket_key, 0, timeout=int(self.period * 2) + 1)
+        try:
+            used = cache.incr(bucket_key, tokens)
+        except ValueError:
+            # A chave expirou entre o add e o incr
+            cache.add(bucket_key, tokens, timeout=int(self.period * 2) + 1)
+            used = tokens
+
+        if used <= self.capacity:
+            return 0.0
+
+        cache.decr(bucket_key, tokens)
+        return max((window + 1) * self.period - now, 0.001)
+
+    def acquire(self, tokens: int = 1, timeout: float | None = None) -> bool:
+        """Bloqueia até obter ``tokens`` (ou até ``timeout`` segundos)."""
+        deadline = None if timeout is None else self._clock() + timeout
+        while True:
+            wait = self.try_acquire(tokens)
+            if not wait:
+                return True
+            if deadline is not None and self._clock() + wait > deadline:
+                return False
+            self._sleep(wait)
@@ -33,6 +33,47 @@ def ensure_no_conflict(event: "app_models.Event") -> None:
         raise ValidationError("Conflito de horário: já existe um evento no mesmo espaço e intervalo.")
 
 
+def find_conflicting_events(events) -> set:
+    """Versão em lote de ``ensure_no_conflict`` para eventos com novos horários.
+
+    Usa uma única consulta para os eventos vizinhos de todos os recursos
+    envolvidos e compara também os eventos do lote entre si.
+
+    Returns:
+        set: ids dos eventos do lote que ficariam sobrepostos no mesmo recurso
+    """
+    events = [e for e in events if e.resource_id and e.starts_at and e.ends_at]
+    if not events:
+        return set()
+
+    batch_ids = {e.pk for e in events if e.pk}
+    others = app_models.Event.objects.filter(
+        organization_id__in={e.organization_id for e in events},
+        resource_id__in={e.resource_id for e in events},
+        starts_at__lt=max(e.ends_at for e in events),
+        ends_at__gt=min(e.starts_at for e in events),
+    ).exclude(pk__in=batch_ids).values_list("pk", "organization_id", "resource_id", "starts_at", "ends_at")
+
+    by_resource = {}
+    for pk, organization_id, resource_id, starts_at, ends_at in others:
+        by_resource.setdefault((organization_id, resource_id), []).append((pk, starts_at, ends_at))
+    for event in events:
+        by_resource.setdefault((event.organization_id, event.resource_id), []).append(
+            (event.pk, event.starts_at, event.ends_at)
+        )
+
+    conflicts = set()
+    for intervals in by_resource.values():
+        intervals.sort(key=lambda interval: interval[1])
+        latest_pk, latest_end = None, None
+        for pk, starts_at, ends_at in intervals:
+            if latest_end is not None and starts_at < latest_end:
+                conflicts.update({pk, latest_pk})
+            if latest_end is None or ends_at > latest_end:
+                latest_pk, latest_end = pk, ends_at
+    return conflicts & batch_ids
+
+
 def ensure_capacity(booking: "app_models.Booking") -> None:
     """Valida capacidade do evento e regras básicas da reserva.
 
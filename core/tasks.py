@@ -1,23 +1,73 @@
-from celery import shared_task
+import logging
+from datetime import date, datetime, time, timedelta
+
+from celery import group, shared_task
 from django.core.exceptions import ObjectDoesNotExist
+from django.utils import timezone
+
+from .models import Organization, Instructor, Event, InstructorGoogleCalendar
+from .services.billing import billing_run
+from .services.commissions import close_month
+from .services.credits import take_snapshots, verify_snapshots
+from .services.expiry import run_expiry
+from .services.google_calendar import GoogleQuotaExceeded, get_google_calendar_service
+from .services.google_sync_dispatch import flush_event_sync
+from .services.locks import cache_lock
+from .services.outbox import drain_outbox, purge_outbox
+
+logger = logging.getLogger(__name__)
 
-from .models import Organization, Instructor, Event
-from .services.google_calendar import get_google_calendar_service
+# Tempo máximo de uma sincronização de instrutor (o lock expira depois disto)
+INSTRUCTOR_SYNC_LOCK_TIMEOUT = 15 * 60
 
+# Só a quota da API justifica repetir; os restantes erros ficam nos logs de sincronização
+QUOTA_RETRY_OPTIONS = {
+    "autoretry_for": (GoogleQuotaExceeded,),
+    "retry_backoff": 30,
+    "retry_backoff_max": 15 * 60,
+    "retry_jitter": True,
+    "retry_kwargs": {"max_retries": 5},
+}
 
-@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={"max_retries": 3})
+
+@shared_task(bind=True, **QUOTA_RETRY_OPTIONS)
 def sync_instructor_events_task(self, organization_id: int, instructor_id: int) -> dict:
     try:
         organization = Organization.objects.get(id=organization_id)
-        instructor = Instructor.objects.get(id=instructor_id, organization=organization)
+        instructor = Instructor.objects.select_related("google_calendar").get(
+            id=instructor_id, organization=organization
+        )
     except ObjectDoesNotExist as exc:
         return {"success": 0, "imported": 0, "errors": 1, "skipped": 0, "error": str(exc)}
 
-    service = get_google_calendar_service(organization)
-    return service.sync_all_instructor_events(instructor)
+    with cache_lock(f"google-sync:instructor:{instructor_id}", timeout=INSTRUCTOR_SYNC_LOCK_TIMEOUT) as acquired:
+        if not acquired:
+            # Outro worker já está a sincronizar este instrutor
+            return {"success": 0, "imported": 0, "errors": 0, "skipped": 0, "locked": True}
+        service = get_google_calendar_service(organization)
+        return service.sync_all_instructor_events(instructor)
+
 
+def organization_sync_group(organization_id: int):
+    """Grupo Celery com uma sincronização por instrutor ativo com calendário Google."""
+    instructor_ids = InstructorGoogleCalendar.objects.filter(
+        instructor__organization_id=organization_id,
+        instructor__is_active=True,
+        sync_enabled=True,
+    ).exclude(google_calendar_id="").values_list("instructor_id", flat=True)
+    return group(sync_instructor_events_task.s(organization_id, instructor_id) for instructor_id in instructor_ids)
 
-@shared_task(bind=True, autoretry_for=(Exception,), retry_backoff=True, retry_kwargs={"max_retries": 3})
+
+@shared_task
+def sync_organization_events_task(organization_id: int):
+    """Sincroniza todos os instrutores da organização em paralelo pelos workers."""
+    job = organization_sync_group(organization_id)
+    if not job.tasks:
+        return None
+    return job.apply_async().id
+
+
+@shared_task(bind=True, **QUOTA_RETRY_OPTIONS)
 def sync_event_task(self, organization_id: int, event_id: int) -> dict:
     try:
         organization = Organization.objects.get(id=organization_id)
@@ -28,3 +78,69 @@ def sync_event_task(self, organization_id: int, event_id: int) -> dict:
     service = get_google_calendar_service(organization)
     result = service.sync_event_to_google(event)
     return {"success": bool(result)}
+
+
+@shared_task(bind=True, acks_late=True)
+def flush_event_sync_task(self, event_id: int) -> dict:
+    """Sincroniza um evento após o período de acalmia (ver ``mark_event_dirty``)."""
+    # Em modo eager o countdown é ignorado: sincronizar de imediato em vez de reagendar
+    result = flush_event_sync(event_id, force=self.request.is_eager)
+    if result["status"] == "waiting" and not self.request.is_eager:
+        self.apply_async(args=[event_id], countdown=result["countdown"])
+    return result
+
+
+@shared_task
+def relay_outbox_task(max_batches: int = 20) -> int:
+    """Entrega as mensagens pendentes do outbox (agendada pelo Celery beat)."""
+    with cache_lock("outbox-relay", timeout=5 * 60) as acquired:
+        # Um relay de cada vez preserva a ordem das mensagens
+        if not acquired:
+            return 0
+        return drain_outbox(max_batches=max_batches)
+
+
+@shared_task
+def purge_outbox_task() -> int:
+    """Apaga as mensagens do outbox processadas há mais de ``OUTBOX_RETENTION_DAYS`` dias."""
+    return purge_outbox()
+
+
+@shared_task
+def close_commissions_task(organization_id: int | None = None, year: int | None = None, month: int | None = None) -> dict:
+    """Fecho das comissões (por omissão, do mês anterior) de cada organização."""
+    if not (year and month):
+        previous = timezone.localdate().replace(day=1) - timedelta(days=1)
+        year, month = previous.year, previous.month
+    organizations = Organization.objects.order_by("pk")
+    if organization_id:
+        organizations = organizations.filter(pk=organization_id)
+    return {organization.pk: close_month(organization, year, month) for organization in organizations}
+
+
+@shared_task
+def billing_run_task(organization_id: int | None = None, period: str | None = None) -> dict:
+    """Mensalidades do mês (por omissão, o atual) de cada organização; repetir não duplica."""
+    day = date.fromisoformat(period) if period else timezone.localdate()
+    organizations = Organization.objects.order_by("pk")
+    if organization_id:
+        organizations = organizations.filter(pk=organization_id)
+    return {organization.pk: billing_run(organization, day) for organization in organizations}
+
+
+@shared_task
+def credit_snapshots_task() -> dict:
+    """Snapshot mensal dos saldos de créditos (início do mês local) e verificação."""
+    month_start = timezone.localdate().replace(day=1)
+    taken_at = timezone.make_aware(datetime.combine(month_start, time.min))
+    created = take_snapshots(taken_at)
+    mismatches = verify_snapshots()
+    if mismatches:
+        logger.error("Snapshots de créditos inconsistentes com o histórico: %s", mismatches[:50])
+    return {"taken_at": taken_at.isoformat(), "created": created, "mismatches": len(mismatches)}
+
+
+@shared_task
+def expire_subscriptions_task() -> dict:
+    """Expiração noturna de créditos e subscrições terminados (todas as organizações)."""
+    return run_expiry()
@@ -74,6 +74,7 @@ urlpatterns = [
     path('google-calendar/instructors/<int:instructor_id>/create/', google_calendar_views.google_calendar_create_instructor_calendar, name='google_calendar_create_instructor_calendar'),
     path('google-calendar/instructors/<int:instructor_id>/sync/', google_calendar_views.google_calendar_sync_instructor, name='google_calendar_sync_instructor'),
     path('google-calendar/instructors/<int:instructor_id>/toggle/', google_calendar_views.google_calendar_toggle_instructor_sync, name='google_calendar_toggle_instructor_sync'),
+    path('google-calendar/instructors/sync-all/', google_calendar_views.google_calendar_sync_all, name='google_calendar_sync_all'),
     path('google-calendar/sync-logs/', google_calendar_views.google_calendar_sync_logs, name='google_calendar_sync_logs'),
     path('google-calendar/settings/', google_calendar_views.google_calendar_settings, name='google_calendar_settings'),
     path('google-calendar/oauth/start/', google_calendar_views.google_calendar_oauth_start, name='google_calendar_oauth_start'),
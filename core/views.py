@@ -11,6 +11,7 @@ from django.db import IntegrityError, DatabaseError
 from django.core.exceptions import ValidationError
 from .auth_views import role_required
 from .services.bookings import cancel_booking
+from .services.cache_versions import cache_version
 from .models import Person, Event, Booking, Resource, Modality, Instructor, ClassGroup
 
 logger = logging.getLogger(__name__)
@@ -482,7 +483,9 @@ class OptimizedGanttAPI:
 
         resource_ids = sorted({int(rid) for rid in resource_ids if rid.isdigit()})
         resource_key = ",".join(str(rid) for rid in resource_ids) if resource_ids else "all"
-        cache_key = f"gantt:events:{org.id}:{selected_date.isoformat()}:{resource_key}"
+        # A versão muda sempre que o outbox regista alterações a eventos/reservas da organização
+        version = cache_version("gantt", org.id)
+        cache_key = f"gantt:events:{org.id}:v{version}:{selected_date.isoformat()}:{resource_key}"
         cached = cache.get(cache_key)
         if cached:
             return JsonResponse(cached)
@@ -1,4 +1,3 @@
-import csv
 from datetime import datetime, timedelta
 
 from django.shortcuts import render, get_object_or_404, redirect
@@ -8,14 +7,20 @@ from django.core.paginator import Paginator
 from django.db import DatabaseError
 from django.db.models import Q, Count
 from django.db.models.deletion import ProtectedError
-from django.http import JsonResponse, HttpResponse
+from django.http import JsonResponse
 from django.urls import reverse
 from django.utils import timezone
 from django.utils.dateparse import parse_date
 from django.views.decorators.http import require_http_methods
 
-from .models import Person, Instructor, Modality, Event, Resource, Payment, Booking
+from reports.models import RevenueBucket
+from reports.revenue import revenue_total
+
+from .models import Person, Instructor, Modality, Event, Resource, Booking
 from .forms import PersonForm, InstructorForm, ModalityForm, EventForm, BookingForm, ResourceForm
+from .services.exports import (
+    BOOKING_EXPORT_HEADER, EVENT_EXPORT_HEADER, booking_export_rows, csv_response, date_bounds, event_export_rows
+)
 
 
 @role_required(["admin", "staff"])
@@ -62,14 +67,9 @@ def dashboard(request):
         starts_at__lte=tomorrow
     ).select_related('resource', 'modality', 'instructor').order_by('starts_at')[:5]
 
-    # Receitas do mês atual (corrigido)
-    current_month = timezone.now().replace(day=1)
-    monthly_payments = Payment.objects.filter(
-        organization=org,
-        status=Payment.Status.COMPLETED,
-        paid_date__gte=current_month
-    )
-    monthly_revenue = sum(payment.amount for payment in monthly_payments)
+    # Receitas do mês atual (agregados de receita, sem ler os pagamentos)
+    today = timezone.localdate()
+    monthly_revenue = revenue_total(org, today.replace(day=1), today, source=RevenueBucket.Source.PAYMENT)
 
     # Clientes recentes (últimos 7 dias)
     week_ago = timezone.now() - timedelta(days=7)
@@ -612,11 +612,7 @@ def event_list(request):
     org = request.organization
 
     # Base queryset
-    events_qs = Event.objects.filter(organization=org).select_related(
-        'resource', 'modality', 'instructor'
-    ).annotate(
-        active_bookings_count=Count('bookings', filter=Q(bookings__status=Booking.Status.CONFIRMED))
-    ).order_by('-starts_at')
+    events_qs = Event.objects.filter(organization=org).order_by('-starts_at')
 
     # Filtros (opcional)
     search = request.GET.get('search') or ''
@@ -624,6 +620,8 @@ def event_list(request):
     instructor_filter = request.GET.get('instructor') or ''
     resource_filter = request.GET.get('resource') or ''
     period_filter = request.GET.get('period') or 'all'
+    start_date = parse_date(request.GET.get('start_date') or '')
+    end_date = parse_date(request.GET.get('end_date') or '')
 
     if search:
         events_qs = events_qs.filter(title__icontains=search)
@@ -644,37 +642,25 @@ def event_list(request):
         events_qs = events_qs.filter(starts_at__date__gte=start)
     elif period_filter == 'upcoming':
         events_qs = events_qs.filter(starts_at__gte=timezone.now())
+    range_start, range_end = date_bounds(start_date, end_date)
+    if range_start:
+        events_qs = events_qs.filter(starts_at__gte=range_start)
+    if range_end:
+        events_qs = events_qs.filter(starts_at__lt=range_end)
 
     export = request.GET.get('export')
     if export == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=eventos.csv'
-        writer = csv.writer(response)
-        writer.writerow([
-            'Data Inicio', 'Hora Inicio', 'Hora Fim', 'Titulo', 'Modalidade',
-            'Instrutor', 'Espaco', 'Capacidade', 'Reservas', 'Estado'
-        ])
-        now = timezone.now()
-        for ev in events_qs.iterator():
-            if ev.starts_at > now:
-                status_label = 'Agendada'
-            elif ev.ends_at < now:
-                status_label = 'Concluida'
-            else:
-                status_label = 'A decorrer'
-            writer.writerow([
-                ev.starts_at.strftime('%Y-%m-%d'),
-                ev.starts_at.strftime('%H:%M'),
-                ev.ends_at.strftime('%H:%M'),
-                ev.title,
-                ev.modality.name if ev.modality else '',
-                ev.instructor.full_name if ev.instructor else '',
-                ev.resource.name if ev.resource else '',
-                ev.capacity,
-                ev.active_bookings_count,
-                status_label,
-            ])
-        return response
+        # Streaming em memória constante; ?gzip=1 comprime à medida
+        return csv_response(
+            'eventos.csv', EVENT_EXPORT_HEADER, event_export_rows(events_qs),
+            compress=request.GET.get('gzip') == '1',
+        )
+
+    events_qs = events_qs.select_related(
+        'resource', 'modality', 'instructor'
+    ).annotate(
+        active_bookings_count=Count('bookings', filter=Q(bookings__status=Booking.Status.CONFIRMED))
+    )
 
     # Paginação
     paginator = Paginator(events_qs, 20)
@@ -803,26 +789,18 @@ def booking_list(request):
         )
     if status_filter:
         bookings = bookings.filter(status=status_filter)
-    if start_date:
-        bookings = bookings.filter(event__starts_at__date__gte=start_date)
-    if end_date:
-        bookings = bookings.filter(event__starts_at__date__lte=end_date)
+    range_start, range_end = date_bounds(start_date, end_date)
+    if range_start:
+        bookings = bookings.filter(event__starts_at__gte=range_start)
+    if range_end:
+        bookings = bookings.filter(event__starts_at__lt=range_end)
 
     if request.GET.get('export') == 'csv':
-        response = HttpResponse(content_type='text/csv')
-        response['Content-Disposition'] = 'attachment; filename=reservas.csv'
-        writer = csv.writer(response)
-        writer.writerow(['Evento', 'Data', 'Hora', 'Cliente', 'Estado', 'Criada em'])
-        for booking in bookings.iterator():
-            writer.writerow([
-                booking.event.title,
-                booking.event.starts_at.strftime('%Y-%m-%d'),
-                booking.event.starts_at.strftime('%H:%M'),
-                booking.person.full_name,
-                booking.status,
-                booking.created_at.strftime('%Y-%m-%d %H:%M'),
-            ])
-        return response
+        # Streaming em memória constante; ?gzip=1 comprime à medida
+        return csv_response(
+            'reservas.csv', BOOKING_EXPORT_HEADER, booking_export_rows(bookings),
+            compress=request.GET.get('gzip') == '1',
+        )
 
     paginator = Paginator(bookings, 20)
     page_number = request.GET.get('page')
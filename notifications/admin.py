@@ -0,0 +1,23 @@
+from django.contrib import admin, messages
+
+from core.admin import OrgScopedAdmin, admin_site
+from .models import Segment
+from .segments import refresh_segment
+
+
+class SegmentAdmin(OrgScopedAdmin):
+    list_display = ("name", "organization", "member_count", "refreshed_at")
+    list_filter = ("organization",)
+    search_fields = ("name",)
+    readonly_fields = ("member_count", "refreshed_at")
+    actions = ["refresh_members"]
+
+    @admin.action(description="Recalcular membros dos segmentos selecionados")
+    def refresh_members(self, request, queryset):
+        for segment in queryset:
+            refresh_segment(segment, full=True)
+        self.message_user(request, f"{queryset.count()} segmentos atualizados.", messages.SUCCESS)
+
+
+admin_site.register(Segment, SegmentAdmin)
+admin.site.register(Segment, SegmentAdmin)
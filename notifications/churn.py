@@ -0,0 +1,237 @@
+"""
+Pontuação de risco de abandono (``Person.lifecycle_stage``).
+
+Corrida em lote (todas as noites, ver ``score_churn_task``): as métricas de
+cada cliente são lidas em três consultas agregadas (pessoas, reservas,
+subscrições ativas), a pontuação é calculada com aritmética vetorial NumPy e só
+as pessoas cuja fase muda são gravadas, com ``bulk_update`` por blocos.
+
+Fatores (0 = sem risco, 1 = risco máximo) e pesos em ``CHURN_WEIGHTS``:
+
+- ``recency``: dias desde a última aula frequentada (máximo a partir de
+  ``CHURN_RECENCY_DAYS``);
+- ``frequency``: queda das reservas dos últimos 30 dias face à média mensal dos
+  60 dias anteriores;
+- ``subscription``: subscrição ativa a terminar (ou nenhuma);
+- ``credits``: poucos créditos por usar nas subscrições ativas de planos de
+  créditos (planos mensais/ilimitados não contam);
+- ``no_show``: proporção de faltas nos últimos 90 dias.
+
+Transições: um ``subscriber`` (fase por omissão de ``Person``) com subscrição
+ativa ou aulas nos últimos 30 dias passa a ``member`` e é avaliado como tal na
+mesma corrida; ``member`` passa a ``churn_risk`` com pontuação
+``>= CHURN_RISK_THRESHOLD`` e volta a ``member`` abaixo do limiar menos
+``CHURN_RECOVERY_MARGIN``; sem aulas há ``CHURNED_AFTER_DAYS`` e sem subscrição
+ativa (e cliente há pelo menos esse tempo) passa a ``churned``; um ``churned``
+que volte a reservar é de novo ``member``. Os ``subscriber`` sem subscrição nem
+aulas recentes e os ``lead`` não são tocados.
+
+O ``updated_at`` das pessoas alteradas é atualizado para que o refresh
+incremental dos segmentos (ex. o segmento ``CHURN_SEGMENT_NAME``, usado nas
+campanhas de retenção) as reavalie.
+"""
+from __future__ import annotations
+
+from datetime import timedelta
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count, Max, Q, Sum
+from django.utils import timezone
+
+from core.models import Booking, ClientSubscription, PaymentPlan, Person
+
+from .models import Segment
+
+SUBSCRIBER = "subscriber"
+MEMBER = "member"
+CHURN_RISK = "churn_risk"
+CHURNED = "churned"
+SCORED_STAGES = (SUBSCRIBER, MEMBER, CHURN_RISK, CHURNED)
+
+CHURN_WEIGHTS = {
+    "recency": 0.35,
+    "frequency": 0.25,
+    "subscription": 0.2,
+    "credits": 0.1,
+    "no_show": 0.1,
+}
+# Dias sem aulas a partir dos quais o fator de recência é máximo
+CHURN_RECENCY_DAYS = 45
+# Dias até ao fim da subscrição a partir dos quais o fator começa a subir
+CHURN_SUBSCRIPTION_DAYS = 21
+# Créditos a partir dos quais o fator de créditos é nulo
+CHURN_COMFORTABLE_CREDITS = 4
+CHURN_RECOVERY_MARGIN = 0.15
+CHURN_SEGMENT_NAME = "Risco de abandono"
+UPDATE_CHUNK_SIZE = 2000
+ATTENDED_STATUSES = (Booking.Status.CONFIRMED, Booking.Status.CHECKED_IN)
+
+
+def load_churn_features(organization_id: int, now=None) -> dict:
+    """Métricas por pessoa (arrays alinhados por ``ids``), em três consultas."""
+    now = now or timezone.now()
+    people = list(
+        Person.objects.filter(
+            organization_id=organization_id, status=Person.Status.ACTIVE, lifecycle_stage__in=SCORED_STAGES
+        ).order_by("pk").values_list("pk", "lifecycle_stage", "created_at")
+    )
+    count = len(people)
+    ids = np.fromiter((pk for pk, _, _ in people), dtype=np.int64, count=count)
+    features = {
+        "ids": ids,
+        "stages": np.array([stage for _, stage, _ in people], dtype=object),
+        "age_days": np.fromiter(
+            ((now - created_at).total_seconds() / 86400 for _, _, created_at in people), dtype=np.float64, count=count
+        ),
+        "recent": np.zeros(count),
+        "previous": np.zeros(count),
+        "no_shows": np.zeros(count),
+        "bookings_90d": np.zeros(count),
+        "days_since_last": np.full(count, np.inf),
+        "credits": np.zeros(count),
+        "has_subscription": np.zeros(count, dtype=bool),
+        "has_credit_plan": np.zeros(count, dtype=bool),
+        "days_to_end": np.full(count, np.inf),
+    }
+    if not count:
+        return features
+
+    def positions(person_ids):
+        return np.searchsorted(ids, np.asarray(person_ids, dtype=np.int64))
+
+    past = Q(event__starts_at__lte=now)
+    attended = past & Q(status__in=ATTENDED_STATUSES)
+    bookings = list(
+        Booking.objects.filter(
+            organization_id=organization_id, person__lifecycle_stage__in=SCORED_STAGES,
+            person__status=Person.Status.ACTIVE, event__starts_at__gte=now - timedelta(days=365),
+        ).values("person_id").annotate(
+            recent=Count("pk", filter=attended & Q(event__starts_at__gt=now - timedelta(days=30))),
+            previous=Count("pk", filter=attended & Q(
+                event__starts_at__gt=now - timedelta(days=90), event__starts_at__lte=now - timedelta(days=30)
+            )),
+            no_shows=Count("pk", filter=past & Q(status=Booking.Status.NO_SHOW, event__starts_at__gt=now - timedelta(days=90))),
+            bookings_90d=Count("pk", filter=past & Q(event__starts_at__gt=now - timedelta(days=90))),
+            last=Max("event__starts_at", filter=attended),
+        ).order_by()
+    )
+    if bookings:
+        index = positions([row["person_id"] for row in bookings])
+        for key in ("recent", "previous", "no_shows", "bookings_90d"):
+            features[key][index] = [row[key] for row in bookings]
+        features["days_since_last"][index] = [
+            (now - row["last"]).total_seconds() / 86400 if row["last"] else np.inf for row in bookings
+        ]
+
+    credit_plan = Q(payment_plan__plan_type=PaymentPlan.PlanType.CREDITS)
+    subscriptions = list(
+        ClientSubscription.objects.filter(
+            organization_id=organization_id, status=ClientSubscription.Status.ACTIVE,
+            person__lifecycle_stage__in=SCORED_STAGES, person__status=Person.Status.ACTIVE,
+        ).values("person_id").annotate(
+            credits=Sum("remaining_credits", filter=credit_plan),
+            credit_plans=Count("pk", filter=credit_plan),
+            open_ended=Count("pk", filter=Q(end_date__isnull=True)),
+            end=Max("end_date"),
+        ).order_by()
+    )
+    if subscriptions:
+        index = positions([row["person_id"] for row in subscriptions])
+        today = timezone.localdate(now)
+        features["has_subscription"][index] = True
+        features["has_credit_plan"][index] = [row["credit_plans"] > 0 for row in subscriptions]
+        features["credits"][index] = [row["credits"] or 0 for row in subscriptions]
+        features["days_to_end"][index] = [
+            np.inf if row["open_ended"] or row["end"] is None else (row["end"] - today).days
+            for row in subscriptions
+        ]
+    return features
+
+
+def churn_scores(features: dict) -> np.ndarray:
+    """Pontuação 0..1 por pessoa (média pesada dos fatores)."""
+    recency = np.clip(features["days_since_last"] / CHURN_RECENCY_DAYS, 0, 1)
+
+    # Média mensal dos 60 dias anteriores vs. últimos 30 dias
+    baseline = features["previous"] / 2
+    frequency = np.where(
+        baseline > 0,
+        np.clip(1 - features["recent"] / np.maximum(baseline, 1e-9), 0, 1),
+        np.where(features["recent"] > 0, 0.0, 0.5),
+    )
+
+    days_to_end = features["days_to_end"]
+    subscription = np.where(
+        features["has_subscription"], np.clip(1 - days_to_end / CHURN_SUBSCRIPTION_DAYS, 0, 1), 1.0
+    )
+    credits = np.where(
+        features["has_credit_plan"], np.clip(1 - features["credits"] / CHURN_COMFORTABLE_CREDITS, 0, 1),
+        np.where(features["has_subscription"], 0.0, 1.0),
+    )
+    no_show = np.clip(features["no_shows"] / np.maximum(features["bookings_90d"], 1), 0, 1)
+
+    return (
+        CHURN_WEIGHTS["recency"] * recency
+        + CHURN_WEIGHTS["frequency"] * frequency
+        + CHURN_WEIGHTS["subscription"] * subscription
+        + CHURN_WEIGHTS["credits"] * credits
+        + CHURN_WEIGHTS["no_show"] * no_show
+    )
+
+
+def next_stages(features: dict, scores: np.ndarray) -> np.ndarray:
+    """Nova fase de cada pessoa a partir da fase atual e da pontuação."""
+    threshold = settings.CHURN_RISK_THRESHOLD
+    churned = (
+        (features["days_since_last"] >= settings.CHURNED_AFTER_DAYS)
+        & (features["age_days"] >= settings.CHURNED_AFTER_DAYS)
+        & ~features["has_subscription"]
+    )
+    came_back = features["recent"] > 0
+    # Subscritores que pagam ou frequentam aulas passam a membros
+    stages = features["stages"]
+    stages = np.where((stages == SUBSCRIBER) & (features["has_subscription"] | came_back), MEMBER, stages)
+
+    result = stages.copy()
+    result[(stages == MEMBER) & (scores >= threshold)] = CHURN_RISK
+    result[(stages == CHURN_RISK) & (scores < threshold - CHURN_RECOVERY_MARGIN)] = MEMBER
+    result[(stages != CHURNED) & (stages != SUBSCRIBER) & churned] = CHURNED
+    result[(stages == CHURNED) & came_back] = MEMBER
+    return result
+
+
+def ensure_churn_segment(organization_id: int) -> Segment:
+    """Segmento com os clientes em risco, para campanhas de retenção."""
+    segment, _ = Segment.objects.get_or_create(
+        organization_id=organization_id, name=CHURN_SEGMENT_NAME,
+        defaults={"rules": {"lifecycle_stages": [CHURN_RISK]}},
+    )
+    return segment
+
+
+def score_churn(organization_id: int, now=None) -> dict:
+    """Pontua os clientes de uma organização e grava as mudanças de fase.
+
+    Returns:
+        dict: pessoas pontuadas e número de mudanças por nova fase
+    """
+    now = now or timezone.now()
+    features = load_churn_features(organization_id, now)
+    scores = churn_scores(features)
+    stages = next_stages(features, scores)
+
+    changed = np.flatnonzero(stages != features["stages"])
+    updates = [
+        Person(pk=int(features["ids"][index]), lifecycle_stage=stages[index], updated_at=now)
+        for index in changed
+    ]
+    # updated_at explícito: bulk_update não aplica auto_now e o refresh incremental dos segmentos depende dele
+    Person.objects.bulk_update(updates, ["lifecycle_stage", "updated_at"], batch_size=UPDATE_CHUNK_SIZE)
+
+    transitions = {}
+    for stage in stages[changed]:
+        transitions[stage] = transitions.get(stage, 0) + 1
+    if features["ids"].size:
+        ensure_churn_segment(organization_id)
+    return {"scored": int(features["ids"].size), "changed": transitions}
@@ -0,0 +1,73 @@
+"""
+Benchmark do pipeline de envio de campanhas.
+
+Cria destinatários sintéticos numa transação que é revertida no fim, envia a
+campanha através de um backend de email local (locmem ou console) e reporta
+mensagens/segundo. Os limites de débito por fornecedor são desativados para medir
+o pipeline em si.
+"""
+import os
+import time
+from contextlib import redirect_stdout
+
+from django.core import mail
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+
+from core.models import Organization, Person
+from notifications.models import Campaign, Template
+from notifications.services import DEFAULT_BATCH_SIZE, deliver_campaign
+
+BACKENDS = {
+    "locmem": "django.core.mail.backends.locmem.EmailBackend",
+    "console": "django.core.mail.backends.console.EmailBackend",
+}
+
+
+class Command(BaseCommand):
+    help = "Mede o débito (mensagens/s) do envio de campanhas com um backend de email local"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--recipients', type=int, default=100_000, help='Número de destinatários (padrão: 100000)')
+        parser.add_argument('--batch-size', type=int, default=DEFAULT_BATCH_SIZE, help='Tamanho do lote')
+        parser.add_argument('--backend', choices=sorted(BACKENDS), default='locmem', help='Backend de email')
+
+    def handle(self, *args, **options):
+        total = options['recipients']
+        batch_size = options['batch_size']
+
+        with transaction.atomic():
+            org = Organization.objects.create(name="Benchmark", domain=f"benchmark-{time.time_ns()}.local")
+            template = Template.objects.create(name="Benchmark", subject="Benchmark", body="Olá!")
+            campaign = Campaign.objects.create(organization=org, name="Benchmark", template=template)
+
+            started = time.perf_counter()
+            Person.objects.bulk_create(
+                (
+                    Person(
+                        organization=org,
+                        first_name=f"Cliente {i}",
+                        email=f"cliente{i}@benchmark.local",
+                        marketing_optin_email=True,
+                        consent_rgpd=True,
+                    )
+                    for i in range(total)
+                ),
+                batch_size=5000,
+            )
+            self.stdout.write(f"{total} destinatários criados em {time.perf_counter() - started:.1f}s")
+
+            with override_settings(EMAIL_BACKEND=BACKENDS[options['backend']], NOTIFICATION_RATE_LIMITS={}), \
+                    open(os.devnull, 'w') as devnull, redirect_stdout(devnull):
+                mail.outbox = []
+                started = time.perf_counter()
+                sent = deliver_campaign(campaign, batch_size=batch_size)
+                elapsed = time.perf_counter() - started
+
+            transaction.set_rollback(True)
+
+        rate = sent / elapsed if elapsed else float('inf')
+        self.stdout.write(self.style.SUCCESS(
+            f"{sent} mensagens em {elapsed:.2f}s ({rate:,.0f} mensagens/s, lotes de {batch_size})"
+        ))
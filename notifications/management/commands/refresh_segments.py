@@ -0,0 +1,22 @@
+"""
+Atualiza os bitmaps de membros dos segmentos de audiência.
+
+Sem ``--full`` o refresh é incremental (apenas pessoas alteradas desde o último
+refresh). Agendar uma execução ``--full`` noturna cobre remoções de registos.
+"""
+from django.core.management.base import BaseCommand
+
+from notifications.segments import refresh_segments
+
+
+class Command(BaseCommand):
+    help = "Atualiza os membros dos segmentos de audiência (incremental por omissão)"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--full', action='store_true', help='Recalcular todos os membros de raiz')
+        parser.add_argument('--organization', type=int, help='Apenas segmentos desta organização (id)')
+
+    def handle(self, *args, **options):
+        count = refresh_segments(organization_id=options['organization'], full=options['full'])
+        mode = "completo" if options['full'] else "incremental"
+        self.stdout.write(self.style.SUCCESS(f"{count} segmentos atualizados (refresh {mode})"))
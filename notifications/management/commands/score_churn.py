@@ -0,0 +1,23 @@
+"""
+Pontua o risco de abandono dos clientes e atualiza ``lifecycle_stage``.
+
+Normalmente corre todas as noites pelo Celery beat (``score_churn_task``); o
+comando permite corridas manuais, seguidas do refresh dos segmentos.
+"""
+from django.core.management.base import BaseCommand
+
+from notifications.tasks import score_churn_task
+
+
+class Command(BaseCommand):
+    help = "Pontua o risco de abandono dos clientes e atualiza as fases de ciclo de vida"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='Apenas esta organização (id)')
+
+    def handle(self, *args, **options):
+        results = score_churn_task(organization_id=options['organization'])
+        for organization_id, result in results.items():
+            changes = ", ".join(f"{stage}: {count}" for stage, count in sorted(result['changed'].items())) or "sem mudanças"
+            self.stdout.write(f"Organização {organization_id}: {result['scored']} clientes ({changes})")
+        self.stdout.write(self.style.SUCCESS("Pontuação de abandono concluída"))
@@ -0,0 +1,52 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:03
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('notifications', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='campaign',
+            name='completed_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='failed_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='sent_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='status',
+            field=models.CharField(choices=[('draft', 'Rascunho'), ('sending', 'A enviar'), ('sent', 'Enviada')], default='draft', max_length=20),
+        ),
+        migrations.CreateModel(
+            name='CampaignShard',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('start_id', models.PositiveBigIntegerField()),
+                ('end_id', models.PositiveBigIntegerField()),
+                ('status', models.CharField(choices=[('draft', 'Rascunho'), ('sending', 'A enviar'), ('sent', 'Enviada')], default='draft', max_length=20)),
+                ('last_person_id', models.PositiveBigIntegerField(default=0, help_text='Último destinatário processado (os envios retomam a partir daqui)')),
+                ('sent_count', models.PositiveIntegerField(default=0)),
+                ('failed_count', models.PositiveIntegerField(default=0)),
+                ('completed_at', models.DateTimeField(blank=True, null=True)),
+                ('campaign', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shards', to='notifications.campaign')),
+            ],
+            options={
+                'ordering': ['start_id'],
+                'constraints': [models.UniqueConstraint(fields=('campaign', 'start_id'), name='unique_campaign_shard_start')],
+            },
+        ),
+    ]
@@ -0,0 +1,41 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:12
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0016_person_updated_at'),
+        ('notifications', '0002_campaign_progress'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Segment',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=200)),
+                ('rules', models.JSONField(blank=True, default=dict, help_text='Ex: {"optin": "email", "lifecycle_stages": ["member"], "min_credits": 1}')),
+                ('members', models.BinaryField(default=bytes)),
+                ('member_count', models.PositiveIntegerField(default=0, editable=False)),
+                ('refreshed_at', models.DateTimeField(blank=True, editable=False, null=True)),
+                ('created_at', models.DateTimeField(auto_now_add=True)),
+                ('updated_at', models.DateTimeField(auto_now=True)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='segments', to='core.organization')),
+            ],
+            options={
+                'ordering': ['name'],
+            },
+        ),
+        migrations.AddField(
+            model_name='campaign',
+            name='segment',
+            field=models.ForeignKey(blank=True, help_text='Sem segmento, a campanha vai para todos os clientes com opt-in', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='campaigns', to='notifications.segment'),
+        ),
+        migrations.AddConstraint(
+            model_name='segment',
+            constraint=models.UniqueConstraint(fields=('organization', 'name'), name='unique_segment_org_name'),
+        ),
+    ]
@@ -19,19 +19,98 @@ class Template(models.Model):
         return self.name
 
 
+class Segment(models.Model):
+    """Audiência pré-calculada a partir de regras sobre ``Person``.
+
+    Os membros são guardados como bitmap de ids (ver ``notifications.segments``),
+    o que torna contagens e operações de conjuntos baratas mesmo com muitos
+    milhares de clientes.
+    """
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="segments")
+    name = models.CharField(max_length=200)
+    rules = models.JSONField(
+        default=dict, blank=True,
+        help_text="Ex: {\"optin\": \"email\", \"lifecycle_stages\": [\"member\"], \"min_credits\": 1}",
+    )
+    members = models.BinaryField(default=bytes, editable=False)
+    member_count = models.PositiveIntegerField(default=0, editable=False)
+    refreshed_at = models.DateTimeField(null=True, blank=True, editable=False)
+    created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        ordering = ["name"]
+        constraints = [
+            models.UniqueConstraint(fields=["organization", "name"], name="unique_segment_org_name"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.name} ({self.member_count})"
+
+    def clean(self):
+        from .segments import validate_rules
+        validate_rules(self.rules)
+
+    def save(self, *args, **kwargs):
+        # Regras alteradas invalidam o bitmap: o próximo refresh é completo
+        if self.pk and self.refreshed_at:
+            previous = Segment.objects.filter(pk=self.pk).values_list("rules", flat=True).first()
+            if previous is not None and previous != self.rules:
+                self.refreshed_at = None
+        super().save(*args, **kwargs)
+
+
 class Campaign(models.Model):
     CHANNEL_CHOICES = Template.CHANNEL_CHOICES
+    STATUS_CHOICES = [
+        ("draft", "Rascunho"),
+        ("sending", "A enviar"),
+        ("sent", "Enviada"),
+    ]
     organization = models.ForeignKey(Organization, on_delete=models.CASCADE)
     name = models.CharField(max_length=200)
     template = models.ForeignKey(Template, on_delete=models.CASCADE)
+    segment = models.ForeignKey(
+        Segment, on_delete=models.SET_NULL, null=True, blank=True, related_name="campaigns",
+        help_text="Sem segmento, a campanha vai para todos os clientes com opt-in",
+    )
     channel = models.CharField(max_length=10, choices=CHANNEL_CHOICES, default="email")
     scheduled_for = models.DateTimeField(null=True, blank=True)
     created_at = models.DateTimeField(auto_now_add=True)
 
+    # Progresso agregado do envio (checkpoints por lote vivem em CampaignShard)
+    status = models.CharField(max_length=20, choices=STATUS_CHOICES, default="draft")
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
     def __str__(self) -> str:
         return self.name
 
 
+class CampaignShard(models.Model):
+    """Intervalo de ids de destinatários enviado por uma subtarefa Celery."""
+    campaign = models.ForeignKey(Campaign, on_delete=models.CASCADE, related_name="shards")
+    start_id = models.PositiveBigIntegerField()
+    end_id = models.PositiveBigIntegerField()
+    status = models.CharField(max_length=20, choices=Campaign.STATUS_CHOICES, default="draft")
+    last_person_id = models.PositiveBigIntegerField(
+        default=0, help_text="Último destinatário processado (os envios retomam a partir daqui)"
+    )
+    sent_count = models.PositiveIntegerField(default=0)
+    failed_count = models.PositiveIntegerField(default=0)
+    completed_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["start_id"]
+        constraints = [
+            models.UniqueConstraint(fields=["campaign", "start_id"], name="unique_campaign_shard_start"),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.campaign.name} [{self.start_id}-{self.end_id}] ({self.status})"
+
+
 class NotificationLog(models.Model):
     STATUS_CHOICES = [
         ("pending", "Pendente"),
@@ -0,0 +1,29 @@
+"""
+Handlers do outbox transacional para a app de notificações.
+
+Reservas alteradas mudam a pertença a segmentos com regras sobre reservas;
+em vez de esperar pelo refresh periódico, é agendado um refresh incremental
+por organização afetada (um por lote do relay, depois do commit).
+"""
+from core.models import OutboxMessage
+from core.services.outbox import publish, register_handler
+
+from .models import Segment
+from .segments import TIME_WINDOW_RULES
+from .tasks import refresh_segments_task
+
+# Regras cujo resultado depende de reservas (diretamente ou pelos créditos gastos)
+BOOKING_RULES = TIME_WINDOW_RULES + ("min_credits", "max_credits")
+
+
+@register_handler(OutboxMessage.Topic.BOOKING_CHANGED)
+def refresh_booking_segments(messages):
+    organization_ids = {message.organization_id for message in messages}
+    affected = set()
+    for organization_id, rules in Segment.objects.filter(
+        organization_id__in=organization_ids
+    ).values_list("organization_id", "rules"):
+        if any((rules or {}).get(key) is not None for key in BOOKING_RULES):
+            affected.add(organization_id)
+    for organization_id in sorted(affected):
+        publish(refresh_segments_task.delay, organization_id=organization_id)
@@ -0,0 +1,260 @@
+"""
+Motor de segmentos de audiência.
+
+Cada ``Segment`` define regras sobre ``Person`` e guarda os membros como um
+bitmap de ids (bit ``n`` ligado = pessoa ``n`` pertence ao segmento). Contar
+membros e combinar segmentos (união, interseção, exclusão) passa a ser
+aritmética sobre inteiros, sem consultas à base de dados.
+
+O refresh incremental reavalia apenas as pessoas alteradas desde o último
+refresh (``Person.updated_at``, reservas criadas/canceladas, subscrições
+atualizadas) e as que saem das janelas temporais das regras. Remoções físicas
+não deixam rasto, por isso convém agendar também um refresh completo noturno
+(``manage.py refresh_segments --full``).
+
+Regras suportadas::
+
+    {
+        "optin": "email" | "sms",
+        "consent_rgpd": true,
+        "lifecycle_stages": ["member", "churn_risk"],
+        "entity_affiliations": ["acr_only", "both"],
+        "booked_within_days": 30,   # reserva em aula com início nos últimos N dias (ou futura)
+        "inactive_days": 60,        # nenhuma reserva nos últimos N dias
+        "min_credits": 1,           # créditos em subscrições ativas
+        "max_credits": 2
+    }
+"""
+from datetime import timedelta
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q, Sum
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from core.models import Booking, ClientSubscription, Person
+from .models import Segment
+
+RULE_KEYS = {
+    "optin", "consent_rgpd", "lifecycle_stages", "entity_affiliations",
+    "booked_within_days", "inactive_days", "min_credits", "max_credits",
+}
+TIME_WINDOW_RULES = ("booked_within_days", "inactive_days")
+REFRESH_CHUNK_SIZE = 5000
+
+
+class SegmentSet:
+    """Conjunto de ids de pessoas representado como bitmap (inteiro Python)."""
+
+    __slots__ = ("_bits", "_bytes")
+
+    def __init__(self, bits: int = 0):
+        self._bits = bits
+        self._bytes = None
+
+    @classmethod
+    def from_ids(cls, ids) -> "SegmentSet":
+        buffer = bytearray()
+        for person_id in ids:
+            index, bit = divmod(person_id, 8)
+            if index >= len(buffer):
+                buffer.extend(bytes(index - len(buffer) + 1))
+            buffer[index] |= 1 << bit
+        return cls(int.from_bytes(buffer, "little"))
+
+    @classmethod
+    def from_bytes(cls, data) -> "SegmentSet":
+        return cls(int.from_bytes(bytes(data or b""), "little"))
+
+    def to_bytes(self) -> bytes:
+        if self._bytes is None:
+            self._bytes = self._bits.to_bytes((self._bits.bit_length() + 7) // 8, "little")
+        return self._bytes
+
+    def first(self):
+        return (self._bits & -self._bits).bit_length() - 1 if self._bits else None
+
+    def last(self):
+        return self._bits.bit_length() - 1 if self._bits else None
+
+    def between(self, low: int, high: int | None = None) -> "SegmentSet":
+        """Membros com id em ``]low, high]`` (``high=None``: sem limite superior)."""
+        bits = self._bits >> (low + 1) << (low + 1)
+        if high is not None:
+            bits &= (1 << (high + 1)) - 1
+        return SegmentSet(bits)
+
+    def __len__(self) -> int:
+        return self._bits.bit_count()
+
+    def __bool__(self) -> bool:
+        return bool(self._bits)
+
+    def __contains__(self, person_id) -> bool:
+        data = self.to_bytes()
+        index = person_id >> 3
+        return 0 <= index < len(data) and bool(data[index] >> (person_id & 7) & 1)
+
+    def __iter__(self):
+        for index, byte in enumerate(self.to_bytes()):
+            base = index * 8
+            while byte:
+                lowest = byte & -byte
+                yield base + lowest.bit_length() - 1
+                byte ^= lowest
+
+    def __or__(self, other: "SegmentSet") -> "SegmentSet":
+        return SegmentSet(self._bits | other._bits)
+
+    def __and__(self, other: "SegmentSet") -> "SegmentSet":
+        return SegmentSet(self._bits & other._bits)
+
+    def __sub__(self, other: "SegmentSet") -> "SegmentSet":
+        return SegmentSet(self._bits & ~other._bits)
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, SegmentSet) and self._bits == other._bits
+
+    def __repr__(self) -> str:
+        return f"<SegmentSet {len(self)} membros>"
+
+
+def validate_rules(rules: dict):
+    """Valida a estrutura das regras de um segmento."""
+    if not isinstance(rules, dict):
+        raise ValidationError("As regras do segmento devem ser um objeto JSON.")
+    unknown = set(rules) - RULE_KEYS
+    if unknown:
+        raise ValidationError(f"Regras desconhecidas: {', '.join(sorted(unknown))}")
+    if rules.get("optin") not in (None, "email", "sms"):
+        raise ValidationError("'optin' deve ser 'email' ou 'sms'.")
+    for key in TIME_WINDOW_RULES + ("min_credits", "max_credits"):
+        value = rules.get(key)
+        if value is not None and (not isinstance(value, int) or value < 0):
+            raise ValidationError(f"'{key}' deve ser um inteiro não negativo.")
+
+
+def _booked_since(organization_id: int, since):
+    return Booking.objects.filter(
+        organization_id=organization_id, event__starts_at__gte=since
+    ).exclude(status=Booking.Status.CANCELLED).values("person_id")
+
+
+def segment_queryset(segment: Segment, now=None):
+    """Pessoas que cumprem as regras do segmento no instante ``now``."""
+    now = now or timezone.now()
+    rules = segment.rules or {}
+    qs = Person.objects.filter(organization_id=segment.organization_id)
+
+    if rules.get("optin") == "email":
+        qs = qs.filter(marketing_optin_email=True).exclude(email="")
+    elif rules.get("optin") == "sms":
+        qs = qs.filter(marketing_optin_sms=True).exclude(phone="")
+    if rules.get("consent_rgpd"):
+        qs = qs.filter(consent_rgpd=True)
+    if rules.get("lifecycle_stages"):
+        qs = qs.filter(lifecycle_stage__in=rules["lifecycle_stages"])
+    if rules.get("entity_affiliations"):
+        qs = qs.filter(entity_affiliation__in=rules["entity_affiliations"])
+
+    if rules.get("booked_within_days") is not None:
+        since = now - timedelta(days=rules["booked_within_days"])
+        qs = qs.filter(pk__in=_booked_since(segment.organization_id, since))
+    if rules.get("inactive_days") is not None:
+        since = now - timedelta(days=rules["inactive_days"])
+        qs = qs.exclude(pk__in=_booked_since(segment.organization_id, since))
+
+    if rules.get("min_credits") is not None or rules.get("max_credits") is not None:
+        qs = qs.annotate(credits=Coalesce(
+            Sum("subscriptions__remaining_credits",
+                filter=Q(subscriptions__status=ClientSubscription.Status.ACTIVE)),
+            0,
+        ))
+        if rules.get("min_credits") is not None:
+            qs = qs.filter(credits__gte=rules["min_credits"])
+        if rules.get("max_credits") is not None:
+            qs = qs.filter(credits__lte=rules["max_credits"])
+    return qs
+
+
+def changed_person_ids(segment: Segment, since, now) -> set:
+    """Pessoas cuja pertença ao segmento pode ter mudado em ``]since, now]``."""
+    org_id = segment.organization_id
+    ids = set(Person.objects.filter(organization_id=org_id, updated_at__gt=since).values_list("pk", flat=True))
+    ids.update(
+        Booking.objects.filter(organization_id=org_id)
+        .filter(Q(created_at__gt=since) | Q(cancelled_at__gt=since))
+        .values_list("person_id", flat=True)
+    )
+    ids.update(
+        ClientSubscription.objects.filter(organization_id=org_id, updated_at__gt=since)
+        .values_list("person_id", flat=True)
+    )
+    # Janelas deslizantes: reservas que deixaram de estar "nos últimos N dias"
+    rules = segment.rules or {}
+    for key in TIME_WINDOW_RULES:
+        if rules.get(key) is not None:
+            window = timedelta(days=rules[key])
+            ids.update(
+                Booking.objects.filter(
+                    organization_id=org_id,
+                    event__starts_at__gte=since - window,
+                    event__starts_at__lt=now - window,
+                ).values_list("person_id", flat=True)
+            )
+    return ids
+
+
+def refresh_segment(segment: Segment, full: bool = False, now=None) -> SegmentSet:
+    """Atualiza o bitmap de membros (incremental salvo ``full`` ou regras novas)."""
+    now = now or timezone.now()
+    if full or segment.refreshed_at is None:
+        members = SegmentSet.from_ids(
+            segment_queryset(segment, now).values_list("pk", flat=True).iterator(chunk_size=REFRESH_CHUNK_SIZE)
+        )
+    else:
+        members = SegmentSet.from_bytes(segment.members)
+        affected = sorted(changed_person_ids(segment, segment.refreshed_at, now))
+        matching = []
+        for start in range(0, len(affected), REFRESH_CHUNK_SIZE):
+            chunk = affected[start:start + REFRESH_CHUNK_SIZE]
+            matching.extend(segment_queryset(segment, now).filter(pk__in=chunk).values_list("pk", flat=True))
+        members = (members - SegmentSet.from_ids(affected)) | SegmentSet.from_ids(matching)
+
+    segment.members = members.to_bytes()
+    segment.member_count = len(members)
+    segment.refreshed_at = now
+    # update() para não disparar Segment.save (nem alterar updated_at)
+    Segment.objects.filter(pk=segment.pk).update(
+        members=segment.members, member_count=segment.member_count, refreshed_at=now
+    )
+    return members
+
+
+def refresh_segments(organization_id=None, full: bool = False) -> int:
+    """Atualiza todos os segmentos (opcionalmente de uma organização)."""
+    segments = Segment.objects.all()
+    if organization_id:
+        segments = segments.filter(organization_id=organization_id)
+    count = 0
+    for segment in segments.iterator():
+        refresh_segment(segment, full=full)
+        count += 1
+    return count
+
+
+def segment_members(segment: Segment) -> SegmentSet:
+    return SegmentSet.from_bytes(segment.members)
+
+
+def preview_audience(include, exclude=()) -> SegmentSet:
+    """União dos segmentos ``include`` menos os membros dos segmentos ``exclude``.
+
+    ``len()`` do resultado dá a contagem para pré-visualização.
+    """
+    members = SegmentSet()
+    for segment in include:
+        members |= segment_members(segment)
+    for segment in exclude:
+        members -= segment_members(segment)
+    return members
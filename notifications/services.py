@@ -0,0 +1,260 @@
+"""
+Pipeline de envio de campanhas.
+
+Os destinatários de uma campanha são divididos em shards (intervalos de ids)
+que podem ser enviados em paralelo por vários workers. Dentro de cada shard os
+destinatários são lidos em streaming (``.iterator()``) ou, com segmento, por
+blocos de ids do bitmap (``pk__in``); são enviados em lotes que partilham uma
+única ligação SMTP e registados com ``bulk_create``. Após cada lote é gravado
+um checkpoint (``CampaignShard.last_person_id``) para que um shard
+interrompido retome a partir do último lote confirmado.
+
+Um segmento nunca calculado ou com regras alteradas (``refreshed_at`` vazio)
+é recalculado antes de ser usado, para não enviar a uma audiência vazia ou
+desatualizada.
+"""
+import logging
+import math
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import Count, F, Max, Min, Q, Sum
+from django.utils import timezone
+
+from core.models import Person
+from core.services.rate_limit import RateLimiter
+from .models import Campaign, CampaignShard, NotificationLog
+from .segments import refresh_segment, segment_members
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_BATCH_SIZE = 500
+
+
+def _send_sms(to_number: str, body: str):  # pragma: no cover - placeholder
+    print(f"Sending SMS to {to_number}: {body}")
+
+
+def _contact_field(campaign: Campaign) -> str:
+    return "phone" if campaign.channel == "sms" else "email"
+
+
+def _provider(channel: str) -> str:
+    if channel == "sms":
+        return "stub"
+    return settings.EMAIL_HOST or "default"
+
+
+def channel_rate_limiter(channel: str):
+    """Limitador partilhado por canal e fornecedor (``None`` se sem limite)."""
+    limit = getattr(settings, "NOTIFICATION_RATE_LIMITS", {}).get(channel)
+    if not limit:
+        return None
+    return RateLimiter(f"notifications:{channel}:{_provider(channel)}", capacity=limit, period=1.0)
+
+
+def recipients_queryset(campaign: Campaign):
+    """Pessoas elegíveis para a campanha (opt-in do canal + consentimento RGPD)."""
+    qs = Person.objects.filter(organization_id=campaign.organization_id, consent_rgpd=True)
+    if campaign.channel == "sms":
+        return qs.filter(marketing_optin_sms=True).exclude(phone="")
+    return qs.filter(marketing_optin_email=True).exclude(email="")
+
+
+def campaign_members(campaign: Campaign):
+    """Membros do segmento da campanha (``None`` = sem restrição de segmento).
+
+    O bitmap só é usado depois de calculado com as regras atuais.
+    """
+    if not campaign.segment_id:
+        return None
+    segment = campaign.segment
+    if segment.refreshed_at is None:
+        return refresh_segment(segment)
+    return segment_members(segment)
+
+
+def _member_rows(campaign: Campaign, members, after_id: int, until_id: int | None, batch_size: int):
+    """Destinatários do segmento, lidos por blocos de ids do bitmap."""
+    rows = recipients_queryset(campaign).order_by("pk").values_list("pk", _contact_field(campaign))
+    chunk = []
+    for person_id in members.between(after_id, until_id):
+        chunk.append(person_id)
+        if len(chunk) >= batch_size:
+            yield from rows.filter(pk__in=chunk)
+            chunk = []
+    if chunk:
+        yield from rows.filter(pk__in=chunk)
+
+
+def iter_recipient_batches(campaign: Campaign, after_id: int = 0, until_id: int | None = None,
+                           batch_size: int = DEFAULT_BATCH_SIZE):
+    """Gera lotes de ``(person_id, contacto)`` por ordem de id, em ``]after_id, until_id]``."""
+    members = campaign_members(campaign)
+    if members is not None:
+        rows = _member_rows(campaign, members, after_id, until_id, batch_size)
+    else:
+        rows = recipients_queryset(campaign).filter(pk__gt=after_id)
+        if until_id is not None:
+            rows = rows.filter(pk__lte=until_id)
+        rows = rows.order_by("pk").values_list("pk", _contact_field(campaign)).iterator(chunk_size=batch_size)
+    batch = []
+    for row in rows:
+        batch.append(row)
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def deliver_batch(campaign: Campaign, batch, limiter=None) -> list:
+    """Envia um lote e devolve os ``NotificationLog`` (por gravar) correspondentes."""
+    template = campaign.template
+    now = timezone.now()
+    logs = []
+
+    def _log(person_id, status, detail=""):
+        logs.append(NotificationLog(
+            campaign=campaign,
+            person_id=person_id,
+            status=status,
+            channel=campaign.channel,
+            sent_at=now if status == "sent" else None,
+            detail=detail,
+        ))
+
+    if campaign.channel == "sms":
+        for person_id, phone in batch:
+            if limiter:
+                limiter.acquire()
+            try:
+                _send_sms(phone, template.body)
+                _log(person_id, "sent")
+            except Exception as exc:  # pragma: no cover - depende do fornecedor
+                _log(person_id, "failed", str(exc))
+        return logs
+
+    # Uma única ligação SMTP para todo o lote
+    with get_connection() as connection:
+        for person_id, email in batch:
+            if limiter:
+                limiter.acquire()
+            message = EmailMessage(
+                template.subject, template.body, settings.DEFAULT_FROM_EMAIL, [email],
+                connection=connection,
+            )
+            try:
+                message.send()
+                _log(person_id, "sent")
+            except Exception as exc:  # pragma: no cover - log error
+                _log(person_id, "failed", str(exc))
+    return logs
+
+
+def plan_shards(campaign: Campaign, shard_size: int | None = None) -> list:
+    """Divide os destinatários em intervalos de ids com ~``shard_size`` pessoas.
+
+    Idempotente: se a campanha já tem shards (por exemplo, após uma falha),
+    devolve os existentes para que o reenvio retome os respetivos checkpoints.
+    """
+    existing = list(campaign.shards.all())
+    if existing:
+        return existing
+
+    shard_size = shard_size or settings.NOTIFICATION_SHARD_SIZE
+    members = campaign_members(campaign)
+    if members is not None:
+        bounds = {"low": members.first(), "high": members.last(), "total": len(members)}
+    else:
+        bounds = recipients_queryset(campaign).aggregate(low=Min("pk"), high=Max("pk"), total=Count("pk"))
+    if not bounds["total"]:
+        return []
+
+    # Intervalos de largura igual; ids contíguos dão shards com tamanho semelhante
+    shards_count = math.ceil(bounds["total"] / shard_size)
+    width = math.ceil((bounds["high"] - bounds["low"] + 1) / shards_count)
+    shards = []
+    for index in range(shards_count):
+        start_id = bounds["low"] + index * width
+        if start_id > bounds["high"]:
+            break
+        shards.append(CampaignShard(
+            campaign=campaign,
+            start_id=start_id,
+            end_id=min(start_id + width - 1, bounds["high"]),
+            last_person_id=start_id - 1,
+        ))
+    return CampaignShard.objects.bulk_create(shards)
+
+
+def deliver_shard(shard: CampaignShard, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Envia um shard a partir do seu checkpoint.
+
+    Os logs e o checkpoint de cada lote são gravados na mesma transação. Se o
+    processo falhar entre o envio e a gravação, o lote é reenviado ao retomar
+    (entrega pelo menos uma vez).
+
+    Returns:
+        int: mensagens enviadas com sucesso no shard
+    """
+    if shard.status == "sent":
+        return shard.sent_count
+
+    campaign = shard.campaign
+    limiter = channel_rate_limiter(campaign.channel)
+    CampaignShard.objects.filter(pk=shard.pk).update(status="sending")
+
+    batches = iter_recipient_batches(
+        campaign, after_id=shard.last_person_id, until_id=shard.end_id, batch_size=batch_size
+    )
+    for batch in batches:
+        logs = deliver_batch(campaign, batch, limiter=limiter)
+        sent = sum(1 for log in logs if log.status == "sent")
+        with transaction.atomic():
+            NotificationLog.objects.bulk_create(logs, batch_size=batch_size)
+            CampaignShard.objects.filter(pk=shard.pk).update(
+                last_person_id=batch[-1][0],
+                sent_count=F("sent_count") + sent,
+                failed_count=F("failed_count") + (len(logs) - sent),
+            )
+
+    CampaignShard.objects.filter(pk=shard.pk).update(status="sent", completed_at=timezone.now())
+    shard.refresh_from_db(fields=["status", "last_person_id", "sent_count", "failed_count", "completed_at"])
+    return shard.sent_count
+
+
+def finalize_campaign(campaign: Campaign) -> int:
+    """Consolida as contagens dos shards na campanha.
+
+    Returns:
+        int: total de mensagens enviadas com sucesso na campanha
+    """
+    totals = campaign.shards.aggregate(
+        sent=Sum("sent_count"),
+        failed=Sum("failed_count"),
+        pending=Count("pk", filter=~Q(status="sent")),
+    )
+    fields = {"sent_count": totals["sent"] or 0, "failed_count": totals["failed"] or 0}
+    if not totals["pending"]:
+        fields.update(status="sent", completed_at=timezone.now())
+    Campaign.objects.filter(pk=campaign.pk).update(**fields)
+    campaign.refresh_from_db(fields=["status", "sent_count", "failed_count", "completed_at"])
+    logger.info(
+        "Campanha %s: %s enviados, %s falhados (%s)",
+        campaign.pk, campaign.sent_count, campaign.failed_count, campaign.status,
+    )
+    return campaign.sent_count
+
+
+def deliver_campaign(campaign: Campaign, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Envia todos os shards da campanha no processo atual (sem Celery)."""
+    if campaign.status == "sent":
+        return campaign.sent_count
+
+    Campaign.objects.filter(pk=campaign.pk).update(status="sending")
+    for shard in plan_shards(campaign):
+        shard.campaign = campaign
+        deliver_shard(shard, batch_size=batch_size)
+    return finalize_campaign(campaign)
@@ -1,54 +1,62 @@
-from celery import shared_task
-from django.core.mail import send_mail
-from django.conf import settings
-from .models import Campaign, NotificationLog
-from core.models import Person
+from celery import chord, shared_task
 
+from core.models import Organization
 
-def _send_email(to_email: str, subject: str, body: str):
-    send_mail(subject, body, settings.DEFAULT_FROM_EMAIL, [to_email])
+from .churn import score_churn
+from .models import Campaign, CampaignShard
+from .segments import refresh_segments
+from .services import DEFAULT_BATCH_SIZE, deliver_shard, finalize_campaign, plan_shards
 
 
-def _send_sms(to_number: str, body: str):  # pragma: no cover - placeholder
-    print(f"Sending SMS to {to_number}: {body}")
+@shared_task
+def send_campaign(campaign_id: int, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    """Planeia os shards da campanha e distribui-os pelos workers.
+
+    Returns:
+        int: shards agendados (0 se a campanha já estava enviada ou não havia
+        nada por enviar, caso em que é logo finalizada)
+    """
+    campaign = Campaign.objects.get(pk=campaign_id)
+    if campaign.status == "sent":
+        return 0
+
+    Campaign.objects.filter(pk=campaign.pk).update(status="sending")
+    shards = [shard for shard in plan_shards(campaign) if shard.status != "sent"]
+    if not shards:
+        finalize_campaign_task(campaign_id)
+        return 0
+
+    header = [send_campaign_shard.s(shard.pk, batch_size) for shard in shards]
+    chord(header)(finalize_campaign_task.si(campaign_id))
+    return len(shards)
+
+
+@shared_task(acks_late=True)
+def send_campaign_shard(shard_id: int, batch_size: int = DEFAULT_BATCH_SIZE) -> int:
+    shard = CampaignShard.objects.select_related("campaign__template").get(pk=shard_id)
+    return deliver_shard(shard, batch_size=batch_size)
 
 
 @shared_task
-def send_campaign(campaign_id: int) -> int:
+def finalize_campaign_task(campaign_id: int) -> int:
     campaign = Campaign.objects.get(pk=campaign_id)
-    template = campaign.template
-    if campaign.channel == "sms":
-        recipients = Person.objects.filter(
-            organization=campaign.organization,
-            marketing_optin_sms=True,
-            consent_rgpd=True,
-        ).exclude(phone="").values_list("id", "phone")
-    else:
-        recipients = Person.objects.filter(
-            organization=campaign.organization,
-            marketing_optin_email=True,
-            consent_rgpd=True,
-        ).exclude(email="").values_list("id", "email")
-    count = 0
-    for person_id, contact in recipients:
-        try:
-            if campaign.channel == "sms":
-                _send_sms(contact, template.body)
-            else:
-                _send_email(contact, template.subject, template.body)
-            NotificationLog.objects.create(
-                campaign=campaign,
-                person_id=person_id,
-                status="sent",
-                channel=campaign.channel,
-            )
-            count += 1
-        except Exception as exc:  # pragma: no cover - log error
-            NotificationLog.objects.create(
-                campaign=campaign,
-                person_id=person_id,
-                status="failed",
-                channel=campaign.channel,
-                detail=str(exc),
-            )
-    return count
+    return finalize_campaign(campaign)
+
+
+@shared_task
+def refresh_segments_task(organization_id: int | None = None, full: bool = False) -> int:
+    return refresh_segments(organization_id=organization_id, full=full)
+
+
+@shared_task
+def score_churn_task(organization_id: int | None = None) -> dict:
+    """Pontuação noturna de risco de abandono, seguida do refresh dos segmentos."""
+    organizations = Organization.objects.order_by("pk").values_list("pk", flat=True)
+    if organization_id:
+        organizations = organizations.filter(pk=organization_id)
+    results = {}
+    for org_id in organizations:
+        results[org_id] = score_churn(org_id)
+        # Segmentos por fase (ex. "Risco de abandono") ficam logo prontos para campanhas
+        refresh_segments(organization_id=org_id)
+    return results
@@ -1,7 +1,24 @@
-from django.test import TestCase
+import time
+from datetime import timedelta
+from unittest import mock
+
+import numpy as np
+
+from django.core import mail
+from django.core.exceptions import ValidationError
+from django.test import TestCase, override_settings
 from django.utils import timezone
-from core.models import Organization, Person
-from .models import Template, Campaign, NotificationLog
+from celery.backends.cache import CacheBackend
+
+from acr_gestao.celery import app as celery_app
+from core.models import Booking, ClientSubscription, Event, Organization, PaymentPlan, Person, Resource
+from core.services.outbox import relay_outbox
+from tests.core.clock import FakeClock
+from .churn import CHURN_SEGMENT_NAME, churn_scores, next_stages
+from .models import Template, Campaign, CampaignShard, NotificationLog, Segment
+from .segments import SegmentSet, preview_audience, refresh_segment, segment_members
+from .services import deliver_campaign, plan_shards
+from .tasks import score_churn_task, send_campaign
 
 
 class NotificationModelsTestCase(TestCase):
@@ -21,3 +38,381 @@ class NotificationModelsTestCase(TestCase):
         log.mark_sent()
         self.assertEqual(log.status, "sent")
         self.assertIsNotNone(log.sent_at)
+
+
+class SendCampaignTestCase(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", domain="org.com")
+        self.template = Template.objects.create(name="Temp", subject="Sub", body="Body")
+        self.campaign = Campaign.objects.create(organization=self.org, name="Camp", template=self.template)
+        self.people = [
+            Person.objects.create(
+                organization=self.org,
+                first_name=f"P{i}",
+                email=f"p{i}@example.com",
+                marketing_optin_email=True,
+                consent_rgpd=True,
+            )
+            for i in range(5)
+        ]
+        # Sem opt-in: não deve receber
+        Person.objects.create(organization=self.org, first_name="X", email="x@example.com", consent_rgpd=True)
+
+    def test_send_campaign_batches_and_logs(self):
+        with mock.patch("notifications.services.get_connection", wraps=mail.get_connection) as get_connection:
+            sent = deliver_campaign(self.campaign, batch_size=2)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(len(mail.outbox), 5)
+        # Uma ligação por lote (3 lotes de até 2 destinatários)
+        self.assertEqual(get_connection.call_count, 3)
+        self.assertEqual(NotificationLog.objects.filter(campaign=self.campaign, status="sent").count(), 5)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, "sent")
+        self.assertEqual(self.campaign.sent_count, 5)
+
+    def test_send_campaign_resumes_from_checkpoint(self):
+        # Simular campanha interrompida após os dois primeiros destinatários
+        Campaign.objects.filter(pk=self.campaign.pk).update(status="sending")
+        shard = plan_shards(self.campaign)[0]
+        CampaignShard.objects.filter(pk=shard.pk).update(
+            status="sending", last_person_id=self.people[1].pk, sent_count=2
+        )
+        self.campaign.refresh_from_db()
+
+        sent = deliver_campaign(self.campaign, batch_size=2)
+
+        self.assertEqual(sent, 5)
+        self.assertEqual(sorted(m.to[0] for m in mail.outbox), [f"p{i}@example.com" for i in range(2, 5)])
+
+    def test_plan_shards_covers_recipients_without_overlap(self):
+        shards = plan_shards(self.campaign, shard_size=2)
+
+        self.assertEqual(len(shards), 3)
+        self.assertEqual(shards[0].start_id, self.people[0].pk)
+        self.assertEqual(shards[-1].end_id, self.people[-1].pk)
+        for previous, current in zip(shards, shards[1:]):
+            self.assertEqual(current.start_id, previous.end_id + 1)
+        # Replanear devolve os shards existentes (checkpoints preservados)
+        self.assertEqual([s.pk for s in plan_shards(self.campaign, shard_size=1)], [s.pk for s in shards])
+
+    @override_settings(NOTIFICATION_SHARD_SIZE=2)
+    def test_send_campaign_task_fans_out_shards(self):
+        # Execução síncrona: o chord corre os shards e o callback no processo de teste
+        celery_app.conf.update(task_always_eager=True)
+        self.addCleanup(celery_app.conf.update, task_always_eager=False)
+        backend = CacheBackend(app=celery_app, backend="memory")
+        with mock.patch.object(type(celery_app), "backend", new=backend):
+            result = send_campaign.apply(args=(self.campaign.pk,), kwargs={"batch_size": 2})
+
+        self.assertEqual(result.get(), 3)
+        self.assertEqual(CampaignShard.objects.filter(campaign=self.campaign, status="sent").count(), 3)
+        self.assertEqual(len(mail.outbox), 5)
+        self.campaign.refresh_from_db()
+        self.assertEqual(self.campaign.status, "sent")
+        self.assertEqual(self.campaign.sent_count, 5)
+
+    @override_settings(NOTIFICATION_RATE_LIMITS={"email": 3})
+    def test_delivery_respects_channel_rate_limit(self):
+        clock = FakeClock(1000.0)
+        with mock.patch("core.services.rate_limit.time", clock):
+            deliver_campaign(self.campaign, batch_size=5)
+
+        # 5 mensagens com limite de 3/s: uma espera pela janela seguinte
+        self.assertEqual(clock.sleeps, [1.0])
+        self.assertEqual(len(mail.outbox), 5)
+
+
+class SegmentSetTestCase(TestCase):
+    def test_set_operations_and_round_trip(self):
+        a = SegmentSet.from_ids([1, 5, 9, 1000])
+        b = SegmentSet.from_ids([5, 7, 1000])
+
+        self.assertEqual(len(a), 4)
+        self.assertEqual(list(a | b), [1, 5, 7, 9, 1000])
+        self.assertEqual(list(a & b), [5, 1000])
+        self.assertEqual(list(a - b), [1, 9])
+        self.assertIn(9, a)
+        self.assertNotIn(8, a)
+        self.assertNotIn(5000, a)
+        self.assertEqual((a.first(), a.last()), (1, 1000))
+        self.assertEqual(SegmentSet.from_bytes(a.to_bytes()), a)
+        self.assertEqual(len(SegmentSet.from_bytes(b"")), 0)
+        self.assertEqual(list(a.between(1, 9)), [5, 9])
+        self.assertEqual(list(a.between(9)), [1000])
+
+
+class SegmentRefreshTestCase(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", domain="org.com")
+        self.resource = Resource.objects.create(organization=self.org, name="Sala")
+        self.ana = Person.objects.create(
+            organization=self.org, first_name="Ana", email="ana@example.com",
+            marketing_optin_email=True, consent_rgpd=True, lifecycle_stage="member",
+        )
+        self.bea = Person.objects.create(
+            organization=self.org, first_name="Bea", email="bea@example.com",
+            marketing_optin_email=True, consent_rgpd=True, lifecycle_stage="lead",
+        )
+        self.caio = Person.objects.create(
+            organization=self.org, first_name="Caio", email="caio@example.com", lifecycle_stage="member",
+        )
+        self.members = Segment.objects.create(
+            organization=self.org, name="Membros com opt-in",
+            rules={"optin": "email", "consent_rgpd": True, "lifecycle_stages": ["member"]},
+        )
+
+    def _book(self, person, starts_at):
+        event = Event.objects.create(
+            organization=self.org, resource=self.resource, title="Aula",
+            starts_at=starts_at, ends_at=starts_at + timedelta(hours=1), capacity=5,
+        )
+        return Booking.objects.create(organization=self.org, event=event, person=person)
+
+    def test_full_refresh_materialises_rule_matches(self):
+        members = refresh_segment(self.members)
+
+        self.assertEqual(list(members), [self.ana.pk])
+        self.members.refresh_from_db()
+        self.assertEqual(self.members.member_count, 1)
+        self.assertIsNotNone(self.members.refreshed_at)
+
+    def test_incremental_refresh_only_reevaluates_changed_people(self):
+        refresh_segment(self.members)
+
+        self.bea.lifecycle_stage = "member"
+        self.bea.save()
+        Person.objects.filter(pk=self.ana.pk).update(marketing_optin_email=False)  # sem updated_at
+
+        members = refresh_segment(self.members)
+
+        # Bea entra (alterada); Ana mantém-se até ao próximo refresh completo
+        self.assertEqual(list(members), [self.ana.pk, self.bea.pk])
+        self.assertEqual(list(refresh_segment(self.members, full=True)), [self.bea.pk])
+
+    def test_booking_and_credit_rules(self):
+        active = Segment.objects.create(
+            organization=self.org, name="Ativos", rules={"booked_within_days": 30}
+        )
+        credits = Segment.objects.create(organization=self.org, name="Com créditos", rules={"min_credits": 2})
+        refresh_segment(active)
+        refresh_segment(credits)
+        self.assertEqual(len(segment_members(active)), 0)
+
+        self._book(self.bea, timezone.now() + timedelta(days=1))
+        plan = PaymentPlan.objects.create(
+            organization=self.org, name="10 aulas", plan_type=PaymentPlan.PlanType.CREDITS,
+            price=50, credits_included=10,
+        )
+        ClientSubscription.objects.create(
+            organization=self.org, person=self.caio, payment_plan=plan, remaining_credits=3,
+        )
+
+        self.assertEqual(list(refresh_segment(active)), [self.bea.pk])
+        self.assertEqual(list(refresh_segment(credits)), [self.caio.pk])
+        self.assertEqual(len(preview_audience([active, credits], exclude=[self.members])), 2)
+
+    def test_sliding_window_drops_stale_bookings(self):
+        inactive = Segment.objects.create(organization=self.org, name="Inativos", rules={"inactive_days": 7})
+        self._book(self.ana, timezone.now() - timedelta(days=6))
+        now = timezone.now()
+        refresh_segment(inactive, now=now)
+        self.assertNotIn(self.ana.pk, segment_members(inactive))
+
+        members = refresh_segment(inactive, now=now + timedelta(days=2))
+
+        self.assertIn(self.ana.pk, members)
+
+    def test_changing_rules_forces_full_rebuild(self):
+        refresh_segment(self.members)
+        self.members.rules = {"lifecycle_stages": ["lead"]}
+        self.members.save()
+
+        self.assertIsNone(self.members.refreshed_at)
+        self.assertEqual(list(refresh_segment(self.members)), [self.bea.pk])
+
+    def test_invalid_rules_are_rejected(self):
+        segment = Segment(organization=self.org, name="Mau", rules={"optin": "fax", "colour": "red"})
+        with self.assertRaises(ValidationError):
+            segment.full_clean()
+
+    def test_campaign_targets_segment_members(self):
+        template = Template.objects.create(name="Temp", subject="Sub", body="Body")
+        refresh_segment(self.members)
+        campaign = Campaign.objects.create(
+            organization=self.org, name="Camp", template=template, segment=self.members
+        )
+
+        sent = deliver_campaign(campaign)
+
+        self.assertEqual(sent, 1)
+        self.assertEqual([m.to[0] for m in mail.outbox], ["ana@example.com"])
+
+    def test_campaign_refreshes_stale_segment_before_planning(self):
+        template = Template.objects.create(name="Temp", subject="Sub", body="Body")
+        # Nunca calculado: o bitmap está vazio
+        campaign = Campaign.objects.create(
+            organization=self.org, name="Camp", template=template, segment=self.members
+        )
+        self.assertEqual(deliver_campaign(campaign), 1)
+        self.assertEqual([m.to[0] for m in mail.outbox], ["ana@example.com"])
+
+        # Regras alteradas depois do último refresh: não usa o bitmap antigo
+        self.members.refresh_from_db()
+        self.members.rules = {"optin": "email", "lifecycle_stages": ["lead"]}
+        self.members.save()
+        mail.outbox.clear()
+        campaign = Campaign.objects.create(
+            organization=self.org, name="Camp 2", template=template, segment=self.members
+        )
+        self.assertEqual(deliver_campaign(campaign), 1)
+        self.assertEqual([m.to[0] for m in mail.outbox], ["bea@example.com"])
+
+    def test_booking_changes_schedule_segment_refresh_via_outbox(self):
+        Segment.objects.create(organization=self.org, name="Ativos", rules={"booked_within_days": 30})
+        other = Organization.objects.create(name="Outra", domain="outra.com")
+        Segment.objects.create(organization=other, name="Sem reservas", rules={"optin": "email"})
+        self._book(self.ana, timezone.now() + timedelta(days=1))
+        self._book(self.bea, timezone.now() + timedelta(days=2))
+
+        with mock.patch("notifications.outbox_handlers.refresh_segments_task.delay") as delay:
+            with self.captureOnCommitCallbacks(execute=True):
+                relay_outbox()
+                # Agendado só depois do commit do lote (mensagens já desbloqueadas)
+                delay.assert_not_called()
+
+        # Um refresh por organização com segmentos dependentes de reservas
+        delay.assert_called_once_with(organization_id=self.org.pk)
+
+
+class ChurnScoringTestCase(TestCase):
+    def setUp(self):
+        self.org = Organization.objects.create(name="Org", domain="org.com")
+        self.resource = Resource.objects.create(organization=self.org, name="Sala")
+        self.now = timezone.now()
+        self.plan = PaymentPlan.objects.create(
+            organization=self.org, name="10 aulas", plan_type=PaymentPlan.PlanType.CREDITS,
+            price=50, credits_included=10,
+        )
+        self.slot = 0
+
+    def _person(self, name, stage="member", joined_days_ago=365):
+        person = Person.objects.create(
+            organization=self.org, first_name=name, email=f"{name.lower()}@example.com", lifecycle_stage=stage,
+        )
+        Person.objects.filter(pk=person.pk).update(created_at=self.now - timedelta(days=joined_days_ago))
+        return person
+
+    def _book(self, person, days_ago, status=Booking.Status.CONFIRMED):
+        self.slot += 1
+        starts_at = self.now - timedelta(days=days_ago, hours=self.slot)
+        event = Event.objects.create(
+            organization=self.org, resource=self.resource, title="Aula",
+            starts_at=starts_at, ends_at=starts_at + timedelta(minutes=30), capacity=5,
+        )
+        return Booking.objects.create(organization=self.org, event=event, person=person, status=status)
+
+    def _subscribe(self, person, credits, ends_in_days=None):
+        end_date = timezone.localdate(self.now) + timedelta(days=ends_in_days) if ends_in_days is not None else None
+        ClientSubscription.objects.create(
+            organization=self.org, person=person, payment_plan=self.plan,
+            remaining_credits=credits, end_date=end_date,
+        )
+
+    def test_nightly_scoring_moves_stages_and_feeds_segment(self):
+        loyal = self._person("Leal")
+        for days_ago in (3, 10, 17, 24, 40, 55, 70):
+            self._book(loyal, days_ago)
+        self._subscribe(loyal, credits=8)
+
+        fading = self._person("Fading")
+        for days_ago in (35, 45, 50, 60, 75, 80):
+            self._book(fading, days_ago)
+        self._book(fading, 20, status=Booking.Status.NO_SHOW)
+        self._subscribe(fading, credits=0, ends_in_days=5)
+
+        self._book(self._person("Gone"), 120)
+        newcomer = self._person("Novo", joined_days_ago=5)
+        self._book(self._person("Volta", stage="churned"), 2)
+        lead = self._person("Lead", stage="lead")
+        before = Person.objects.get(pk=fading.pk).updated_at
+
+        # Número fixo de consultas (leituras agregadas, bulk_update, segmento), qualquer que seja o nº de clientes
+        with self.assertNumQueries(12):
+            results = score_churn_task(organization_id=self.org.pk)
+
+        stages = dict(Person.objects.values_list("first_name", "lifecycle_stage"))
+        self.assertEqual(stages, {
+            "Leal": "member", "Fading": "churn_risk", "Gone": "churned", "Novo": "churn_risk",
+            "Volta": "member", "Lead": "lead",
+        })
+        self.assertEqual(results[self.org.pk]["scored"], 5)
+        self.assertEqual(results[self.org.pk]["changed"], {"churn_risk": 2, "churned": 1, "member": 1})
+        self.assertGreater(Person.objects.get(pk=fading.pk).updated_at, before)
+        self.assertEqual(Person.objects.get(pk=lead.pk).lifecycle_stage, "lead")
+
+        # O segmento de retenção fica pronto para campanhas
+        segment = Segment.objects.get(organization=self.org, name=CHURN_SEGMENT_NAME)
+        self.assertEqual(sorted(segment_members(segment)), sorted([fading.pk, newcomer.pk]))
+
+    def test_default_subscribers_become_members_when_paying_or_attending(self):
+        def default_person(name):
+            person = Person.objects.create(organization=self.org, first_name=name, email=f"{name}@example.com")
+            Person.objects.filter(pk=person.pk).update(created_at=self.now - timedelta(days=365))
+            return person
+
+        paying = default_person("Paga")
+        self._subscribe(paying, credits=8)
+        for days_ago in (3, 10, 17, 24, 40, 55):
+            self._book(paying, days_ago)
+        self._book(default_person("Frequenta"), 2)
+        fading = default_person("Afasta")
+        self._book(fading, 50)
+        self._subscribe(fading, credits=0, ends_in_days=3)
+        default_person("Newsletter")
+        self.assertEqual(Person._meta.get_field("lifecycle_stage").default, "subscriber")
+
+        results = score_churn_task(organization_id=self.org.pk)
+
+        stages = dict(Person.objects.values_list("first_name", "lifecycle_stage"))
+        self.assertEqual(stages, {
+            "Paga": "member", "Frequenta": "member", "Afasta": "churn_risk", "Newsletter": "subscriber",
+        })
+        self.assertEqual(results[self.org.pk]["scored"], 4)
+
+    def test_recovery_needs_margin_below_threshold(self):
+        features = {
+            "stages": np.array(["churn_risk", "churn_risk", "member"], dtype=object),
+            "days_since_last": np.array([1.0, 1.0, 1.0]),
+            "age_days": np.array([400.0, 400.0, 400.0]),
+            "has_subscription": np.array([True, True, True]),
+            "recent": np.array([1.0, 1.0, 1.0]),
+        }
+        stages = next_stages(features, np.array([0.5, 0.4, 0.59]))
+        self.assertEqual(list(stages), ["churn_risk", "member", "member"])
+
+    def test_scoring_is_vectorised_for_large_member_bases(self):
+        rng = np.random.default_rng(0)
+        size = 100_000
+        features = {
+            "stages": np.array(["member"] * size, dtype=object),
+            "age_days": rng.uniform(0, 1000, size),
+            "recent": rng.integers(0, 12, size).astype(float),
+            "previous": rng.integers(0, 24, size).astype(float),
+            "no_shows": rng.integers(0, 3, size).astype(float),
+            "bookings_90d": rng.integers(0, 36, size).astype(float),
+            "days_since_last": rng.uniform(0, 200, size),
+            "credits": rng.integers(0, 10, size).astype(float),
+            "has_subscription": rng.random(size) > 0.2,
+            "has_credit_plan": rng.random(size) > 0.5,
+            "days_to_end": rng.uniform(-5, 60, size),
+        }
+
+        began = time.perf_counter()
+        scores = churn_scores(features)
+        stages = next_stages(features, scores)
+        elapsed = time.perf_counter() - began
+
+        self.assertTrue(((scores >= 0) & (scores <= 1)).all())
+        self.assertEqual(len(stages), size)
+        self.assertLess(elapsed, 1.0)
@@ -0,0 +1,25 @@
+"""
+Recalcula de raiz os agregados de receita (``RevenueBucket``).
+
+Fazer a carga inicial depois do deploy que cria os agregados (``migrate`` não a
+faz) e usar depois de alterações que não passam pelo outbox (``QuerySet.update``
+ou afiliação de clientes alterada).
+"""
+from django.core.management.base import BaseCommand
+
+from core.models import Organization
+from reports.revenue import rebuild_revenue
+
+
+class Command(BaseCommand):
+    help = "Recalcula os agregados de receita por dia/semana/mês"
+
+    def add_arguments(self, parser):
+        parser.add_argument('--organization', type=int, help='Apenas esta organização (id)')
+
+    def handle(self, *args, **options):
+        organizations = Organization.objects.order_by('pk').values_list('pk', flat=True)
+        if options['organization']:
+            organizations = organizations.filter(pk=options['organization'])
+        total = sum(rebuild_revenue(organization_id) for organization_id in organizations)
+        self.stdout.write(self.style.SUCCESS(f"{total} baldes de receita gravados"))
@@ -0,0 +1,33 @@
+# Generated by Django 5.1.1 on 2026-10-18 22:47
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('core', '0021_outbox_revenue_topics'),
+        ('reports', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='RevenueBucket',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('granularity', models.CharField(choices=[('day', 'Dia'), ('week', 'Semana'), ('month', 'Mês')], max_length=10)),
+                ('period_start', models.DateField()),
+                ('source', models.CharField(choices=[('payment', 'Pagamentos'), ('subscription', 'Subscrições'), ('commission', 'Comissões de instrutores')], max_length=20)),
+                ('entity', models.CharField(choices=[('acr', 'ACR (Ginásio)'), ('proform', 'Proform (Pilates/Wellness)'), ('both', 'Ambas')], max_length=20)),
+                ('method', models.CharField(blank=True, max_length=20)),
+                ('amount', models.DecimalField(decimal_places=2, default=0, max_digits=14)),
+                ('count', models.PositiveIntegerField(default=0)),
+                ('organization', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revenue_buckets', to='core.organization')),
+            ],
+            options={
+                'ordering': ['period_start', 'source', 'entity', 'method'],
+                'constraints': [models.UniqueConstraint(fields=('organization', 'granularity', 'period_start', 'source', 'entity', 'method'), name='revenue_bucket_unique')],
+            },
+        ),
+    ]
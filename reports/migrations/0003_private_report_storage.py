@@ -0,0 +1,19 @@
+# Generated by Django 5.1.1 on 2026-10-18 23:27
+
+import reports.storage
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('reports', '0002_revenuebucket'),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name='reportjob',
+            name='file',
+            field=models.FileField(blank=True, storage=reports.storage.ReportStorage(), upload_to='reports/'),
+        ),
+    ]
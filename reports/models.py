@@ -0,0 +1,91 @@
+from django.conf import settings
+from django.db import models
+
+from core.models import Organization
+
+from .storage import report_storage
+
+
+class ReportJob(models.Model):
+    """Relatório gerado em segundo plano por um worker Celery.
+
+    O resultado é escrito no armazenamento privado ``REPORTS_ROOT`` (ver
+    ``reports.storage``) e descarregado por ``job_download`` quando o estado
+    passa a ``done``; o pedido HTTP só cria o job e consulta o estado.
+    """
+    class Kind(models.TextChoices):
+        EVENTS = "events", "Eventos"
+        BOOKINGS = "bookings", "Reservas"
+        PAYMENTS = "payments", "Pagamentos"
+
+    class Status(models.TextChoices):
+        QUEUED = "queued", "Em fila"
+        RUNNING = "running", "Em execução"
+        DONE = "done", "Concluído"
+        FAILED = "failed", "Falhou"
+
+    ACTIVE_STATUSES = (Status.QUEUED, Status.RUNNING)
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="report_jobs")
+    requested_by = models.ForeignKey(
+        settings.AUTH_USER_MODEL, null=True, blank=True, on_delete=models.SET_NULL, related_name="report_jobs"
+    )
+    kind = models.CharField(max_length=20, choices=Kind.choices)
+    params = models.JSONField(default=dict, blank=True)
+    status = models.CharField(max_length=20, choices=Status.choices, default=Status.QUEUED)
+    file = models.FileField(upload_to="reports/", storage=report_storage, blank=True)
+    row_count = models.PositiveIntegerField(default=0)
+    error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+    started_at = models.DateTimeField(null=True, blank=True)
+    finished_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        ordering = ["-created_at"]
+        indexes = [models.Index(fields=["organization", "status"], name="report_job_org_status_idx")]
+
+    def __str__(self) -> str:
+        return f"{self.get_kind_display()} #{self.pk} ({self.get_status_display()})"
+
+
+class RevenueBucket(models.Model):
+    """Receita agregada por período (dia/semana/mês), origem, entidade e método.
+
+    Mantido incrementalmente a partir do outbox (ver ``reports.revenue``): só os
+    dias alterados são recalculados e as semanas/meses derivam dos dias.
+    """
+    class Source(models.TextChoices):
+        PAYMENT = "payment", "Pagamentos"
+        SUBSCRIPTION = "subscription", "Subscrições"
+        COMMISSION = "commission", "Comissões de instrutores"
+
+    class Granularity(models.TextChoices):
+        DAY = "day", "Dia"
+        WEEK = "week", "Semana"
+        MONTH = "month", "Mês"
+
+    class Entity(models.TextChoices):
+        ACR = "acr", "ACR (Ginásio)"
+        PROFORM = "proform", "Proform (Pilates/Wellness)"
+        BOTH = "both", "Ambas"
+
+    organization = models.ForeignKey(Organization, on_delete=models.CASCADE, related_name="revenue_buckets")
+    granularity = models.CharField(max_length=10, choices=Granularity.choices)
+    period_start = models.DateField()
+    source = models.CharField(max_length=20, choices=Source.choices)
+    entity = models.CharField(max_length=20, choices=Entity.choices)
+    method = models.CharField(max_length=20, blank=True)
+    amount = models.DecimalField(max_digits=14, decimal_places=2, default=0)
+    count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        ordering = ["period_start", "source", "entity", "method"]
+        constraints = [
+            models.UniqueConstraint(
+                fields=["organization", "granularity", "period_start", "source", "entity", "method"],
+                name="revenue_bucket_unique",
+            ),
+        ]
+
+    def __str__(self) -> str:
+        return f"{self.get_source_display()} {self.granularity} {self.period_start}: €{self.amount}"
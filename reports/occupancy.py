@@ -0,0 +1,149 @@
+"""
+Ocupação dos espaços por dia da semana e hora (heatmap).
+
+Os eventos do intervalo e o número de reservas ativas de cada um são lidos
+numa única consulta para arrays colunares NumPy. Cada evento é expandido nas
+horas que ocupa (com a fração de cada hora efetivamente usada) e as somas por
+espaço × dia da semana × hora são feitas com ``np.bincount``, sem ciclos em
+Python por evento.
+
+Matrizes devolvidas (forma ``espaços × 7 × 24``, segunda-feira = 0, hora local):
+
+- ``occupancy``: fração das ocorrências dessa hora da semana, no intervalo, em
+  que o espaço teve aula;
+- ``fill_rate``: lugares reservados / lugares disponíveis nas aulas dessa hora.
+"""
+from __future__ import annotations
+
+from datetime import date, datetime, time, timedelta
+
+import numpy as np
+from django.core.cache import cache
+from django.db.models import Count, Q
+from django.utils import timezone
+
+from core.models import Booking, Event, OutboxMessage
+from core.services.cache_versions import bump_cache_version, cache_version
+from core.services.outbox import publish, register_handler
+
+HOURS_PER_WEEK = 7 * 24
+# Um evento nunca ocupa mais de um dia inteiro de horas
+MAX_EVENT_HOURS = 24
+OCCUPANCY_CACHE_TIMEOUT = 10 * 60
+ACTIVE_BOOKING_STATUSES = (Booking.Status.CONFIRMED, Booking.Status.CHECKED_IN)
+
+
+def load_event_columns(organization, start: date, end: date) -> dict:
+    """Eventos de ``start`` a ``end`` (inclusive) como arrays, numa consulta."""
+    tz = timezone.get_current_timezone()
+    range_start = timezone.make_aware(datetime.combine(start, time.min), tz)
+    range_end = timezone.make_aware(datetime.combine(end + timedelta(days=1), time.min), tz)
+    rows = list(
+        Event.objects.filter(organization=organization, starts_at__gte=range_start, starts_at__lt=range_end)
+        .annotate(booked=Count('bookings', filter=Q(bookings__status__in=ACTIVE_BOOKING_STATUSES)))
+        .values_list('resource_id', 'resource__name', 'starts_at', 'ends_at', 'capacity', 'booked')
+        .order_by()
+    )
+    names = {resource_id: name for resource_id, name, *_ in rows}
+    count = len(rows)
+    return {
+        'resource_id': np.fromiter((row[0] for row in rows), dtype=np.int64, count=count),
+        'starts_at': np.fromiter((row[2].timestamp() for row in rows), dtype=np.float64, count=count),
+        'ends_at': np.fromiter((row[3].timestamp() for row in rows), dtype=np.float64, count=count),
+        'capacity': np.fromiter((row[4] for row in rows), dtype=np.float64, count=count),
+        'booked': np.fromiter((row[5] for row in rows), dtype=np.float64, count=count),
+        'names': names,
+    }
+
+
+def _local_seconds(epoch: np.ndarray) -> np.ndarray:
+    """Converte segundos UTC em segundos "locais" (hora de parede do fuso atual).
+
+    O desvio do fuso só muda nas mudanças de hora, por isso é calculado uma vez
+    por dia distinto e aplicado em bloco.
+    """
+    if not epoch.size:
+        return epoch
+    tz = timezone.get_current_timezone()
+    days, inverse = np.unique(np.floor(epoch / 86400.0).astype(np.int64), return_inverse=True)
+    offsets = np.array([
+        datetime.fromtimestamp(int(day) * 86400 + 43200, tz).utcoffset().total_seconds() for day in days
+    ])
+    return epoch + offsets[inverse]
+
+
+def _weekday_counts(start: date, end: date) -> np.ndarray:
+    """Número de ocorrências de cada dia da semana entre ``start`` e ``end``."""
+    total = (end - start).days + 1
+    counts = np.full(7, total // 7, dtype=np.float64)
+    for offset in range(total % 7):
+        counts[(start.weekday() + offset) % 7] += 1
+    return counts
+
+
+def compute_occupancy(columns: dict, start: date, end: date) -> dict:
+    """Matrizes de ocupação e taxa de preenchimento a partir de ``load_event_columns``."""
+    resource_ids, resource_index = np.unique(columns['resource_id'], return_inverse=True)
+    shape = (len(resource_ids), 7, 24)
+    if not resource_ids.size:
+        return {'resource_ids': resource_ids, 'occupancy': np.zeros(shape), 'fill_rate': np.zeros(shape)}
+
+    begin = _local_seconds(columns['starts_at']) / 3600.0
+    finish = np.maximum(_local_seconds(columns['ends_at']) / 3600.0, begin)
+    first_slot = np.floor(begin).astype(np.int64)
+    slots_per_event = np.clip(np.ceil(finish).astype(np.int64) - first_slot, 1, MAX_EVENT_HOURS)
+
+    # Expansão evento -> horas ocupadas: (evento, hora absoluta) para cada par
+    event_of_slot = np.repeat(np.arange(len(first_slot)), slots_per_event)
+    position = np.arange(event_of_slot.size) - np.repeat(np.cumsum(slots_per_event) - slots_per_event, slots_per_event)
+    slot = first_slot[event_of_slot] + position
+    used = np.clip(np.minimum(finish[event_of_slot], slot + 1) - np.maximum(begin[event_of_slot], slot), 0, 1)
+
+    # 1970-01-01 foi quinta-feira (weekday 3)
+    weekday = (slot // 24 + 3) % 7
+    hour = slot % 24
+    flat = resource_index[event_of_slot] * HOURS_PER_WEEK + weekday * 24 + hour
+    size = len(resource_ids) * HOURS_PER_WEEK
+
+    hours_used = np.bincount(flat, weights=used, minlength=size).reshape(shape)
+    seats = np.bincount(flat, weights=used * columns['capacity'][event_of_slot], minlength=size).reshape(shape)
+    booked = np.bincount(flat, weights=used * columns['booked'][event_of_slot], minlength=size).reshape(shape)
+
+    # Intervalos curtos podem não incluir todos os dias da semana
+    occurrences = np.broadcast_to(_weekday_counts(start, end)[None, :, None], shape)
+    occupancy = np.minimum(np.divide(hours_used, occurrences, out=np.zeros(shape), where=occurrences > 0), 1.0)
+    fill_rate = np.divide(booked, seats, out=np.zeros(shape), where=seats > 0)
+    return {'resource_ids': resource_ids, 'occupancy': occupancy, 'fill_rate': fill_rate}
+
+
+def occupancy_heatmap(organization, start: date, end: date) -> dict:
+    """Heatmap serializável (JSON), em cache por organização e intervalo."""
+    version = cache_version("occupancy", organization.id)
+    cache_key = f"reports:occupancy:{organization.id}:v{version}:{start.isoformat()}:{end.isoformat()}"
+    cached = cache.get(cache_key)
+    if cached is not None:
+        return cached
+
+    columns = load_event_columns(organization, start, end)
+    result = compute_occupancy(columns, start, end)
+    payload = {
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'resources': [
+            {'id': int(resource_id), 'name': columns['names'][resource_id]}
+            for resource_id in result['resource_ids'].tolist()
+        ],
+        'occupancy': np.round(result['occupancy'], 3).tolist(),
+        'fill_rate': np.round(result['fill_rate'], 3).tolist(),
+    }
+    cache.set(cache_key, payload, timeout=OCCUPANCY_CACHE_TIMEOUT)
+    return payload
+
+
+@register_handler(
+    OutboxMessage.Topic.EVENT_CHANGED, OutboxMessage.Topic.EVENT_DELETED, OutboxMessage.Topic.BOOKING_CHANGED
+)
+def bump_occupancy_cache(messages):
+    """Invalida os heatmaps das organizações com eventos/reservas alterados."""
+    for organization_id in {message.organization_id for message in messages}:
+        publish(bump_cache_version, "occupancy", organization_id)
@@ -0,0 +1,239 @@
+"""
+Agregados de receita por período (``RevenueBucket``).
+
+Pagamentos concluídos, subscrições pagas e comissões de instrutores são
+somados por dia, semana (segunda-feira) e mês, por organização, entidade
+(ACR/Proform) e método de pagamento. As gravações destes modelos registam no
+outbox os dias afetados; o handler ``refresh_revenue_buckets`` recalcula esses
+dias a partir das tabelas de origem e volta a derivar as semanas e meses que os
+contêm a partir dos baldes diários. Os recálculos substituem os valores (não
+somam deltas), pelo que reentregas do outbox são inofensivas.
+
+Qualquer total de um período lê apenas baldes: meses completos mais os dias
+soltos nas pontas (``revenue_total``).
+"""
+from __future__ import annotations
+
+from collections import defaultdict
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.db import transaction
+from django.db.models import CharField, Count, F, Sum, Value
+from django.db.models.functions import Coalesce, TruncDate
+
+from core.models import ClientSubscription, InstructorCommission, OutboxMessage, Payment, Person
+from core.services.outbox import register_handler
+
+from .models import RevenueBucket
+
+Source = RevenueBucket.Source
+Granularity = RevenueBucket.Granularity
+
+SOURCE_BY_TOPIC = {
+    OutboxMessage.Topic.PAYMENT_CHANGED: Source.PAYMENT,
+    OutboxMessage.Topic.SUBSCRIPTION_CHANGED: Source.SUBSCRIPTION,
+    OutboxMessage.Topic.COMMISSION_CHANGED: Source.COMMISSION,
+}
+
+# Afiliação do cliente -> entidade do balde
+PERSON_ENTITY = {
+    Person.EntityAffiliation.ACR_ONLY: RevenueBucket.Entity.ACR,
+    Person.EntityAffiliation.PROFORM_ONLY: RevenueBucket.Entity.PROFORM,
+    Person.EntityAffiliation.BOTH: RevenueBucket.Entity.BOTH,
+}
+
+
+def week_start(day: date) -> date:
+    return day - timedelta(days=day.weekday())
+
+
+def month_start(day: date) -> date:
+    return day.replace(day=1)
+
+
+def _next_month(day: date) -> date:
+    return (day.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+
+def _source_rows(source: str, organization_id: int, days=None):
+    """Totais por (dia, entidade, método) lidos das tabelas de origem.
+
+    O dia de cada linha segue ``revenue_day()`` do modelo correspondente.
+    """
+    if source == Source.PAYMENT:
+        queryset = Payment.objects.filter(
+            organization_id=organization_id, status=Payment.Status.COMPLETED
+        ).annotate(
+            day=Coalesce('paid_date', TruncDate('created_at')),
+            bucket_entity=F('person__entity_affiliation'),
+            bucket_method=F('method'),
+            value=F('amount'),
+        )
+    elif source == Source.SUBSCRIPTION:
+        queryset = ClientSubscription.objects.filter(organization_id=organization_id, is_paid=True).annotate(
+            day=Coalesce('payment_date', 'start_date'),
+            bucket_entity=F('payment_plan__entity_type'),
+            bucket_method=Value('', output_field=CharField()),
+            # Preço fixado na compra (subscrições anteriores ao campo: preço do plano)
+            value=Coalesce('price', 'payment_plan__price'),
+        )
+    else:
+        queryset = InstructorCommission.objects.filter(organization_id=organization_id).annotate(
+            day=TruncDate('event__starts_at'),
+            bucket_entity=Coalesce('event__modality__entity_type', 'event__resource__entity_type'),
+            bucket_method=Value('', output_field=CharField()),
+            value=F('instructor_amount'),
+        )
+    if days is not None:
+        queryset = queryset.filter(day__in=list(days))
+    rows = queryset.values('day', 'bucket_entity', 'bucket_method').annotate(total=Sum('value'), n=Count('pk'))
+    for row in rows.order_by():
+        entity = PERSON_ENTITY.get(row['bucket_entity'], row['bucket_entity'])
+        yield row['day'], entity, row['bucket_method'], row['total'] or Decimal('0'), row['n']
+
+
+def _replace(organization_id: int, source: str, granularity: str, periods, totals: dict) -> None:
+    """Substitui os baldes de ``periods`` pelos valores em ``totals``."""
+    if periods:
+        RevenueBucket.objects.filter(
+            organization_id=organization_id, source=source, granularity=granularity, period_start__in=list(periods)
+        ).delete()
+    RevenueBucket.objects.bulk_create([
+        RevenueBucket(
+            organization_id=organization_id, source=source, granularity=granularity,
+            period_start=period, entity=entity, method=method, amount=amount, count=count,
+        )
+        for (period, entity, method), (amount, count) in totals.items()
+        if count
+    ])
+
+
+def _rollup(rows, period_of) -> dict:
+    totals = defaultdict(lambda: [Decimal('0'), 0])
+    for day, entity, method, amount, count in rows:
+        bucket = totals[(period_of(day), entity, method)]
+        bucket[0] += amount
+        bucket[1] += count
+    return totals
+
+
+def refresh_days(organization_id: int, source: str, days) -> None:
+    """Recalcula os baldes diários de ``days`` e as semanas/meses que os contêm."""
+    days = set(days)
+    if not days:
+        return
+    with transaction.atomic():
+        _replace(organization_id, source, Granularity.DAY, days,
+                 _rollup(_source_rows(source, organization_id, days), lambda day: day))
+
+        weeks = {week_start(day) for day in days}
+        months = {month_start(day) for day in days}
+        start = min(min(weeks), min(months))
+        end = max(max(week + timedelta(days=7) for week in weeks), _next_month(max(months)))
+        daily = [
+            (bucket.period_start, bucket.entity, bucket.method, bucket.amount, bucket.count)
+            for bucket in RevenueBucket.objects.filter(
+                organization_id=organization_id, source=source, granularity=Granularity.DAY,
+                period_start__gte=start, period_start__lt=end,
+            )
+        ]
+        _replace(organization_id, source, Granularity.WEEK, weeks,
+                 _rollup([row for row in daily if week_start(row[0]) in weeks], week_start))
+        _replace(organization_id, source, Granularity.MONTH, months,
+                 _rollup([row for row in daily if month_start(row[0]) in months], month_start))
+
+
+def rebuild_revenue(organization_id: int) -> int:
+    """Recalcula todos os baldes de uma organização (carga inicial ou correções).
+
+    Returns:
+        int: número de baldes gravados
+    """
+    created = 0
+    with transaction.atomic():
+        RevenueBucket.objects.filter(organization_id=organization_id).delete()
+        for source in Source.values:
+            rows = list(_source_rows(source, organization_id))
+            for granularity, period_of in (
+                (Granularity.DAY, lambda day: day),
+                (Granularity.WEEK, week_start),
+                (Granularity.MONTH, month_start),
+            ):
+                totals = _rollup(rows, period_of)
+                _replace(organization_id, source, granularity, (), totals)
+                created += len(totals)
+    return created
+
+
+# --- Leitura -------------------------------------------------------------------------
+
+
+def _buckets(organization, granularity, start, end, source=None, entity=None, method=None):
+    queryset = RevenueBucket.objects.filter(
+        organization=organization, granularity=granularity, period_start__gte=start, period_start__lt=end
+    )
+    if source:
+        queryset = queryset.filter(source=source)
+    if entity:
+        queryset = queryset.filter(entity=entity)
+    if method:
+        queryset = queryset.filter(method=method)
+    return queryset
+
+
+def revenue_total(organization, start: date, end: date, **filters) -> Decimal:
+    """Receita entre ``start`` e ``end`` (inclusive), lida só dos baldes.
+
+    Os meses completos do intervalo vêm dos baldes mensais; os dias nas pontas
+    vêm dos baldes diários.
+    """
+    stop = end + timedelta(days=1)
+    first_month = start if start.day == 1 else _next_month(start)
+    last_month = month_start(stop)
+    total = Decimal('0')
+    if first_month < last_month:
+        total += _buckets(organization, Granularity.MONTH, first_month, last_month, **filters).aggregate(
+            total=Sum('amount'))['total'] or 0
+        edges = [(start, first_month), (last_month, stop)]
+    else:
+        edges = [(start, stop)]
+    for edge_start, edge_end in edges:
+        if edge_start < edge_end:
+            total += _buckets(organization, Granularity.DAY, edge_start, edge_end, **filters).aggregate(
+                total=Sum('amount'))['total'] or 0
+    return total
+
+
+def revenue_series(organization, granularity: str, start: date, end: date, group_by: str | None = None,
+                   **filters) -> list[dict]:
+    """Série de receita por período, opcionalmente separada por ``source``/``entity``/``method``."""
+    period_of = {Granularity.DAY: lambda day: day, Granularity.WEEK: week_start, Granularity.MONTH: month_start}
+    fields = ['period_start'] + ([group_by] if group_by else [])
+    rows = (
+        _buckets(organization, granularity, period_of[granularity](start), end + timedelta(days=1), **filters)
+        .values(*fields)
+        .annotate(total=Sum('amount'), n=Sum('count'))
+        .order_by(*fields)
+    )
+    series = []
+    for row in rows:
+        item = {'period': row['period_start'].isoformat(), 'amount': float(row['total']), 'count': row['n']}
+        if group_by:
+            item[group_by] = row[group_by]
+        series.append(item)
+    return series
+
+
+# --- Handler do outbox ---------------------------------------------------------------
+
+
+@register_handler(*SOURCE_BY_TOPIC)
+def refresh_revenue_buckets(messages):
+    """Recalcula os dias de receita referidos nas mensagens do lote."""
+    dirty = defaultdict(set)
+    for message in messages:
+        key = (message.organization_id, SOURCE_BY_TOPIC[message.topic])
+        dirty[key].update(date.fromisoformat(day) for day in message.payload.get("days", []))
+    for (organization_id, source), days in dirty.items():
+        refresh_days(organization_id, source, days)
@@ -1,11 +1,39 @@
+import logging
+import os
+import secrets
+from datetime import timedelta
+from pathlib import Path
+
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
 from django.core.cache import cache
+from django.db import transaction
 from django.db.models import Sum
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from kombu.exceptions import OperationalError
+
+from core.models import Booking, Organization, Person, Event, Payment
+from core.services.cache_versions import cache_version
+from core.services.exports import (
+    BOOKING_EXPORT_HEADER,
+    EVENT_EXPORT_HEADER,
+    PAYMENT_EXPORT_HEADER,
+    booking_export_rows,
+    date_bounds,
+    event_export_rows,
+    iter_csv,
+    iter_encoded,
+    payment_export_rows,
+)
+
+from .models import ReportJob
 
-from core.models import Organization, Person, Event, Payment
+logger = logging.getLogger(__name__)
 
 
 def get_summary_data(organization: Organization) -> dict:
-    cache_key = f"reports:summary:{organization.id}"
+    cache_key = f"reports:summary:{organization.id}:v{cache_version('reports', organization.id)}"
     cached = cache.get(cache_key)
     if cached:
         return cached
@@ -22,3 +50,199 @@ def get_summary_data(organization: Organization) -> dict:
     }
     cache.set(cache_key, payload, timeout=60)
     return payload
+
+
+class ReportLimitExceeded(Exception):
+    """A organização já tem o número máximo de relatórios em curso."""
+
+
+def _date_range(params: dict):
+    start_date = parse_date(params.get('start_date') or '') if params.get('start_date') else None
+    end_date = parse_date(params.get('end_date') or '') if params.get('end_date') else None
+    return date_bounds(start_date, end_date)
+
+
+def _event_rows(organization, params):
+    events = Event.objects.filter(organization=organization).order_by('starts_at')
+    start, end = _date_range(params)
+    if start:
+        events = events.filter(starts_at__gte=start)
+    if end:
+        events = events.filter(starts_at__lt=end)
+    return event_export_rows(events)
+
+
+def _booking_rows(organization, params):
+    bookings = Booking.objects.filter(organization=organization).order_by('event__starts_at', 'pk')
+    start, end = _date_range(params)
+    if start:
+        bookings = bookings.filter(event__starts_at__gte=start)
+    if end:
+        bookings = bookings.filter(event__starts_at__lt=end)
+    return booking_export_rows(bookings)
+
+
+def _payment_rows(organization, params):
+    payments = Payment.objects.filter(organization=organization).order_by('created_at', 'pk')
+    start, end = _date_range(params)
+    if start:
+        payments = payments.filter(created_at__gte=start)
+    if end:
+        payments = payments.filter(created_at__lt=end)
+    return payment_export_rows(payments)
+
+
+# Tipo de relatório -> (cabeçalho, gerador de linhas)
+REPORT_BUILDERS = {
+    ReportJob.Kind.EVENTS: (EVENT_EXPORT_HEADER, _event_rows),
+    ReportJob.Kind.BOOKINGS: (BOOKING_EXPORT_HEADER, _booking_rows),
+    ReportJob.Kind.PAYMENTS: (PAYMENT_EXPORT_HEADER, _payment_rows),
+}
+
+
+def active_jobs(organization: Organization):
+    """Jobs em fila ou em execução (os que excedem o timeout já não contam)."""
+    cutoff = timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+    return ReportJob.objects.filter(
+        organization=organization, status__in=ReportJob.ACTIVE_STATUSES, created_at__gte=cutoff
+    )
+
+
+def enqueue_report(organization: Organization, kind: str, params: dict | None = None, user=None) -> ReportJob:
+    """Cria um ``ReportJob`` e agenda a geração num worker.
+
+    Raises:
+        ReportLimitExceeded: se a organização já tiver
+            ``REPORT_JOBS_PER_ORGANIZATION`` relatórios em curso.
+    """
+    from .tasks import generate_report_task
+
+    if kind not in REPORT_BUILDERS:
+        raise ValueError(f"Tipo de relatório desconhecido: {kind}")
+
+    with transaction.atomic():
+        # Serializa pedidos concorrentes da mesma organização antes de contar
+        Organization.objects.select_for_update().filter(pk=organization.pk).exists()
+        if active_jobs(organization).count() >= settings.REPORT_JOBS_PER_ORGANIZATION:
+            raise ReportLimitExceeded(
+                f"Já existem {settings.REPORT_JOBS_PER_ORGANIZATION} relatórios em curso para esta organização."
+            )
+        job = ReportJob.objects.create(
+            organization=organization, kind=kind, params=params or {}, requested_by=user
+        )
+
+        def dispatch():
+            try:
+                generate_report_task.delay(job.pk)
+            except OperationalError as exc:
+                logger.warning("Não foi possível agendar o relatório %s: %s", job.pk, exc)
+                ReportJob.objects.filter(pk=job.pk).update(
+                    status=ReportJob.Status.FAILED, error="Serviço de tarefas indisponível.",
+                    finished_at=timezone.now(),
+                )
+
+        transaction.on_commit(dispatch)
+    return job
+
+
+TIMEOUT_ERROR = "Tempo limite de geração excedido."
+
+
+def _report_path(job: ReportJob) -> str:
+    """Caminho do ficheiro do job, relativo a ``REPORTS_ROOT`` (nome não previsível)."""
+    return f"{job.organization_id}/{job.pk}-{job.kind}-{secrets.token_hex(8)}.csv.gz"
+
+
+def _storage():
+    return ReportJob._meta.get_field("file").storage
+
+
+def fail_job(job_id: int, error: str) -> int:
+    """Marca o job como falhado se ainda estiver em fila/execução."""
+    return ReportJob.objects.filter(pk=job_id, status__in=ReportJob.ACTIVE_STATUSES).update(
+        status=ReportJob.Status.FAILED, error=error, finished_at=timezone.now()
+    )
+
+
+def run_report_job(job_id: int) -> ReportJob:
+    """Gera o relatório em blocos para ``REPORTS_ROOT`` e atualiza o estado do job."""
+    claimed = ReportJob.objects.filter(pk=job_id, status=ReportJob.Status.QUEUED).update(
+        status=ReportJob.Status.RUNNING, started_at=timezone.now()
+    )
+    job = ReportJob.objects.select_related('organization').get(pk=job_id)
+    if not claimed:
+        # Já tratado por outra entrega da mesma tarefa
+        return job
+
+    header, build_rows = REPORT_BUILDERS[job.kind]
+    relative = _report_path(job)
+    path = Path(_storage().path(relative))
+    partial = path.with_name(path.name + ".part")
+    row_count = 0
+
+    def counted(rows):
+        nonlocal row_count
+        for row in rows:
+            row_count += 1
+            yield row
+
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(partial, "wb") as handle:
+            chunks = iter_csv(header, counted(build_rows(job.organization, job.params)))
+            for data in iter_encoded(chunks, compress=True):
+                handle.write(data)
+        # Só publica o ficheiro completo
+        os.replace(partial, path)
+    except Exception as exc:
+        timed_out = isinstance(exc, SoftTimeLimitExceeded)
+        if timed_out:
+            logger.error("Relatório %s excedeu o tempo limite", job.pk)
+        else:
+            logger.exception("Falha ao gerar o relatório %s", job.pk)
+        partial.unlink(missing_ok=True)
+        job.status = ReportJob.Status.FAILED
+        job.error = TIMEOUT_ERROR if timed_out else str(exc)[:2000]
+        job.finished_at = timezone.now()
+        job.save(update_fields=['status', 'error', 'finished_at'])
+        return job
+
+    job.file.name = relative
+    job.row_count = row_count
+    job.status = ReportJob.Status.DONE
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'row_count', 'status', 'finished_at'])
+    return job
+
+
+def fail_stale_report_jobs(now=None) -> int:
+    """Marca como falhados os jobs em fila/execução além de ``REPORT_JOB_TIMEOUT``.
+
+    Cobre os workers mortos (``time_limit``, OOM, reinício) que não chegaram a
+    atualizar o job; remove também o ficheiro parcial que tenham deixado.
+    """
+    now = now or timezone.now()
+    cutoff = now - timedelta(seconds=settings.REPORT_JOB_TIMEOUT)
+    stale = list(
+        ReportJob.objects.filter(status__in=ReportJob.ACTIVE_STATUSES, created_at__lt=cutoff)
+        .values_list('pk', 'organization_id')
+    )
+    if not stale:
+        return 0
+    root = Path(_storage().location)
+    for pk, organization_id in stale:
+        for partial in (root / str(organization_id)).glob(f"{pk}-*.part"):
+            partial.unlink(missing_ok=True)
+    return ReportJob.objects.filter(
+        pk__in=[pk for pk, _ in stale], status__in=ReportJob.ACTIVE_STATUSES
+    ).update(status=ReportJob.Status.FAILED, error=TIMEOUT_ERROR, finished_at=now)
+
+
+def purge_report_jobs(now=None) -> int:
+    """Apaga jobs (e ficheiros) com mais de ``REPORT_JOB_RETENTION_HOURS``."""
+    cutoff = (now or timezone.now()) - timedelta(hours=settings.REPORT_JOB_RETENTION_HOURS)
+    expired = ReportJob.objects.filter(created_at__lt=cutoff)
+    for job in expired.exclude(file="").only('pk', 'file').iterator():
+        job.file.delete(save=False)
+    deleted, _ = expired.delete()
+    return deleted
@@ -0,0 +1,32 @@
+"""
+Armazenamento privado dos ficheiros de relatório.
+
+Os relatórios têm dados pessoais (nomes, NIF, pagamentos) e ficam em
+``REPORTS_ROOT``, fora de ``MEDIA_ROOT`` (servido publicamente pelo nginx em
+``/media/``). Não têm URL: só são entregues pela vista ``job_download``, que
+valida a organização e o papel do utilizador.
+"""
+import os
+
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.utils.deconstruct import deconstructible
+
+
+@deconstructible
+class ReportStorage(FileSystemStorage):
+    """``FileSystemStorage`` em ``settings.REPORTS_ROOT`` (lido a cada acesso)."""
+
+    @property
+    def base_location(self):
+        return settings.REPORTS_ROOT
+
+    @property
+    def location(self):
+        return os.path.abspath(self.base_location)
+
+    def url(self, name):
+        raise ValueError("Os relatórios não têm URL pública; usar a vista job_download.")
+
+
+report_storage = ReportStorage()
@@ -0,0 +1,31 @@
+from celery import shared_task
+from celery.exceptions import SoftTimeLimitExceeded
+from django.conf import settings
+
+from .models import ReportJob
+from .services import TIMEOUT_ERROR, fail_job, fail_stale_report_jobs, purge_report_jobs, run_report_job
+
+# Margem entre o limite suave (o job é marcado como falhado) e o limite que mata o worker
+REPORT_JOB_SOFT_MARGIN = 30
+
+
+@shared_task(
+    acks_late=True,
+    soft_time_limit=max(settings.REPORT_JOB_TIMEOUT - REPORT_JOB_SOFT_MARGIN, 1),
+    time_limit=settings.REPORT_JOB_TIMEOUT,
+)
+def generate_report_task(job_id: int) -> str:
+    """Gera um relatório (encaminhada para a fila ``reports``)."""
+    try:
+        return run_report_job(job_id).status
+    except SoftTimeLimitExceeded:
+        # Fora da escrita do ficheiro (ex. ao reclamar o job)
+        fail_job(job_id, TIMEOUT_ERROR)
+        return ReportJob.Status.FAILED
+
+
+@shared_task
+def purge_report_jobs_task() -> int:
+    """Falha os jobs presos (worker morto) e apaga os jobs expirados."""
+    fail_stale_report_jobs()
+    return purge_report_jobs()
@@ -7,4 +7,9 @@ app_name = 'reports'
 urlpatterns = [
     path('dashboard/', views.dashboard, name='dashboard'),
     path('data/summary/', views.summary_data, name='summary_data'),
+    path('data/revenue/', views.revenue_data, name='revenue_data'),
+    path('data/occupancy/', views.occupancy_data, name='occupancy_data'),
+    path('jobs/', views.job_create, name='job_create'),
+    path('jobs/<int:job_id>/', views.job_status, name='job_status'),
+    path('jobs/<int:job_id>/download/', views.job_download, name='job_download'),
 ]
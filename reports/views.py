@@ -1,8 +1,19 @@
-from django.http import JsonResponse, Http404
-from django.shortcuts import render
+from datetime import timedelta
+
+from django.http import FileResponse, JsonResponse, Http404
+from django.shortcuts import get_object_or_404, render
 from django.contrib.auth.decorators import login_required
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.dateparse import parse_date
+from django.views.decorators.http import require_GET, require_POST
+
+from core.auth_views import role_required
 
-from .services import get_summary_data
+from .models import ReportJob, RevenueBucket
+from .occupancy import occupancy_heatmap
+from .revenue import revenue_series, revenue_total
+from .services import REPORT_BUILDERS, ReportLimitExceeded, enqueue_report, get_summary_data
 
 
 @login_required
@@ -19,3 +30,136 @@ def summary_data(request):
         return JsonResponse({"error": "organization_not_found"}, status=404)
     data = get_summary_data(organization)
     return JsonResponse(data)
+
+
+def _job_payload(job: ReportJob) -> dict:
+    payload = {
+        "id": job.pk,
+        "kind": job.kind,
+        "status": job.status,
+        "row_count": job.row_count,
+        "created_at": job.created_at.isoformat(),
+        "finished_at": job.finished_at.isoformat() if job.finished_at else None,
+        "status_url": reverse("reports:job_status", args=[job.pk]),
+    }
+    if job.status == ReportJob.Status.DONE:
+        payload["download_url"] = reverse("reports:job_download", args=[job.pk])
+    if job.status == ReportJob.Status.FAILED:
+        payload["error"] = job.error
+    return payload
+
+
+def _organization_job(request, job_id):
+    organization = getattr(request, "organization", None)
+    if not organization:
+        raise Http404("Organização não encontrada.")
+    return get_object_or_404(ReportJob, pk=job_id, organization=organization)
+
+
+@role_required(["admin", "staff"])
+@require_POST
+def job_create(request):
+    """Agenda a geração de um relatório; o cliente consulta depois ``status_url``."""
+    organization = getattr(request, "organization", None)
+    if not organization:
+        return JsonResponse({"error": "organization_not_found"}, status=404)
+    kind = request.POST.get("kind") or ""
+    if kind not in REPORT_BUILDERS:
+        return JsonResponse({"error": "invalid_kind"}, status=400)
+    params = {
+        key: request.POST[key] for key in ("start_date", "end_date") if request.POST.get(key)
+    }
+    try:
+        job = enqueue_report(organization, kind, params, user=request.user)
+    except ReportLimitExceeded as exc:
+        return JsonResponse({"error": "too_many_jobs", "message": str(exc)}, status=429)
+    return JsonResponse(_job_payload(job), status=202)
+
+
+@role_required(["admin", "staff"])
+@require_GET
+def job_status(request, job_id):
+    return JsonResponse(_job_payload(_organization_job(request, job_id)))
+
+
+@role_required(["admin", "staff"])
+@require_GET
+def job_download(request, job_id):
+    job = _organization_job(request, job_id)
+    if job.status != ReportJob.Status.DONE or not job.file:
+        raise Http404("Relatório ainda não disponível.")
+    return FileResponse(
+        job.file.open("rb"), as_attachment=True,
+        filename=f"{job.kind}-{job.pk}.csv.gz", content_type="application/gzip",
+    )
+
+
+REVENUE_GROUPS = {"source", "entity", "method"}
+
+
+def _date_range(request, default_start):
+    """Intervalo ``start``/``end`` do pedido (fim por omissão: hoje).
+
+    ``default_start`` recebe o fim e devolve o início por omissão. Devolve
+    ``None`` para datas inválidas (ex. 2026-02-30) ou início depois do fim.
+    """
+    try:
+        end = parse_date(request.GET.get("end") or "") or timezone.localdate()
+        start = parse_date(request.GET.get("start") or "") or default_start(end)
+    except ValueError:
+        return None
+    if start > end:
+        return None
+    return start, end
+
+
+@role_required(["admin", "staff"])
+@require_GET
+def revenue_data(request):
+    """Receita por período lida dos agregados (``RevenueBucket``).
+
+    Parâmetros: ``granularity`` (day/week/month), ``start``/``end`` (datas,
+    por omissão os últimos 12 meses), ``group_by`` (source/entity/method) e
+    filtros ``source``, ``entity`` e ``method``.
+    """
+    organization = getattr(request, "organization", None)
+    if not organization:
+        return JsonResponse({"error": "organization_not_found"}, status=404)
+
+    granularity = request.GET.get("granularity") or RevenueBucket.Granularity.MONTH
+    group_by = request.GET.get("group_by") or None
+    if granularity not in RevenueBucket.Granularity.values or (group_by and group_by not in REVENUE_GROUPS):
+        return JsonResponse({"error": "invalid_parameters"}, status=400)
+    dates = _date_range(request, lambda end: (end - timedelta(days=365)).replace(day=1))
+    if dates is None:
+        return JsonResponse({"error": "invalid_parameters"}, status=400)
+    start, end = dates
+    filters = {key: request.GET[key] for key in ("source", "entity", "method") if request.GET.get(key)}
+
+    return JsonResponse({
+        "granularity": granularity,
+        "start": start.isoformat(),
+        "end": end.isoformat(),
+        "total": float(revenue_total(organization, start, end, **filters)),
+        "series": revenue_series(organization, granularity, start, end, group_by=group_by, **filters),
+    })
+
+
+OCCUPANCY_MAX_DAYS = 366
+
+
+@role_required(["admin", "staff"])
+@require_GET
+def occupancy_data(request):
+    """Ocupação e taxa de preenchimento por espaço × dia da semana × hora.
+
+    Parâmetros ``start``/``end`` (datas; por omissão as últimas 12 semanas).
+    """
+    organization = getattr(request, "organization", None)
+    if not organization:
+        return JsonResponse({"error": "organization_not_found"}, status=404)
+    dates = _date_range(request, lambda end: end - timedelta(weeks=12))
+    if dates is None or (dates[1] - dates[0]).days >= OCCUPANCY_MAX_DAYS:
+        return JsonResponse({"error": "invalid_parameters"}, status=400)
+    start, end = dates
+    return JsonResponse(occupancy_heatmap(organization, start, end))
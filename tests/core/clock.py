@@ -0,0 +1,23 @@
+"""
+Relógio falso para os testes dos limitadores de débito.
+
+Pode ser passado como ``clock``/``sleep`` a ``RateLimiter`` ou substituir o
+módulo ``time`` (``time()``/``sleep()``); as esperas avançam o relógio sem
+esperas reais e ficam registadas em ``sleeps``.
+"""
+
+
+class FakeClock:
+    def __init__(self, now=100.0):
+        self.now = now
+        self.sleeps = []
+
+    def __call__(self):
+        return self.now
+
+    def time(self):
+        return self.now
+
+    def sleep(self, seconds):
+        self.sleeps.append(seconds)
+        self.now += seconds
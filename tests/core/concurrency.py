@@ -0,0 +1,46 @@
+"""
+Harness de concorrência para testes com base de dados.
+
+``run_concurrently`` corre a mesma função em várias threads, libertadas ao
+mesmo tempo por uma barreira, cada uma com a sua ligação à base de dados
+(fechada no fim). Devolve os resultados e as exceções por thread. Usar com
+``@pytest.mark.django_db(transaction=True)`` para que as threads vejam os
+dados gravados pelo teste.
+
+Em SQLite as escritas são serializadas pelo lock da base de dados; as threads
+que não o obtêm a tempo repetem a operação (``retry_on``), como repetiria um
+worker. Em PostgreSQL os ``UPDATE`` concorrentes correm de facto em paralelo.
+"""
+import threading
+import time
+
+from django.db import OperationalError, connection
+
+
+def run_concurrently(func, workers: int, *, retry_on=(OperationalError,), attempts: int = 50):
+    barrier = threading.Barrier(workers)
+    results = [None] * workers
+    errors = [None] * workers
+
+    def worker(index):
+        try:
+            barrier.wait()
+            for attempt in range(attempts):
+                try:
+                    results[index] = func(index)
+                    break
+                except retry_on:
+                    if attempt == attempts - 1:
+                        raise
+                    time.sleep(0.01)
+        except Exception as exc:  # noqa: BLE001 - devolvida ao teste
+            errors[index] = exc
+        finally:
+            connection.close()
+
+    threads = [threading.Thread(target=worker, args=(index,)) for index in range(workers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results, errors
@@ -0,0 +1,183 @@
+"""
+Fake local da API HTTP do Google Calendar (v3) para testes.
+
+Implementa o subconjunto usado por ``GoogleCalendarService`` — inserção de
+calendários, insert/update/delete/list de eventos (com ``syncToken`` e
+paginação) e pedidos em batch (``multipart/mixed``) — e conta as idas à rede
+em ``round_trips``. O cliente real do ``googleapiclient`` é construído contra
+este objeto com o documento de discovery estático, por isso a serialização dos
+pedidos é exercitada de ponta a ponta.
+"""
+import itertools
+import json
+import urllib.parse
+from email.parser import FeedParser
+
+import httplib2
+from googleapiclient.discovery import build
+
+BATCH_PATH = "/batch/calendar/v3"
+API_PREFIX = "/calendar/v3"
+
+
+class FakeCalendarApi:
+    def __init__(self):
+        self.calendars = {}
+        self.round_trips = 0
+        self.operations = []
+        # Estados HTTP a devolver nas próximas operações (ex.: [429, 403])
+        self.errors = []
+        self.expired_sync_tokens = set()
+        self._ids = itertools.count(1)
+        self._sequence = 0
+
+    # --- API pública para os testes -------------------------------------------------
+
+    def build_service(self):
+        return build("calendar", "v3", http=self, static_discovery=True, cache_discovery=False)
+
+    def add_calendar(self, calendar_id: str):
+        self.calendars.setdefault(calendar_id, {})
+        return calendar_id
+
+    def add_remote_event(self, calendar_id: str, summary: str, start: str, end: str, event_id=None) -> dict:
+        """Simula um evento criado/alterado diretamente no Google."""
+        body = {"summary": summary, "start": {"dateTime": start}, "end": {"dateTime": end}}
+        if event_id and event_id in self.calendars.get(calendar_id, {}):
+            return self._store(calendar_id, event_id, body)
+        return self._store(calendar_id, event_id or f"g{next(self._ids)}", body)
+
+    def cancel_remote_event(self, calendar_id: str, event_id: str):
+        self._touch(self.calendars[calendar_id][event_id], status="cancelled")
+
+    def count(self, method: str) -> int:
+        return sum(1 for op_method, _ in self.operations if op_method == method)
+
+    # --- Interface httplib2 ------------------------------------------------------------
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=None, connection_type=None):
+        self.round_trips += 1
+        parsed = urllib.parse.urlparse(uri)
+        if parsed.path == BATCH_PATH:
+            return self._batch(body, headers or {})
+        status, payload = self._dispatch(method, parsed.path, parsed.query, body)
+        return self._response(status), json.dumps(payload).encode("utf-8")
+
+    # --- Implementação -----------------------------------------------------------------
+
+    @staticmethod
+    def _response(status: int, content_type: str = "application/json"):
+        return httplib2.Response({"status": str(status), "content-type": content_type})
+
+    def _touch(self, event: dict, **changes) -> dict:
+        self._sequence += 1
+        event.update(changes, _seq=self._sequence)
+        return event
+
+    def _store(self, calendar_id: str, event_id: str, body: dict) -> dict:
+        events = self.calendars.setdefault(calendar_id, {})
+        event = events.setdefault(event_id, {"id": event_id, "status": "confirmed"})
+        event.update(body)
+        return self._touch(event, status="confirmed")
+
+    @staticmethod
+    def _public(event: dict) -> dict:
+        return {key: value for key, value in event.items() if not key.startswith("_")}
+
+    @staticmethod
+    def _error(status: int, reason: str):
+        return status, {"error": {"code": status, "message": reason, "errors": [{"reason": reason}]}}
+
+    def _dispatch(self, method: str, path: str, query: str, body):
+        if not path.startswith(API_PREFIX):
+            return self._error(404, "notFound")
+        parts = [urllib.parse.unquote(p) for p in path[len(API_PREFIX):].strip("/").split("/")]
+        self.operations.append((method, "/".join(parts)))
+
+        if self.errors:
+            status = self.errors.pop(0)
+            reason = "rateLimitExceeded" if status in (403, 429) else "backendError"
+            return self._error(status, reason)
+
+        data = json.loads(body) if body else {}
+        params = urllib.parse.parse_qs(query)
+
+        if parts == ["calendars"] and method == "POST":
+            calendar_id = f"cal{next(self._ids)}@group.calendar.google.com"
+            self.add_calendar(calendar_id)
+            return 200, {"id": calendar_id, **data}
+
+        if len(parts) >= 3 and parts[0] == "calendars" and parts[2] == "events":
+            calendar_id = parts[1]
+            if calendar_id not in self.calendars:
+                return self._error(404, "notFound")
+            events = self.calendars[calendar_id]
+            if len(parts) == 3 and method == "POST":
+                return 200, self._public(self._store(calendar_id, f"g{next(self._ids)}", data))
+            if len(parts) == 3 and method == "GET":
+                return self._list(events, params)
+            event_id = parts[3]
+            if event_id not in events:
+                return self._error(404, "notFound")
+            if method == "PUT":
+                return 200, self._public(self._store(calendar_id, event_id, data))
+            if method == "DELETE":
+                self._touch(events[event_id], status="cancelled")
+                return 204, {}
+            if method == "GET":
+                return 200, self._public(events[event_id])
+
+        return self._error(404, "notFound")
+
+    def _list(self, events: dict, params: dict):
+        sync_token = params.get("syncToken", [None])[0]
+        if sync_token in self.expired_sync_tokens:
+            return self._error(410, "fullSyncRequired")
+
+        items = sorted(events.values(), key=lambda event: event["_seq"])
+        if sync_token is not None:
+            items = [event for event in items if event["_seq"] > int(sync_token)]
+        else:
+            items = [event for event in items if event["status"] != "cancelled"]
+
+        offset = int(params.get("pageToken", ["0"])[0])
+        page_size = int(params.get("maxResults", ["250"])[0])
+        page = items[offset:offset + page_size]
+        payload = {"items": [self._public(event) for event in page]}
+        if offset + page_size < len(items):
+            payload["nextPageToken"] = str(offset + page_size)
+        else:
+            payload["nextSyncToken"] = str(self._sequence)
+        return 200, payload
+
+    def _batch(self, body, headers):
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        parser = FeedParser()
+        parser.feed(f"content-type: {headers['content-type']}\r\n\r\n{body}")
+        message = parser.close()
+
+        boundary = "fake_batch_boundary"
+        chunks = []
+        for part in message.get_payload():
+            request_line, raw = part.get_payload().split("\n", 1)
+            method, target, _ = request_line.split(" ", 2)
+            inner = FeedParser()
+            inner.feed(raw)
+            inner_body = inner.close().get_payload() or None
+            parsed = urllib.parse.urlparse(target)
+            status, payload = self._dispatch(method, parsed.path, parsed.query, inner_body)
+            content_id = part["Content-ID"]
+            chunks.append(
+                f"--{boundary}\r\n"
+                "Content-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id[1:]}\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\n"
+                "Content-Type: application/json\r\n\r\n"
+                f"{json.dumps(payload)}\r\n"
+            )
+        content = "".join(chunks) + f"--{boundary}--\r\n"
+        return (
+            self._response(200, f'multipart/mixed; boundary="{boundary}"'),
+            content.encode("utf-8"),
+        )
@@ -0,0 +1,85 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.core.management import call_command
+
+from core.models import Organization, Payment, Person
+from core.services.billing import billing_run
+
+from .concurrency import run_concurrently
+
+
+@pytest.fixture
+def org():
+    return Organization.objects.create(
+        name="Org", domain="org.local", gym_monthly_fee=Decimal("30.00"), wellness_monthly_fee=Decimal("45.00")
+    )
+
+
+def _person(org, n, **fields):
+    return Person.objects.create(organization=org, first_name=f"Cliente {n}", nif=str(n), **fields)
+
+
+@pytest.mark.django_db
+def test_billing_run_bills_active_people_by_affiliation(org, django_assert_num_queries):
+    gym = _person(org, 1)
+    pilates = _person(org, 2, entity_affiliation=Person.EntityAffiliation.PROFORM_ONLY)
+    both = _person(org, 3, entity_affiliation=Person.EntityAffiliation.BOTH)
+    _person(org, 4, status=Person.Status.INACTIVE)
+    other_org = Organization.objects.create(name="Outra", domain="outra.local")
+    _person(other_org, 5)
+
+    # Lock da organização + consulta dos clientes + bulk_create (um bloco) + savepoint
+    with django_assert_num_queries(5):
+        result = billing_run(org, date(2026, 5, 17))
+
+    assert result == {"period": "2026-05-01", "created": 3, "total": Decimal("150.00")}
+    fees = dict(Payment.objects.filter(organization=org).values_list("person_id", "amount"))
+    assert fees == {gym.pk: Decimal("30.00"), pilates.pk: Decimal("45.00"), both.pk: Decimal("75.00")}
+    for person in (gym, pilates, both):
+        assert fees[person.pk] == person.get_monthly_fee()
+    payment = Payment.objects.get(person=gym)
+    assert payment.status == Payment.Status.PENDING
+    assert payment.billing_period == date(2026, 5, 1)
+    assert payment.due_date == date(2026, 5, 9)
+
+
+@pytest.mark.django_db
+def test_billing_run_is_idempotent_per_period(org):
+    first = _person(org, 1)
+    billing_run(org, date(2026, 5, 1))
+    Payment.objects.filter(person=first).update(status=Payment.Status.COMPLETED)
+    second = _person(org, 2)
+
+    again = billing_run(org, date(2026, 5, 31))
+    june = billing_run(org, date(2026, 6, 1), chunk_size=1)
+
+    assert again["created"] == 1
+    assert june["created"] == 2
+    assert Payment.objects.filter(person=first).count() == 2
+    assert Payment.objects.filter(person=second, billing_period=date(2026, 5, 1)).count() == 1
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_billing_runs_count_each_payment_once(org):
+    for n in range(1, 6):
+        _person(org, n)
+
+    results, errors = run_concurrently(lambda _index: billing_run(org, date(2026, 5, 1)), workers=4)
+
+    assert errors == [None] * 4
+    assert sum(result["created"] for result in results) == 5
+    assert sum(result["total"] for result in results) == Decimal("150.00")
+    assert Payment.objects.filter(organization=org, billing_period=date(2026, 5, 1)).count() == 5
+
+
+@pytest.mark.django_db
+def test_billing_run_command(org, capsys):
+    _person(org, 1)
+
+    call_command("billing_run", "--organization", str(org.pk), "--month", "2026-07")
+    call_command("billing_run", "--organization", str(org.pk), "--month", "2026-07")
+
+    assert Payment.objects.filter(billing_period=date(2026, 7, 1)).count() == 1
+    assert "0 mensalidades" in capsys.readouterr().out
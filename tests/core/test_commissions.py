@@ -0,0 +1,161 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from django.utils import timezone
+
+from core.models import (
+    Booking,
+    ClientSubscription,
+    Event,
+    Instructor,
+    InstructorCommission,
+    Modality,
+    Organization,
+    OutboxMessage,
+    PaymentPlan,
+    Person,
+    Resource,
+)
+from core.services.commissions import close_month
+from core.services.outbox import drain_outbox
+from reports.revenue import revenue_total
+
+
+@pytest.fixture
+def org():
+    return Organization.objects.create(name="Org", domain="org.local")
+
+
+@pytest.fixture
+def setup(org):
+    gym = Resource.objects.create(organization=org, name="Sala", entity_type=Resource.EntityType.ACR)
+    pilates = Modality.objects.create(organization=org, name="Pilates", entity_type=Modality.EntityType.PROFORM)
+    rui = Instructor.objects.create(organization=org, first_name="Rui")
+    sara = Instructor.objects.create(organization=org, first_name="Sara", proform_commission_rate=Decimal("50"))
+    credits = PaymentPlan.objects.create(
+        organization=org, name="10 aulas", plan_type=PaymentPlan.PlanType.CREDITS,
+        price=Decimal("100.00"), credits_included=10,
+    )
+    monthly = PaymentPlan.objects.create(organization=org, name="Mensal", price=Decimal("60.00"))
+    people = [
+        Person.objects.create(organization=org, first_name=f"Cliente {n}", nif=str(n), email=f"c{n}@example.com")
+        for n in range(4)
+    ]
+    subscriptions = {
+        "credits": ClientSubscription.objects.create(
+            organization=org, person=people[0], payment_plan=credits, remaining_credits=10
+        ),
+        "monthly": ClientSubscription.objects.create(organization=org, person=people[1], payment_plan=monthly),
+    }
+    return {
+        "gym": gym, "pilates": pilates, "rui": rui, "sara": sara,
+        "people": people, "subscriptions": subscriptions,
+    }
+
+
+def _event(org, resource, instructor, day, modality=None):
+    start = timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=10))
+    return Event.objects.create(
+        organization=org, resource=resource, instructor=instructor, modality=modality,
+        title="Aula", starts_at=start, ends_at=start + timedelta(hours=1),
+    )
+
+
+def _book(org, event, person, **fields):
+    return Booking.objects.create(organization=org, event=event, person=person, **fields)
+
+
+@pytest.mark.django_db
+def test_close_month_computes_revenue_rates_and_payouts(org, setup):
+    people, subscriptions = setup["people"], setup["subscriptions"]
+    gym_class = _event(org, setup["gym"], setup["rui"], date(2026, 3, 10))
+    _book(org, gym_class, people[0], subscription_used=subscriptions["credits"])  # 100/10
+    _book(org, gym_class, people[1], subscription_used=subscriptions["monthly"])  # 60/8
+    _book(org, gym_class, people[2], is_paid=True, payment_amount=Decimal("12.00"))
+    _book(org, gym_class, people[3], is_paid=True, payment_amount=Decimal("99.00"), status=Booking.Status.CANCELLED)
+
+    pilates_class = _event(org, setup["gym"], setup["sara"], date(2026, 3, 20), modality=setup["pilates"])
+    _book(org, pilates_class, people[0], subscription_used=subscriptions["credits"], credits_used=2)
+    _book(org, pilates_class, people[2], is_paid=True, payment_amount=Decimal("15.00"), status=Booking.Status.NO_SHOW)
+
+    # Fora do mês e aula ainda por acontecer não contam
+    _event(org, setup["gym"], setup["rui"], date(2026, 4, 2))
+    now = timezone.make_aware(datetime(2026, 4, 1, 12))
+
+    result = close_month(org, 2026, 3, now=now)
+
+    assert result["events"] == 2
+    gym_commission = InstructorCommission.objects.get(event=gym_class)
+    assert gym_commission.total_revenue == Decimal("29.50")
+    assert gym_commission.commission_rate == Decimal("60.00")
+    assert gym_commission.instructor_amount == Decimal("17.70")
+    assert gym_commission.entity_amount == Decimal("11.80")
+    pilates_commission = InstructorCommission.objects.get(event=pilates_class)
+    assert pilates_commission.total_revenue == Decimal("35.00")
+    assert pilates_commission.instructor_amount == Decimal("17.50")
+
+    assert [(p["instructor"], p["classes"], p["amount"], p["due"]) for p in result["payouts"]] == [
+        ("Rui", 1, Decimal("17.70"), Decimal("17.70")),
+        ("Sara", 1, Decimal("17.50"), Decimal("17.50")),
+    ]
+
+    # bulk_create não passa por save(): os dias seguem pelo outbox para os agregados
+    assert OutboxMessage.objects.filter(topic=OutboxMessage.Topic.COMMISSION_CHANGED).exists()
+    drain_outbox()
+    assert revenue_total(org, date(2026, 3, 1), date(2026, 3, 31), source="commission") == Decimal("35.20")
+
+
+@pytest.mark.django_db
+def test_close_month_is_idempotent_and_keeps_paid_commissions(org, setup):
+    people = setup["people"]
+    first = _event(org, setup["gym"], setup["rui"], date(2026, 3, 3))
+    second = _event(org, setup["gym"], setup["rui"], date(2026, 3, 4))
+    _book(org, first, people[2], is_paid=True, payment_amount=Decimal("10.00"))
+    _book(org, second, people[2], is_paid=True, payment_amount=Decimal("20.00"))
+    now = timezone.make_aware(datetime(2026, 4, 1, 12))
+
+    close_month(org, 2026, 3, now=now)
+    InstructorCommission.objects.filter(event=first).update(is_paid=True)
+    _book(org, first, people[3], is_paid=True, payment_amount=Decimal("10.00"))
+    _book(org, second, people[3], is_paid=True, payment_amount=Decimal("20.00"))
+
+    result = close_month(org, 2026, 3, now=now)
+
+    assert InstructorCommission.objects.count() == 2
+    assert InstructorCommission.objects.get(event=first).total_revenue == Decimal("10.00")
+    assert InstructorCommission.objects.get(event=second).total_revenue == Decimal("40.00")
+    assert result["payouts"][0]["amount"] == Decimal("30.00")
+    assert result["payouts"][0]["due"] == Decimal("24.00")
+
+
+@pytest.mark.django_db
+def test_close_month_moves_unpaid_commission_to_new_instructor(org, setup):
+    event = _event(org, setup["gym"], setup["rui"], date(2026, 3, 5))
+    _book(org, event, setup["people"][2], is_paid=True, payment_amount=Decimal("10.00"))
+    now = timezone.make_aware(datetime(2026, 4, 1, 12))
+    close_month(org, 2026, 3, now=now)
+
+    event.instructor = setup["sara"]
+    event.save()
+    close_month(org, 2026, 3, now=now)
+
+    assert list(InstructorCommission.objects.values_list("instructor__first_name", flat=True)) == ["Sara"]
+
+
+@pytest.mark.django_db
+def test_close_month_clears_revenue_of_class_left_without_instructor(org, setup):
+    event = _event(org, setup["gym"], setup["rui"], date(2026, 3, 5))
+    _book(org, event, setup["people"][2], is_paid=True, payment_amount=Decimal("10.00"))
+    now = timezone.make_aware(datetime(2026, 4, 1, 12))
+    close_month(org, 2026, 3, now=now)
+    drain_outbox()
+    assert revenue_total(org, date(2026, 3, 1), date(2026, 3, 31), source="commission") == Decimal("6.00")
+
+    event.instructor = None
+    event.save()
+    close_month(org, 2026, 3, now=now)
+    drain_outbox()
+
+    assert not InstructorCommission.objects.exists()
+    assert revenue_total(org, date(2026, 3, 1), date(2026, 3, 31), source="commission") == 0
@@ -0,0 +1,172 @@
+from datetime import datetime
+
+import pytest
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    ClientSubscription,
+    CreditBalanceSnapshot,
+    CreditHistory,
+    Organization,
+    PaymentPlan,
+    Person,
+    UserProfile,
+)
+from core.services.alerts import CreditHistoryService
+from core.services.credits import (
+    InsufficientCredits,
+    balance_at,
+    consume_credits,
+    credit_statement,
+    refund_credits,
+    take_snapshots,
+    verify_snapshots,
+)
+from core.services.locks import cache_lock
+
+from .concurrency import run_concurrently
+
+
+def _subscription(credits=5, plan_type=PaymentPlan.PlanType.CREDITS):
+    org = Organization.objects.create(name="Org", domain="org.local")
+    person = Person.objects.create(organization=org, first_name="Ana", nif="1", email="ana@example.com")
+    plan = PaymentPlan.objects.create(
+        organization=org, name="Plano", plan_type=plan_type, price=50, credits_included=credits
+    )
+    return ClientSubscription.objects.create(
+        organization=org, person=person, payment_plan=plan, remaining_credits=credits
+    )
+
+
+@pytest.mark.django_db
+def test_consume_and_refund_write_history_from_returned_balance(django_assert_num_queries):
+    subscription = _subscription(credits=5)
+    stale = ClientSubscription.objects.get(pk=subscription.pk)
+
+    # savepoint, UPDATE ... RETURNING, INSERT do histórico, release
+    with django_assert_num_queries(4):
+        entry = consume_credits(subscription, 2)
+    assert (entry.credits_before, entry.credits_after, entry.credits_amount) == (5, 3, -2)
+    assert subscription.remaining_credits == 3
+
+    # Instância desatualizada (saldo 5): o histórico segue o saldo real
+    entry = consume_credits(stale.pk, 1)
+    assert (entry.credits_before, entry.credits_after) == (3, 2)
+    entry = refund_credits(stale, 1)
+    assert (entry.action, entry.credits_before, entry.credits_after) == (CreditHistory.Action.REFUND, 2, 3)
+
+    with pytest.raises(InsufficientCredits):
+        consume_credits(subscription, 4)
+    subscription.refresh_from_db()
+    assert subscription.remaining_credits == 3
+    assert CreditHistory.objects.count() == 3
+
+
+@pytest.mark.django_db
+def test_use_credit_on_non_credit_plan_has_no_ledger_movement():
+    subscription = _subscription(credits=0, plan_type=PaymentPlan.PlanType.MONTHLY)
+
+    assert subscription.use_credit() is True
+    assert consume_credits(subscription) is None
+    assert not CreditHistory.objects.exists()
+
+
+@pytest.mark.django_db(transaction=True)
+def test_concurrent_consumption_never_overspends():
+    subscription = _subscription(credits=5)
+
+    def book(_index):
+        try:
+            return consume_credits(subscription.pk, 1).credits_after
+        except InsufficientCredits:
+            return None
+
+    results, errors = run_concurrently(book, workers=8)
+
+    assert errors == [None] * 8
+    balances = [after for after in results if after is not None]
+    assert sorted(balances) == [0, 1, 2, 3, 4]
+    subscription.refresh_from_db()
+    assert subscription.remaining_credits == 0
+    history = CreditHistory.objects.filter(subscription=subscription)
+    assert sorted(history.values_list("credits_before", flat=True)) == [1, 2, 3, 4, 5]
+
+
+def _at(month, day=1):
+    return timezone.make_aware(datetime(2026, month, day))
+
+
+def _backdate(entry, when):
+    CreditHistory.objects.filter(pk=entry.pk).update(created_at=when)
+
+
+@pytest.mark.django_db
+def test_snapshots_are_incremental_and_balances_read_recent_deltas(django_assert_num_queries):
+    subscription = _subscription(credits=10)
+    for month, day, credits in ((1, 5, 2), (1, 20, 1), (2, 3, 3), (3, 10, 1)):
+        _backdate(consume_credits(subscription, credits), _at(month, day))
+    _backdate(refund_credits(subscription, 1), _at(3, 12))
+
+    assert take_snapshots(_at(2)) == 1
+    assert take_snapshots(_at(3)) == 1
+    assert take_snapshots(_at(3)) == 0
+    # Outro processo a gravar o mesmo instante: esta chamada não grava nem conta nada
+    with cache_lock(f"credit-snapshots:{_at(4).isoformat()}"):
+        assert take_snapshots(_at(4)) == 0
+    assert not CreditBalanceSnapshot.objects.filter(taken_at=_at(4)).exists()
+    assert list(CreditBalanceSnapshot.objects.order_by("taken_at").values_list("balance", "entries")) == [
+        (7, 2), (4, 3),
+    ]
+
+    # Último snapshot + movimentos desde então
+    with django_assert_num_queries(2):
+        assert balance_at(subscription, _at(3, 11)) == 3
+    assert balance_at(subscription, _at(1, 1)) == 10
+    assert balance_at(subscription, _at(4)) == subscription.remaining_credits == 4
+
+    statement = credit_statement(subscription, _at(3), _at(4))
+    assert (statement["opening"], len(statement["entries"]), statement["closing"]) == (4, 2, 4)
+    assert verify_snapshots() == []
+
+
+@pytest.mark.django_db
+def test_verify_snapshots_flags_ledger_mismatches():
+    subscription = _subscription(credits=5)
+    _backdate(consume_credits(subscription, 1), _at(1, 10))
+    take_snapshots(_at(2))
+    snapshot = CreditBalanceSnapshot.objects.get()
+
+    late = consume_credits(subscription, 1)
+    _backdate(late, _at(1, 15))  # movimento retroativo, depois do snapshot
+
+    assert verify_snapshots() == [snapshot.pk]
+    assert verify_snapshots(organization_id=subscription.organization_id + 1) == []
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["org.local"])
+def test_credit_history_shows_the_month_statement_from_snapshots(client):
+    subscription = _subscription(credits=10)
+    for month, day, credits in ((1, 5, 2), (2, 3, 3), (2, 20, 1)):
+        _backdate(consume_credits(subscription, credits), _at(month, day))
+    take_snapshots(_at(2))
+
+    summary = CreditHistoryService.get_client_credit_summary(
+        subscription.person, subscription.organization, _at(2), _at(3)
+    )
+    (statement,) = summary["statements"]
+    assert statement["subscription"] == subscription
+    assert (statement["opening"], len(statement["entries"]), statement["closing"]) == (8, 2, 4)
+
+    user = User.objects.create_user(username="ana", password="pwd")
+    UserProfile.objects.create(user=user, organization=subscription.organization, person=subscription.person)
+    client.force_login(user)
+    response = client.get(
+        reverse("core:credit_history"), {"month": "2026-02"}, secure=True, HTTP_HOST="org.local"
+    )
+    assert response.status_code == 200
+    assert response.context["credit_summary"]["statements"][0]["closing"] == 4
+    assert response.context["next_month"].isoformat() == "2026-03-01"
@@ -0,0 +1,80 @@
+from datetime import date
+
+import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
+
+from core.models import Membership, Organization, Person
+from core.services.eligibility import MembershipEligibility, eligibility_for
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def org():
+    return Organization.objects.create(name="Org", domain="org.local")
+
+
+@pytest.fixture
+def people(org):
+    people = [
+        Person.objects.create(organization=org, first_name=f"Cliente {n}", nif=str(n), email=f"c{n}@example.com")
+        for n in range(4)
+    ]
+    ana, rui, bea, _ = people
+    Membership.objects.create(organization=org, person=ana, plan="Anual", starts_on=date(2026, 1, 1))
+    Membership.objects.create(
+        organization=org, person=rui, plan="Mensal", starts_on=date(2026, 1, 1), ends_on=date(2026, 1, 31)
+    )
+    # Renovação contígua e um intervalo separado
+    Membership.objects.create(
+        organization=org, person=rui, plan="Mensal", starts_on=date(2026, 2, 1), ends_on=date(2026, 2, 28)
+    )
+    Membership.objects.create(
+        organization=org, person=rui, plan="Mensal", starts_on=date(2026, 5, 1), ends_on=date(2026, 5, 31)
+    )
+    Membership.objects.create(
+        organization=org, person=bea, plan="Anual", starts_on=date(2026, 1, 1), status=Membership.Status.CANCELLED
+    )
+    return people
+
+
+@pytest.mark.django_db
+def test_active_on_answers_many_people_and_days_from_one_query(org, people, django_assert_num_queries):
+    ana, rui, bea, other = people
+    eligibility = MembershipEligibility(org.pk)
+    ids = [person.pk for person in people]
+
+    with django_assert_num_queries(1):
+        assert eligibility.active_on(ids, date(2025, 12, 31)) == set()
+        assert eligibility.active_on(ids, date(2026, 2, 15)) == {ana.pk, rui.pk}
+        assert eligibility.active_on(ids, date(2026, 3, 15)) == {ana.pk}
+        assert eligibility.active_on(ids, date(2026, 5, 31)) == {ana.pk, rui.pk}
+        assert not eligibility.is_active(bea.pk, date(2026, 2, 1))
+
+    starts, ends = eligibility._intervals[rui.pk]
+    assert [date.fromordinal(day) for day in starts] == [date(2026, 1, 1), date(2026, 5, 1)]
+    assert date.fromordinal(ends[0]) == date(2026, 2, 28)
+
+
+@pytest.mark.django_db
+def test_request_scoped_instance_is_invalidated_on_membership_change(
+    org, people, django_assert_num_queries, django_capture_on_commit_callbacks
+):
+    other = people[3]
+    request = RequestFactory().get("/")
+
+    assert not eligibility_for(org, request).is_active(other.pk, date(2026, 6, 1))
+    with django_assert_num_queries(0):
+        assert eligibility_for(org, request).active_on([other.pk], date(2026, 6, 1)) == set()
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Membership.objects.create(organization=org, person=other, plan="Anual", starts_on=date(2026, 6, 1))
+
+    assert eligibility_for(org, request).is_active(other.pk, date(2026, 6, 1))
+    assert eligibility_for(org, request) is eligibility_for(org, request)
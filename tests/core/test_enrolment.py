@@ -0,0 +1,171 @@
+from datetime import timedelta
+
+import pytest
+from django.utils import timezone
+
+from core.models import (
+    Booking,
+    ClassGroup,
+    ClientSubscription,
+    CreditHistory,
+    Event,
+    Modality,
+    Organization,
+    OutboxMessage,
+    PaymentPlan,
+    Person,
+    Resource,
+)
+from core.services import enrolment
+from core.services.enrolment import enrol_members
+
+
+@pytest.fixture
+def org():
+    return Organization.objects.create(name="Org", domain="org.local")
+
+
+@pytest.fixture
+def group(org):
+    modality = Modality.objects.create(organization=org, name="Pilates")
+    return ClassGroup.objects.create(organization=org, name="Turma A", modality=modality, max_students=3)
+
+
+@pytest.fixture
+def plans(org):
+    credits = PaymentPlan.objects.create(
+        organization=org, name="Pack", plan_type=PaymentPlan.PlanType.CREDITS, price=50, credits_included=10
+    )
+    monthly = PaymentPlan.objects.create(
+        organization=org, name="Mensal", plan_type=PaymentPlan.PlanType.MONTHLY, price=30
+    )
+    return credits, monthly
+
+
+def _person(org, name, status=Person.Status.ACTIVE):
+    return Person.objects.create(organization=org, first_name=name, nif=name, email=f"{name}@example.com", status=status)
+
+
+def _event(org, group, hours, **fields):
+    resource = Resource.objects.create(organization=org, name=f"Sala {hours}")
+    start = timezone.now() + timedelta(hours=hours)
+    return Event.objects.create(
+        organization=org, resource=resource, title="Aula", event_type=Event.EventType.GROUP_CLASS,
+        class_group=group, starts_at=start, ends_at=start + timedelta(hours=1), **fields,
+    )
+
+
+def _join(group, people):
+    """Adiciona membros sem a propagação (``m2m_changed``)."""
+    ClassGroup.members.through.objects.bulk_create(
+        [ClassGroup.members.through(classgroup=group, person=person) for person in people]
+    )
+
+
+@pytest.mark.django_db
+def test_creating_group_class_books_members_once_against_max_students(org, group, plans):
+    credits, monthly = plans
+    ana, rui, bea, eva = (_person(org, name) for name in ("ana", "rui", "bea", "eva"))
+    inactive = _person(org, "ivo", status=Person.Status.INACTIVE)
+    _join(group, [ana, rui, inactive, bea, eva])
+    pack = ClientSubscription.objects.create(organization=org, person=ana, payment_plan=credits, remaining_credits=2)
+    empty = ClientSubscription.objects.create(organization=org, person=bea, payment_plan=credits, remaining_credits=0)
+    mensal = ClientSubscription.objects.create(organization=org, person=rui, payment_plan=monthly)
+    # Com mensalidade ativa, o pack de créditos não é usado
+    rui_pack = ClientSubscription.objects.create(organization=org, person=rui, payment_plan=credits, remaining_credits=3)
+
+    event = _event(org, group, 24)
+
+    bookings = {booking.person_id: booking for booking in Booking.objects.filter(event=event)}
+    assert set(bookings) == {ana.pk, rui.pk, bea.pk, eva.pk}
+    assert bookings[eva.pk].status == Booking.Status.WAITLIST
+    assert [bookings[p.pk].status for p in (ana, rui, bea)] == [Booking.Status.CONFIRMED] * 3
+    assert bookings[ana.pk].subscription_used_id == pack.pk
+    assert bookings[rui.pk].subscription_used_id == mensal.pk
+    assert bookings[bea.pk].subscription_used_id is None
+    empty.refresh_from_db()
+    assert empty.remaining_credits == 0
+
+    pack.refresh_from_db()
+    rui_pack.refresh_from_db()
+    assert (pack.remaining_credits, rui_pack.remaining_credits) == (1, 3)
+    entry = CreditHistory.objects.get()
+    assert (entry.booking_id, entry.credits_before, entry.credits_after) == (bookings[ana.pk].pk, 2, 1)
+    assert OutboxMessage.objects.filter(topic=OutboxMessage.Topic.BOOKING_CHANGED).count() == 4
+
+    # Repetir não duplica nem ultrapassa a capacidade
+    assert enrol_members([event]) == {"confirmed": 0, "waitlist": 0, "skipped": 0}
+
+
+@pytest.mark.django_db
+def test_enrol_members_query_count_does_not_grow_with_events(org, group, plans, django_assert_num_queries):
+    credits, _ = plans
+    events = [_event(org, group, hours, waitlist_enabled=False) for hours in (24, 48, 72)]
+    people = [_person(org, f"c{n}") for n in range(5)]
+    _join(group, people)
+    for person in people:
+        ClientSubscription.objects.create(organization=org, person=person, payment_plan=credits, remaining_credits=2)
+
+    with django_assert_num_queries(12):
+        result = enrol_members(events)
+
+    assert result == {"confirmed": 9, "waitlist": 0, "skipped": 6}
+    balances = sorted(ClientSubscription.objects.values_list("remaining_credits", flat=True))
+    assert balances == [0, 0, 0, 2, 2]  # 3 primeiros membros, créditos gastos nas 2 primeiras aulas
+    assert CreditHistory.objects.count() == 6
+    assert Booking.objects.filter(subscription_used__isnull=True).count() == 3
+
+
+@pytest.mark.django_db
+def test_membership_changes_propagate_to_future_events_in_chunks(org, group, plans, monkeypatch):
+    credits, _ = plans
+    monkeypatch.setattr(enrolment, "ENROLMENT_CHUNK_SIZE", 2)
+    past = _event(org, group, -48)
+    future = [_event(org, group, hours) for hours in (24, 48, 72)]
+    ana = _person(org, "ana")
+    pack = ClientSubscription.objects.create(organization=org, person=ana, payment_plan=credits, remaining_credits=5)
+
+    group.members.add(ana)
+
+    assert set(Booking.objects.filter(person=ana).values_list("event_id", flat=True)) == {e.pk for e in future}
+    pack.refresh_from_db()
+    assert pack.remaining_credits == 2
+    assert not past.bookings.exists()
+
+    ana.class_groups.remove(group)
+
+    assert set(Booking.objects.filter(person=ana).values_list("status", flat=True)) == {Booking.Status.CANCELLED}
+    pack.refresh_from_db()
+    assert pack.remaining_credits == 5
+    assert CreditHistory.objects.filter(action=CreditHistory.Action.REFUND).count() == 3
+
+    rui = _person(org, "rui")
+    group.members.add(rui)
+    assert Booking.objects.filter(person=rui, status=Booking.Status.CONFIRMED).count() == 3
+    group.members.clear()
+    assert not Booking.objects.exclude(status=Booking.Status.CANCELLED).exists()
+
+
+@pytest.mark.django_db
+def test_readded_member_reactivates_cancelled_bookings(org, group, plans):
+    credits, _ = plans
+    events = [_event(org, group, hours) for hours in (24, 48)]
+    ana, rui = _person(org, "ana"), _person(org, "rui")
+    pack = ClientSubscription.objects.create(organization=org, person=ana, payment_plan=credits, remaining_credits=5)
+
+    group.members.add(ana)
+    group.members.remove(ana)
+    pack.refresh_from_db()
+    assert pack.remaining_credits == 5
+
+    # Entretanto a primeira aula enche (max_students=3)
+    others = [_person(org, f"c{n}") for n in range(3)]
+    Booking.objects.bulk_create([Booking(organization=org, event=events[0], person=person) for person in others])
+    group.members.add(rui, ana)
+
+    statuses = dict(Booking.objects.filter(person=ana).values_list("event_id", "status"))
+    assert statuses == {events[0].pk: Booking.Status.WAITLIST, events[1].pk: Booking.Status.CONFIRMED}
+    assert Booking.objects.filter(person=ana).count() == 2
+    assert Booking.objects.get(person=ana, event=events[1]).subscription_used_id == pack.pk
+    pack.refresh_from_db()
+    assert pack.remaining_credits == 4
@@ -0,0 +1,87 @@
+from datetime import date
+
+import pytest
+
+from core.models import ClientSubscription, CreditHistory, Organization, PaymentPlan, Person, SystemAlert
+from core.services.alerts import AlertService
+from core.services.expiry import run_expiry
+
+TODAY = date(2026, 6, 1)
+
+
+def _subscription(org, name, plan, credits=0, **fields):
+    person = Person.objects.create(organization=org, first_name=name, nif=name, email=f"{name}@example.com")
+    return ClientSubscription.objects.create(
+        organization=org, person=person, payment_plan=plan, remaining_credits=credits, **fields
+    )
+
+
+@pytest.fixture
+def org():
+    return Organization.objects.create(name="Org", domain="org.local")
+
+
+@pytest.fixture
+def plans(org):
+    credits = PaymentPlan.objects.create(
+        organization=org, name="Pack 10", plan_type=PaymentPlan.PlanType.CREDITS, price=50, credits_included=10
+    )
+    monthly = PaymentPlan.objects.create(
+        organization=org, name="Mensal", plan_type=PaymentPlan.PlanType.MONTHLY, price=30
+    )
+    return credits, monthly
+
+
+@pytest.mark.django_db
+def test_run_expiry_is_set_based(org, plans, django_assert_num_queries):
+    credits, monthly = plans
+    old_credits = _subscription(org, "ana", credits, 4, credits_expire_date=date(2026, 5, 31))
+    ended = _subscription(org, "rui", credits, 2, end_date=date(2026, 5, 15))
+    ended_monthly = _subscription(org, "bea", monthly, end_date=date(2026, 5, 31))
+    current = _subscription(org, "eva", credits, 3, credits_expire_date=TODAY, end_date=TODAY)
+    empty = _subscription(org, "ivo", credits, 0, credits_expire_date=date(2026, 5, 1))
+    for n in range(5):
+        _subscription(org, f"extra{n}", credits, 1, credits_expire_date=date(2026, 4, 1))
+
+    # savepoint, SELECT (bloqueio), INSERT ... SELECT, 2 UPDATE, alertas, release
+    with django_assert_num_queries(7):
+        result = run_expiry(TODAY)
+
+    assert result == {"credits_expired": 7, "history": 7, "subscriptions_expired": 2}
+    states = dict(ClientSubscription.objects.values_list("pk", "status"))
+    assert states[ended.pk] == states[ended_monthly.pk] == ClientSubscription.Status.EXPIRED
+    assert states[old_credits.pk] == states[current.pk] == states[empty.pk] == ClientSubscription.Status.ACTIVE
+    old_credits.refresh_from_db()
+    current.refresh_from_db()
+    assert (old_credits.remaining_credits, current.remaining_credits) == (0, 3)
+
+    entry = CreditHistory.objects.get(subscription=old_credits)
+    assert (entry.action, entry.credits_amount, entry.credits_before, entry.credits_after) == (
+        CreditHistory.Action.EXPIRE, -4, 4, 0,
+    )
+    assert entry.organization_id == org.pk and entry.person_id == old_credits.person_id
+    assert entry.description == f"Créditos expirados em {TODAY}"
+    alert = SystemAlert.objects.get(person=old_credits.person)
+    assert alert.alert_type == SystemAlert.AlertType.CREDITS_EXPIRED
+    assert alert.metadata == {"subscription_id": old_credits.pk, "expired_credits": 4, "expiry_date": "2026-06-01"}
+
+    assert run_expiry(TODAY) == {"credits_expired": 0, "history": 0, "subscriptions_expired": 0}
+    assert CreditHistory.objects.count() == SystemAlert.objects.count() == 7
+
+
+@pytest.mark.django_db
+def test_check_expired_credits_is_scoped_to_the_organization(org, plans):
+    credits, _ = plans
+    mine = _subscription(org, "ana", credits, 4, credits_expire_date=date(2020, 1, 1))
+    other_org = Organization.objects.create(name="Outra", domain="outra.local")
+    other_plan = PaymentPlan.objects.create(
+        organization=other_org, name="Pack", plan_type=PaymentPlan.PlanType.CREDITS, price=50, credits_included=5
+    )
+    theirs = _subscription(other_org, "rui", other_plan, 5, credits_expire_date=date(2020, 1, 1))
+
+    AlertService.check_expired_credits(org)
+
+    mine.refresh_from_db()
+    theirs.refresh_from_db()
+    assert (mine.remaining_credits, theirs.remaining_credits) == (0, 5)
+    assert list(CreditHistory.objects.values_list("subscription_id", flat=True)) == [mine.pk]
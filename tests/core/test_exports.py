@@ -0,0 +1,115 @@
+import csv
+import gzip
+import io
+from datetime import timedelta
+
+import pytest
+from django.contrib.auth.models import User
+from django.http import StreamingHttpResponse
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Booking, Event, Instructor, Organization, Person, Resource, UserProfile
+from core.services.exports import STREAM_BUFFER_SIZE, iter_csv, iter_encoded
+
+
+@pytest.fixture
+def admin_client(client):
+    org = Organization.objects.create(name="Org", domain="example.com")
+    user = User.objects.create_user(username="admin", password="pwd")
+    UserProfile.objects.create(user=user, organization=org, user_type=UserProfile.UserType.ADMIN)
+    client.force_login(user)
+    return client, org
+
+
+def _get(client, name, **params):
+    return client.get(reverse(name), params, HTTP_HOST="example.com", secure=True)
+
+
+def _rows(response):
+    body = b"".join(response.streaming_content)
+    if response["Content-Type"] == "application/gzip":
+        body = gzip.decompress(body)
+    return list(csv.reader(io.StringIO(body.decode("utf-8"))))
+
+
+@pytest.fixture
+def schedule(admin_client):
+    client, org = admin_client
+    resource = Resource.objects.create(organization=org, name="Sala 1")
+    instructor = Instructor.objects.create(organization=org, first_name="Rui", last_name="Sousa")
+    base = timezone.now().replace(hour=10, minute=0, second=0, microsecond=0) + timedelta(days=1)
+    events = [
+        Event.objects.create(
+            organization=org, resource=resource, instructor=instructor, title=f"Aula {day}",
+            starts_at=base + timedelta(days=day), ends_at=base + timedelta(days=day, hours=1), capacity=5,
+        )
+        for day in range(3)
+    ]
+    for index in range(2):
+        person = Person.objects.create(
+            organization=org, first_name=f"Cliente{index}", last_name="Silva",
+            email=f"c{index}@example.com", nif=f"{index}",
+        )
+        Booking.objects.create(organization=org, event=events[0], person=person)
+    return client, events
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["example.com"])
+def test_event_export_streams_rows(schedule, django_assert_max_num_queries):
+    client, events = schedule
+
+    response = _get(client, "core:event_list", export="csv")
+    assert isinstance(response, StreamingHttpResponse)
+    assert response["Content-Disposition"] == "attachment; filename=eventos.csv"
+    # Uma única consulta para todas as linhas (sem acessos por evento)
+    with django_assert_max_num_queries(1):
+        rows = _rows(response)
+
+    assert rows[0][:4] == ["Data Inicio", "Hora Inicio", "Hora Fim", "Titulo"]
+    assert [row[3] for row in rows[1:]] == ["Aula 2", "Aula 1", "Aula 0"]
+    first = rows[-1]
+    assert first[5:] == ["Rui Sousa", "Sala 1", "5", "2", "Agendada"]
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["example.com"])
+def test_event_export_date_range_and_gzip(schedule):
+    client, events = schedule
+    day = events[1].starts_at.date()
+
+    response = _get(client, "core:event_list", export="csv", gzip="1", start_date=day, end_date=day)
+
+    assert response["Content-Type"] == "application/gzip"
+    assert response["Content-Disposition"] == "attachment; filename=eventos.csv.gz"
+    assert [row[3] for row in _rows(response)[1:]] == ["Aula 1"]
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["example.com"])
+def test_booking_export_streams_rows(schedule):
+    client, events = schedule
+    day = events[0].starts_at.date()
+
+    response = _get(client, "core:booking_list", export="csv", start_date=day, end_date=day)
+
+    assert isinstance(response, StreamingHttpResponse)
+    rows = _rows(response)
+    assert rows[0] == ["Evento", "Data", "Hora", "Cliente", "Estado", "Criada em"]
+    assert sorted(row[3] for row in rows[1:]) == ["Cliente0 Silva", "Cliente1 Silva"]
+    assert {row[0] for row in rows[1:]} == {"Aula 0"}
+
+
+def test_stream_is_chunked_and_gzip_roundtrips():
+    chunks = list(iter_csv(["id", "valor"], ([i, "x" * 50] for i in range(5000))))
+
+    # Vários blocos de tamanho limitado, não uma única string com tudo
+    assert len(chunks) > 1
+    assert all(len(chunk) < STREAM_BUFFER_SIZE + 100 for chunk in chunks)
+
+    compressed = b"".join(iter_encoded(iter(chunks), compress=True))
+    text = gzip.decompress(compressed).decode("utf-8")
+    assert text == "".join(chunks)
+    assert text.count("\r\n") == 5001
@@ -1,8 +1,15 @@
 from datetime import datetime, timedelta
 from unittest import mock
 
+import httplib2
 import pytest
+from celery.backends.cache import CacheBackend
+from django.core.cache import cache
 from django.utils import timezone
+from googleapiclient.errors import HttpError
+
+from acr_gestao.celery import app as celery_app
+from core import tasks
 
 from core.models import (
     Event,
@@ -10,9 +17,28 @@ from core.models import (
     Organization,
     Resource,
     GoogleCalendarConfig,
+    GoogleCalendarSyncLog,
     InstructorGoogleCalendar,
 )
-from core.services.google_calendar import GoogleCalendarService
+from core.services import google_calendar
+from core.services.google_calendar import (
+    GoogleCalendarService,
+    GoogleQuotaExceeded,
+    clear_google_client_cache,
+    get_google_calendar_service,
+    is_quota_error,
+)
+from core.services.locks import cache_lock
+from core.services.rate_limit import RateLimiter
+
+from .clock import FakeClock
+from .google_fake import FakeCalendarApi
+
+
+@pytest.fixture(autouse=True)
+def _no_api_rate_limit(settings):
+    # Os testes de limite de débito ativam-no explicitamente
+    settings.GOOGLE_API_RATE_LIMIT = 0
 
 
 @pytest.mark.django_db
@@ -156,3 +182,357 @@ def test_upload_backup_to_drive(monkeypatch, tmp_path):
     assert file_id == "file123"
     assert dummy_drive.files.return_value.create.called
 
+
+def _bulk_events(org, instructor, resource, count, **extra):
+    start = timezone.now() + timedelta(days=1)
+    return Event.objects.bulk_create(
+        Event(
+            organization=org,
+            resource=resource,
+            instructor=instructor,
+            title=f"Aula {i}",
+            starts_at=start + timedelta(hours=2 * i),
+            ends_at=start + timedelta(hours=2 * i + 1),
+            capacity=5,
+            **extra,
+        )
+        for i in range(count)
+    )
+
+
+@pytest.mark.django_db
+def test_batch_sync_groups_requests_and_bulk_writes_logs(monkeypatch, django_assert_max_num_queries):
+    org = Organization.objects.create(name="Org5", domain="org5.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=fake.add_calendar("cal1"))
+    _bulk_events(org, instructor, resource, 120)
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    instructor = Instructor.objects.select_related("google_calendar").get(pk=instructor.pk)
+    events = list(service._future_events_for_sync(instructor))
+
+    # Sem consultas por evento: logs e IDs gravados em bulk, last_sync uma vez
+    with django_assert_max_num_queries(6):
+        stats = service.sync_events_to_google_batch(instructor, events)
+
+    assert stats == {"success": 120, "errors": 0, "skipped": 0}
+    # 120 inserts em 3 pedidos HTTP (lotes de 50) em vez de 120
+    assert fake.round_trips == 3
+    assert fake.count("POST") == 120
+    assert Event.objects.filter(organization=org, google_calendar_id__isnull=True).count() == 0
+    assert GoogleCalendarSyncLog.objects.filter(organization=org, status="success").count() == 120
+
+    # Segunda passagem com alterações: os mesmos eventos passam a updates, também em batch
+    Event.objects.filter(organization=org).update(title="Renomeada")
+    events = list(service._future_events_for_sync(instructor))
+    fake.round_trips = 0
+    stats = service.sync_events_to_google_batch(instructor, events)
+    assert stats["success"] == 120
+    assert fake.round_trips == 3
+    assert fake.count("PUT") == 120
+
+
+@pytest.mark.django_db
+def test_batch_sync_records_per_item_errors(monkeypatch):
+    org = Organization.objects.create(name="Org6", domain="org6.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=fake.add_calendar("cal1"))
+    events = _bulk_events(org, instructor, resource, 3)
+    fake.errors = [500]
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    stats = service.sync_events_to_google_batch(instructor, events)
+
+    assert stats == {"success": 2, "errors": 1, "skipped": 0}
+    assert GoogleCalendarSyncLog.objects.filter(organization=org, status="error").count() == 1
+    config = InstructorGoogleCalendar.objects.get(instructor=instructor)
+    assert config.last_sync is not None
+
+
+@pytest.mark.django_db
+def test_incremental_import_uses_sync_token_and_single_lookup(monkeypatch, django_assert_max_num_queries):
+    org = Organization.objects.create(name="Org7", domain="org7.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    calendar_id = fake.add_calendar("cal1")
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=calendar_id)
+    events = _bulk_events(org, instructor, resource, 300)
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    service.sync_events_to_google_batch(instructor, events)
+
+    # Sincronização inicial: lista tudo (2 páginas de 250) e guarda o token
+    instructor = Instructor.objects.select_related("google_calendar").get(pk=instructor.pk)
+    stats = service.sync_events_from_google(instructor)
+    assert stats["imported"] == 300
+    assert instructor.google_calendar.next_sync_token
+
+    # Alterações no Google: só esses itens são pedidos e aplicados
+    first, second = Event.objects.filter(organization=org).order_by("starts_at")[:2]
+    fake.add_remote_event(calendar_id, "Mudou", "2030-01-01T10:00:00Z", "2030-01-01T11:00:00Z",
+                          event_id=first.google_calendar_id)
+    fake.cancel_remote_event(calendar_id, second.google_calendar_id)
+    fake.round_trips = 0
+
+    with django_assert_max_num_queries(4):
+        stats = service.sync_events_from_google(instructor)
+
+    assert fake.round_trips == 1
+    assert stats == {"imported": 1, "errors": 0, "skipped": 1}
+    first.refresh_from_db()
+    assert first.title == "Mudou"
+    assert first.starts_at.year == 2030
+
+
+@pytest.mark.django_db
+def test_incremental_import_recovers_from_expired_token(monkeypatch):
+    org = Organization.objects.create(name="Org8", domain="org8.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    fake = FakeCalendarApi()
+    calendar_id = fake.add_calendar("cal1")
+    config = InstructorGoogleCalendar.objects.create(
+        instructor=instructor, google_calendar_id=calendar_id, next_sync_token="old"
+    )
+    fake.expired_sync_tokens.add("old")
+    fake.add_remote_event(calendar_id, "Remoto", "2030-01-01T10:00:00Z", "2030-01-01T11:00:00Z")
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    stats = service.sync_events_from_google(instructor)
+
+    assert stats == {"imported": 0, "errors": 0, "skipped": 1}
+    config.refresh_from_db()
+    assert config.next_sync_token not in ("", "old")
+
+
+@pytest.mark.django_db
+def test_incremental_import_rejects_conflicting_moves(monkeypatch):
+    org = Organization.objects.create(name="Org9", domain="org9.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    calendar_id = fake.add_calendar("cal1")
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=calendar_id)
+    first, second = _bulk_events(org, instructor, resource, 2)
+    Event.objects.filter(pk=first.pk).update(google_calendar_id="g1")
+    fake.add_remote_event(
+        calendar_id, "Sobreposto", second.starts_at.isoformat(), second.ends_at.isoformat(), event_id="g1"
+    )
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    stats = service.sync_events_from_google(instructor)
+
+    assert stats["errors"] == 1
+    first.refresh_from_db()
+    assert first.title == "Aula 0"
+
+
+@pytest.mark.django_db
+def test_unchanged_events_are_not_pushed_again(monkeypatch):
+    org = Organization.objects.create(name="Org10", domain="org10.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=fake.add_calendar("cal1"))
+    _bulk_events(org, instructor, resource, 60)
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    first = service.sync_all_instructor_events(instructor)
+    assert first["success"] == 60
+
+    # Semana sem alterações: apenas a listagem incremental, nenhum envio
+    writes_before = fake.count("POST") + fake.count("PUT")
+    quiet = service.sync_all_instructor_events(instructor)
+    assert quiet["success"] == 0
+    assert quiet["skipped"] == 60
+    assert fake.count("POST") + fake.count("PUT") == writes_before
+
+    # Só o evento alterado volta a ser enviado (também pelo caminho individual)
+    event = Event.objects.filter(organization=org).order_by("starts_at").first()
+    event.title = "Novo título"
+    event.save(update_fields=["title"])
+    assert service.sync_event_to_google(event) is True
+    assert fake.count("PUT") == 1
+    assert service.sync_event_to_google(event) is True
+    assert fake.count("PUT") == 1
+
+
+@pytest.mark.django_db
+def test_clients_and_credentials_are_cached_per_token_version(monkeypatch):
+    org = Organization.objects.create(name="Org11", domain="org11.test")
+    config = GoogleCalendarConfig.objects.create(
+        organization=org, client_id="cid", client_secret="secret", access_token="tok",
+    )
+    clear_google_client_cache()
+    built = []
+    monkeypatch.setattr(
+        google_calendar, "build_from_document",
+        lambda document, credentials: built.append(credentials) or mock.MagicMock(),
+    )
+
+    first = get_google_calendar_service(org)._get_service()
+    second = get_google_calendar_service(org)._get_service()
+    assert first is second
+    assert len(built) == 1
+
+    # Nova autorização OAuth: nova versão, novo cliente
+    GoogleCalendarConfig.objects.filter(pk=config.pk).update(token_version=1, access_token="tok2")
+    third = get_google_calendar_service(org)._get_service()
+    assert third is not first
+    assert built[-1].token == "tok2"
+    clear_google_client_cache()
+
+
+@pytest.mark.django_db
+def test_refreshed_token_is_persisted_without_full_save(monkeypatch):
+    org = Organization.objects.create(name="Org12", domain="org12.test")
+    config = GoogleCalendarConfig.objects.create(
+        organization=org, client_id="cid", client_secret="secret",
+        access_token="old", refresh_token="ref", token_expiry=timezone.now() - timedelta(minutes=5),
+    )
+    clear_google_client_cache()
+
+    def fake_refresh(credentials, request):
+        credentials.token = "new"
+        credentials.expiry = datetime.utcnow() + timedelta(hours=1)
+
+    monkeypatch.setattr(google_calendar.Credentials, "refresh", fake_refresh)
+    updated_at = config.updated_at
+
+    credentials = GoogleCalendarService(org)._get_credentials()
+    assert credentials.token == "new"
+    # Segunda instância reutiliza as credenciais válidas em cache
+    assert GoogleCalendarService(org)._get_credentials() is credentials
+
+    config.refresh_from_db()
+    assert config.access_token == "new"
+    assert config.updated_at == updated_at
+    clear_google_client_cache()
+
+
+def _http_error(status, reason):
+    content = f'{{"error": {{"code": {status}, "errors": [{{"reason": "{reason}"}}]}}}}'
+    return HttpError(httplib2.Response({"status": str(status)}), content.encode("utf-8"))
+
+
+def test_only_quota_responses_are_quota_errors():
+    assert is_quota_error(_http_error(429, "rateLimitExceeded"))
+    assert is_quota_error(_http_error(403, "userRateLimitExceeded"))
+    assert not is_quota_error(_http_error(403, "forbidden"))
+    assert not is_quota_error(_http_error(500, "backendError"))
+    assert not is_quota_error(ValueError("x"))
+
+
+@pytest.mark.django_db
+def test_batch_stops_on_quota_and_resumes_without_resending(monkeypatch):
+    org = Organization.objects.create(name="Org13", domain="org13.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=fake.add_calendar("cal1"))
+    _bulk_events(org, instructor, resource, 120)
+    fake.errors = [429]
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    with pytest.raises(GoogleQuotaExceeded):
+        service.sync_events_to_google_batch(instructor, list(service._future_events_for_sync(instructor)))
+
+    # Só o primeiro lote foi enviado; os 49 sucessos ficaram gravados
+    assert fake.round_trips == 1
+    assert Event.objects.filter(organization=org, google_calendar_id__isnull=False).count() == 49
+
+    stats = service.sync_events_to_google_batch(instructor, list(service._future_events_for_sync(instructor)))
+    assert stats == {"success": 71, "errors": 0, "skipped": 49}
+    assert fake.count("POST") == 120 + 1
+
+
+@pytest.mark.django_db
+def test_requests_are_throttled_per_organization(monkeypatch):
+    org = Organization.objects.create(name="Org14", domain="org14.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=fake.add_calendar("cal1"))
+    events = _bulk_events(org, instructor, resource, 25)
+    cache.clear()
+
+    service = GoogleCalendarService(org)
+    monkeypatch.setattr(service, "_get_service", fake.build_service)
+    clock = FakeClock(100.0)
+    service.limiter = RateLimiter(f"google:{org.pk}", capacity=10, period=1.0, clock=clock, sleep=clock.sleep)
+
+    stats = service.sync_events_to_google_batch(instructor, events)
+
+    # 25 pedidos dentro do batch com 10/s: consumidos em 3 janelas
+    assert stats["success"] == 25
+    assert clock.now >= 102.0
+    cache.clear()
+
+
+@pytest.mark.django_db
+def test_instructor_sync_task_is_locked_and_retries_only_on_quota(monkeypatch):
+    org = Organization.objects.create(name="Org15", domain="org15.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    called = []
+    monkeypatch.setattr(
+        GoogleCalendarService, "sync_all_instructor_events", lambda self, inst: called.append(inst.pk) or {"success": 1}
+    )
+    cache.clear()
+
+    with cache_lock(f"google-sync:instructor:{instructor.pk}") as acquired:
+        assert acquired
+        result = tasks.sync_instructor_events_task(org.pk, instructor.pk)
+    assert result["locked"] is True
+    assert called == []
+
+    assert tasks.sync_instructor_events_task(org.pk, instructor.pk) == {"success": 1}
+    assert called == [instructor.pk]
+    assert tasks.sync_instructor_events_task.autoretry_for == (GoogleQuotaExceeded,)
+    assert tasks.sync_event_task.autoretry_for == (GoogleQuotaExceeded,)
+
+
+@pytest.mark.django_db
+def test_organization_sync_runs_one_task_per_instructor_calendar(monkeypatch):
+    org = Organization.objects.create(name="Org16", domain="org16.test")
+    GoogleCalendarConfig.objects.create(organization=org, client_id="cid", client_secret="secret")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    for index in range(3):
+        instructor = Instructor.objects.create(organization=org, first_name=f"Inst{index}")
+        InstructorGoogleCalendar.objects.create(
+            instructor=instructor, google_calendar_id=fake.add_calendar(f"cal{index}")
+        )
+        _bulk_events(org, instructor, resource, 2)
+    # Sem calendário: fica fora do grupo
+    Instructor.objects.create(organization=org, first_name="Sem calendário")
+    monkeypatch.setattr(GoogleCalendarService, "_get_service", lambda self: fake.build_service())
+    cache.clear()
+
+    job = tasks.organization_sync_group(org.pk)
+    assert len(job.tasks) == 3
+
+    backend = CacheBackend(app=celery_app, backend="memory")
+    with mock.patch.object(type(celery_app), "backend", new=backend):
+        results = job.apply().get()
+    assert sorted(result["success"] for result in results) == [2, 2, 2]
+    assert fake.count("POST") == 6
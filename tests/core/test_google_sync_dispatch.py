@@ -0,0 +1,129 @@
+from datetime import timedelta
+from unittest import mock
+
+import pytest
+from celery.backends.cache import CacheBackend
+from django.core.cache import cache
+from django.utils import timezone
+
+from acr_gestao.celery import app as celery_app
+from core import tasks
+from core.models import (
+    Event,
+    GoogleCalendarConfig,
+    GoogleCalendarSyncLog,
+    Instructor,
+    InstructorGoogleCalendar,
+    Organization,
+    Resource,
+)
+from core.services.google_calendar import GoogleCalendarService
+from core.services.google_sync_dispatch import flush_event_sync, mark_event_dirty
+
+from .google_fake import FakeCalendarApi
+
+
+@pytest.fixture
+def google_org(monkeypatch, settings):
+    settings.GOOGLE_SYNC_DEBOUNCE_SECONDS = 30
+    settings.GOOGLE_API_RATE_LIMIT = 0
+    cache.clear()
+    org = Organization.objects.create(name="OrgSync", domain="orgsync.test")
+    GoogleCalendarConfig.objects.create(
+        organization=org, client_id="cid", client_secret="secret", sync_enabled=True
+    )
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    fake = FakeCalendarApi()
+    InstructorGoogleCalendar.objects.create(instructor=instructor, google_calendar_id=fake.add_calendar("cal1"))
+    monkeypatch.setattr(GoogleCalendarService, "_get_service", lambda self: fake.build_service())
+    yield org, instructor, resource, fake
+    cache.clear()
+
+
+def _event(org, instructor, resource):
+    start = timezone.now() + timedelta(days=1)
+    return Event.objects.create(
+        organization=org, resource=resource, instructor=instructor,
+        title="Aula", starts_at=start, ends_at=start + timedelta(hours=1), capacity=5,
+    )
+
+
+@pytest.mark.django_db
+def test_repeated_edits_are_coalesced_into_one_sync(google_org):
+    org, instructor, resource, fake = google_org
+    event = _event(org, instructor, resource)
+
+    with mock.patch.object(tasks.flush_event_sync_task, "apply_async") as apply_async:
+        # Três arrastos no Gantt dentro da janela: uma única tarefa agendada
+        for offset, hour in enumerate((9, 10, 11)):
+            event.starts_at = event.starts_at.replace(hour=hour)
+            event.ends_at = event.starts_at + timedelta(hours=1)
+            event.save()
+            mark_event_dirty(event, now=1000.0 + offset * 10)
+    apply_async.assert_called_once_with(args=[event.pk], countdown=30.0)
+
+    # A tarefa acorda antes da acalmia e reagenda-se pelo tempo em falta
+    assert flush_event_sync(event.pk, now=1030.0) == {"status": "waiting", "countdown": 20.0}
+    assert fake.round_trips == 0
+
+    result = flush_event_sync(event.pk, now=1050.0)
+    assert result == {"status": "synced", "success": True}
+    assert fake.count("POST") == 1
+    assert GoogleCalendarSyncLog.objects.filter(event=event).count() == 1
+    remote = fake.calendars["cal1"][Event.objects.get(pk=event.pk).google_calendar_id]
+    assert remote["start"]["dateTime"].startswith(event.starts_at.isoformat()[:13])
+
+    # Depois do envio, nova edição volta a agendar
+    with mock.patch.object(tasks.flush_event_sync_task, "apply_async") as apply_async:
+        assert mark_event_dirty(event, now=2000.0) is True
+
+
+@pytest.mark.django_db
+def test_create_then_delete_within_window_is_noop(google_org):
+    org, instructor, resource, fake = google_org
+    event = _event(org, instructor, resource)
+    event_id = event.pk
+
+    with mock.patch.object(tasks.flush_event_sync_task, "apply_async") as apply_async:
+        mark_event_dirty(event, now=1000.0)
+        mark_event_dirty(event, deleted=True, now=1005.0)
+        event.delete()
+    assert apply_async.call_count == 1
+
+    assert flush_event_sync(event_id, now=1100.0) == {"status": "noop"}
+    assert fake.round_trips == 0
+    assert not GoogleCalendarSyncLog.objects.filter(organization=org).exists()
+
+
+@pytest.mark.django_db
+def test_deleting_synced_event_removes_remote_copy(google_org):
+    org, instructor, resource, fake = google_org
+    event = _event(org, instructor, resource)
+    GoogleCalendarService(org).sync_event_to_google(event)
+    google_id = event.google_calendar_id
+
+    # Execução local (eager) da tarefa: corre logo, sem esperar pela janela
+    task = tasks.flush_event_sync_task
+    backend = CacheBackend(app=celery_app, backend="memory")
+    with mock.patch.object(type(celery_app), "backend", new=backend), \
+            mock.patch.object(task, "apply_async", side_effect=lambda args, countdown: task.apply(args=args)):
+        assert mark_event_dirty(event, deleted=True) is True
+    event.delete()
+
+    assert fake.calendars["cal1"][google_id]["status"] == "cancelled"
+    log = GoogleCalendarSyncLog.objects.get(organization=org, sync_type="delete")
+    assert log.google_event_id == google_id
+
+
+@pytest.mark.django_db
+def test_nothing_is_scheduled_without_auto_sync(google_org):
+    org, instructor, resource, fake = google_org
+    GoogleCalendarConfig.objects.filter(organization=org).update(auto_sync_events=False)
+    event = _event(org, instructor, resource)
+
+    with mock.patch.object(tasks.flush_event_sync_task, "apply_async") as apply_async:
+        assert mark_event_dirty(event) is False
+        assert mark_event_dirty(event) is False
+    apply_async.assert_not_called()
+    assert flush_event_sync(event.pk) == {"status": "noop"}
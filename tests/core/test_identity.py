@@ -0,0 +1,84 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+from django.core.cache import cache
+
+from core.models import Membership, Organization, Person, PersonIdentity, Price, Product
+from core.services.cache_versions import cache_version
+from core.services.identity import linked_people, rebuild_identities
+from core.services.pricing import quote_many
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+@pytest.fixture
+def orgs():
+    return (
+        Organization.objects.create(name="ACR", domain="acr.test"),
+        Organization.objects.create(name="Ginásio", domain="gym.test"),
+    )
+
+
+@pytest.mark.django_db
+def test_person_save_links_same_nif_or_email_across_organizations(orgs):
+    acr, gym = orgs
+    ana = Person.objects.create(organization=acr, first_name="Ana", nif="123 456 789", email="Ana@Example.com")
+    Person.objects.create(organization=gym, first_name="Ana", nif="PT123456789")
+    rui = Person.objects.create(organization=acr, first_name="Rui", nif="111111111")
+    rui_gym = Person.objects.create(organization=gym, first_name="Rui", nif="222222222")
+    Person.objects.create(organization=gym, first_name="Bea", email=" ana@example.com ")
+
+    assert set(linked_people(acr, gym)) == {ana}
+    assert PersonIdentity.objects.filter(kind="nif").count() == 3
+    # Só hashes: o NIF não fica em claro
+    assert not PersonIdentity.objects.filter(digest__contains="123456789").exists()
+
+    rui_gym.nif = "111-111-111"
+    rui_gym.save()
+    assert set(linked_people(acr, gym)) == {ana, rui}
+
+
+@pytest.mark.django_db
+def test_rebuild_identities_indexes_bulk_created_people(orgs, django_capture_on_commit_callbacks):
+    acr, gym = orgs
+    Person.objects.bulk_create([
+        Person(organization=acr, first_name="Ana", nif="123456789"),
+        Person(organization=gym, first_name="Ana", nif="123456789"),
+        Person(organization=gym, first_name="Rui", email="rui@example.com"),
+    ])
+    assert not linked_people(acr, gym).exists()
+
+    assert rebuild_identities() == 3
+    assert linked_people(gym, acr).get().first_name == "Ana"
+
+    # A elegibilidade em cache das duas organizações (ligadas pela Ana) fica inválida
+    versions = [cache_version("pricing", org.pk) for org in orgs]
+    with django_capture_on_commit_callbacks(execute=True):
+        assert rebuild_identities(organization_id=gym.pk) == 2
+    assert [cache_version("pricing", org.pk) for org in orgs] == [version + 1 for version in versions]
+    assert PersonIdentity.objects.count() == 2
+
+
+@pytest.mark.django_db
+def test_discount_uses_membership_of_same_person_in_other_organization(orgs, django_assert_num_queries):
+    acr, gym = orgs
+    product = Product.objects.create(organization=acr, name="Plano", price=10, duration_months=1)
+    Price.objects.create(organization=acr, product=product, amount=Decimal("40.00"), valid_from=date(2026, 1, 1))
+    ana = Person.objects.create(organization=acr, first_name="Ana", nif="123456789")
+    rui = Person.objects.create(organization=acr, first_name="Rui", nif="111111111")
+    ana_gym = Person.objects.create(organization=gym, first_name="Ana", nif="123456789")
+    for person in (ana, rui):
+        Membership.objects.create(organization=acr, person=person, plan="ACR", starts_on=date(2026, 1, 1))
+    Membership.objects.create(organization=gym, person=ana_gym, plan="Gym", starts_on=date(2026, 1, 1))
+
+    # Organizações do desconto, preços, registos ligados, memberships de cada organização
+    with django_assert_num_queries(5):
+        quotes = quote_many([ana, rui], product, date(2026, 2, 1))
+
+    assert quotes == {ana.pk: Decimal("36.00"), rui.pk: Decimal("40.00")}
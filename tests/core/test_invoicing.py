@@ -0,0 +1,55 @@
+from datetime import date
+from decimal import Decimal
+
+import pytest
+
+from core.models import Invoice, InvoiceItem, Organization, Person
+from core.services.invoicing import InvoiceLine, build_invoice, save_invoice_items
+
+
+@pytest.fixture
+def person():
+    org = Organization.objects.create(name="Org", domain="org.local")
+    return Person.objects.create(organization=org, first_name="Ana", nif="1", email="ana@example.com")
+
+
+@pytest.mark.django_db
+def test_build_invoice_creates_lines_and_total_in_constant_queries(person, django_assert_num_queries):
+    lines = [InvoiceLine(f"Linha {n}", Decimal("2"), Decimal("1.25")) for n in range(50)]
+
+    # savepoint, fatura, bulk_create das linhas, release
+    with django_assert_num_queries(4):
+        invoice = build_invoice(person.organization, person, lines, issue_date=date(2026, 5, 1))
+
+    invoice.refresh_from_db()
+    assert invoice.total == Decimal("125.00")
+    assert invoice.issue_date == date(2026, 5, 1)
+    assert invoice.items.count() == 50
+
+
+@pytest.mark.django_db
+def test_save_invoice_items_updates_total_once(person):
+    invoice = build_invoice(person.organization, person, [
+        InvoiceLine("Mensalidade", Decimal("1"), Decimal("30.00")),
+        InvoiceLine("Toalha", Decimal("3"), Decimal("1.50")),
+    ])
+    monthly, towel = invoice.items.order_by("pk")
+    monthly.unit_price = Decimal("35.00")
+
+    save_invoice_items(
+        invoice,
+        [monthly, InvoiceItem(description="Garrafa", quantity=Decimal("2"), unit_price=Decimal("4.25"))],
+        deleted=[towel],
+    )
+
+    assert Invoice.objects.get(pk=invoice.pk).total == Decimal("43.50")
+    assert sorted(invoice.items.values_list("description", flat=True)) == ["Garrafa", "Mensalidade"]
+
+
+@pytest.mark.django_db
+def test_single_item_save_still_recomputes_total(person):
+    invoice = build_invoice(person.organization, person, [InvoiceLine("Aula", Decimal("1"), Decimal("10.00"))])
+
+    InvoiceItem.objects.create(invoice=invoice, description="Extra", quantity=Decimal("1"), unit_price=Decimal("5.00"))
+
+    assert Invoice.objects.get(pk=invoice.pk).total == Decimal("15.00")
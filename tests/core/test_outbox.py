@@ -0,0 +1,216 @@
+from datetime import timedelta
+from decimal import Decimal
+from unittest import mock
+
+import pytest
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.utils import timezone
+
+from core.models import (
+    Booking,
+    Event,
+    GoogleCalendarConfig,
+    Instructor,
+    Organization,
+    OutboxMessage,
+    Payment,
+    Person,
+    Resource,
+)
+from core.services import outbox
+from core.services.cache_versions import cache_version
+from core.services.outbox import purge_outbox, relay_outbox
+
+
+@pytest.fixture
+def org_setup():
+    cache.clear()
+    org = Organization.objects.create(name="OrgOutbox", domain="outbox.test")
+    GoogleCalendarConfig.objects.create(organization=org, sync_enabled=True)
+    instructor = Instructor.objects.create(organization=org, first_name="Inst")
+    resource = Resource.objects.create(organization=org, name="Room")
+    yield org, instructor, resource
+    cache.clear()
+
+
+def _event(org, instructor, resource, hours=0, **extra):
+    start = timezone.now() + timedelta(days=1, hours=hours)
+    return Event.objects.create(
+        organization=org, resource=resource, instructor=instructor, title="Aula",
+        starts_at=start, ends_at=start + timedelta(hours=1), capacity=5, **extra,
+    )
+
+
+@pytest.mark.django_db
+def test_changes_are_recorded_in_the_same_transaction(org_setup):
+    org, instructor, resource = org_setup
+
+    with pytest.raises(RuntimeError):
+        with transaction.atomic():
+            _event(org, instructor, resource)
+            raise RuntimeError("falha depois de gravar")
+    assert not OutboxMessage.objects.exists()
+
+    event = _event(org, instructor, resource)
+    assert list(OutboxMessage.objects.values_list("topic", "object_id")) == [("event.changed", event.pk)]
+
+    # Gravações da própria sincronização Google não geram mensagens
+    event.google_calendar_id = "g1"
+    event.save(update_fields=["google_calendar_id"])
+    assert OutboxMessage.objects.count() == 1
+
+
+@pytest.mark.django_db
+def test_relay_deduplicates_and_fans_out(org_setup, django_capture_on_commit_callbacks):
+    org, instructor, resource = org_setup
+    kept = _event(org, instructor, resource)
+    for title in ("A", "B", "C"):
+        kept.title = title
+        kept.save()
+    removed = _event(org, instructor, resource, hours=3, google_calendar_id="g-removed")
+    removed.starts_at += timedelta(hours=1)
+    removed.ends_at += timedelta(hours=1)
+    removed.save()
+    removed_id = removed.pk
+    removed.delete()
+    gantt_version = cache_version("gantt", org.pk)
+    reports_version = cache_version("reports", org.pk)
+
+    with mock.patch.object(outbox, "mark_event_dirty") as mark:
+        with django_capture_on_commit_callbacks(execute=True):
+            assert relay_outbox() == 7
+            # Chamadas ao broker e invalidações só depois do commit do lote
+            mark.assert_not_called()
+            assert cache_version("gantt", org.pk) == gantt_version
+
+    # Uma marcação por evento: a última mensagem de cada um prevalece
+    assert mark.call_count == 2
+    (changed,), changed_kwargs = mark.call_args_list[0]
+    assert changed.pk == kept.pk and changed_kwargs == {"auto_sync": True}
+    (deleted,), deleted_kwargs = mark.call_args_list[1]
+    assert deleted.pk == removed_id and deleted.google_calendar_id == "g-removed"
+    assert deleted_kwargs == {"deleted": True, "auto_sync": True}
+
+    assert cache_version("gantt", org.pk) > gantt_version
+    assert cache_version("reports", org.pk) > reports_version
+    assert not OutboxMessage.objects.filter(processed_at__isnull=True).exists()
+    assert relay_outbox() == 0
+
+
+@pytest.mark.django_db
+def test_booking_changes_resync_their_event(org_setup, django_capture_on_commit_callbacks):
+    org, instructor, resource = org_setup
+    event = _event(org, instructor, resource)
+    person = Person.objects.create(organization=org, first_name="Ana", email="ana@example.com", nif="123456789")
+    with mock.patch.object(outbox, "mark_event_dirty"):
+        relay_outbox()
+    reports_version = cache_version("reports", org.pk)
+
+    Booking.objects.create(organization=org, event=event, person=person)
+    with mock.patch.object(outbox, "mark_event_dirty") as mark:
+        with django_capture_on_commit_callbacks(execute=True):
+            relay_outbox()
+
+    mark.assert_called_once()
+    assert mark.call_args.args[0].pk == event.pk
+    assert cache_version("reports", org.pk) == reports_version
+
+
+@pytest.mark.django_db
+def test_failed_handler_keeps_messages_pending_until_max_attempts(org_setup, monkeypatch, settings):
+    org, instructor, resource = org_setup
+    settings.OUTBOX_MAX_ATTEMPTS = 2
+
+    def broken(messages):
+        raise RuntimeError("indisponível")
+
+    monkeypatch.setattr(outbox, "_handlers", outbox._handlers + [(frozenset({"event.changed"}), broken)])
+    _event(org, instructor, resource)
+
+    with mock.patch.object(outbox, "mark_event_dirty"):
+        relay_outbox()
+        message = OutboxMessage.objects.get()
+        assert message.processed_at is None
+        assert message.attempts == 1
+        assert "indisponível" in message.last_error
+
+        # Última tentativa: a mensagem é descartada para não bloquear o outbox
+        relay_outbox()
+    message.refresh_from_db()
+    assert message.processed_at is not None
+    assert message.attempts == 2
+
+
+@pytest.mark.django_db
+def test_failed_query_in_handler_does_not_abort_the_batch(org_setup, monkeypatch, django_capture_on_commit_callbacks):
+    org, instructor, resource = org_setup
+
+    def broken_query(messages):
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT * FROM tabela_inexistente")
+
+    monkeypatch.setattr(outbox, "_handlers", outbox._handlers + [(frozenset({"event.changed"}), broken_query)])
+    _event(org, instructor, resource)
+    person = Person.objects.create(organization=org, first_name="Cliente", nif="123")
+    Payment.objects.create(
+        organization=org, person=person, amount=Decimal("10.00"), status=Payment.Status.COMPLETED,
+        paid_date=timezone.localdate(),
+    )
+
+    with mock.patch.object(outbox, "mark_event_dirty"), django_capture_on_commit_callbacks(execute=True):
+        relay_outbox()
+
+    failed = OutboxMessage.objects.get(topic="event.changed")
+    assert failed.processed_at is None
+    assert failed.attempts == 1
+    assert "broken_query" in failed.last_error
+    others = OutboxMessage.objects.exclude(topic="event.changed")
+    assert others.exists()
+    assert not others.filter(processed_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_relay_command_drains_outbox(org_setup):
+    org, instructor, resource = org_setup
+    for index in range(3):
+        _event(org, instructor, resource, hours=2 * index).delete()
+
+    with mock.patch.object(outbox, "mark_event_dirty"):
+        call_command("relay_outbox", batch_size=2)
+    assert not OutboxMessage.objects.filter(processed_at__isnull=True).exists()
+
+
+@pytest.mark.django_db
+def test_payment_and_person_changes_invalidate_reports(org_setup, django_capture_on_commit_callbacks):
+    org, _, _ = org_setup
+    reports_version = cache_version("reports", org.pk)
+    with django_capture_on_commit_callbacks(execute=True):
+        person = Person.objects.create(organization=org, first_name="Ana", email="ana@example.com", nif="123456789")
+    assert cache_version("reports", org.pk) > reports_version
+
+    reports_version = cache_version("reports", org.pk)
+    Payment.objects.create(
+        organization=org, person=person, amount=Decimal("30"), status=Payment.Status.COMPLETED,
+        paid_date=timezone.localdate(),
+    )
+    with django_capture_on_commit_callbacks(execute=True):
+        relay_outbox()
+    assert cache_version("reports", org.pk) > reports_version
+
+
+@pytest.mark.django_db
+def test_purge_outbox_deletes_only_old_processed_messages(org_setup, settings, monkeypatch):
+    org, instructor, resource = org_setup
+    settings.OUTBOX_RETENTION_DAYS = 7
+    monkeypatch.setattr(outbox, "PURGE_CHUNK_SIZE", 2)
+    for index in range(4):
+        _event(org, instructor, resource, hours=2 * index)
+    old, recent, pending, *_ = OutboxMessage.objects.order_by("pk")
+    now = timezone.now()
+    OutboxMessage.objects.exclude(pk__in=[recent.pk, pending.pk]).update(processed_at=now - timedelta(days=8))
+    OutboxMessage.objects.filter(pk=recent.pk).update(processed_at=now - timedelta(days=6))
+
+    assert purge_outbox(now) == 2
+    assert set(OutboxMessage.objects.values_list("pk", flat=True)) == {recent.pk, pending.pk}
@@ -1,9 +1,20 @@
 from datetime import date
+from decimal import Decimal
 
 import pytest
+from django.core.cache import cache
+from django.test import RequestFactory
 
-from core.models import Organization, Person, Product, Price
-from core.services.pricing import compute_price
+from core.models import Membership, Organization, Person, Product, Price
+from core.services.eligibility import eligibility_for
+from core.services.pricing import PriceBook, compute_price, quote_many
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
 
 
 @pytest.mark.django_db
@@ -52,3 +63,71 @@ def test_compute_price_without_price_raises():
 
     with pytest.raises(ValueError):
         compute_price(person, product, date.today())
+
+
+@pytest.fixture
+def discount_setup():
+    acr = Organization.objects.create(name="ACR", domain="acr.test")
+    gym = Organization.objects.create(name="Ginásio", domain="gym.test")
+    product = Product.objects.create(organization=acr, name="Plano", price=10, duration_months=1)
+    Price.objects.create(organization=acr, product=product, amount=Decimal("40.00"), valid_from=date(2026, 1, 1))
+    Price.objects.create(
+        organization=acr, product=product, amount=Decimal("50.00"),
+        valid_from=date(2026, 3, 1), valid_to=date(2026, 3, 31),
+    )
+    people = [
+        Person.objects.create(organization=acr, first_name=f"Cliente {n}", nif=str(n), email=f"c{n}@example.com")
+        for n in range(3)
+    ]
+    for person in people[:2]:
+        Membership.objects.create(organization=acr, person=person, plan="ACR", starts_on=date(2026, 1, 1))
+    Membership.objects.create(organization=gym, person=people[0], plan="Gym", starts_on=date(2026, 1, 1))
+    return acr, gym, product, people
+
+
+def test_price_book_looks_up_intervals_by_date():
+    book = PriceBook.from_prices([
+        (date(2026, 3, 1), date(2026, 3, 31), Decimal("50")),
+        (date(2026, 1, 1), None, Decimal("40")),
+    ])
+
+    assert book.price_on(date(2025, 12, 31)) is None
+    assert book.price_on(date(2026, 2, 10)) == Decimal("40")
+    assert book.price_on(date(2026, 3, 31)) == Decimal("50")
+    # Fim da promoção: volta ao preço sem fim
+    assert book.price_on(date(2026, 4, 1)) == Decimal("40")
+
+
+@pytest.mark.django_db
+def test_quote_many_resolves_discounts_from_membership_intervals(discount_setup, django_assert_num_queries):
+    acr, _, product, people = discount_setup
+    request = RequestFactory().get("/")
+
+    # Organizações do desconto, preços do produto, registos ligados, memberships de cada organização
+    with django_assert_num_queries(5):
+        quotes = quote_many(people, product, date(2026, 3, 15), request=request)
+    assert quotes == {people[0].pk: Decimal("45.00"), people[1].pk: Decimal("50.00"), people[2].pk: Decimal("50.00")}
+
+    with django_assert_num_queries(0):
+        assert compute_price(people[0], product, date(2026, 3, 15)) == Decimal("45.00")
+        assert quote_many(people, product, date(2026, 3, 15)) == quotes
+        # Os intervalos carregados ficam no pedido para outras verificações
+        assert eligibility_for(acr, request).active_on([p.pk for p in people], date(2026, 3, 15)) == {
+            people[0].pk, people[1].pk,
+        }
+
+
+@pytest.mark.django_db
+def test_price_and_membership_writes_invalidate_quotes(discount_setup, django_capture_on_commit_callbacks):
+    _, gym, product, people = discount_setup
+    day = date(2026, 5, 1)
+    assert quote_many(people, product, day)[people[1].pk] == Decimal("40.00")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Membership.objects.create(organization=gym, person=people[1], plan="Gym", starts_on=date(2026, 4, 1))
+    assert quote_many(people, product, day)[people[1].pk] == Decimal("36.00")
+
+    with django_capture_on_commit_callbacks(execute=True):
+        Price.objects.create(organization=product.organization, product=product, amount=Decimal("60.00"),
+                             valid_from=date(2026, 5, 1))
+    assert quote_many(people, product, day)[people[2].pk] == Decimal("60.00")
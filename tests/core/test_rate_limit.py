@@ -0,0 +1,52 @@
+import pytest
+from django.core.cache import cache
+
+from core.services.rate_limit import RateLimiter
+
+from .clock import FakeClock
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    cache.clear()
+    yield
+    cache.clear()
+
+
+def test_try_acquire_refills_each_window():
+    clock = FakeClock(100.25)
+    limiter = RateLimiter("test", capacity=2, period=1.0, clock=clock, sleep=clock.sleep)
+
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == 0
+    assert limiter.try_acquire() == pytest.approx(0.75)
+
+    clock.now = 101.0
+    assert limiter.try_acquire() == 0
+
+
+def test_limiters_with_same_key_share_budget():
+    clock = FakeClock()
+    first = RateLimiter("shared", capacity=3, clock=clock, sleep=clock.sleep)
+    second = RateLimiter("shared", capacity=3, clock=clock, sleep=clock.sleep)
+
+    assert first.try_acquire(2) == 0
+    assert second.try_acquire(2) > 0
+    assert second.try_acquire(1) == 0
+
+
+def test_acquire_waits_and_honours_timeout():
+    clock = FakeClock(100.0)
+    limiter = RateLimiter("wait", capacity=1, clock=clock, sleep=clock.sleep)
+
+    assert limiter.acquire()
+    assert limiter.acquire()
+    assert clock.sleeps == [1.0]
+    assert limiter.acquire(timeout=0.5) is False
+
+
+def test_invalid_requests_raise():
+    with pytest.raises(ValueError):
+        RateLimiter("bad", capacity=0)
+    with pytest.raises(ValueError):
+        RateLimiter("bad", capacity=1).try_acquire(2)
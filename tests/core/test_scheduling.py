@@ -5,6 +5,7 @@ from django.core.exceptions import ValidationError
 from django.utils import timezone
 
 from core.models import Organization, Resource, Event
+from core.services.scheduling import find_conflicting_events
 
 
 @pytest.mark.django_db
@@ -34,3 +35,24 @@ def test_event_overlap_raises_validation_error():
 
     with pytest.raises(ValidationError):
         event2.full_clean()
+
+
+@pytest.mark.django_db
+def test_find_conflicting_events_checks_batch_in_one_query(django_assert_num_queries):
+    org = Organization.objects.create(name="Org", domain="org-batch.test")
+    room = Resource.objects.create(organization=org, name="Sala 1", capacity=5)
+    other_room = Resource.objects.create(organization=org, name="Sala 2", capacity=5)
+    start = timezone.now()
+    fixed, a, b, c = Event.objects.bulk_create(
+        Event(organization=org, resource=resource, title=title, capacity=5,
+              starts_at=start + timedelta(hours=offset), ends_at=start + timedelta(hours=offset + 1))
+        for title, resource, offset in [("Fixa", room, 0), ("A", room, 2), ("B", room, 4), ("C", other_room, 0)]
+    )
+    # A passa a colidir com a aula fixa; B e C mudam para horários livres
+    a.starts_at, a.ends_at = fixed.starts_at + timedelta(minutes=30), fixed.ends_at + timedelta(minutes=30)
+    b.starts_at, b.ends_at = start + timedelta(hours=6), start + timedelta(hours=7)
+
+    with django_assert_num_queries(1):
+        conflicts = find_conflicting_events([a, b, c])
+
+    assert conflicts == {a.pk}
@@ -0,0 +1,176 @@
+import csv
+import gzip
+import io
+from datetime import timedelta
+from pathlib import Path
+from unittest import mock
+
+import pytest
+from celery.exceptions import SoftTimeLimitExceeded
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Event, Organization, Payment, Person, Resource, UserProfile
+from reports import services, tasks
+from reports.models import ReportJob
+from reports.services import (
+    ReportLimitExceeded,
+    enqueue_report,
+    fail_stale_report_jobs,
+    purge_report_jobs,
+    run_report_job,
+)
+
+
+@pytest.fixture
+def report_org(settings, tmp_path):
+    settings.MEDIA_ROOT = tmp_path / "media"
+    settings.REPORTS_ROOT = tmp_path / "reports"
+    settings.REPORT_JOBS_PER_ORGANIZATION = 2
+    org = Organization.objects.create(name="Org", domain="org.local")
+    resource = Resource.objects.create(organization=org, name="Sala")
+    start = timezone.now() + timedelta(days=1)
+    for index in range(3):
+        Event.objects.create(
+            organization=org, resource=resource, title=f"Aula {index}",
+            starts_at=start + timedelta(hours=2 * index), ends_at=start + timedelta(hours=2 * index + 1),
+        )
+    person = Person.objects.create(organization=org, first_name="Ana", nif="1", email="ana@example.com")
+    Payment.objects.create(organization=org, person=person, amount=30, status=Payment.Status.COMPLETED)
+    return org
+
+
+def _read_rows(path):
+    return list(csv.reader(io.StringIO(gzip.decompress(Path(path).read_bytes()).decode("utf-8"))))
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["org.local"])
+def test_job_lifecycle_through_views(client, report_org, django_capture_on_commit_callbacks):
+    user = User.objects.create_user(username="admin", password="pwd")
+    UserProfile.objects.create(user=user, organization=report_org, user_type=UserProfile.UserType.ADMIN)
+    client.force_login(user)
+
+    with mock.patch.object(tasks.generate_report_task, "delay") as delay, \
+            django_capture_on_commit_callbacks(execute=True):
+        response = client.post(reverse("reports:job_create"), {"kind": "events"}, secure=True, HTTP_HOST="org.local")
+    assert response.status_code == 202
+    job_id = response.json()["id"]
+    # O pedido só agenda: a geração corre no worker
+    delay.assert_called_once_with(job_id)
+    assert response.json()["status"] == "queued"
+    assert "download_url" not in response.json()
+
+    tasks.generate_report_task(job_id)
+
+    status = client.get(response.json()["status_url"], secure=True, HTTP_HOST="org.local").json()
+    assert status["status"] == "done"
+    assert status["row_count"] == 3
+
+    download = client.get(status["download_url"], secure=True, HTTP_HOST="org.local")
+    assert download["Content-Type"] == "application/gzip"
+    content = gzip.decompress(b"".join(download.streaming_content)).decode("utf-8")
+    assert [row[3] for row in csv.reader(io.StringIO(content))][1:] == ["Aula 0", "Aula 1", "Aula 2"]
+
+
+@pytest.mark.django_db
+def test_run_writes_artefact_to_private_storage(report_org, settings):
+    with mock.patch.object(tasks.generate_report_task, "delay"):
+        job = enqueue_report(report_org, ReportJob.Kind.PAYMENTS)
+
+    job = run_report_job(job.pk)
+
+    assert job.status == ReportJob.Status.DONE
+    assert job.file.name.startswith(f"{report_org.pk}/{job.pk}-payments-")
+    assert job.file.name.endswith(".csv.gz")
+    # Fora de MEDIA_ROOT e sem URL pública: só via job_download
+    assert not Path(settings.MEDIA_ROOT).exists()
+    with pytest.raises(ValueError):
+        job.file.url
+    rows = _read_rows(Path(settings.REPORTS_ROOT) / job.file.name)
+    assert rows[1][1:3] == ["Ana", "1"] and rows[1][6] == "30.00"
+    # Uma segunda entrega da mesma tarefa não volta a gerar o ficheiro
+    assert run_report_job(job.pk).finished_at == job.finished_at
+
+
+@pytest.mark.django_db
+def test_concurrency_limit_per_organization(report_org, settings):
+    settings.REPORT_JOBS_PER_ORGANIZATION = 1
+    other = Organization.objects.create(name="Outra", domain="outra.local")
+
+    with mock.patch.object(tasks.generate_report_task, "delay"):
+        first = enqueue_report(report_org, ReportJob.Kind.EVENTS)
+        with pytest.raises(ReportLimitExceeded):
+            enqueue_report(report_org, ReportJob.Kind.BOOKINGS)
+        # O limite é por organização
+        enqueue_report(other, ReportJob.Kind.EVENTS)
+
+        # Jobs presos além do timeout (ex.: worker morto) deixam de contar
+        ReportJob.objects.filter(pk=first.pk).update(
+            created_at=timezone.now() - timedelta(seconds=settings.REPORT_JOB_TIMEOUT + 1)
+        )
+        enqueue_report(report_org, ReportJob.Kind.BOOKINGS)
+
+
+@pytest.mark.django_db
+def test_failed_generation_leaves_no_partial_file(report_org, settings):
+    with mock.patch.object(tasks.generate_report_task, "delay"):
+        job = enqueue_report(report_org, ReportJob.Kind.EVENTS)
+
+    def broken(organization, params):
+        yield ["linha"]
+        raise RuntimeError("base de dados indisponível")
+
+    header = services.REPORT_BUILDERS[ReportJob.Kind.EVENTS][0]
+    with mock.patch.dict(services.REPORT_BUILDERS, {ReportJob.Kind.EVENTS: (header, broken)}):
+        job = run_report_job(job.pk)
+
+    assert job.status == ReportJob.Status.FAILED
+    assert "indisponível" in job.error
+    assert not any(Path(settings.REPORTS_ROOT).rglob("*.gz*"))
+
+
+@pytest.mark.django_db
+def test_purge_removes_old_jobs_and_files(report_org, settings):
+    with mock.patch.object(tasks.generate_report_task, "delay"):
+        job = run_report_job(enqueue_report(report_org, ReportJob.Kind.EVENTS).pk)
+    path = Path(settings.REPORTS_ROOT) / job.file.name
+    assert path.exists()
+
+    assert purge_report_jobs() == 0
+    later = timezone.now() + timedelta(hours=settings.REPORT_JOB_RETENTION_HOURS + 1)
+    assert purge_report_jobs(now=later) == 1
+    assert not path.exists()
+    assert not ReportJob.objects.exists()
+
+
+@pytest.mark.django_db
+def test_soft_time_limit_and_stale_jobs_are_marked_failed(report_org, settings):
+    with mock.patch.object(tasks.generate_report_task, "delay"):
+        slow = enqueue_report(report_org, ReportJob.Kind.EVENTS)
+        killed = enqueue_report(report_org, ReportJob.Kind.BOOKINGS)
+
+    def interrupted(organization, params):
+        yield ["linha"]
+        raise SoftTimeLimitExceeded()
+
+    header = services.REPORT_BUILDERS[ReportJob.Kind.EVENTS][0]
+    with mock.patch.dict(services.REPORT_BUILDERS, {ReportJob.Kind.EVENTS: (header, interrupted)}):
+        assert tasks.generate_report_task(slow.pk) == ReportJob.Status.FAILED
+    slow.refresh_from_db()
+    assert slow.error == services.TIMEOUT_ERROR
+
+    # Worker morto pelo time_limit a meio: job em execução e ficheiro parcial
+    ReportJob.objects.filter(pk=killed.pk).update(status=ReportJob.Status.RUNNING)
+    partial = Path(settings.REPORTS_ROOT) / str(report_org.pk) / f"{killed.pk}-bookings-abc.csv.gz.part"
+    partial.parent.mkdir(parents=True, exist_ok=True)
+    partial.write_bytes(b"...")
+
+    assert fail_stale_report_jobs() == 0
+    later = timezone.now() + timedelta(seconds=settings.REPORT_JOB_TIMEOUT + 1)
+    assert fail_stale_report_jobs(now=later) == 1
+    killed.refresh_from_db()
+    assert (killed.status, killed.error) == (ReportJob.Status.FAILED, services.TIMEOUT_ERROR)
+    assert not partial.exists()
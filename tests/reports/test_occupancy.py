@@ -0,0 +1,128 @@
+import time
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytest
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import Booking, Event, Organization, Person, Resource, UserProfile
+from core.services.outbox import drain_outbox
+from reports.occupancy import compute_occupancy, occupancy_heatmap
+
+# Segunda-feira
+MONDAY = date(2026, 3, 2)
+
+
+def _at(day, hour, minute=0):
+    return timezone.make_aware(datetime.combine(day, datetime.min.time()).replace(hour=hour, minute=minute))
+
+
+@pytest.fixture
+def studio():
+    cache.clear()
+    org = Organization.objects.create(name="Org", domain="org.local")
+    room = Resource.objects.create(organization=org, name="Sala", capacity=4)
+    people = [
+        Person.objects.create(organization=org, first_name=f"P{index}", nif=str(index), email=f"p{index}@example.com")
+        for index in range(3)
+    ]
+    yield org, room, people
+    cache.clear()
+
+
+def _event(org, room, starts_at, ends_at, capacity=4):
+    return Event.objects.create(
+        organization=org, resource=room, title="Aula", starts_at=starts_at, ends_at=ends_at, capacity=capacity
+    )
+
+
+@pytest.mark.django_db
+def test_heatmap_by_weekday_and_hour(studio, django_assert_num_queries):
+    org, room, people = studio
+    # Duas segundas seguidas às 18h; na segunda, 3 de 4 lugares reservados
+    _event(org, room, _at(MONDAY, 18), _at(MONDAY, 19))
+    busy = _event(org, room, _at(MONDAY + timedelta(days=7), 18), _at(MONDAY + timedelta(days=7), 19))
+    for person in people:
+        Booking.objects.create(organization=org, event=busy, person=person)
+    Booking.objects.filter(person=people[2]).update(status=Booking.Status.CANCELLED)
+    # Quarta 9h30-11h: meia hora às 9h e a hora das 10h
+    _event(org, room, _at(MONDAY + timedelta(days=2), 9, 30), _at(MONDAY + timedelta(days=2), 11))
+
+    with django_assert_num_queries(1):
+        heatmap = occupancy_heatmap(org, MONDAY, MONDAY + timedelta(days=13))
+
+    assert heatmap["resources"] == [{"id": room.pk, "name": "Sala"}]
+    occupancy = np.array(heatmap["occupancy"])
+    fill_rate = np.array(heatmap["fill_rate"])
+    assert occupancy.shape == (1, 7, 24)
+    # Duas segundas no intervalo, ambas com aula às 18h
+    assert occupancy[0, 0, 18] == 1.0
+    assert fill_rate[0, 0, 18] == 0.25
+    assert occupancy[0, 2, 9] == 0.25
+    assert occupancy[0, 2, 10] == 0.5
+    assert occupancy.sum() == pytest.approx(1.75)
+
+    # Cache por organização e intervalo
+    with django_assert_num_queries(0):
+        occupancy_heatmap(org, MONDAY, MONDAY + timedelta(days=13))
+
+
+@pytest.mark.django_db
+def test_schedule_changes_invalidate_the_cache(studio, django_capture_on_commit_callbacks):
+    org, room, _ = studio
+    _event(org, room, _at(MONDAY, 8), _at(MONDAY, 9))
+    drain_outbox()
+    assert np.array(occupancy_heatmap(org, MONDAY, MONDAY)["occupancy"])[0, 0, 8] == 1.0
+
+    _event(org, room, _at(MONDAY, 12), _at(MONDAY, 13))
+    with django_capture_on_commit_callbacks(execute=True):
+        drain_outbox()
+    assert np.array(occupancy_heatmap(org, MONDAY, MONDAY)["occupancy"])[0, 0, 12] == 1.0
+
+
+def test_year_of_classes_computes_quickly():
+    rng = np.random.default_rng(0)
+    events = 60_000
+    start = datetime(2025, 1, 1, tzinfo=timezone.get_current_timezone()).timestamp()
+    starts = start + rng.integers(0, 365, events) * 86400 + rng.integers(7, 21, events) * 3600
+    columns = {
+        "resource_id": rng.integers(1, 13, events),
+        "starts_at": starts.astype(np.float64),
+        "ends_at": starts + rng.choice([2700, 3600, 5400], events),
+        "capacity": np.full(events, 12.0),
+        "booked": rng.integers(0, 13, events).astype(np.float64),
+    }
+
+    began = time.perf_counter()
+    result = compute_occupancy(columns, date(2025, 1, 1), date(2025, 12, 31))
+    elapsed = time.perf_counter() - began
+
+    assert result["occupancy"].shape == (12, 7, 24)
+    assert (result["fill_rate"] <= 1.0).all()
+    assert elapsed < 0.5
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["org.local"])
+def test_occupancy_api(client, studio):
+    org, room, _ = studio
+    _event(org, room, _at(MONDAY, 18), _at(MONDAY, 19))
+    user = User.objects.create_user(username="admin", password="pwd")
+    UserProfile.objects.create(user=user, organization=org, user_type=UserProfile.UserType.ADMIN)
+    client.force_login(user)
+    url = reverse("reports:occupancy_data")
+
+    response = client.get(url, {"start": MONDAY, "end": MONDAY}, secure=True, HTTP_HOST="org.local")
+    assert response.status_code == 200
+    assert response.json()["occupancy"][0][0][18] == 1.0
+
+    too_long = client.get(url, {"start": "2020-01-01", "end": "2026-01-01"}, secure=True, HTTP_HOST="org.local")
+    assert too_long.status_code == 400
+
+    impossible = client.get(url, {"start": "2026-02-30", "end": "2026-03-02"}, secure=True, HTTP_HOST="org.local")
+    assert impossible.status_code == 400
+    assert impossible.json() == {"error": "invalid_parameters"}
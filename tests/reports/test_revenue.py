@@ -0,0 +1,196 @@
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+
+import pytest
+from django.contrib.auth.models import User
+from django.test import override_settings
+from django.urls import reverse
+from django.utils import timezone
+
+from core.models import (
+    ClientSubscription,
+    Event,
+    Instructor,
+    InstructorCommission,
+    Organization,
+    OutboxMessage,
+    Payment,
+    PaymentPlan,
+    Person,
+    Resource,
+    RevenueSourceMixin,
+    UserProfile,
+)
+from core.services.outbox import drain_outbox
+from reports.models import RevenueBucket
+from reports.revenue import rebuild_revenue, revenue_series, revenue_total
+
+Source = RevenueBucket.Source
+
+
+@pytest.fixture
+def org():
+    return Organization.objects.create(name="Org", domain="org.local")
+
+
+@pytest.fixture
+def people(org):
+    acr = Person.objects.create(organization=org, first_name="Ana", nif="1", email="ana@example.com")
+    proform = Person.objects.create(
+        organization=org, first_name="Rita", nif="2", email="rita@example.com",
+        entity_affiliation=Person.EntityAffiliation.PROFORM_ONLY,
+    )
+    return acr, proform
+
+
+def _pay(org, person, amount, day, method=Payment.Method.CASH, status=Payment.Status.COMPLETED):
+    return Payment.objects.create(
+        organization=org, person=person, amount=Decimal(amount), method=method, status=status, paid_date=day
+    )
+
+
+def _snapshot(org):
+    return sorted(
+        RevenueBucket.objects.filter(organization=org).values_list(
+            "granularity", "period_start", "source", "entity", "method", "amount", "count"
+        )
+    )
+
+
+@pytest.mark.django_db
+def test_payments_roll_into_day_week_and_month_buckets(org, people):
+    acr, proform = people
+    _pay(org, acr, "30.00", date(2026, 3, 30))
+    _pay(org, acr, "20.00", date(2026, 3, 31), method=Payment.Method.CARD)
+    _pay(org, proform, "45.50", date(2026, 4, 1), method=Payment.Method.MBWAY)
+    _pay(org, acr, "99.00", date(2026, 4, 1), status=Payment.Status.PENDING)
+
+    drain_outbox()
+
+    months = RevenueBucket.objects.filter(organization=org, granularity="month").values_list(
+        "period_start", "entity", "method", "amount")
+    assert sorted(months) == [
+        (date(2026, 3, 1), "acr", "card", Decimal("20.00")),
+        (date(2026, 3, 1), "acr", "cash", Decimal("30.00")),
+        (date(2026, 4, 1), "proform", "mbway", Decimal("45.50")),
+    ]
+    # A semana de 30/03 (segunda) junta os três dias, atravessando o mês
+    week = RevenueBucket.objects.filter(organization=org, granularity="week", period_start=date(2026, 3, 30))
+    assert sum(bucket.amount for bucket in week) == Decimal("95.50")
+
+    assert revenue_total(org, date(2026, 3, 31), date(2026, 4, 30)) == Decimal("65.50")
+    assert revenue_total(org, date(2026, 3, 1), date(2026, 4, 30), entity="acr") == Decimal("50.00")
+    assert revenue_total(org, date(2026, 4, 2), date(2026, 4, 30)) == 0
+
+
+@pytest.mark.django_db
+def test_moved_and_deleted_payments_clear_their_old_days(org, people):
+    acr, _ = people
+    payment = _pay(org, acr, "10.00", date(2026, 5, 4))
+    keep = _pay(org, acr, "5.00", date(2026, 5, 4))
+    drain_outbox()
+
+    # Duas mudanças de dia no mesmo lote do relay
+    payment.paid_date = date(2026, 5, 12)
+    payment.save()
+    payment.paid_date = date(2026, 6, 2)
+    payment.save()
+    keep.delete()
+    drain_outbox()
+
+    days = RevenueBucket.objects.filter(organization=org, granularity="day").values_list("period_start", "amount")
+    assert list(days) == [(date(2026, 6, 2), Decimal("10.00"))]
+    assert revenue_total(org, date(2026, 5, 1), date(2026, 5, 31)) == 0
+
+
+@pytest.mark.django_db
+def test_subscriptions_and_commissions_and_full_rebuild(org, people):
+    acr, proform = people
+    plan = PaymentPlan.objects.create(
+        organization=org, name="Pilates", price=Decimal("60.00"), entity_type=PaymentPlan.EntityType.PROFORM
+    )
+    ClientSubscription.objects.create(
+        organization=org, person=proform, payment_plan=plan, is_paid=True, payment_date=date(2026, 2, 3)
+    )
+    unpaid = ClientSubscription.objects.create(organization=org, person=acr, payment_plan=plan)
+    # Gravações de créditos não tocam na receita
+    unpaid.save(update_fields=["remaining_credits", "updated_at"])
+
+    resource = Resource.objects.create(organization=org, name="Estúdio", entity_type=Resource.EntityType.PROFORM)
+    instructor = Instructor.objects.create(organization=org, first_name="Rui")
+    start = timezone.make_aware(datetime(2026, 2, 4, 10, 0))
+    event = Event.objects.create(
+        organization=org, resource=resource, instructor=instructor, title="Pilates",
+        starts_at=start, ends_at=start + timedelta(hours=1),
+    )
+    InstructorCommission.objects.create(
+        organization=org, instructor=instructor, event=event, total_revenue=Decimal("100.00"),
+        commission_rate=Decimal("40.00"),
+    )
+    _pay(org, acr, "25.00", date(2026, 2, 5))
+
+    drain_outbox()
+    incremental = _snapshot(org)
+
+    series = revenue_series(org, "month", date(2026, 2, 1), date(2026, 2, 28), group_by="source")
+    assert series == [
+        {"period": "2026-02-01", "amount": 40.0, "count": 1, "source": "commission"},
+        {"period": "2026-02-01", "amount": 25.0, "count": 1, "source": "payment"},
+        {"period": "2026-02-01", "amount": 60.0, "count": 1, "source": "subscription"},
+    ]
+    assert revenue_total(org, date(2026, 2, 1), date(2026, 2, 28), source=Source.COMMISSION, entity="proform") == 40
+
+    # A receita das subscrições usa o preço da compra, não o preço atual do plano
+    plan.price = Decimal("80.00")
+    plan.save()
+    assert rebuild_revenue(org.pk) == len(incremental)
+    assert _snapshot(org) == incremental
+
+
+@pytest.mark.django_db
+def test_saving_a_loaded_payment_reads_the_previous_day_without_a_select(org, people, django_assert_num_queries):
+    acr, _ = people
+    payment = Payment.objects.get(pk=_pay(org, acr, "10.00", date(2026, 5, 4)).pk)
+    payment.paid_date = date(2026, 5, 12)
+
+    # savepoint, UPDATE, INSERT no outbox, release
+    with django_assert_num_queries(4):
+        payment.save()
+
+    message = OutboxMessage.objects.filter(topic=OutboxMessage.Topic.PAYMENT_CHANGED).last()
+    assert message.payload == {"days": ["2026-05-04", "2026-05-12"]}
+
+
+def test_revenue_sources_must_define_the_contract():
+    with pytest.raises(TypeError):
+        class Incomplete(RevenueSourceMixin):
+            REVENUE_TOPIC = "payment.changed"
+
+
+@pytest.mark.django_db
+@override_settings(ALLOWED_HOSTS=["org.local"])
+def test_revenue_api(client, org, people):
+    acr, proform = people
+    today = timezone.localdate()
+    _pay(org, acr, "10.00", today)
+    _pay(org, proform, "15.00", today)
+    drain_outbox()
+
+    user = User.objects.create_user(username="admin", password="pwd")
+    UserProfile.objects.create(user=user, organization=org, user_type=UserProfile.UserType.ADMIN)
+    client.force_login(user)
+    url = reverse("reports:revenue_data")
+
+    data = client.get(url, {"granularity": "day", "group_by": "entity"}, secure=True, HTTP_HOST="org.local").json()
+    assert data["total"] == 25.0
+    assert data["series"] == [
+        {"period": today.isoformat(), "amount": 10.0, "count": 1, "entity": "acr"},
+        {"period": today.isoformat(), "amount": 15.0, "count": 1, "entity": "proform"},
+    ]
+
+    response = client.get(url, {"granularity": "year"}, secure=True, HTTP_HOST="org.local")
+    assert response.status_code == 400
+
+    impossible = client.get(url, {"start": "2026-02-30"}, secure=True, HTTP_HOST="org.local")
+    assert impossible.status_code == 400
+    assert impossible.json() == {"error": "invalid_parameters"}